@@ -0,0 +1,74 @@
+"""add_list_filter_indexes
+
+Revision ID: 3b9c1f4a7d21
+Revises: 1ddf5e5e272f
+Create Date: 2026-10-18 10:12:41.503118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '3b9c1f4a7d21'
+down_revision: Union[str, None] = '1ddf5e5e272f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (table, column) для регистронезависимого поиска по lower(column)
+SEARCH_COLUMNS = [
+    ('users', 'username'),
+    ('users', 'email'),
+    ('roles', 'name'),
+    ('permissions', 'name'),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    is_postgres = op.get_context().dialect.name == 'postgresql'
+    if is_postgres:
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    for table, column in SEARCH_COLUMNS:
+        label = f'{column}_lower'
+        # prefix: lower(column) LIKE 'abc%'
+        op.create_index(
+            f'ix_{table}_{column}_lower_pattern',
+            table,
+            [sa.func.lower(sa.column(column)).label(label)],
+            postgresql_ops={label: 'varchar_pattern_ops'},
+        )
+        # contains: lower(column) LIKE '%abc%' — только Postgres
+        if is_postgres:
+            op.create_index(
+                f'ix_{table}_{column}_lower_trgm',
+                table,
+                [sa.func.lower(sa.column(column)).label(label)],
+                postgresql_using='gin',
+                postgresql_ops={label: 'gin_trgm_ops'},
+            )
+
+    op.create_index('ix_users_is_active_id', 'users', ['is_active', 'id'])
+    op.create_index('ix_users_is_superuser_id', 'users', ['is_superuser', 'id'])
+    op.create_index('ix_users_created_at', 'users', ['created_at'])
+    op.create_index(
+        'ix_user_roles_role_id_user_id', 'user_roles', ['role_id', 'user_id']
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    is_postgres = op.get_context().dialect.name == 'postgresql'
+
+    op.drop_index('ix_user_roles_role_id_user_id', table_name='user_roles')
+    op.drop_index('ix_users_created_at', table_name='users')
+    op.drop_index('ix_users_is_superuser_id', table_name='users')
+    op.drop_index('ix_users_is_active_id', table_name='users')
+    for table, column in reversed(SEARCH_COLUMNS):
+        if is_postgres:
+            op.drop_index(f'ix_{table}_{column}_lower_trgm', table_name=table)
+        op.drop_index(f'ix_{table}_{column}_lower_pattern', table_name=table)
+    # pg_trgm оставляем: расширение могло понадобиться не только нам
@@ -0,0 +1,51 @@
+"""namespaced_permission_names
+
+Revision ID: 5f0b2d8e6c13
+Revises: c41a7e9d2b58
+Create Date: 2026-10-18 16:02:54.118240
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '5f0b2d8e6c13'
+down_revision: Union[str, None] = 'c41a7e9d2b58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# встроенные разрешения эндпоинтов: read_user -> users:read и т.д.
+RENAMES = [
+    (f'{action}_{entity}', f'{entity}s:{action}')
+    for entity in ('user', 'role', 'permission')
+    for action in ('create', 'read', 'update', 'delete')
+]
+
+permissions = sa.table('permissions', sa.column('name', sa.String))
+
+
+def _rename(pairs) -> None:
+    for old, new in pairs:
+        # не трогаем, если новое имя уже заведено вручную (name уникален)
+        taken = permissions.alias('taken')
+        op.execute(
+            permissions.update()
+            .where(
+                permissions.c.name == old,
+                ~sa.exists().where(taken.c.name == new),
+            )
+            .values(name=new)
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    _rename(RENAMES)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _rename([(new, old) for old, new in RENAMES])
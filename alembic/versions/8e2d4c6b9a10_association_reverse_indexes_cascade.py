@@ -0,0 +1,55 @@
+"""association_reverse_indexes_cascade
+
+Revision ID: 8e2d4c6b9a10
+Revises: 3b9c1f4a7d21
+Create Date: 2026-10-18 11:47:05.218334
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = '8e2d4c6b9a10'
+down_revision: Union[str, None] = '3b9c1f4a7d21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (table, column, referred table) — имена FK совпадают с дефолтными именами
+# Postgres из начальной миграции
+FOREIGN_KEYS = [
+    ('user_roles', 'user_id', 'users'),
+    ('user_roles', 'role_id', 'roles'),
+    ('role_permissions', 'role_id', 'roles'),
+    ('role_permissions', 'permission_id', 'permissions'),
+]
+
+
+def _recreate_foreign_keys(ondelete: Union[str, None]) -> None:
+    for table, column, referred in FOREIGN_KEYS:
+        name = f'{table}_{column}_fkey'
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_constraint(name, type_='foreignkey')
+            batch_op.create_foreign_key(
+                name, referred, [column], ['id'], ondelete=ondelete
+            )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # user_roles(role_id, user_id) уже создан в 3b9c1f4a7d21
+    op.create_index(
+        'ix_role_permissions_permission_id_role_id',
+        'role_permissions',
+        ['permission_id', 'role_id'],
+    )
+    _recreate_foreign_keys('CASCADE')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _recreate_foreign_keys(None)
+    op.drop_index(
+        'ix_role_permissions_permission_id_role_id', table_name='role_permissions'
+    )
@@ -0,0 +1,33 @@
+"""role_assignment_validity
+
+Revision ID: a4e8d1c7b352
+Revises: f2b7c9e4a613
+Create Date: 2026-10-19 10:12:40.517203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'a4e8d1c7b352'
+down_revision: Union[str, None] = 'f2b7c9e4a613'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('user_roles', sa.Column('valid_from', sa.DateTime(), nullable=True))
+    op.add_column('user_roles', sa.Column('valid_until', sa.DateTime(), nullable=True))
+    op.create_index('ix_user_roles_valid_until', 'user_roles', ['valid_until'])
+    op.create_index('ix_user_roles_valid_from', 'user_roles', ['valid_from'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_user_roles_valid_from', table_name='user_roles')
+    op.drop_index('ix_user_roles_valid_until', table_name='user_roles')
+    op.drop_column('user_roles', 'valid_until')
+    op.drop_column('user_roles', 'valid_from')
@@ -0,0 +1,53 @@
+"""scoped_grants
+
+Revision ID: a7d3e5f1c920
+Revises: 5f0b2d8e6c13
+Create Date: 2026-10-18 17:35:12.640981
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'a7d3e5f1c920'
+down_revision: Union[str, None] = '5f0b2d8e6c13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'scoped_grants',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('role_id', sa.Integer(), nullable=False),
+        sa.Column('permission_id', sa.Integer(), nullable=False),
+        sa.Column('resource_type', sa.String(length=50), nullable=False),
+        sa.Column('resource_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['permission_id'], ['permissions.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['role_id'], ['roles.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_scoped_grants_resource',
+        'scoped_grants',
+        ['resource_type', 'resource_id', 'role_id'],
+    )
+    op.create_index(
+        'uq_scoped_grants_role_permission_resource',
+        'scoped_grants',
+        ['role_id', 'permission_id', 'resource_type', 'resource_id'],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        'uq_scoped_grants_role_permission_resource', table_name='scoped_grants'
+    )
+    op.drop_index('ix_scoped_grants_resource', table_name='scoped_grants')
+    op.drop_table('scoped_grants')
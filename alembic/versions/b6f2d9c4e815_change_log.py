@@ -0,0 +1,45 @@
+"""change_log
+
+Revision ID: b6f2d9c4e815
+Revises: e3c8a1f6b274
+Create Date: 2026-10-18 20:41:06.382915
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'b6f2d9c4e815'
+down_revision: Union[str, None] = 'e3c8a1f6b274'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'change_log',
+        sa.Column(
+            'seq',
+            sa.BigInteger().with_variant(sa.Integer(), 'sqlite'),
+            nullable=False,
+        ),
+        sa.Column('tenant_id', sa.Integer(), nullable=False),
+        sa.Column('entity_type', sa.String(length=20), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('op', sa.String(length=10), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('seq'),
+        sqlite_autoincrement=True,
+    )
+    op.create_index(
+        'ix_change_log_tenant_id_seq', 'change_log', ['tenant_id', 'seq']
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_change_log_tenant_id_seq', table_name='change_log')
+    op.drop_table('change_log')
@@ -0,0 +1,47 @@
+"""entity_counters
+
+Revision ID: c41a7e9d2b58
+Revises: 8e2d4c6b9a10
+Create Date: 2026-10-18 14:21:37.904512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'c41a7e9d2b58'
+down_revision: Union[str, None] = '8e2d4c6b9a10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'entity_counts',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('value', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+    # начальные значения; дальше счётчики ведёт crud (см. counters.py)
+    op.execute(
+        """
+        INSERT INTO entity_counts (name, value)
+        SELECT 'users', count(*) FROM users
+        UNION ALL
+        SELECT 'users:active', count(*) FROM users WHERE is_active
+        UNION ALL
+        SELECT 'users:superuser', count(*) FROM users WHERE is_superuser
+        UNION ALL
+        SELECT 'roles', count(*) FROM roles
+        UNION ALL
+        SELECT 'permissions', count(*) FROM permissions
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('entity_counts')
@@ -0,0 +1,89 @@
+"""row_versions
+
+Revision ID: d58a3f7c1e09
+Revises: b6f2d9c4e815
+Create Date: 2026-10-18 22:14:37.520186
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'd58a3f7c1e09'
+down_revision: Union[str, None] = 'b6f2d9c4e815'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# таблица -> entity_type её событий в change_log (changes.ENTITY_TYPES)
+VERSIONED_TABLES = {
+    'users': 'user',
+    'roles': 'role',
+    'permissions': 'permission',
+    'scoped_grants': 'grant',
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    is_postgres = op.get_context().dialect.name == 'postgresql'
+
+    for table in VERSIONED_TABLES:
+        op.add_column(
+            table,
+            sa.Column(
+                'version', sa.BigInteger(), nullable=False, server_default='0'
+            ),
+        )
+        op.alter_column(table, 'version', server_default=None)
+
+    if is_postgres:
+        # seq журнала и version строк — одна последовательность
+        op.execute('CREATE SEQUENCE rbac_version_seq')
+        op.execute(
+            "SELECT setval('rbac_version_seq', "
+            "coalesce((SELECT max(seq) FROM change_log), 0) + 1, false)"
+        )
+        op.execute(
+            "ALTER TABLE change_log "
+            "ALTER COLUMN seq SET DEFAULT nextval('rbac_version_seq')"
+        )
+        op.execute('DROP SEQUENCE change_log_seq_seq')
+        # существующие строки получают свои версии и событие о создании,
+        # чтобы первая синхронизация могла разбить их на страницы
+        for table, entity_type in VERSIONED_TABLES.items():
+            op.execute(f"UPDATE {table} SET version = nextval('rbac_version_seq')")
+            op.execute(
+                'INSERT INTO change_log '
+                '(seq, tenant_id, entity_type, entity_id, op, created_at) '
+                f"SELECT version, tenant_id, '{entity_type}', id, 'create', now() "
+                f'FROM {table}'
+            )
+
+    for table in VERSIONED_TABLES:
+        op.create_index(
+            f'ix_{table}_tenant_id_version', table, ['tenant_id', 'version']
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    is_postgres = op.get_context().dialect.name == 'postgresql'
+
+    for table in VERSIONED_TABLES:
+        op.drop_index(f'ix_{table}_tenant_id_version', table_name=table)
+        op.drop_column(table, 'version')
+
+    if is_postgres:
+        op.execute('CREATE SEQUENCE change_log_seq_seq OWNED BY change_log.seq')
+        op.execute(
+            "SELECT setval('change_log_seq_seq', "
+            "coalesce((SELECT max(seq) FROM change_log), 0) + 1, false)"
+        )
+        op.execute(
+            "ALTER TABLE change_log "
+            "ALTER COLUMN seq SET DEFAULT nextval('change_log_seq_seq')"
+        )
+        op.execute('DROP SEQUENCE rbac_version_seq')
@@ -0,0 +1,125 @@
+"""tenant_partitioning
+
+Revision ID: e3c8a1f6b274
+Revises: a7d3e5f1c920
+Create Date: 2026-10-18 19:02:53.117604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'e3c8a1f6b274'
+down_revision: Union[str, None] = 'a7d3e5f1c920'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# существующие строки уходят арендатору по умолчанию (models.DEFAULT_TENANT_ID)
+DEFAULT_TENANT_ID = '1'
+
+TENANT_TABLES = ['users', 'roles', 'permissions', 'scoped_grants', 'entity_counts']
+
+# (table, column): уникальность и prefix-поиск теперь внутри арендатора
+NAME_COLUMNS = [
+    ('users', 'username'),
+    ('users', 'email'),
+    ('roles', 'name'),
+    ('permissions', 'name'),
+]
+
+# индексы списков пользователей: (старое имя, новое имя, столбцы без tenant_id)
+USER_INDEXES = [
+    ('ix_users_is_active_id', 'ix_users_tenant_id_is_active_id', ['is_active', 'id']),
+    (
+        'ix_users_is_superuser_id',
+        'ix_users_tenant_id_is_superuser_id',
+        ['is_superuser', 'id'],
+    ),
+    ('ix_users_created_at', 'ix_users_tenant_id_created_at', ['created_at']),
+]
+
+
+def _pattern_index(table, column, leading):
+    label = f'{column}_lower'
+    op.create_index(
+        f'ix_{table}_{column}_lower_pattern',
+        table,
+        [*leading, sa.func.lower(sa.column(column)).label(label)],
+        postgresql_ops={label: 'varchar_pattern_ops'},
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in TENANT_TABLES:
+        op.add_column(
+            table,
+            sa.Column(
+                'tenant_id',
+                sa.Integer(),
+                nullable=False,
+                server_default=DEFAULT_TENANT_ID,
+            ),
+        )
+        # значение задаёт приложение; серверный default нужен только для заливки
+        op.alter_column(table, 'tenant_id', server_default=None)
+
+    for table, column in NAME_COLUMNS:
+        op.drop_index(f'ix_{table}_{column}', table_name=table)
+        op.create_index(
+            f'uq_{table}_tenant_id_{column}',
+            table,
+            ['tenant_id', column],
+            unique=True,
+        )
+        op.drop_index(f'ix_{table}_{column}_lower_pattern', table_name=table)
+        _pattern_index(table, column, [sa.column('tenant_id')])
+
+    for table in ('users', 'roles', 'permissions'):
+        op.create_index(f'ix_{table}_tenant_id_id', table, ['tenant_id', 'id'])
+    for old, new, columns in USER_INDEXES:
+        op.drop_index(old, table_name='users')
+        op.create_index(new, 'users', ['tenant_id', *columns])
+
+    op.drop_index('ix_scoped_grants_resource', table_name='scoped_grants')
+    op.create_index(
+        'ix_scoped_grants_resource',
+        'scoped_grants',
+        ['tenant_id', 'resource_type', 'resource_id', 'role_id'],
+    )
+
+    op.drop_constraint('entity_counts_pkey', 'entity_counts', type_='primary')
+    op.create_primary_key('entity_counts_pkey', 'entity_counts', ['tenant_id', 'name'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # возврат к одному арендатору: строки прочих арендаторов не переносятся
+    op.execute(f'DELETE FROM entity_counts WHERE tenant_id <> {DEFAULT_TENANT_ID}')
+    op.drop_constraint('entity_counts_pkey', 'entity_counts', type_='primary')
+    op.create_primary_key('entity_counts_pkey', 'entity_counts', ['name'])
+
+    op.drop_index('ix_scoped_grants_resource', table_name='scoped_grants')
+    op.create_index(
+        'ix_scoped_grants_resource',
+        'scoped_grants',
+        ['resource_type', 'resource_id', 'role_id'],
+    )
+
+    for old, new, columns in reversed(USER_INDEXES):
+        op.drop_index(new, table_name='users')
+        op.create_index(old, 'users', columns)
+    for table in ('permissions', 'roles', 'users'):
+        op.drop_index(f'ix_{table}_tenant_id_id', table_name=table)
+
+    for table, column in reversed(NAME_COLUMNS):
+        op.drop_index(f'ix_{table}_{column}_lower_pattern', table_name=table)
+        _pattern_index(table, column, [])
+        op.drop_index(f'uq_{table}_tenant_id_{column}', table_name=table)
+        op.create_index(f'ix_{table}_{column}', table, [column], unique=True)
+
+    for table in reversed(TENANT_TABLES):
+        op.drop_column(table, 'tenant_id')
@@ -0,0 +1,67 @@
+import argparse
+import asyncio
+import json
+from pathlib import Path
+
+from benchmarks.dataset import DatasetSpec
+from benchmarks.runner import run_benchmark, save_report
+from benchmarks.scenarios import SCENARIOS
+
+
+def _pair(value: str) -> tuple[int, int]:
+    lo, _, hi = value.partition(":")
+    return int(lo), int(hi or lo)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="In-process бенчмарк Access Manager на синтетическом RBAC.",
+    )
+    parser.add_argument(
+        "--db-url",
+        default="sqlite+aiosqlite:///./benchmark.sqlite",
+        help="async-DSN; схема в этой БД будет пересоздана",
+    )
+    parser.add_argument("--users", type=int, default=DatasetSpec.users)
+    parser.add_argument("--roles", type=int, default=DatasetSpec.roles)
+    parser.add_argument("--permissions", type=int, default=DatasetSpec.permissions)
+    parser.add_argument("--roles-per-user", type=_pair, default="1:3", help="min:max")
+    parser.add_argument(
+        "--permissions-per-role", type=_pair, default="5:30", help="min:max"
+    )
+    parser.add_argument("--seed", type=int, default=DatasetSpec.seed)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="можно указать несколько раз; по умолчанию — все",
+    )
+    parser.add_argument("--output", type=Path, default=Path("benchmark-results.json"))
+    args = parser.parse_args()
+
+    spec = DatasetSpec(
+        users=args.users,
+        roles=args.roles,
+        permissions=args.permissions,
+        roles_per_user=args.roles_per_user,
+        permissions_per_role=args.permissions_per_role,
+        seed=args.seed,
+    )
+    report = asyncio.run(
+        run_benchmark(
+            args.db_url,
+            spec,
+            scenarios=args.scenario or tuple(SCENARIOS),
+            requests=args.requests,
+            concurrency=args.concurrency,
+        )
+    )
+    save_report(report, args.output)
+    print(json.dumps(report["scenarios"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
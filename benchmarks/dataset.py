@@ -0,0 +1,153 @@
+"""
+Генератор синтетического RBAC-датасета на factory-boy/faker.
+
+Форма нагрузки повторяет типичную инсталляцию: мало ролей и разрешений,
+много пользователей; у большинства пользователей 1–3 роли, у роли —
+от нескольких до нескольких десятков разрешений.
+"""
+
+import random
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+
+import factory
+import factory.random
+from faker import Faker
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.access_manager import counters
+from src.access_manager.models import (
+    Permission,
+    Role,
+    User,
+    role_permissions,
+    user_roles,
+)
+from src.access_manager.security import get_password_hash
+
+BENCH_PASSWORD = "bench-password"
+
+# Действия, под которые в main.py есть require_permission(...)
+ADMIN_PERMISSIONS = [
+    f"{entity}:{action}"
+    for entity in ("users", "roles", "permissions")
+    for action in ("create", "read", "update", "delete")
+]
+
+
+@dataclass(frozen=True)
+class DatasetSpec:
+    users: int = 1000
+    roles: int = 50
+    permissions: int = 200
+    # роли на пользователя и разрешения на роль: (min, max)
+    roles_per_user: tuple[int, int] = (1, 3)
+    permissions_per_role: tuple[int, int] = (5, 30)
+    seed: int = 42
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class Dataset:
+    spec: DatasetSpec
+    admin_id: int
+    user_ids: list[int]
+    usernames: list[str]
+    role_ids: list[int]
+    permission_ids: list[int]
+
+
+@lru_cache(maxsize=None)
+def _password_hash() -> str:
+    return get_password_hash(BENCH_PASSWORD)
+
+
+class PermissionFactory(factory.Factory):
+    class Meta:
+        model = Permission
+
+    name = factory.Sequence(lambda n: f"bench_perm_{n}")
+    description = factory.Faker("sentence", nb_words=6)
+
+
+class RoleFactory(factory.Factory):
+    class Meta:
+        model = Role
+
+    name = factory.Sequence(lambda n: f"bench_role_{n}")
+    description = factory.Faker("job")
+
+
+class UserFactory(factory.Factory):
+    class Meta:
+        model = User
+
+    username = factory.Sequence(lambda n: f"bench_user_{n}")
+    email = factory.LazyAttribute(lambda o: f"{o.username}@bench.example.com")
+    # bcrypt дорогой — один хэш на весь датасет
+    hashed_password = factory.LazyFunction(_password_hash)
+    is_active = True
+    is_superuser = False
+
+
+def _seed(seed: int) -> random.Random:
+    Faker.seed(seed)
+    factory.random.reseed_random(seed)
+    for f in (PermissionFactory, RoleFactory, UserFactory):
+        f.reset_sequence()
+    return random.Random(seed)
+
+
+async def generate(session: AsyncSession, spec: DatasetSpec) -> Dataset:
+    """
+    Заполняет пустую схему датасетом по spec. Связи вставляются пачками
+    через Core insert, без ORM-коллекций.
+    """
+    rng = _seed(spec.seed)
+
+    admin_perms = [
+        Permission(name=name, description="benchmark admin permission")
+        for name in ADMIN_PERMISSIONS
+    ]
+    perms = PermissionFactory.build_batch(spec.permissions)
+    roles = RoleFactory.build_batch(spec.roles)
+    admin_role = Role(name="bench_admin", description="benchmark admin role")
+    users = UserFactory.build_batch(spec.users)
+    admin = UserFactory.build(username="bench_admin", is_superuser=True)
+
+    session.add_all([*admin_perms, *perms, *roles, admin_role, *users, admin])
+    await session.flush()
+
+    rp_rows = [{"role_id": admin_role.id, "permission_id": p.id} for p in admin_perms]
+    lo, hi = spec.permissions_per_role
+    for role in roles:
+        k = min(rng.randint(lo, hi), len(perms))
+        rp_rows += [
+            {"role_id": role.id, "permission_id": p.id} for p in rng.sample(perms, k)
+        ]
+
+    ur_rows = [{"user_id": admin.id, "role_id": admin_role.id}]
+    lo, hi = spec.roles_per_user
+    for user in users:
+        k = min(rng.randint(lo, hi), len(roles))
+        ur_rows += [{"user_id": user.id, "role_id": r.id} for r in rng.sample(roles, k)]
+
+    if rp_rows:
+        await session.execute(insert(role_permissions), rp_rows)
+    if ur_rows:
+        await session.execute(insert(user_roles), ur_rows)
+    # строки вставлены в обход crud — счётчики для X-Total-Count пересчитываем
+    await counters.rebuild(session)
+    await session.commit()
+
+    return Dataset(
+        spec=spec,
+        admin_id=admin.id,
+        user_ids=[u.id for u in users],
+        usernames=[u.username for u in users],
+        role_ids=[r.id for r in roles],
+        permission_ids=[p.id for p in perms],
+    )
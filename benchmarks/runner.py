@@ -0,0 +1,185 @@
+"""
+Прогон сценариев и сбор статистики.
+"""
+
+import asyncio
+import json
+import math
+import platform
+import subprocess
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Optional
+
+from benchmarks.dataset import DatasetSpec, generate
+from benchmarks.scenarios import SCENARIOS, ScenarioContext
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.access_manager.admission import limiter as admission_limiter
+from src.access_manager.db import configure_engine, get_db
+from src.access_manager.main import app
+from src.access_manager.models import Base
+from src.access_manager.ratelimit import login_limiter
+from src.access_manager.security import create_access_token
+
+
+@dataclass
+class ScenarioResult:
+    requests: int
+    errors: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    mean_ms: float
+    throughput_rps: float
+    queries_per_request: float
+
+
+class QueryCounter:
+    """Считает SQL-запросы на движке через before_cursor_execute."""
+
+    def __init__(self, engine) -> None:
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args) -> None:
+        self.count += 1
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank перцентиль по отсортированной выборке."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+async def run_scenario(
+    client: AsyncClient,
+    ctx: ScenarioContext,
+    name: str,
+    requests: int,
+    concurrency: int,
+    counter: QueryCounter,
+) -> ScenarioResult:
+    scenario = SCENARIOS[name]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors = 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await scenario(client, ctx, i)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    queries_before = counter.count
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return ScenarioResult(
+        requests=requests,
+        errors=errors,
+        p50_ms=round(percentile(latencies, 50), 3),
+        p95_ms=round(percentile(latencies, 95), 3),
+        p99_ms=round(percentile(latencies, 99), 3),
+        mean_ms=round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        throughput_rps=round(requests / elapsed, 2) if elapsed else 0.0,
+        queries_per_request=round((counter.count - queries_before) / requests, 2),
+    )
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_benchmark(
+    db_url: str,
+    spec: DatasetSpec,
+    scenarios: Iterable[str] = tuple(SCENARIOS),
+    requests: int = 200,
+    concurrency: int = 10,
+) -> dict:
+    """
+    Пересоздаёт схему в db_url (БД должна быть выделенной под бенчмарк),
+    заполняет датасет и прогоняет сценарии. Возвращает JSON-совместимый отчёт.
+    """
+    engine = configure_engine(create_async_engine(db_url, future=True, echo=False))
+    session_maker = sessionmaker(
+        bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+    )
+
+    counter = QueryCounter(engine)
+    results: dict[str, dict] = {}
+    # сценарий login меряет bcrypt и выдачу токена, а не ограничитель:
+    # все запросы бенчмарка идут с одного адреса. Лимит одновременных
+    # запросов тоже снят: 503 исказили бы задержки сценариев
+    limiter_enabled = login_limiter.enabled
+    admission_enabled = admission_limiter.enabled
+    login_limiter.enabled = False
+    admission_limiter.enabled = False
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+
+        async with session_maker() as session:
+            dataset = await generate(session, spec)
+
+        async def _bench_db():
+            async with session_maker() as session:
+                yield session
+
+        app.dependency_overrides[get_db] = _bench_db
+        token = create_access_token({"sub": str(dataset.admin_id)})
+        ctx = ScenarioContext(
+            dataset=dataset, headers={"Authorization": f"Bearer {token}"}
+        )
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name in scenarios:
+                result = await run_scenario(
+                    client, ctx, name, requests, concurrency, counter
+                )
+                results[name] = asdict(result)
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+        login_limiter.enabled = limiter_enabled
+        admission_limiter.enabled = admission_enabled
+        await engine.dispose()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "db_url": make_url(db_url).render_as_string(hide_password=True),
+            "requests_per_scenario": requests,
+            "concurrency": concurrency,
+            "dataset": spec.as_dict(),
+        },
+        "scenarios": results,
+    }
+
+
+def save_report(report: dict, path: Path) -> None:
+    path.write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n")
@@ -0,0 +1,76 @@
+"""
+Сценарии нагрузки. Каждый сценарий — корутина `(client, ctx, i) -> Response`,
+где i — порядковый номер запроса (для детерминированного выбора данных).
+"""
+
+import random
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from benchmarks.dataset import BENCH_PASSWORD, Dataset
+from httpx import AsyncClient, Response
+
+
+@dataclass
+class ScenarioContext:
+    dataset: Dataset
+    headers: dict[str, str]
+    rng: random.Random = field(default_factory=lambda: random.Random(0))
+
+
+Scenario = Callable[[AsyncClient, ScenarioContext, int], Awaitable[Response]]
+
+
+async def login(client: AsyncClient, ctx: ScenarioContext, i: int) -> Response:
+    username = ctx.rng.choice(ctx.dataset.usernames)
+    return await client.post(
+        "/login/token", data={"username": username, "password": BENCH_PASSWORD}
+    )
+
+
+async def guarded_read(client: AsyncClient, ctx: ScenarioContext, i: int) -> Response:
+    """GET /users/{id} за require_permission("users:read")."""
+    user_id = ctx.rng.choice(ctx.dataset.user_ids)
+    return await client.get(f"/users/{user_id}", headers=ctx.headers)
+
+
+async def list_users_page(
+    client: AsyncClient, ctx: ScenarioContext, i: int
+) -> Response:
+    limit = 50
+    pages = max(len(ctx.dataset.user_ids) // limit, 1)
+    skip = (i % pages) * limit
+    return await client.get(
+        "/users/", params={"skip": skip, "limit": limit}, headers=ctx.headers
+    )
+
+
+async def list_roles_page(
+    client: AsyncClient, ctx: ScenarioContext, i: int
+) -> Response:
+    return await client.get("/roles/", params={"limit": 50}, headers=ctx.headers)
+
+
+async def bulk_write(client: AsyncClient, ctx: ScenarioContext, i: int) -> Response:
+    """Создание пользователя с 1–3 ролями (хэширование пароля включено)."""
+    k = min(ctx.rng.randint(1, 3), len(ctx.dataset.role_ids))
+    suffix = f"{ctx.rng.getrandbits(48):012x}"
+    return await client.post(
+        "/users/",
+        json={
+            "username": f"bench_new_{suffix}",
+            "email": f"bench_new_{suffix}@bench.example.com",
+            "password": BENCH_PASSWORD,
+            "role_ids": ctx.rng.sample(ctx.dataset.role_ids, k),
+        },
+        headers=ctx.headers,
+    )
+
+
+SCENARIOS: dict[str, Scenario] = {
+    "login": login,
+    "guarded_read": guarded_read,
+    "list_users_page": list_users_page,
+    "list_roles_page": list_roles_page,
+    "bulk_write": bulk_write,
+}
@@ -0,0 +1,164 @@
+# src/access_manager/admission.py
+"""
+Адаптивный лимит одновременных запросов и ранний сброс лишних.
+
+Без лимита перегрузка превращается в очередь: запросы копятся в uvicorn,
+держат соединения пула из get_db и истекают разом. Здесь число запросов
+в работе ограничено, а сверх лимита запрос сразу получает 503 с
+Retry-After — до роутинга, зависимостей и БД.
+
+Лимит подбирается по задержке (AIMD): запрос уложился в target_latency
+при загруженном лимите — лимит растёт на 1/limit (≈ +1 за «оборот»
+лимита); не уложился — лимит умножается на backoff, не чаще раза за
+target_latency, чтобы один всплеск медленных ответов не обрушил его до
+минимума.
+
+Классы приоритета делят лимит: критичные (вход, проверки прав, снимки
+для edge-узлов) допускаются до всего лимита, списки в админке — только
+до доли; при перегрузке первыми отбрасываются они. Долгоживущие потоки
+(/changes) и служебные /health, /metrics лимитом не считаются.
+"""
+
+import math
+import re
+import time
+from enum import IntEnum
+from typing import Optional
+
+from prometheus_client import Counter, Gauge
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+CONCURRENCY_LIMIT = Gauge(
+    "access_manager_concurrency_limit", "Current adaptive concurrency limit"
+)
+IN_FLIGHT = Gauge(
+    "access_manager_requests_in_flight", "Requests admitted and not yet finished"
+)
+SHED = Counter(
+    "access_manager_requests_shed_total",
+    "Requests rejected with 503 by the concurrency limiter",
+    ["priority"],
+)
+
+
+class Priority(IntEnum):
+    CRITICAL = 0
+    NORMAL = 1
+    SHEDDABLE = 2
+
+
+# (метод или None — любой, путь) -> класс; None — вне лимита.
+# Первое совпадение; всё остальное — NORMAL
+_RULES = (
+    (None, re.compile(r"/(health|metrics|changes)"), None),
+    ("POST", re.compile(r"/login/token"), Priority.CRITICAL),
+    ("GET", re.compile(r"/(users/me|sync|snapshot)"), Priority.CRITICAL),
+    ("GET", re.compile(r"/(users|roles|permissions)/"), Priority.SHEDDABLE),
+    (
+        "GET",
+        re.compile(r"/(roles|permissions)/\d+/(users|roles|grants)"),
+        Priority.SHEDDABLE,
+    ),
+)
+
+
+def classify(method: str, path: str) -> Optional[Priority]:
+    for rule_method, pattern, priority in _RULES:
+        if (rule_method is None or rule_method == method) and pattern.fullmatch(path):
+            return priority
+    return Priority.NORMAL
+
+
+class AdaptiveLimiter:
+    """
+    Состояние лимита одного воркера. Вызывается только из event loop,
+    поэтому без блокировок.
+    """
+
+    def __init__(
+        self,
+        initial: float = 20,
+        min_limit: float = 4,
+        max_limit: float = 200,
+        target_latency: float = 0.5,
+        backoff: float = 0.9,
+        # доля лимита, до которой допускается класс (по Priority)
+        shares: tuple[float, ...] = (1.0, 0.9, 0.6),
+        retry_after: int = 1,
+        enabled: bool = True,
+    ) -> None:
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.shares = shares
+        self.retry_after = retry_after
+        self.enabled = enabled
+        self.in_flight = 0
+        self._decreased_at = -math.inf
+        self.reset(initial)
+
+    def reset(self, limit: float) -> None:
+        self.limit = float(min(max(limit, self.min_limit), self.max_limit))
+        CONCURRENCY_LIMIT.set(self.limit)
+
+    def try_acquire(self, priority: Priority) -> bool:
+        # хотя бы один запрос любого класса проходит всегда
+        if self.in_flight >= max(1.0, self.limit * self.shares[priority]):
+            SHED.labels(priority.name.lower()).inc()
+            return False
+        self.in_flight += 1
+        IN_FLIGHT.inc()
+        return True
+
+    def release(self, latency: float, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        busy = self.in_flight >= self.limit / 2
+        self.in_flight -= 1
+        IN_FLIGHT.dec()
+        if latency > self.target_latency:
+            if now - self._decreased_at >= self.target_latency:
+                self._decreased_at = now
+                self.reset(self.limit * self.backoff)
+        elif busy:
+            # лимит растёт, только когда он и правда ограничивает
+            self.reset(self.limit + 1 / self.limit)
+
+
+class AdmissionMiddleware:
+    """
+    ASGI-middleware: 503 сверх лимита до остального стека. Время запроса —
+    до конца отправки ответа.
+    """
+
+    def __init__(self, app: ASGIApp, limiter: AdaptiveLimiter) -> None:
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        limiter = self.limiter
+        if scope["type"] != "http" or not limiter.enabled:
+            await self.app(scope, receive, send)
+            return
+        priority = classify(scope["method"], scope["path"])
+        if priority is None:
+            await self.app(scope, receive, send)
+            return
+        if not limiter.try_acquire(priority):
+            response = JSONResponse(
+                {"detail": "Service overloaded, retry later"},
+                status_code=503,
+                headers={"Retry-After": str(limiter.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.monotonic() - start)
+
+
+# Настраивается в create_app из настроек
+limiter = AdaptiveLimiter()
@@ -0,0 +1,562 @@
+# src/access_manager/changes.py
+"""
+Лента изменений RBAC для синхронизации кэшей внешних сервисов.
+
+crud пишет событие в change_log в той же транзакции, что и саму запись
+(на Postgres — CTE того же запроса, как счётчики), так что событие видно
+ровно тогда, когда видно изменение. seq — глобальный возрастающий номер;
+у создания и изменения он совпадает с version записанной строки (см.
+models.VERSION_SEQUENCE), удаления остаются в журнале как tombstone.
+
+ChangeFeed — один на процесс: фоновая задача читает журнал одним запросом
+на всех подписчиков (по таймеру и сразу после коммита в этом процессе),
+держит последние события в кольцевом буфере и раскладывает их по очередям
+подписчиков. Возобновление (Last-Event-ID) обслуживается из буфера, а если
+он уже не покрывает пропуск, — из журнала по индексу (tenant_id, seq).
+Журнал старше retention удаляется; возобновиться с удалённого места нельзя —
+подписчик получает ResyncRequired и перечитывает состояние целиком.
+
+Номера раздаются до коммита, поэтому транзакция с меньшим seq может
+закоммититься позже большего. Лента не ждёт пропущенные номера: они
+перечитываются каждым опросом, пока их транзакции не завершатся
+(finished_seq), и опоздавшее событие рассылается, когда появится, — не по
+порядку seq. id события SSE поэтому — точка возобновления, а не seq: всё с
+номером не больше неё уже разослано (или не появится никогда).
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import AsyncIterator, Callable, Collection, Optional
+
+from sqlalchemy import (
+    DateTime,
+    column,
+    delete,
+    event,
+    func,
+    insert,
+    literal,
+    or_,
+    select,
+    table,
+    text,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+
+from src.access_manager.models import (
+    VERSION_SEQUENCE,
+    ChangeLogEntry,
+    Permission,
+    Role,
+    ScopedGrant,
+    User,
+)
+
+logger = logging.getLogger("access_manager.changes")
+
+CREATE = "create"
+UPDATE = "update"
+DELETE = "delete"
+
+# модель -> тип сущности в событиях
+ENTITY_TYPES = {
+    User: "user",
+    Role: "role",
+    Permission: "permission",
+    ScopedGrant: "grant",
+}
+
+# метка в session.info: в транзакции есть события — после коммита будим ленту
+_PENDING = "changes_pending"
+
+
+# SQLite (тесты): последовательностей нет, следующий номер — отметка
+# AUTOINCREMENT журнала; записи в SQLite и так идут по одной
+_sqlite_sequence = table("sqlite_sequence", column("name"), column("seq"))
+
+
+def operation(stmt) -> str:
+    if stmt.is_insert:
+        return CREATE
+    if stmt.is_update:
+        return UPDATE
+    return DELETE
+
+
+def next_version(db: AsyncSession):
+    """Выражение следующей версии — для INSERT/UPDATE записываемой строки."""
+    if db.get_bind().dialect.name == "postgresql":
+        return VERSION_SEQUENCE.next_value()
+    return (
+        select(func.coalesce(func.max(_sqlite_sequence.c.seq), 0) + 1)
+        .where(_sqlite_sequence.c.name == ChangeLogEntry.__tablename__)
+        .scalar_subquery()
+    )
+
+
+async def record(db: AsyncSession, obj, op: str) -> None:
+    """
+    Пишет событие об obj в текущей транзакции; коммитит вызывающий. seq
+    события о создании/изменении — версия, уже записанная в obj.
+    """
+    values = {}
+    if op != DELETE:
+        values["seq"] = obj.version
+    await db.execute(
+        insert(ChangeLogEntry).values(
+            tenant_id=obj.tenant_id,
+            entity_type=ENTITY_TYPES[type(obj)],
+            entity_id=obj.id,
+            op=op,
+            **values,
+        )
+    )
+    db.info[_PENDING] = True
+
+
+def record_from(db: AsyncSession, written, model, op: str):
+    """
+    То же, что record, но INSERT ... SELECT по строкам RETURNING-CTE
+    `written` (Postgres): crud подключает его в тот же запрос, что и запись.
+    """
+    db.info[_PENDING] = True
+    names = ["tenant_id", "entity_type", "entity_id", "op"]
+    columns = [
+        written.c.tenant_id,
+        literal(ENTITY_TYPES[model]),
+        written.c.id,
+        literal(op),
+    ]
+    if op != DELETE:
+        names.append("seq")
+        columns.append(written.c.version)
+    return pg_insert(ChangeLogEntry).from_select(names, select(*columns))
+
+
+async def settled_version(db: AsyncSession, settle: float) -> int:
+    """
+    Последняя версия, старше которой не появится новых событий: номера
+    раздаются до коммита, и транзакция с меньшим номером может
+    закоммититься позже большего. Не дальше finished_seq — номера ещё
+    идущих транзакций — и seq последнего события старше settle секунд
+    (запас сверху).
+    """
+    upto = await finished_seq(db)
+    if settle > 0:
+        if _dialect(db) == "postgresql":
+            cutoff = func.now() - timedelta(seconds=settle)
+        else:
+            cutoff = func.datetime("now", f"-{settle} seconds")
+        aged = await db.scalar(
+            select(ChangeLogEntry.seq)
+            .where(ChangeLogEntry.seq <= upto, ChangeLogEntry.created_at < cutoff)
+            .order_by(ChangeLogEntry.seq.desc())
+            .limit(1)
+        )
+        upto = aged or 0
+    return upto
+
+
+def _dialect(db) -> str:
+    if isinstance(db, AsyncConnection):
+        return db.dialect.name
+    return db.get_bind().dialect.name
+
+
+# транзакции, которые могут держать ещё не закоммиченный номер: с выданным
+# xid (уже писали) или посреди оператора (nextval выдан, строка ещё нет)
+_in_flight = text(
+    """
+    SELECT min(xact_start) FROM pg_stat_activity
+    WHERE datname = current_database()
+      AND pid <> pg_backend_pid()
+      AND (backend_xid IS NOT NULL OR state = 'active')
+    """
+).columns(column("xact_start", DateTime(timezone=True)))
+
+
+async def finished_seq(db) -> int:
+    """
+    Номер, все транзакции с номерами не больше которого завершились:
+    пропуск до него — откат (или очистка журнала), а не поздний коммит.
+
+    На Postgres created_at события — время оператора (clock_timestamp),
+    не раньше выдачи его seq. Транзакция, ещё держащая номер, началась не
+    раньше старейшей незавершённой; значит, все номера до последнего
+    события, записанного раньше её начала, выданы и уже закоммичены или
+    откачены. На SQLite записи идут по одной — годится конец журнала.
+    """
+    # шаг назад по первичному ключу от конца журнала
+    stmt = select(ChangeLogEntry.seq).order_by(ChangeLogEntry.seq.desc()).limit(1)
+    if _dialect(db) == "postgresql":
+        oldest = _in_flight.scalar_subquery()
+        stmt = stmt.where(or_(oldest.is_(None), ChangeLogEntry.created_at < oldest))
+    return await db.scalar(stmt) or 0
+
+
+async def oldest_retained(db: AsyncSession) -> Optional[int]:
+    """seq самого старого события в журнале; None — журнал пуст."""
+    return await db.scalar(select(func.min(ChangeLogEntry.seq)))
+
+
+@dataclass(frozen=True, slots=True)
+class Change:
+    seq: int
+    tenant_id: int
+    entity_type: str
+    entity_id: int
+    op: str
+    # событие в формате SSE — кодируется один раз на всех подписчиков
+    sse: str
+
+    @classmethod
+    def from_row(cls, row, resume: Optional[int] = None) -> "Change":
+        """resume — id события SSE (см. ChangeFeed.watermark); None — seq."""
+        data = json.dumps(
+            {
+                "seq": row.seq,
+                "type": row.entity_type,
+                "id": row.entity_id,
+                "op": row.op,
+            },
+            separators=(",", ":"),
+        )
+        return cls(
+            row.seq,
+            row.tenant_id,
+            row.entity_type,
+            row.entity_id,
+            row.op,
+            f"id: {row.seq if resume is None else resume}\n"
+            f"event: change\ndata: {data}\n\n",
+        )
+
+
+class ResyncRequired(Exception):
+    """Пропущенные события уже удалены из журнала — нужна полная пересинхронизация."""
+
+
+class _Subscription:
+    __slots__ = ("tenant_id", "types", "queue")
+
+    def __init__(self, tenant_id: int, types: frozenset, queue_size: int) -> None:
+        self.tenant_id = tenant_id
+        self.types = types
+        self.queue: asyncio.Queue[Optional[Change]] = asyncio.Queue(queue_size)
+
+    def accepts(self, change: Change) -> bool:
+        return change.tenant_id == self.tenant_id and change.entity_type in self.types
+
+    def offer(self, change: Change) -> None:
+        if not self.accepts(change):
+            return
+        try:
+            self.queue.put_nowait(change)
+        except asyncio.QueueFull:
+            # медленный подписчик не тормозит остальных: поток закрывается,
+            # клиент переподключается с Last-Event-ID и догружает из журнала
+            self.close()
+
+    def close(self) -> None:
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+_COLUMNS = (
+    ChangeLogEntry.seq,
+    ChangeLogEntry.tenant_id,
+    ChangeLogEntry.entity_type,
+    ChangeLogEntry.entity_id,
+    ChangeLogEntry.op,
+)
+
+
+class ChangeFeed:
+    """
+    Раздача событий журнала подписчикам. poll_interval — как часто читать
+    журнал (изменения других процессов). Пропущенный номер ждёт своего
+    события в pending, пока его транзакция не завершится (finished_seq), но
+    не дольше retention — столько событие прожило бы в журнале.
+    """
+
+    def __init__(
+        self,
+        poll_interval: float = 0.5,
+        buffer_size: int = 10_000,
+        queue_size: int = 1_000,
+        retention: float = 24 * 3600,
+        batch_size: int = 1_000,
+    ) -> None:
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.retention = retention
+        self.batch_size = batch_size
+        self._buffer: deque[Change] = deque(maxlen=buffer_size)
+        # наибольший seq, вытесненный из буфера (или разосланный до старта):
+        # буфер покрывает возобновление только после него
+        self._evicted = 0
+        self._subscribers: set[_Subscription] = set()
+        # внутренние потребители (кэши процесса): все события всех арендаторов
+        self._listeners: list[Callable[[Change], None]] = []
+        self._engine: Optional[AsyncEngine] = None
+        self._task: Optional[asyncio.Task] = None
+        self._start_lock = asyncio.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._cursor = 0
+        # пропущенные номера ниже курсора -> monotonic, когда пропуск замечен
+        self._pending: dict[int, float] = {}
+        # (monotonic, seq): до какого seq журнал был прочитан в момент времени;
+        # по ним очистка удаляет диапазон seq, не завися от часов БД
+        self._checkpoints: deque[tuple[float, int]] = deque()
+
+    @property
+    def cursor(self) -> int:
+        """Наибольший разосланный seq."""
+        return self._cursor
+
+    @property
+    def watermark(self) -> int:
+        """seq, до которого включительно всё уже разослано или не появится."""
+        if self._pending:
+            return min(self._pending) - 1
+        return self._cursor
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def resize(self, buffer_size: int) -> None:
+        while len(self._buffer) > buffer_size:
+            self._evicted = max(self._evicted, self._buffer.popleft().seq)
+        self._buffer = deque(self._buffer, maxlen=buffer_size)
+
+    async def start(self, engine: AsyncEngine) -> None:
+        """Запускает чтение журнала с текущего конца; повторный вызов — no-op."""
+        async with self._start_lock:
+            if self.running:
+                return
+            self._engine = engine
+            self._wakeup = asyncio.Event()
+            async with engine.connect() as conn:
+                # номера до конца журнала, чьи транзакции ещё идут, — в pending
+                settled = await finished_seq(conn)
+                self._cursor = await conn.scalar(
+                    select(func.coalesce(func.max(ChangeLogEntry.seq), 0))
+                )
+                present = set(
+                    (
+                        await conn.scalars(
+                            select(ChangeLogEntry.seq).where(
+                                ChangeLogEntry.seq > settled
+                            )
+                        )
+                    ).all()
+                )
+            now = time.monotonic()
+            self._pending = {
+                seq: now
+                for seq in range(settled + 1, self._cursor)
+                if seq not in present
+            }
+            self._buffer.clear()
+            self._evicted = self._cursor
+            self._checkpoints.clear()
+            self._task = asyncio.create_task(self._run(), name="change-feed")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for subscription in self._subscribers:
+            subscription.close()
+
+    def add_listener(self, listener: Callable[[Change], None]) -> None:
+        """Вызывается синхронно на каждое событие; повторная регистрация — no-op."""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[Change], None]) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.poll()
+                await self._prune()
+            except Exception:
+                logger.exception("change feed poll failed")
+
+    async def poll(self) -> int:
+        """
+        Читает новые события журнала и опоздавшие пропущенные и раздаёт их;
+        возвращает их число.
+        """
+        async with self._engine.connect() as conn:
+            # граница — до чтения: пропуск ниже неё уже не закоммитится
+            settled = await finished_seq(conn) if self._pending else 0
+            late = []
+            if self._pending:
+                late = (
+                    await conn.execute(
+                        select(*_COLUMNS)
+                        .where(ChangeLogEntry.seq.in_(sorted(self._pending)))
+                        .order_by(ChangeLogEntry.seq)
+                    )
+                ).all()
+            rows = (
+                await conn.execute(
+                    select(*_COLUMNS)
+                    .where(ChangeLogEntry.seq > self._cursor)
+                    .order_by(ChangeLogEntry.seq)
+                    .limit(self.batch_size)
+                )
+            ).all()
+        now = time.monotonic()
+        for row in late:
+            del self._pending[row.seq]
+        for seq, seen in list(self._pending.items()):
+            if seq <= settled or now - seen >= self.retention:
+                del self._pending[seq]
+        for row in late:
+            self._publish(row)
+        for row in rows:
+            for seq in range(self._cursor + 1, row.seq):
+                self._pending[seq] = now
+            self._cursor = row.seq
+            self._publish(row)
+        return len(late) + len(rows)
+
+    def _publish(self, row) -> None:
+        # всё до watermark разослано раньше этого события или вместе с ним
+        change = Change.from_row(row, self.watermark)
+        if len(self._buffer) == self._buffer.maxlen:
+            self._evicted = max(self._evicted, self._buffer[0].seq)
+        self._buffer.append(change)
+        for subscription in self._subscribers:
+            subscription.offer(change)
+        for listener in self._listeners:
+            listener(change)
+
+    async def _prune(self) -> None:
+        now = time.monotonic()
+        if not self._checkpoints or now - self._checkpoints[-1][0] >= 60:
+            self._checkpoints.append((now, self.watermark))
+        boundary = None
+        while self._checkpoints and now - self._checkpoints[0][0] >= self.retention:
+            boundary = self._checkpoints.popleft()[1]
+        if boundary:
+            async with self._engine.begin() as conn:
+                # последнее событие до границы остаётся: по нему /sync
+                # отличает «ничего не менялось» от «журнал уже очищен»
+                await conn.execute(
+                    delete(ChangeLogEntry).where(ChangeLogEntry.seq < boundary)
+                )
+
+    async def _backlog(
+        self, subscription: _Subscription, after: int, upto: int, resume: int
+    ) -> AsyncIterator[Change]:
+        # буфер снимается синхронно — до первого await, пока лента не сдвинулась
+        if self._evicted <= after:
+            for change in list(self._buffer):
+                if after < change.seq <= upto and subscription.accepts(change):
+                    yield change
+            return
+
+        async with self._engine.connect() as conn:
+            oldest = await conn.scalar(select(func.min(ChangeLogEntry.seq)))
+            if oldest is None or oldest > after + 1:
+                raise ResyncRequired(after)
+            while True:
+                rows = (
+                    await conn.execute(
+                        select(*_COLUMNS)
+                        .where(
+                            ChangeLogEntry.tenant_id == subscription.tenant_id,
+                            ChangeLogEntry.seq > after,
+                            ChangeLogEntry.seq <= upto,
+                            ChangeLogEntry.entity_type.in_(subscription.types),
+                        )
+                        .order_by(ChangeLogEntry.seq)
+                        .limit(self.batch_size)
+                    )
+                ).all()
+                for row in rows:
+                    yield Change.from_row(row, min(row.seq, resume))
+                if len(rows) < self.batch_size:
+                    return
+                after = rows[-1].seq
+
+    async def subscribe(
+        self,
+        tenant_id: int,
+        types: Collection[str],
+        last_event_id: Optional[int] = None,
+        heartbeat: Optional[float] = None,
+    ) -> AsyncIterator[Optional[Change]]:
+        """
+        События арендатора по типам types. С last_event_id (id события SSE)
+        — сначала пропущенные после него, без — только новые; после
+        переподключения события могут повториться. Раз в heartbeat секунд
+        простоя отдаёт None (keep-alive). Кончается, если подписчик отстал
+        больше чем на queue_size событий или лента остановлена.
+        """
+        subscription = _Subscription(tenant_id, frozenset(types), self.queue_size)
+        # регистрация и снимок курсора — без await между ними: всё, что
+        # разослано после снимка, придёт через очередь
+        self._subscribers.add(subscription)
+        upto, resume = self._cursor, self.watermark
+        # опоздавшие номера ниже снимка могут прийти и из журнала, и очередью
+        late = set(self._pending)
+        after = upto if last_event_id is None else last_event_id
+        try:
+            if after < upto:
+                async for change in self._backlog(subscription, after, upto, resume):
+                    late.discard(change.seq)
+                    yield change
+            while True:
+                try:
+                    change = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if change is None:
+                    return
+                if change.seq > upto or change.seq in late:
+                    late.discard(change.seq)
+                    yield change
+        finally:
+            self._subscribers.discard(subscription)
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+
+feed = ChangeFeed()
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(session: Session) -> None:
+    if session.info.pop(_PENDING, False):
+        feed.wake()
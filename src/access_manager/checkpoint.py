@@ -0,0 +1,273 @@
+# src/access_manager/checkpoint.py
+"""
+Файл-checkpoint кэша принципалов: словарь имён разрешений, роли и горячие
+принципалы — чтобы перезапущенный воркер отвечал сразу, а не грел кэш
+запросами к БД (см. principal_cache.py).
+
+Формат рассчитан на mmap: тело без сжатия, колонки фиксированной ширины
+лежат подряд с выравниванием на 8 байт и читаются на месте — через
+memoryview, без копирования и разбора при открытии. Воркеры пода, открывшие
+один файл, делят одну копию страниц в page cache. Файл подменяется целиком
+(os.replace), поэтому открытый map видит старую версию, пока его не закроют.
+
+Формат (little-endian): заголовок HEADER, за ним колонки:
+
+    name_offsets   u32[N+1]   имя i — names[o[i]:o[i+1]]
+    names          UTF-8      словарь имён разрешений, без разделителей
+    role_ids       u32[R]     по возрастанию
+    role_offsets   u32[R+1]   CSR: разрешения роли — номера в словаре имён
+    role_names     u32[...]
+    user_keys      u64[U]     (tenant_id << 32) | user_id, по возрастанию
+    user_flags     u8[U]      snapshot.ACTIVE | snapshot.SUPERUSER
+    user_offsets   u32[U+1]   CSR: роли пользователя — позиции в role_ids
+    user_roles     u32[...]
+
+version — версия RBAC (seq журнала изменений), на которую принципалы
+актуальны; valid_until — unix-время, после которого файлу верить нельзя
+(ближайший срок назначения роли или предельный возраст).
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Iterator, Optional
+
+from src.access_manager.principal import Principal
+from src.access_manager.snapshot import ACTIVE, SUPERUSER
+
+MAGIC = b"AMPC"
+FORMAT_VERSION = 1
+
+# magic, формат, версия RBAC, создан и годен до (unix-время), N, R, U
+HEADER = struct.Struct("<4sHxxQddIII4x")
+
+_ALIGN = 8
+_U32 = "I" if array("I").itemsize == 4 else "L"
+_U64 = "Q"
+_LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+class CheckpointError(ValueError):
+    """Файл — не checkpoint, другой версии формата или обрезан."""
+
+
+def _key(tenant_id: int, user_id: int) -> int:
+    return (tenant_id << 32) | user_id
+
+
+def _pad(size: int) -> int:
+    return -size % _ALIGN
+
+
+def _column(typecode: str, values: Iterable[int] = ()) -> bytes:
+    column = array(typecode, values)
+    if not _LITTLE_ENDIAN:
+        column.byteswap()
+    data = column.tobytes()
+    return data + bytes(_pad(len(data)))
+
+
+def encode(
+    version: int,
+    created: float,
+    valid_until: float,
+    principals: Iterable[Principal],
+) -> bytes:
+    """Результат детерминирован: одни принципалы — одни байты."""
+    users = sorted(principals, key=lambda p: _key(p.tenant_id, p.id))
+    roles: dict[int, frozenset] = {}
+    for principal in users:
+        for role_id, names in principal.roles:
+            roles.setdefault(role_id, names)
+    names = sorted(frozenset().union(*roles.values()))
+    name_index = {name: i for i, name in enumerate(names)}
+    encoded_names = [name.encode() for name in names]
+    name_offsets = [0]
+    for name in encoded_names:
+        name_offsets.append(name_offsets[-1] + len(name))
+    blob = b"".join(encoded_names)
+
+    role_ids = sorted(roles)
+    role_offsets, role_names = [0], []
+    for role_id in role_ids:
+        role_names.extend(sorted(name_index[name] for name in roles[role_id]))
+        role_offsets.append(len(role_names))
+
+    role_index = {role_id: i for i, role_id in enumerate(role_ids)}
+    user_offsets, user_roles = [0], []
+    for principal in users:
+        user_roles.extend(sorted(role_index[role_id] for role_id, _ in principal.roles))
+        user_offsets.append(len(user_roles))
+    flags = bytes(
+        (ACTIVE if p.is_active else 0) | (SUPERUSER if p.is_superuser else 0)
+        for p in users
+    )
+
+    header = HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        version,
+        created,
+        valid_until,
+        len(names),
+        len(role_ids),
+        len(users),
+    )
+    return b"".join(
+        (
+            header,
+            _column(_U32, name_offsets),
+            blob + bytes(_pad(len(blob))),
+            _column(_U32, role_ids),
+            _column(_U32, role_offsets),
+            _column(_U32, role_names),
+            _column(_U64, (_key(p.tenant_id, p.id) for p in users)),
+            flags + bytes(_pad(len(flags))),
+            _column(_U32, user_offsets),
+            _column(_U32, user_roles),
+        )
+    )
+
+
+class _Cursor:
+    __slots__ = ("_view", "_pos", "views")
+
+    def __init__(self, view: memoryview, pos: int) -> None:
+        self._view = view
+        self._pos = pos
+        # выданные срезы: держат буфер, пока их не отпустят
+        self.views: list[memoryview] = []
+
+    def raw(self, size: int) -> memoryview:
+        end = self._pos + size
+        if end > len(self._view):
+            raise CheckpointError("truncated checkpoint")
+        chunk = self._view[self._pos : end]
+        self.views.append(chunk)
+        self._pos = end + _pad(size)
+        return chunk
+
+    def column(self, typecode: str, count: int):
+        size = array(typecode).itemsize
+        chunk = self.raw(count * size)
+        if _LITTLE_ENDIAN:
+            # на месте: страницы файла, а не копия
+            column = chunk.cast(typecode)
+            self.views.append(column)
+            return column
+        column = array(typecode, chunk.tobytes())
+        column.byteswap()
+        return column
+
+
+class Checkpoint:
+    """
+    Checkpoint поверх байтов или mmap. Принципалы собираются при обращении;
+    разрешения роли собираются один раз на роль.
+    """
+
+    def __init__(self, buffer) -> None:
+        self._buffer = buffer
+        self._view = memoryview(buffer)
+        self._views: list[memoryview] = []
+        try:
+            self._parse()
+        except Exception:
+            self._release()
+            raise
+
+    def _parse(self) -> None:
+        if len(self._view) < HEADER.size:
+            raise CheckpointError("truncated checkpoint header")
+        (
+            magic,
+            fmt,
+            self.version,
+            self.created,
+            self.valid_until,
+            n_names,
+            n_roles,
+            n_users,
+        ) = HEADER.unpack_from(self._view)
+        if magic != MAGIC:
+            raise CheckpointError("not an authorization checkpoint")
+        if fmt != FORMAT_VERSION:
+            raise CheckpointError(f"unsupported checkpoint format {fmt}")
+
+        cursor = _Cursor(self._view, HEADER.size)
+        self._views = cursor.views
+        name_offsets = cursor.column(_U32, n_names + 1)
+        blob = cursor.raw(name_offsets[-1])
+        self._names = [
+            bytes(blob[name_offsets[i] : name_offsets[i + 1]]).decode()
+            for i in range(n_names)
+        ]
+        self._role_ids = cursor.column(_U32, n_roles)
+        self._role_offsets = cursor.column(_U32, n_roles + 1)
+        self._role_names = cursor.column(_U32, self._role_offsets[-1])
+        self._user_keys = cursor.column(_U64, n_users)
+        self._user_flags = cursor.raw(n_users)
+        self._user_offsets = cursor.column(_U32, n_users + 1)
+        self._user_roles = cursor.column(_U32, self._user_offsets[-1])
+        self._roles: dict[int, tuple[int, frozenset]] = {}
+
+    @classmethod
+    def open(cls, path: str) -> "Checkpoint":
+        with open(path, "rb") as f:
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # пустой файл не отображается
+                raise CheckpointError("empty checkpoint") from None
+        try:
+            return cls(mapped)
+        except Exception:
+            mapped.close()
+            raise
+
+    def _role(self, position: int) -> tuple[int, frozenset]:
+        role = self._roles.get(position)
+        if role is None:
+            start, end = self._role_offsets[position], self._role_offsets[position + 1]
+            names = frozenset(self._names[i] for i in self._role_names[start:end])
+            role = self._roles[position] = (self._role_ids[position], names)
+        return role
+
+    def _principal(self, i: int) -> Principal:
+        key = self._user_keys[i]
+        flags = self._user_flags[i]
+        start, end = self._user_offsets[i], self._user_offsets[i + 1]
+        return Principal(
+            key & 0xFFFFFFFF,
+            key >> 32,
+            bool(flags & ACTIVE),
+            bool(flags & SUPERUSER),
+            [self._role(position) for position in self._user_roles[start:end]],
+        )
+
+    def principal(self, tenant_id: int, user_id: int) -> Optional[Principal]:
+        key = _key(tenant_id, user_id)
+        i = bisect_left(self._user_keys, key)
+        if i < len(self._user_keys) and self._user_keys[i] == key:
+            return self._principal(i)
+        return None
+
+    def __iter__(self) -> Iterator[Principal]:
+        for i in range(len(self._user_keys)):
+            yield self._principal(i)
+
+    def __len__(self) -> int:
+        return len(self._user_keys)
+
+    def close(self) -> None:
+        self._release()
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+    def _release(self) -> None:
+        # экспортированные срезы держат буфер: сначала отпускаем их
+        for view in reversed(self._views):
+            view.release()
+        self._view.release()
@@ -0,0 +1,85 @@
+# src/access_manager/coalesce.py
+"""
+Склейка одинаковых одновременных загрузок (single-flight).
+
+Клиент, отправивший 50 параллельных запросов с одним токеном, вызывает 50
+одинаковых декодирований JWT и 50 одинаковых запросов пользователя с
+ролями. Здесь первый вызов по ключу (ведущий) выполняет загрузку, а
+вызовы с тем же ключом, пришедшие до её окончания, ждут его результат —
+или его исключение. Кэша нет: после завершения следующий вызов снова идёт
+в БД, так что свежесть данных та же, что и без склейки.
+
+Результат общий для всех ожидавших. Принципал неизменяем (principal.py), а
+GET по id отдаёт ORM-объект из сессии ведущего — поэтому склейка
+применяется только там, где результат читается и не меняется.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+from prometheus_client import Counter
+
+T = TypeVar("T")
+
+LOADS = Counter(
+    "access_manager_singleflight_loads_total",
+    "Lookups executed by a single-flight leader",
+    ["loader"],
+)
+COALESCED = Counter(
+    "access_manager_singleflight_coalesced_total",
+    "Lookups served by waiting on an identical in-flight lookup",
+    ["loader"],
+)
+
+
+def _retrieve(future: asyncio.Future) -> None:
+    # исключение без ожидавших не должно попадать в лог «never retrieved»
+    if not future.cancelled():
+        future.exception()
+
+
+class SingleFlight:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[T]], *args) -> T:
+        while True:
+            future = self._calls.get(key)
+            if future is None:
+                break
+            try:
+                result = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # отменили ведущего, а не нас — загружаем сами
+                if future.cancelled():
+                    continue
+                raise
+            COALESCED.labels(self.name).inc()
+            return result
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_retrieve)
+        self._calls[key] = future
+        LOADS.labels(self.name).inc()
+        try:
+            result = await fn(*args)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+
+# принципал по токену: декодирование JWT и пользователь с ролями
+principals = SingleFlight("principal")
+users = SingleFlight("user")
+roles = SingleFlight("role")
+permissions = SingleFlight("permission")
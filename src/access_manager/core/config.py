@@ -1,4 +1,5 @@
-from typing import Optional
+from functools import lru_cache
+from typing import Literal, Optional
 
 from pydantic import PostgresDsn
 from pydantic_settings import (  # Используйте pydantic_settings для Pydantic v2+
@@ -13,9 +14,126 @@ class Settings(BaseSettings):
     access_token_expire_minutes: int = 30
     test_postgres_dsn: Optional[PostgresDsn] = None
 
+    # Наблюдатель SQL: порог медленного запроса и повторов одного отпечатка
+    # за HTTP-запрос, после которого пишется предупреждение о N+1
+    slow_query_threshold_ms: float = 200.0
+    n_plus_one_threshold: int = 5
+
+    # Семплирующий профайлер медленных запросов (выключен по умолчанию)
+    profiler_enabled: bool = False
+    profiler_threshold_ms: float = 500.0
+    profiler_interval_ms: float = 5.0
+    profiler_sample_rate: float = 1.0
+    profiler_output_dir: str = "profiles"
+
+    # Логи: очередь до фонового потока записи (переполнение — отброс), SQL-лог
+    # SQLAlchemy и правила по префиксам логгеров для записей ниже WARNING —
+    # доля запросов в выборке и записей в секунду
+    log_level: str = "INFO"
+    log_format: Literal["json", "text"] = "json"
+    log_queue_size: int = 10_000
+    log_sql: bool = False
+    log_sample: dict[str, float] = {"sqlalchemy.engine": 0.01}
+    log_rate_limits: dict[str, float] = {"sqlalchemy.engine": 200.0}
+
+    # Итоги для X-Total-Count и /metrics: exact — поддерживаемые счётчики,
+    # approximate — статистика pg_class.reltuples (только Postgres)
+    count_mode: Literal["exact", "approximate"] = "exact"
+
+    # Кэш решений по грантам на объекты: сколько живёт запись пользователя
+    # (столько максимум другой воркер видит отозванный грант) и сколько их
+    authz_decision_ttl_seconds: float = 30.0
+    authz_decision_cache_users: int = 10_000
+
+    # Лента изменений /changes: как часто читать журнал (изменения других
+    # воркеров), сколько событий держать в памяти для возобновления и
+    # сколько часов хранить журнал в БД
+    change_feed_poll_interval_seconds: float = 0.5
+    change_feed_buffer_size: int = 10_000
+    change_log_retention_hours: float = 24.0
+
+    # Дельта-синхронизация /sync: версия ответа отстаёт от конца журнала на
+    # столько секунд, чтобы транзакции с меньшими номерами успели закоммититься
+    sync_settle_seconds: float = 1.0
+
+    # Снимок графа /snapshot: как часто догружать изменения и перекодировать
+    snapshot_refresh_interval_seconds: float = 1.0
+
+    # Ограничение попыток входа (до bcrypt): корзины на имя в арендаторе и
+    # на IP; memory — у каждого воркера свои, database — общие в БД
+    login_rate_limit_enabled: bool = True
+    login_rate_limit_backend: Literal["memory", "database"] = "memory"
+    login_attempts_per_user: int = 10
+    login_user_window_seconds: float = 300.0
+    login_attempts_per_ip: int = 100
+    login_ip_window_seconds: float = 60.0
+
+    # Адаптивный лимит одновременных запросов воркера: сверх лимита — 503.
+    # Лимит растёт, пока ответы укладываются в target, и сокращается, когда нет
+    concurrency_limit_enabled: bool = True
+    concurrency_initial_limit: int = 20
+    concurrency_min_limit: int = 4
+    concurrency_max_limit: int = 200
+    concurrency_target_latency_ms: float = 500.0
+    concurrency_retry_after_seconds: int = 1
+
+    # Сроки назначений ролей: как часто перечитывать ближайшие сроки
+    # (назначенные другими воркерами) и сколько связей снимать за запрос
+    role_expiry_reload_interval_seconds: float = 60.0
+    role_expiry_batch_size: int = 500
+
+    # Шардирование пользователей: async-DSN шардов 1..N (шард 0 — postgres_dsn,
+    # на нём каталог ролей и разрешений) и точек на шард в кольце хэширования.
+    # Пустой список — все пользователи в основной БД
+    shard_dsns: list[str] = []
+    shard_vnodes: int = 64
+
+    # Кэш принципалов (при шардировании не включается) и его checkpoint для
+    # тёплого рестарта: путь к файлу (пустой — без файла), как часто писать
+    # и сколько файлу верить
+    principal_cache_enabled: bool = False
+    principal_cache_users: int = 10_000
+    principal_cache_ttl_seconds: float = 300.0
+    authz_checkpoint_path: str = ""
+    authz_checkpoint_interval_seconds: float = 60.0
+    authz_checkpoint_max_age_seconds: float = 3600.0
+
+    # Edge-реплика только для чтения (БД — локальная SQLite по
+    # replica_database_url, postgres_dsn не используется): откуда
+    # и под какой учётной записью тянуть /sync, как часто, сколько отставания
+    # терпеть до 503 (0 — без предела) и проксировать ли запись (иначе — 405).
+    # SECRET_KEY — тот же, что у основной установки
+    replica_enabled: bool = False
+    replica_primary_url: str = ""
+    replica_username: str = ""
+    replica_password: str = ""
+    replica_tenant_id: int = 1
+    replica_sync_interval_seconds: float = 5.0
+    replica_max_staleness_seconds: float = 300.0
+    replica_proxy_writes: bool = False
+    replica_database_url: str = "sqlite+aiosqlite:///./replica.sqlite"
+
+    # Пул соединений (для SQLite не применяется)
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+
+    # Прогрев в lifespan: пул, bcrypt/JWT, OpenAPI; кэш авторизации — опционально
+    warmup_enabled: bool = True
+    warmup_authz_cache: bool = False
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
 
 
-settings = Settings()
+@lru_cache
+def get_settings() -> Settings:
+    """Настройки читаются при первом обращении, а не при импорте модуля."""
+    return Settings()
+
+
+def __getattr__(name: str):
+    # `from ...config import settings` продолжает работать, но лениво
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,203 @@
+# src/access_manager/counters.py
+"""
+Счётчики сущностей для X-Total-Count и /metrics.
+
+Точный режим: строки entity_counts меняет crud в той же транзакции, что и
+сами сущности (upsert value = value + delta), так что чтение — один запрос
+по первичному ключу вместо COUNT(*) по всей таблице. Приблизительный режим
+(только Postgres) берёт итоги по таблицам из статистики планировщика
+pg_class.reltuples и не трогает счётчики; срезы (активные пользователи,
+суперпользователи) всегда читаются из entity_counts.
+
+Счётчики ведутся на арендатора: ключ строки — (tenant_id, имя). Итоги по
+всей установке (/metrics) — сумма по арендаторам; приблизительный режим
+применим только к ним, pg_class не знает об арендаторах.
+"""
+
+from collections import Counter
+from typing import Iterable, Optional
+
+from sqlalchemy import column, delete, func, literal, select, table, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.access_manager.models import EntityCount, Permission, Role, User
+
+USERS = "users"
+USERS_ACTIVE = "users:active"
+USERS_SUPERUSER = "users:superuser"
+ROLES = "roles"
+PERMISSIONS = "permissions"
+
+ALL = (USERS, USERS_ACTIVE, USERS_SUPERUSER, ROLES, PERMISSIONS)
+
+# счётчики сущности: имя -> булев столбец среза (None — вся таблица)
+BUCKETS = {
+    User: {USERS: None, USERS_ACTIVE: "is_active", USERS_SUPERUSER: "is_superuser"},
+    Role: {ROLES: None},
+    Permission: {PERMISSIONS: None},
+}
+
+# счётчики, которые в приблизительном режиме берутся из pg_class
+_TABLES = {USERS: "users", ROLES: "roles", PERMISSIONS: "permissions"}
+
+_pg_class = table("pg_class", column("relname"), column("reltuples"))
+
+# Переопределяется через configure(); по умолчанию — точные счётчики
+APPROXIMATE = False
+
+
+def configure(approximate: Optional[bool] = None) -> None:
+    global APPROXIMATE
+    if approximate is not None:
+        APPROXIMATE = approximate
+
+
+def deltas(obj, sign: int) -> dict[str, int]:
+    """Изменения счётчиков при появлении (+1) или удалении (-1) строки obj."""
+    return {
+        name: sign if flag is None or getattr(obj, flag) else 0
+        for name, flag in BUCKETS[type(obj)].items()
+    }
+
+
+def _insert(db: AsyncSession):
+    return pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+
+
+_KEY = [EntityCount.tenant_id, EntityCount.name]
+
+
+async def adjust(db: AsyncSession, tenant_id: int, deltas: dict[str, int]) -> None:
+    """
+    Прибавляет deltas к счётчикам арендатора в текущей транзакции; коммитит
+    вызывающий. Отсутствующая строка создаётся со значением delta.
+    """
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    # строки в порядке имён — параллельные транзакции берут блокировки
+    # в одном порядке и не ловят deadlock
+    stmt = _insert(db)(EntityCount).values(
+        [
+            {"tenant_id": tenant_id, "name": name, "value": delta}
+            for name, delta in sorted(deltas.items())
+        ]
+    )
+    await db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=_KEY,
+            set_={"value": EntityCount.value + stmt.excluded.value},
+        )
+    )
+
+
+def adjust_from(written, model, sign: int):
+    """
+    То же, что adjust, но одним INSERT ... SELECT по строкам RETURNING-CTE
+    `written` (Postgres): crud подключает его в тот же запрос, что и запись.
+    Нулевые изменения отсекаются HAVING — строку счётчика не блокируем зря.
+    """
+    rows = []
+    for name, flag in sorted(BUCKETS[model].items()):
+        count = func.count()
+        if flag is not None:
+            count = count.filter(written.c[flag].is_(True))
+        rows.append(
+            select(written.c.tenant_id, literal(name), count * sign)
+            .group_by(written.c.tenant_id)
+            .having(count > 0)
+        )
+    stmt = pg_insert(EntityCount).from_select(
+        ["tenant_id", "name", "value"], union_all(*rows)
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=_KEY,
+        set_={"value": EntityCount.value + stmt.excluded.value},
+    )
+
+
+async def rebuild(db: AsyncSession, tenant_id: Optional[int] = None) -> dict[str, int]:
+    """
+    Пересчитывает счётчики арендатора (None — всех) через COUNT(*) — после
+    массовой загрузки в обход crud или для сверки. Возвращает пересчитанные
+    итоги (для всех арендаторов — суммы). Коммитит вызывающий.
+    """
+    rows = []
+    for model, buckets in BUCKETS.items():
+        stmt = select(
+            model.tenant_id,
+            *(
+                (
+                    func.count()
+                    if flag is None
+                    else func.count().filter(getattr(model, flag).is_(True))
+                )
+                for flag in buckets.values()
+            ),
+        ).group_by(model.tenant_id)
+        if tenant_id is not None:
+            stmt = stmt.where(model.tenant_id == tenant_id)
+        for tenant, *counts in (await db.execute(stmt)).all():
+            rows += [
+                {"tenant_id": tenant, "name": name, "value": count}
+                for name, count in zip(buckets, counts)
+            ]
+
+    stmt = delete(EntityCount)
+    if tenant_id is not None:
+        stmt = stmt.where(EntityCount.tenant_id == tenant_id)
+    await db.execute(stmt)
+    if rows:
+        await db.execute(_insert(db)(EntityCount), rows)
+
+    totals = Counter(dict.fromkeys(ALL, 0))
+    for row in rows:
+        totals[row["name"]] += row["value"]
+    return dict(totals)
+
+
+async def _estimates(db: AsyncSession, names: list[str]) -> dict[str, int]:
+    tables = {_TABLES[name]: name for name in names}
+    result = await db.execute(
+        select(_pg_class.c.relname, _pg_class.c.reltuples).where(
+            _pg_class.c.relname.in_(list(tables))
+        )
+    )
+    # reltuples = -1, пока таблицу ни разу не анализировали
+    return {
+        tables[relname]: int(reltuples)
+        for relname, reltuples in result.all()
+        if reltuples >= 0
+    }
+
+
+async def read(
+    db: AsyncSession, tenant_id: Optional[int], names: Iterable[str] = ALL
+) -> dict[str, int]:
+    """
+    Текущие значения счётчиков арендатора — запрос по первичному ключу;
+    tenant_id=None — итоги по всей установке. Отсутствующие считаются нулём.
+    """
+    names = list(names)
+    counts: dict[str, int] = {}
+    if tenant_id is None and APPROXIMATE and db.get_bind().dialect.name == "postgresql":
+        approximate = [name for name in names if name in _TABLES]
+        if approximate:
+            counts.update(await _estimates(db, approximate))
+
+    exact = [name for name in names if name not in counts]
+    if exact:
+        if tenant_id is None:
+            stmt = select(EntityCount.name, func.sum(EntityCount.value)).group_by(
+                EntityCount.name
+            )
+        else:
+            stmt = select(EntityCount.name, EntityCount.value).where(
+                EntityCount.tenant_id == tenant_id
+            )
+        result = await db.execute(stmt.where(EntityCount.name.in_(exact)))
+        counts.update(dict.fromkeys(exact, 0))
+        counts.update((name, int(value)) for name, value in result.tuples().all())
+    return counts
@@ -1,260 +1,1375 @@
 # src/access_manager/crud.py
 
-from typing import List, Optional
+import heapq
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence
 
 from fastapi import HTTPException, status
-from sqlalchemy import select
+from sqlalchemy import (
+    DateTime,
+    and_,
+    case,
+    delete,
+    func,
+    insert,
+    literal,
+    or_,
+    select,
+    tuple_,
+    type_coerce,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import aliased, joinedload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
-from src.access_manager.security import get_password_hash
+from src.access_manager import changes, counters, security
 
-from .models import Permission, Role, User
+from .models import (
+    ChangeLogEntry,
+    Permission,
+    Role,
+    ScopedGrant,
+    User,
+    link_in_force,
+    role_permissions,
+    user_roles,
+)
+from .permissions import covering_grants
+from .principal import Principal
 from .schemas import (
+    MatchMode,
+    NameFilter,
     PermissionCreate,
     PermissionUpdate,
+    RoleAssignment,
     RoleCreate,
     RoleUpdate,
+    ScopedGrantCreate,
+    SyncGrant,
+    SyncPage,
+    SyncPermission,
+    SyncRole,
+    SyncUser,
+    Tombstone,
     UserCreate,
+    UserFilter,
     UserUpdate,
 )
 
+# ——— TENANCY ———
+#
+# Every function takes the tenant explicitly and every statement filters on
+# it; ids are global, so an id from another tenant behaves like a missing
+# one. Association rows are only written between rows of the same tenant.
+
+# ——— FILTERS ———
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _match(column, value: str, mode: MatchMode):
+    # build the pattern here instead of startswith()/contains(): the planner
+    # needs a literal prefix to pick the varchar_pattern_ops index
+    pattern = _escape_like(value.lower())
+    if mode is MatchMode.contains:
+        pattern = f"%{pattern}%"
+    else:
+        pattern = f"{pattern}%"
+    return func.lower(column).like(pattern, escape="\\")
+
+
+def _filter_users(stmt, filters: UserFilter):
+    if filters.username is not None:
+        stmt = stmt.where(_match(User.username, filters.username, filters.match))
+    if filters.email is not None:
+        stmt = stmt.where(_match(User.email, filters.email, filters.match))
+    if filters.is_active is not None:
+        stmt = stmt.where(User.is_active == filters.is_active)
+    if filters.is_superuser is not None:
+        stmt = stmt.where(User.is_superuser == filters.is_superuser)
+    if filters.role_id is not None:
+        stmt = stmt.join(user_roles, user_roles.c.user_id == User.id).where(
+            user_roles.c.role_id == filters.role_id, _in_force(_utcnow())
+        )
+    if filters.created_from is not None:
+        stmt = stmt.where(User.created_at >= filters.created_from)
+    if filters.created_to is not None:
+        stmt = stmt.where(User.created_at < filters.created_to)
+    return stmt
+
+
+def _filter_by_name(stmt, model, filters: NameFilter):
+    if filters.name is not None:
+        stmt = stmt.where(_match(model.name, filters.name, filters.match))
+    return stmt
+
+
+# ——— WRITE HELPERS ———
+#
+# Mutations are single INSERT/UPDATE/DELETE ... RETURNING statements, and
+# responses are built from the returned row. On Postgres the association
+# rows (user_roles / role_permissions), the entity counters and the change
+# log entry are written by data-modifying CTEs of the same statement; other
+# dialects (SQLite in tests) run those statements right after it in the
+# same transaction.
+
+# owner model -> (association table, owner column, target column, target model)
+_LINKS = {
+    User: (user_roles, "user_id", "role_id", Role),
+    Role: (role_permissions, "role_id", "permission_id", Permission),
+}
+
+_RETURNING_OPTIONS = {"populate_existing": True}
+
+
+def _is_postgres(db: AsyncSession) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def _insert(model, **values):
+    # Python-side scalar defaults (is_active=True, ...) are prefetched for one
+    # INSERT per statement only; with several INSERT CTEs the rest would get
+    # NULL, so they are spelled out
+    for column in model.__table__.c:
+        default = column.default
+        if column.key not in values and default is not None and default.is_scalar:
+            values[column.key] = default.arg
+    return insert(model).values(**values)
+
+
+def _link_ctes(written, model, link_ids: List[int], replace_links: bool) -> list:
+    table, owner_key, target_key, target = _LINKS[model]
+    owner_col, target_col = table.c[owner_key], table.c[target_key]
+    ctes = []
+    if replace_links:
+        ctes.append(
+            delete(table)
+            .where(owner_col.in_(select(written.c.id)), target_col.not_in(link_ids))
+            .cte("unlinked")
+        )
+    if link_ids:
+        ctes.append(
+            pg_insert(table)
+            .from_select(
+                [owner_key, target_key],
+                select(written.c.id, target.id)
+                .join(target, target.tenant_id == written.c.tenant_id)
+                .where(target.id.in_(link_ids)),
+            )
+            .on_conflict_do_nothing()
+            .cte("linked")
+        )
+    return ctes
+
+
+async def _write_links(
+    db: AsyncSession, obj, link_ids: List[int], replace_links: bool
+) -> None:
+    table, owner_key, target_key, target = _LINKS[type(obj)]
+    owner_col, target_col = table.c[owner_key], table.c[target_key]
+    if replace_links:
+        await db.execute(
+            delete(table).where(owner_col == obj.id, target_col.not_in(link_ids))
+        )
+    if link_ids:
+        await db.execute(
+            sqlite_insert(table)
+            .from_select(
+                [owner_key, target_key],
+                select(literal(obj.id), target.id).where(
+                    target.id.in_(link_ids), target.tenant_id == obj.tenant_id
+                ),
+            )
+            .on_conflict_do_nothing()
+        )
+
+
+async def _write_returning(
+    db: AsyncSession,
+    stmt,
+    model,
+    link_ids: Optional[List[int]] = None,
+    replace_links: bool = False,
+    count_sign: int = 0,
+):
+    """
+    Executes `stmt` with RETURNING and, when `link_ids` is given, links the
+    written row to those targets (ids that don't exist in the row's tenant
+    are ignored). With `replace_links` the row's other links are removed. A
+    non-zero `count_sign` adds (+1) or removes (-1) the row from the entity
+    counters. Every written row is recorded in the change log; created and
+    updated rows are stamped with the version of that event.
+    """
+    op = changes.operation(stmt)
+    if op != changes.DELETE:
+        stmt = stmt.values(version=changes.next_version(db))
+    if _is_postgres(db):
+        written = stmt.returning(*model.__table__.c).cte("written")
+        ctes = [changes.record_from(db, written, model, op).cte("logged")]
+        if link_ids is not None:
+            ctes += _link_ctes(written, model, link_ids, replace_links)
+        if count_sign:
+            ctes.append(counters.adjust_from(written, model, count_sign).cte("counted"))
+        result = await db.execute(
+            select(aliased(model, written)).add_cte(*ctes),
+            execution_options=_RETURNING_OPTIONS,
+        )
+        return result.scalar_one_or_none()
+
+    result = await db.execute(
+        stmt.returning(model), execution_options=_RETURNING_OPTIONS
+    )
+    obj = result.scalar_one_or_none()
+    if obj is None:
+        return None
+    if link_ids is not None:
+        await _write_links(db, obj, link_ids, replace_links)
+    if count_sign:
+        await counters.adjust(db, obj.tenant_id, counters.deltas(obj, count_sign))
+    await changes.record(db, obj, op)
+    return obj
+
+
+async def _load_user_roles(db: AsyncSession, user_id: int) -> List[Role]:
+    result = await db.execute(
+        select(Role)
+        .join(user_roles, user_roles.c.role_id == Role.id)
+        .where(user_roles.c.user_id == user_id, _in_force(_utcnow()))
+        .options(joinedload(Role.permissions))
+        .order_by(Role.id)
+    )
+    return result.unique().scalars().all()
+
+
+async def _load_role_permissions(db: AsyncSession, role_id: int) -> List[Permission]:
+    result = await db.execute(
+        select(Permission)
+        .join(role_permissions, role_permissions.c.permission_id == Permission.id)
+        .where(role_permissions.c.role_id == role_id)
+        .order_by(Permission.id)
+    )
+    return result.scalars().all()
+
+
+async def _commit_or_400(db: AsyncSession, detail: str) -> None:
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
 # ——— USER ———
 
 
-async def get_user(db: AsyncSession, user_id: int) -> Optional[User]:
+async def get_user(db: AsyncSession, tenant_id: int, user_id: int) -> Optional[User]:
     result = await db.execute(
         select(User)
-        .options(joinedload(User.roles).joinedload(Role.permissions))
-        .where(User.id == user_id)
+        .options(joinedload(User.active_roles).joinedload(Role.permissions))
+        .where(User.id == user_id, User.tenant_id == tenant_id)
     )
-    return result.scalar_one_or_none()
+    return result.unique().scalar_one_or_none()
+
 
+# group_concat separator: permission names cannot contain control characters
+_NAME_SEPARATOR = "\x1f"
 
-async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
-    result = await db.execute(select(User).where(User.username == username))
+
+async def get_principal(
+    db: AsyncSession, tenant_id: int, user_id: int
+) -> Optional[Principal]:
+    """
+    The user's authorization data in one Core query: one row per role in
+    force with the role's permission names aggregated by the database (one
+    row with a NULL role when the user has none). No ORM instances are
+    created. The principal's valid_until is the user's next link deadline,
+    past which the role set changes without any write.
+    """
+    users = User.__table__.c
+    if _is_postgres(db):
+        names = func.array_agg(Permission.name)
+    else:
+        names = func.group_concat(Permission.name, _NAME_SEPARATOR)
+    now = _utcnow()
+    # aliased so it doesn't correlate with the joined user_roles
+    upcoming = user_roles.alias("upcoming").c
+    next_deadline = (
+        select(
+            func.min(
+                case(
+                    (upcoming.valid_from > now, upcoming.valid_from),
+                    (upcoming.valid_until > now, upcoming.valid_until),
+                )
+            )
+        )
+        .where(upcoming.user_id == users.id)
+        .scalar_subquery()
+    )
+    stmt = (
+        select(
+            users.id,
+            users.tenant_id,
+            users.is_active,
+            users.is_superuser,
+            user_roles.c.role_id,
+            names.label("names"),
+            type_coerce(next_deadline, DateTime).label("next_deadline"),
+        )
+        .select_from(User.__table__)
+        .outerjoin(
+            user_roles,
+            and_(user_roles.c.user_id == users.id, _in_force(now)),
+        )
+        .outerjoin(role_permissions, role_permissions.c.role_id == user_roles.c.role_id)
+        .outerjoin(Permission, Permission.id == role_permissions.c.permission_id)
+        .where(users.id == user_id, users.tenant_id == tenant_id)
+        .group_by(users.id, user_roles.c.role_id)
+    )
+    rows = (await db.execute(stmt)).all()
+    if not rows:
+        return None
+    roles = []
+    for row in rows:
+        if row.role_id is None:
+            continue
+        if isinstance(row.names, str):
+            grants = frozenset(row.names.split(_NAME_SEPARATOR))
+        else:
+            # array_agg keeps the NULL of a role without permissions
+            grants = frozenset(name for name in row.names or () if name is not None)
+        roles.append((row.role_id, grants))
+    first = rows[0]
+    valid_until = None
+    if first.next_deadline is not None:
+        valid_until = first.next_deadline.replace(tzinfo=timezone.utc).timestamp()
+    return Principal(
+        first.id,
+        first.tenant_id,
+        first.is_active,
+        first.is_superuser,
+        roles,
+        valid_until,
+    )
+
+
+async def get_user_by_username(
+    db: AsyncSession, tenant_id: int, username: str
+) -> Optional[User]:
+    result = await db.execute(
+        select(User).where(User.tenant_id == tenant_id, User.username == username)
+    )
     return result.scalar_one_or_none()
 
 
-async def get_users(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[User]:
+async def get_users(
+    db: AsyncSession,
+    tenant_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    filters: Optional[UserFilter] = None,
+) -> List[User]:
+    stmt = (
+        select(User)
+        .options(selectinload(User.active_roles).selectinload(Role.permissions))
+        .where(User.tenant_id == tenant_id)
+    )
+    if filters is not None:
+        stmt = _filter_users(stmt, filters)
+    result = await db.execute(stmt.order_by(User.id).offset(skip).limit(limit))
+    return result.scalars().all()
+
+
+async def get_users_by_ids(
+    db: AsyncSession, tenant_id: int, ids: Sequence[int]
+) -> List[User]:
+    # one IN query; roles and their permissions load in one SELECT each
     result = await db.execute(
-        select(User).options(joinedload(User.roles)).offset(skip).limit(limit)
+        select(User)
+        .options(selectinload(User.active_roles).selectinload(Role.permissions))
+        .where(User.tenant_id == tenant_id, User.id.in_(set(ids)))
     )
     return result.scalars().all()
 
 
-async def create_user(db: AsyncSession, data: UserCreate) -> User:
+async def user_conflict(
+    db: AsyncSession,
+    tenant_id: int,
+    username: Optional[str],
+    email: Optional[str],
+    exclude_id: Optional[int] = None,
+) -> bool:
+    # the unique indexes only cover one shard; sharded writes check every
+    # shard with this before writing
+    taken = [User.username == username] if username is not None else []
+    if email is not None:
+        taken.append(User.email == email)
+    if not taken:
+        return False
+    stmt = select(User.id).where(User.tenant_id == tenant_id, or_(*taken))
+    if exclude_id is not None:
+        stmt = stmt.where(User.id != exclude_id)
+    return await db.scalar(stmt.limit(1)) is not None
+
+
+async def create_user(
+    db: AsyncSession, tenant_id: int, data: UserCreate, user_id: Optional[int] = None
+) -> User:
     # hash password
-    hashed = get_password_hash(data.password)
-    user = User(
+    hashed = security.get_password_hash(data.password)
+    # an explicit id comes from the shard allocator (sharding.py)
+    values = {} if user_id is None else {"id": user_id}
+    stmt = _insert(
+        User,
+        tenant_id=tenant_id,
         username=data.username,
         email=data.email,
         hashed_password=hashed,
+        **values,
     )
-    if data.role_ids:
-        q = await db.execute(select(Role).where(Role.id.in_(data.role_ids)))
-        user.roles = q.scalars().all()
-
-    db.add(user)
+    detail = "User with given username or email already exists."
     try:
-        await db.commit()
+        user = await _write_returning(
+            db, stmt, User, link_ids=data.role_ids, count_sign=+1
+        )
+        roles = await _load_user_roles(db, user.id) if data.role_ids else []
     except IntegrityError:
         await db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="User with given username or email already exists.",
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+    await _commit_or_400(db, detail)
+
+    set_committed_value(user, "active_roles", roles)
+    return user
+
+
+async def update_user(
+    db: AsyncSession, tenant_id: int, user_id: int, data: UserUpdate
+) -> Optional[User]:
+    values = data.model_dump(exclude_unset=True)
+    role_ids = values.pop("role_ids", None)
+    if "password" in values:
+        values["hashed_password"] = security.get_password_hash(values.pop("password"))
+    if not values and role_ids is None:
+        return await get_user(db, tenant_id, user_id)
+    if not values:
+        # only the links change; still bump updated_at and get the row back
+        values["updated_at"] = func.now()
+
+    stmt = (
+        update(User)
+        .where(User.id == user_id, User.tenant_id == tenant_id)
+        .values(**values)
+    )
+    detail = "Update conflict: fields must be unique."
+    try:
+        # flag buckets need the old values; the row lock keeps concurrent
+        # toggles from double-counting (no-op on SQLite)
+        old_flags = None
+        if "is_active" in values or "is_superuser" in values:
+            result = await db.execute(
+                select(User.is_active, User.is_superuser)
+                .where(User.id == user_id, User.tenant_id == tenant_id)
+                .with_for_update()
+            )
+            old_flags = result.one_or_none()
+        user = await _write_returning(
+            db, stmt, User, link_ids=role_ids, replace_links=True
         )
+        if user is None:
+            await db.rollback()
+            return None
+        if old_flags is not None:
+            await counters.adjust(
+                db,
+                tenant_id,
+                {
+                    counters.USERS_ACTIVE: user.is_active - old_flags.is_active,
+                    counters.USERS_SUPERUSER: (
+                        user.is_superuser - old_flags.is_superuser
+                    ),
+                },
+            )
+        roles = await _load_user_roles(db, user.id) if role_ids != [] else []
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+    await _commit_or_400(db, detail)
+
+    set_committed_value(user, "active_roles", roles)
+    return user
+
+
+async def delete_user(db: AsyncSession, tenant_id: int, user_id: int) -> Optional[User]:
+    # roles are read first: ON DELETE CASCADE drops the user_roles rows
+    roles = await _load_user_roles(db, user_id)
+    user = await _write_returning(
+        db,
+        delete(User).where(User.id == user_id, User.tenant_id == tenant_id),
+        User,
+        count_sign=-1,
+    )
+    if user is None:
+        return None
+    await db.commit()
+    set_committed_value(user, "active_roles", roles)
+    return user
+
+
+# ——— REVERSE LOOKUPS ———
+#
+# Keyset pagination: `after` is the last id of the previous page. Each query
+# walks one of the reverse (role_id, user_id) / (permission_id, role_id)
+# indexes in order, so the cost of a page doesn't depend on its offset.
+
+
+async def exists(db: AsyncSession, tenant_id: int, model, obj_id: int) -> bool:
+    result = await db.execute(
+        select(model.id).where(model.id == obj_id, model.tenant_id == tenant_id)
+    )
+    return result.scalar_one_or_none() is not None
+
 
-    # reload with eager relationships
+async def get_users_by_role(
+    db: AsyncSession, tenant_id: int, role_id: int, after: int = 0, limit: int = 100
+) -> List[User]:
     result = await db.execute(
         select(User)
-        .options(joinedload(User.roles).joinedload(Role.permissions))
-        .where(User.id == user.id)
+        .join(user_roles, user_roles.c.user_id == User.id)
+        .where(
+            user_roles.c.role_id == role_id,
+            user_roles.c.user_id > after,
+            User.tenant_id == tenant_id,
+            _in_force(_utcnow()),
+        )
+        .options(selectinload(User.active_roles).selectinload(Role.permissions))
+        .order_by(user_roles.c.user_id)
+        .limit(limit)
     )
-    return result.unique().scalar_one()
+    return result.scalars().all()
 
 
-async def update_user(
-    db: AsyncSession, user_id: int, data: UserUpdate
-) -> Optional[User]:
-    user = await get_user(db, user_id)
-    if not user:
+async def _covering_permission_ids(db: AsyncSession, tenant_id: int, perm_id: int):
+    """
+    The permission and the wildcard grants above it (`users:*`, `*`) as an
+    id subquery: a role granting any of them grants the permission, exactly
+    as has_permission decides. None when the permission does not exist.
+    """
+    name = await db.scalar(
+        select(Permission.name).where(
+            Permission.id == perm_id, Permission.tenant_id == tenant_id
+        )
+    )
+    if name is None:
         return None
+    return select(Permission.id).where(
+        Permission.tenant_id == tenant_id,
+        Permission.name.in_(covering_grants(name)),
+    )
 
-    for field, value in data.dict(exclude_unset=True).items():
-        if field == "password":
-            setattr(user, "hashed_password", get_password_hash(value))
-        elif field == "role_ids":
-            q = await db.execute(select(Role).where(Role.id.in_(value)))
-            user.roles = q.scalars().all()
-        else:
-            setattr(user, field, value)
 
-    try:
-        await db.commit()
-    except IntegrityError:
-        await db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Update conflict: fields must be unique.",
+async def get_roles_by_permission(
+    db: AsyncSession, tenant_id: int, perm_id: int, after: int = 0, limit: int = 100
+) -> List[Role]:
+    covering = await _covering_permission_ids(db, tenant_id, perm_id)
+    if covering is None:
+        return []
+    # a role may grant both the permission and a wildcard above it, hence
+    # EXISTS instead of a join
+    granted = (
+        select(role_permissions.c.role_id)
+        .where(
+            role_permissions.c.role_id == Role.id,
+            role_permissions.c.permission_id.in_(covering),
         )
+        .exists()
+    )
+    result = await db.execute(
+        select(Role)
+        .where(Role.tenant_id == tenant_id, granted, Role.id > after)
+        .options(selectinload(Role.permissions))
+        .order_by(Role.id)
+        .limit(limit)
+    )
+    return result.scalars().all()
+
 
-    # reload with eager relationships
+async def get_users_by_permission(
+    db: AsyncSession, tenant_id: int, perm_id: int, after: int = 0, limit: int = 100
+) -> List[User]:
+    covering = await _covering_permission_ids(db, tenant_id, perm_id)
+    if covering is None:
+        return []
+    # a user may hold the permission through several roles, hence EXISTS
+    # instead of a join
+    granted = (
+        select(user_roles.c.user_id)
+        .join(role_permissions, role_permissions.c.role_id == user_roles.c.role_id)
+        .where(
+            role_permissions.c.permission_id.in_(covering),
+            user_roles.c.user_id == User.id,
+            _in_force(_utcnow()),
+        )
+        .exists()
+    )
     result = await db.execute(
         select(User)
-        .options(joinedload(User.roles).joinedload(Role.permissions))
-        .where(User.id == user.id)
+        .where(User.tenant_id == tenant_id, granted, User.id > after)
+        .options(selectinload(User.active_roles).selectinload(Role.permissions))
+        .order_by(User.id)
+        .limit(limit)
+    )
+    return result.scalars().all()
+
+
+# ——— ROLE ASSIGNMENTS ———
+#
+# A user_roles link may carry a validity window (naive UTC, like the other
+# timestamps). Authorization and every read API (User.active_roles, the
+# role filter, reverse lookups) read links through _in_force(), so a link is
+# ignored from the first request past its deadline without any scan;
+# ExpiryScheduler (expiry.py) then deletes expired links and clears
+# valid_from of links that came into force, bumping the users' versions so
+# /changes, /sync and snapshots pick the change up.
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+_in_force = link_in_force
+
+
+async def _touch_users(db: AsyncSession, user_ids) -> None:
+    """
+    Bumps the users' versions and logs an update for each: role links are
+    part of a user's /sync row.
+    """
+    if not user_ids:
+        return
+    if _is_postgres(db):
+        written = (
+            update(User)
+            .where(User.id.in_(user_ids))
+            .values(version=changes.next_version(db))
+            .returning(User.id, User.tenant_id, User.version)
+            .cte("written")
+        )
+        logged = changes.record_from(db, written, User, changes.UPDATE).cte("logged")
+        await db.execute(select(func.count()).select_from(written).add_cte(logged))
+        return
+    # SQLite draws one version per statement
+    for user_id in sorted(user_ids):
+        await _write_returning(db, update(User).where(User.id == user_id), User)
+
+
+async def get_role_assignments(db: AsyncSession, tenant_id: int, user_id: int):
+    """The user's links with their windows; None when there is no such user."""
+    if not await exists(db, tenant_id, User, user_id):
+        return None
+    result = await db.execute(
+        select(user_roles)
+        .where(user_roles.c.user_id == user_id)
+        .order_by(user_roles.c.role_id)
     )
-    return result.unique().scalar_one()
+    return result.all()
 
 
-async def delete_user(db: AsyncSession, user_id: int) -> Optional[User]:
-    user = await get_user(db, user_id)
-    if not user:
+async def assign_role(
+    db: AsyncSession, tenant_id: int, user_id: int, data: RoleAssignment
+):
+    """
+    Creates the link or replaces the window of an existing one. None when
+    there is no such user; a role of another tenant is a 400.
+    """
+    if not await exists(db, tenant_id, User, user_id):
         return None
-    await db.delete(user)
+    if not await exists(db, tenant_id, Role, data.role_id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Role not found."
+        )
+    window = {"valid_from": data.valid_from, "valid_until": data.valid_until}
+    insert_ = pg_insert if _is_postgres(db) else sqlite_insert
+    stmt = (
+        insert_(user_roles)
+        .values(user_id=user_id, role_id=data.role_id, **window)
+        .on_conflict_do_update(
+            index_elements=[user_roles.c.user_id, user_roles.c.role_id], set_=window
+        )
+        .returning(*user_roles.c)
+    )
+    link = (await db.execute(stmt)).one()
+    await _touch_users(db, [user_id])
     await db.commit()
-    return user
+    return link
+
+
+async def revoke_role(db: AsyncSession, tenant_id: int, user_id: int, role_id: int):
+    if not await exists(db, tenant_id, User, user_id):
+        return None
+    link = (
+        await db.execute(
+            delete(user_roles)
+            .where(user_roles.c.user_id == user_id, user_roles.c.role_id == role_id)
+            .returning(*user_roles.c)
+        )
+    ).one_or_none()
+    if link is None:
+        return None
+    await _touch_users(db, [user_id])
+    await db.commit()
+    return link
+
+
+async def get_role_deadlines(
+    db: AsyncSession, before: datetime, limit: int, after: Optional[datetime] = None
+) -> List[datetime]:
+    """
+    The earliest `limit` valid_from / valid_until up to `before`, overdue
+    ones included unless `after` is given; each side is read off its own
+    index.
+    """
+    c = user_roles.c
+    sides = []
+    for column in (c.valid_until, c.valid_from):
+        stmt = select(column).where(column <= before)
+        if after is not None:
+            stmt = stmt.where(column > after)
+        result = await db.execute(stmt.order_by(column).limit(limit))
+        sides.append(result.scalars().all())
+    return list(heapq.merge(*sides))[:limit]
+
+
+async def apply_role_deadlines(
+    db: AsyncSession, now: datetime, batch_size: int
+) -> tuple[List[tuple[int, int]], bool]:
+    """
+    Deletes up to `batch_size` links past valid_until and clears valid_from
+    of up to `batch_size` links that came into force, then touches their
+    users. Concurrent workers claim disjoint rows: the outer conditions are
+    rechecked on the locked row. Returns the touched (tenant_id, user_id)
+    and whether a batch was full, i.e. more may be due.
+    """
+    c = user_roles.c
+    link = tuple_(c.user_id, c.role_id)
+    expired = (
+        (
+            await db.execute(
+                delete(user_roles)
+                .where(
+                    link.in_(
+                        select(c.user_id, c.role_id)
+                        .where(c.valid_until <= now)
+                        .limit(batch_size)
+                    ),
+                    c.valid_until <= now,
+                )
+                .returning(c.user_id)
+            )
+        )
+        .scalars()
+        .all()
+    )
+    started = (
+        (
+            await db.execute(
+                update(user_roles)
+                .where(
+                    link.in_(
+                        select(c.user_id, c.role_id)
+                        .where(c.valid_from <= now)
+                        .limit(batch_size)
+                    ),
+                    c.valid_from <= now,
+                )
+                .values(valid_from=None)
+                .returning(c.user_id)
+            )
+        )
+        .scalars()
+        .all()
+    )
+    user_ids = set(expired) | set(started)
+    touched = []
+    if user_ids:
+        result = await db.execute(
+            select(User.tenant_id, User.id).where(User.id.in_(user_ids))
+        )
+        touched = [tuple(row) for row in result]
+        await _touch_users(db, user_ids)
+    await db.commit()
+    return touched, len(expired) == batch_size or len(started) == batch_size
 
 
 # ——— ROLE ———
 
 
-async def get_role(db: AsyncSession, role_id: int) -> Optional[Role]:
+async def get_role(db: AsyncSession, tenant_id: int, role_id: int) -> Optional[Role]:
     result = await db.execute(
-        select(Role).options(joinedload(Role.permissions)).where(Role.id == role_id)
+        select(Role)
+        .options(joinedload(Role.permissions))
+        .where(Role.id == role_id, Role.tenant_id == tenant_id)
     )
-    return result.scalar_one_or_none()
+    return result.unique().scalar_one_or_none()
 
 
-async def get_roles(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[Role]:
+async def get_roles(
+    db: AsyncSession,
+    tenant_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    filters: Optional[NameFilter] = None,
+) -> List[Role]:
+    stmt = (
+        select(Role)
+        .options(selectinload(Role.permissions))
+        .where(Role.tenant_id == tenant_id)
+    )
+    if filters is not None:
+        stmt = _filter_by_name(stmt, Role, filters)
+    result = await db.execute(stmt.order_by(Role.id).offset(skip).limit(limit))
+    return result.scalars().all()
+
+
+async def get_roles_by_ids(
+    db: AsyncSession, tenant_id: int, ids: Sequence[int]
+) -> List[Role]:
     result = await db.execute(
-        select(Role).options(joinedload(Role.permissions)).offset(skip).limit(limit)
+        select(Role)
+        .options(selectinload(Role.permissions))
+        .where(Role.tenant_id == tenant_id, Role.id.in_(set(ids)))
     )
     return result.scalars().all()
 
 
-async def create_role(db: AsyncSession, data: RoleCreate) -> Role:
-    role = Role(name=data.name, description=data.description or "")
-    if data.permission_ids:
-        q = await db.execute(
-            select(Permission).where(Permission.id.in_(data.permission_ids))
-        )
-        role.permissions = q.scalars().all()
+async def get_role_grants(db: AsyncSession, limit: int) -> List[tuple[int, frozenset]]:
+    """
+    Permission names of the first `limit` roles across tenants, shaped like
+    Principal.roles; used to warm the matcher cache at startup.
+    """
+    first = select(Role.id).order_by(Role.id).limit(limit)
+    result = await db.execute(
+        select(Role.id, Permission.name)
+        .outerjoin(role_permissions, role_permissions.c.role_id == Role.id)
+        .outerjoin(Permission, Permission.id == role_permissions.c.permission_id)
+        .where(Role.id.in_(first))
+    )
+    grants: dict[int, set] = {}
+    for role_id, name in result:
+        names = grants.setdefault(role_id, set())
+        if name is not None:
+            names.add(name)
+    return [(role_id, frozenset(names)) for role_id, names in grants.items()]
 
-    db.add(role)
+
+async def create_role(db: AsyncSession, tenant_id: int, data: RoleCreate) -> Role:
+    stmt = _insert(
+        Role,
+        tenant_id=tenant_id,
+        name=data.name,
+        description=data.description or "",
+    )
+    detail = "Role with given name already exists."
     try:
-        await db.commit()
+        role = await _write_returning(
+            db, stmt, Role, link_ids=data.permission_ids, count_sign=+1
+        )
+        permissions = (
+            await _load_role_permissions(db, role.id) if data.permission_ids else []
+        )
     except IntegrityError:
         await db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Role with given name already exists.",
-        )
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+    await _commit_or_400(db, detail)
 
-    result = await db.execute(
-        select(Role).options(joinedload(Role.permissions)).where(Role.id == role.id)
-    )
-    return result.scalar_one()
+    set_committed_value(role, "permissions", permissions)
+    return role
 
 
 async def update_role(
-    db: AsyncSession, role_id: int, data: RoleUpdate
+    db: AsyncSession, tenant_id: int, role_id: int, data: RoleUpdate
 ) -> Optional[Role]:
-    role = await get_role(db, role_id)
-    if not role:
-        return None
-
-    for field, value in data.dict(exclude_unset=True).items():
-        if field == "permission_ids":
-            q = await db.execute(select(Permission).where(Permission.id.in_(value)))
-            role.permissions = q.scalars().all()
-        else:
-            setattr(role, field, value)
+    values = data.model_dump(exclude_unset=True)
+    permission_ids = values.pop("permission_ids", None)
+    if not values and permission_ids is None:
+        return await get_role(db, tenant_id, role_id)
+    if not values:
+        values["updated_at"] = func.now()
 
+    stmt = (
+        update(Role)
+        .where(Role.id == role_id, Role.tenant_id == tenant_id)
+        .values(**values)
+    )
+    detail = "Update conflict: fields must be unique."
     try:
-        await db.commit()
+        role = await _write_returning(
+            db, stmt, Role, link_ids=permission_ids, replace_links=True
+        )
+        if role is None:
+            await db.rollback()
+            return None
+        permissions = (
+            await _load_role_permissions(db, role.id) if permission_ids != [] else []
+        )
     except IntegrityError:
         await db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Update conflict: fields must be unique.",
-        )
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+    await _commit_or_400(db, detail)
 
-    result = await db.execute(
-        select(Role).options(joinedload(Role.permissions)).where(Role.id == role.id)
-    )
-    return result.scalar_one()
+    set_committed_value(role, "permissions", permissions)
+    return role
 
 
-async def delete_role(db: AsyncSession, role_id: int) -> Optional[Role]:
-    role = await get_role(db, role_id)
-    if not role:
+async def delete_role(db: AsyncSession, tenant_id: int, role_id: int) -> Optional[Role]:
+    permissions = await _load_role_permissions(db, role_id)
+    role = await _write_returning(
+        db,
+        delete(Role).where(Role.id == role_id, Role.tenant_id == tenant_id),
+        Role,
+        count_sign=-1,
+    )
+    if role is None:
         return None
-    await db.delete(role)
     await db.commit()
+    set_committed_value(role, "permissions", permissions)
     return role
 
 
 # ——— PERMISSION ———
 
 
-async def get_permission(db: AsyncSession, perm_id: int) -> Optional[Permission]:
-    result = await db.execute(select(Permission).where(Permission.id == perm_id))
+async def get_permission(
+    db: AsyncSession, tenant_id: int, perm_id: int
+) -> Optional[Permission]:
+    result = await db.execute(
+        select(Permission).where(
+            Permission.id == perm_id, Permission.tenant_id == tenant_id
+        )
+    )
     return result.scalar_one_or_none()
 
 
 async def get_permissions(
-    db: AsyncSession, skip: int = 0, limit: int = 100
+    db: AsyncSession,
+    tenant_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    filters: Optional[NameFilter] = None,
 ) -> List[Permission]:
-    result = await db.execute(select(Permission).offset(skip).limit(limit))
+    stmt = select(Permission).where(Permission.tenant_id == tenant_id)
+    if filters is not None:
+        stmt = _filter_by_name(stmt, Permission, filters)
+    result = await db.execute(stmt.order_by(Permission.id).offset(skip).limit(limit))
     return result.scalars().all()
 
 
-async def create_permission(db: AsyncSession, data: PermissionCreate) -> Permission:
-    perm = Permission(name=data.name, description=data.description or "")
-    db.add(perm)
+async def get_permissions_by_ids(
+    db: AsyncSession, tenant_id: int, ids: Sequence[int]
+) -> List[Permission]:
+    result = await db.execute(
+        select(Permission).where(
+            Permission.tenant_id == tenant_id, Permission.id.in_(set(ids))
+        )
+    )
+    return result.scalars().all()
+
+
+async def create_permission(
+    db: AsyncSession, tenant_id: int, data: PermissionCreate
+) -> Permission:
+    stmt = _insert(
+        Permission,
+        tenant_id=tenant_id,
+        name=data.name,
+        description=data.description or "",
+    )
+    detail = "Permission with given name already exists."
     try:
-        await db.commit()
+        perm = await _write_returning(db, stmt, Permission, count_sign=+1)
     except IntegrityError:
         await db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Permission with given name already exists.",
-        )
-
-    result = await db.execute(select(Permission).where(Permission.id == perm.id))
-    return result.scalar_one()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+    await _commit_or_400(db, detail)
+    return perm
 
 
 async def update_permission(
-    db: AsyncSession, perm_id: int, data: PermissionUpdate
+    db: AsyncSession, tenant_id: int, perm_id: int, data: PermissionUpdate
+) -> Optional[Permission]:
+    values = data.model_dump(exclude_unset=True)
+    if not values:
+        return await get_permission(db, tenant_id, perm_id)
+
+    stmt = (
+        update(Permission)
+        .where(Permission.id == perm_id, Permission.tenant_id == tenant_id)
+        .values(**values)
+    )
+    detail = "Update conflict: fields must be unique."
+    try:
+        perm = await _write_returning(db, stmt, Permission)
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+    if perm is None:
+        await db.rollback()
+        return None
+    await _commit_or_400(db, detail)
+    return perm
+
+
+async def delete_permission(
+    db: AsyncSession, tenant_id: int, perm_id: int
 ) -> Optional[Permission]:
-    perm = await get_permission(db, perm_id)
-    if not perm:
+    perm = await _write_returning(
+        db,
+        delete(Permission).where(
+            Permission.id == perm_id, Permission.tenant_id == tenant_id
+        ),
+        Permission,
+        count_sign=-1,
+    )
+    if perm is None:
         return None
+    await db.commit()
+    return perm
+
 
-    for field, value in data.dict(exclude_unset=True).items():
-        setattr(perm, field, value)
+# ——— SCOPED GRANTS ———
 
+
+async def get_scoped_grants(
+    db: AsyncSession, tenant_id: int, role_id: int
+) -> List[ScopedGrant]:
+    result = await db.execute(
+        select(ScopedGrant)
+        .options(joinedload(ScopedGrant.permission))
+        .where(ScopedGrant.role_id == role_id, ScopedGrant.tenant_id == tenant_id)
+        .order_by(ScopedGrant.id)
+    )
+    return result.scalars().all()
+
+
+async def create_scoped_grant(
+    db: AsyncSession, tenant_id: int, role_id: int, data: ScopedGrantCreate
+) -> Optional[ScopedGrant]:
+    # None when the permission doesn't exist in the tenant; a role of another
+    # tenant is rejected like a missing one
+    perm = await get_permission(db, tenant_id, data.permission_id)
+    if perm is None:
+        return None
+    detail = "Grant already exists or role not found."
+    if not await exists(db, tenant_id, Role, role_id):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+    stmt = _insert(
+        ScopedGrant,
+        tenant_id=tenant_id,
+        role_id=role_id,
+        permission_id=data.permission_id,
+        resource_type=data.resource_type.value,
+        resource_id=data.resource_id,
+    )
     try:
-        await db.commit()
+        grant = await _write_returning(db, stmt, ScopedGrant)
     except IntegrityError:
         await db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Update conflict: fields must be unique.",
-        )
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+    await _commit_or_400(db, detail)
 
-    result = await db.execute(select(Permission).where(Permission.id == perm.id))
-    return result.scalar_one()
+    set_committed_value(grant, "permission", perm)
+    return grant
 
 
-async def delete_permission(db: AsyncSession, perm_id: int) -> Optional[Permission]:
-    perm = await get_permission(db, perm_id)
-    if not perm:
+async def delete_scoped_grant(
+    db: AsyncSession, tenant_id: int, role_id: int, grant_id: int
+) -> Optional[ScopedGrant]:
+    grant = await _write_returning(
+        db,
+        delete(ScopedGrant).where(
+            ScopedGrant.id == grant_id,
+            ScopedGrant.role_id == role_id,
+            ScopedGrant.tenant_id == tenant_id,
+        ),
+        ScopedGrant,
+    )
+    if grant is None:
         return None
-    await db.delete(perm)
+    set_committed_value(
+        grant, "permission", await get_permission(db, tenant_id, grant.permission_id)
+    )
     await db.commit()
-    return perm
+    return grant
+
+
+async def get_grants_for_resources(
+    db: AsyncSession,
+    tenant_id: int,
+    role_ids,
+    resource_type: str,
+    resource_ids: List[int],
+) -> List[tuple[str, Optional[int]]]:
+    """
+    (permission name, resource_id) of the grants the roles hold on the given
+    resources, type-wide grants (resource_id NULL) included. One indexed
+    query that only touches grants on these resources, however many grants
+    the roles hold elsewhere.
+    """
+    if not role_ids or not resource_ids:
+        return []
+    result = await db.execute(
+        select(Permission.name, ScopedGrant.resource_id)
+        .join(Permission, Permission.id == ScopedGrant.permission_id)
+        .where(
+            ScopedGrant.tenant_id == tenant_id,
+            ScopedGrant.resource_type == resource_type,
+            or_(
+                ScopedGrant.resource_id.in_(resource_ids),
+                ScopedGrant.resource_id.is_(None),
+            ),
+            ScopedGrant.role_id.in_(role_ids),
+        )
+    )
+    return result.tuples().all()
+
+
+# ——— SYNC ———
+#
+# Delta sync (GET /sync). Created and updated rows carry the version of their
+# change-log event, so "changed since N" is a (tenant_id, version) range scan
+# per table; deletions come from the log as tombstones. Assignments travel
+# with their owner: link writes bump the owner's version, and a changed user
+# or role is sent with its whole role_ids / permission_ids. Links and grants
+# removed by a cascade have no tombstone of their own: the client drops what
+# references a tombstoned role or permission.
+
+_SYNC_TABLES = {
+    "user": (
+        User,
+        (
+            User.id,
+            User.username,
+            User.email,
+            User.is_active,
+            User.is_superuser,
+            User.updated_at,
+            User.version,
+        ),
+    ),
+    "role": (
+        Role,
+        (Role.id, Role.name, Role.description, Role.updated_at, Role.version),
+    ),
+    "permission": (
+        Permission,
+        (
+            Permission.id,
+            Permission.name,
+            Permission.description,
+            Permission.updated_at,
+            Permission.version,
+        ),
+    ),
+    "grant": (
+        ScopedGrant,
+        (
+            ScopedGrant.id,
+            ScopedGrant.role_id,
+            ScopedGrant.permission_id,
+            ScopedGrant.resource_type,
+            ScopedGrant.resource_id,
+            ScopedGrant.version,
+        ),
+    ),
+}
+
+
+async def _changed_rows(
+    db: AsyncSession,
+    tenant_id: int,
+    types,
+    since: int,
+    upto: int,
+    limit: Optional[int],
+) -> list[tuple[int, str, dict]]:
+    # (version, type, row) of rows and tombstones in (since, upto], at most
+    # `limit` per table, each table read in version order
+    found = []
+    for entity_type in types:
+        model, columns = _SYNC_TABLES[entity_type]
+        stmt = (
+            select(*columns)
+            .where(
+                model.tenant_id == tenant_id,
+                model.version > since,
+                model.version <= upto,
+            )
+            .order_by(model.version)
+            .limit(limit)
+        )
+        for row in (await db.execute(stmt)).mappings():
+            found.append((row["version"], entity_type, dict(row)))
+
+    deleted = await db.execute(
+        select(ChangeLogEntry.seq, ChangeLogEntry.entity_type, ChangeLogEntry.entity_id)
+        .where(
+            ChangeLogEntry.tenant_id == tenant_id,
+            ChangeLogEntry.seq > since,
+            ChangeLogEntry.seq <= upto,
+            ChangeLogEntry.op == changes.DELETE,
+            ChangeLogEntry.entity_type.in_(types),
+        )
+        .order_by(ChangeLogEntry.seq)
+        .limit(limit)
+    )
+    for seq, entity_type, entity_id in deleted:
+        found.append(
+            (seq, None, {"type": entity_type, "id": entity_id, "version": seq})
+        )
+    found.sort(key=lambda item: item[0])
+    return found
+
+
+async def _links_by_owner(
+    db: AsyncSession, table, owner_key, target_key, owner_ids, *where
+):
+    links = {owner_id: [] for owner_id in owner_ids}
+    if owner_ids:
+        result = await db.execute(
+            select(table.c[owner_key], table.c[target_key])
+            .where(table.c[owner_key].in_(owner_ids), *where)
+            .order_by(table.c[target_key])
+        )
+        for owner_id, target_id in result:
+            links[owner_id].append(target_id)
+    return links
+
+
+async def get_changes_since(
+    db: AsyncSession, tenant_id: int, since: int, upto: int, types, limit: int
+) -> SyncPage:
+    """
+    Rows of `types` created, updated or deleted in (since, upto], at most
+    about `limit` of them; `upto` is a settled version (see
+    changes.settled_version). Versions are unique, so a page cut short ends
+    on a whole version: that is the page's version and `has_more` is set.
+    since=0 is a full sync and also brings every row written around crud
+    (version 0), however many. A `since` the change log no longer covers is
+    answered with 410: the tombstones in between are gone.
+    """
+    found = []
+    if since:
+        oldest = await changes.oldest_retained(db)
+        if oldest is None or oldest > since + 1:
+            raise HTTPException(
+                status_code=status.HTTP_410_GONE,
+                detail="Changes since this version are no longer kept; "
+                "sync again from version 0.",
+            )
+    else:
+        found = await _changed_rows(db, tenant_id, types, -1, 0, None)
+
+    version, has_more = max(since, upto), False
+    if since < upto:
+        rows = await _changed_rows(db, tenant_id, types, since, upto, limit + 1)
+        if len(rows) > limit:
+            # every row below the first one left out has been read: each
+            # table was read in order and cut no earlier than that
+            version, has_more = rows[limit][0] - 1, True
+            rows = rows[:limit]
+        found += rows
+
+    page = SyncPage(version=version, has_more=has_more)
+    by_type = {entity_type: [] for entity_type in _SYNC_TABLES}
+    for _, entity_type, row in found:
+        if entity_type is None:
+            page.deleted.append(Tombstone(**row))
+        else:
+            by_type[entity_type].append(row)
+
+    # links out of their window are left out: coming into force and expiry
+    # bump the user's version (see ROLE ASSIGNMENTS)
+    user_roles_of = await _links_by_owner(
+        db,
+        user_roles,
+        "user_id",
+        "role_id",
+        [row["id"] for row in by_type["user"]],
+        _in_force(_utcnow()),
+    )
+    role_permissions_of = await _links_by_owner(
+        db,
+        role_permissions,
+        "role_id",
+        "permission_id",
+        [row["id"] for row in by_type["role"]],
+    )
+    page.users = [
+        SyncUser(**row, role_ids=user_roles_of[row["id"]]) for row in by_type["user"]
+    ]
+    page.roles = [
+        SyncRole(**row, permission_ids=role_permissions_of[row["id"]])
+        for row in by_type["role"]
+    ]
+    page.permissions = [SyncPermission(**row) for row in by_type["permission"]]
+    page.grants = [SyncGrant(**row) for row in by_type["grant"]]
+    return page
+
+
+# ——— COUNTS ———
+#
+# Totals come from the maintained counters (see counters.py). A filtered list
+# only has a cheap total when the filter maps onto a counter bucket; for any
+# other filter the count functions return None instead of running COUNT(*).
+
+
+async def get_counts(db: AsyncSession, tenant_id: Optional[int]) -> dict[str, int]:
+    # tenant_id=None: totals over the whole deployment (/metrics)
+    return await counters.read(db, tenant_id)
+
+
+async def get_users_count(
+    db: AsyncSession, tenant_id: int, filters: Optional[UserFilter] = None
+) -> Optional[int]:
+    flags = {}
+    if filters is not None:
+        flags = filters.model_dump(
+            exclude={"skip", "limit", "match"}, exclude_none=True
+        )
+        if set(flags) - {"is_active", "is_superuser"}:
+            return None
+    if not flags:
+        return (await counters.read(db, tenant_id, [counters.USERS]))[counters.USERS]
+    if len(flags) > 1:
+        return None
+
+    field, value = flags.popitem()
+    bucket = counters.USERS_ACTIVE if field == "is_active" else counters.USERS_SUPERUSER
+    if value:
+        return (await counters.read(db, tenant_id, [bucket]))[bucket]
+    counts = await counters.read(db, tenant_id, [counters.USERS, bucket])
+    return counts[counters.USERS] - counts[bucket]
+
+
+async def _name_filtered_count(
+    db: AsyncSession, tenant_id: int, name: str, filters: Optional[NameFilter]
+) -> Optional[int]:
+    if filters is not None and filters.name is not None:
+        return None
+    return (await counters.read(db, tenant_id, [name]))[name]
+
+
+async def get_roles_count(
+    db: AsyncSession, tenant_id: int, filters: Optional[NameFilter] = None
+) -> Optional[int]:
+    return await _name_filtered_count(db, tenant_id, counters.ROLES, filters)
+
+
+async def get_permissions_count(
+    db: AsyncSession, tenant_id: int, filters: Optional[NameFilter] = None
+) -> Optional[int]:
+    return await _name_filtered_count(db, tenant_id, counters.PERMISSIONS, filters)
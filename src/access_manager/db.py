@@ -1,26 +1,136 @@
-from typing import AsyncGenerator
+import asyncio
+from typing import AsyncGenerator, Optional
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
-from src.access_manager.core.config import settings
+from src.access_manager import counters, query_observer
+from src.access_manager.core.config import get_settings
+from src.access_manager.instrumentation import install_query_hooks
+from src.access_manager.sharding import ShardSet
 
-DATABASE_URL = str(settings.postgres_dsn)  # ожидается async-DSN: postgres+asyncpg://...
+# Движок создаётся при первом обращении (get_engine) или в lifespan
+# приложения, а не при импорте: импорт не тянет драйвер БД и не читает DSN.
+_engine: Optional[AsyncEngine] = None
+_session_factory: Optional[sessionmaker] = None
+# Шарды пользователей 1..N (шард 0 — основной движок), см. sharding.py
+_shards: Optional[ShardSet] = None
 
-engine = create_async_engine(
-    DATABASE_URL,
-    echo=True,
-    future=True,
-)
 
-AsyncSessionLocal = sessionmaker(
-    bind=engine,
-    class_=AsyncSession,
-    autoflush=False,
-    expire_on_commit=False,
-)
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def configure_engine(engine: AsyncEngine) -> AsyncEngine:
+    """
+    Подключает учёт запросов для Server-Timing и наблюдатель медленных
+    запросов / N+1. SQLite по умолчанию игнорирует внешние ключи, а удаление
+    строк связей держится на ON DELETE CASCADE — включаем их на каждом
+    соединении.
+    """
+    install_query_hooks(engine)
+    query_observer.install(engine)
+    if engine.dialect.name == "sqlite":
+        event.listen(engine.sync_engine, "connect", _enable_sqlite_foreign_keys)
+    return engine
+
+
+def create_engine_from_settings() -> AsyncEngine:
+    settings = get_settings()
+    query_observer.configure(
+        slow_query_threshold=settings.slow_query_threshold_ms / 1000,
+        n_plus_one_threshold=settings.n_plus_one_threshold,
+    )
+    counters.configure(approximate=settings.count_mode == "approximate")
+
+    if settings.replica_enabled:
+        # PostgresDsn не примет sqlite:// — у реплики свой URL
+        return _create_engine(settings.replica_database_url)
+    # ожидается async-DSN: postgres+asyncpg://...
+    return _create_engine(str(settings.postgres_dsn))
+
+
+def _create_engine(url: str) -> AsyncEngine:
+    settings = get_settings()
+    pool_options = {}
+    if make_url(url).get_backend_name() != "sqlite":
+        pool_options = {
+            "pool_size": settings.db_pool_size,
+            "max_overflow": settings.db_max_overflow,
+        }
+    # SQL-лог — через logs.configure(sql=True), а не echo: echo пишет в stdout
+    # синхронно и без сэмплинга
+    return configure_engine(create_async_engine(url, future=True, **pool_options))
+
+
+def set_engine(engine: AsyncEngine) -> None:
+    """Подставляет готовый движок (тесты, бенчмарки) вместо движка из настроек."""
+    global _engine, _session_factory
+    _engine = engine
+    _session_factory = sessionmaker(
+        bind=engine,
+        class_=AsyncSession,
+        autoflush=False,
+        expire_on_commit=False,
+    )
+
+
+def get_engine() -> AsyncEngine:
+    if _engine is None:
+        set_engine(create_engine_from_settings())
+    return _engine
+
+
+def set_shards(shards: ShardSet) -> None:
+    """Подставляет готовый набор шардов (тесты) вместо шардов из настроек."""
+    global _shards
+    _shards = shards
+
+
+def get_shards() -> ShardSet:
+    """
+    Шарды пользователей из настроек (shard_dsns); без них — одиночный
+    набор, и всё идёт в основную БД. Годится и как зависимость FastAPI.
+    """
+    if _shards is None:
+        settings = get_settings()
+        set_shards(
+            ShardSet(
+                [_create_engine(dsn) for dsn in settings.shard_dsns],
+                vnodes=settings.shard_vnodes,
+            )
+        )
+    return _shards
+
+
+async def dispose_engine() -> None:
+    global _engine, _session_factory, _shards
+    if _engine is not None:
+        await _engine.dispose()
+    if _shards is not None:
+        await _shards.dispose()
+    _engine = _session_factory = _shards = None
+
+
+async def warm_pool(engine: AsyncEngine, connections: int) -> None:
+    """
+    Заранее открывает connections соединений, чтобы первые запросы не
+    платили за TCP/TLS и аутентификацию. Соединения берутся одновременно —
+    иначе пул раз за разом выдавал бы одно и то же.
+    """
+
+    async def _touch() -> None:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(_touch() for _ in range(connections)))
 
 
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
-    async with AsyncSessionLocal() as session:
+    get_engine()
+    async with _session_factory() as session:
         yield session
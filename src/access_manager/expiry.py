@@ -0,0 +1,153 @@
+# src/access_manager/expiry.py
+"""
+Сроки назначений ролей (user_roles.valid_from / valid_until).
+
+Авторизация сроки уже учитывает (crud._in_force в запросе принципала), так
+что роль перестаёт действовать ровно в срок и без планировщика. Планировщик
+доводит состояние до этого: в срок удаляет истёкшие связи и снимает
+valid_from с вступивших в силу, поднимая версии пользователей (события
+/changes, /sync, снимки) и сбрасывая их решения в decision_cache.
+
+Ближайшие сроки (на horizon вперёд, не больше max_pending) лежат в
+min-куче; задача спит до вершины кучи. Сроки, назначенные в этом процессе,
+попадают в кучу сразу (notify), назначенные другими воркерами — при
+перезагрузке раз в reload_interval. Срабатывание обрабатывает все
+наступившие сроки пачками по batch_size; несколько воркеров делят строки
+без повторов (см. crud.apply_role_deadlines).
+"""
+
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from src.access_manager import crud, principal_cache, security
+
+logger = logging.getLogger("access_manager.expiry")
+
+
+def _utcnow() -> datetime:
+    # как даты в БД — наивное UTC
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class ExpiryScheduler:
+    def __init__(
+        self,
+        horizon: float = 3600.0,
+        reload_interval: float = 60.0,
+        batch_size: int = 500,
+        max_pending: int = 10_000,
+    ) -> None:
+        self.horizon = horizon
+        self.reload_interval = reload_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._heap: list[datetime] = []
+        self._pending: set[datetime] = set()
+        # сроки до этой даты уже в куче; None — куча не загружена
+        self._loaded_until: Optional[datetime] = None
+        self._reload_at: Optional[datetime] = None
+        self._wakeup = asyncio.Event()
+        self._engine: Optional[AsyncEngine] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, engine: AsyncEngine) -> None:
+        """Запускает планировщик; повторный вызов — no-op."""
+        if self.running:
+            return
+        self._engine = engine
+        self._loaded_until = None
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="role-expiry")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def notify(self, *deadlines: Optional[datetime]) -> None:
+        """
+        Сроки, только что записанные в этом процессе. Сроки дальше
+        загруженного горизонта подхватит перезагрузка.
+        """
+        if self._loaded_until is None:
+            return
+        for deadline in deadlines:
+            if deadline is not None and deadline <= self._loaded_until:
+                self._push(deadline)
+                self._wakeup.set()
+
+    def _push(self, deadline: datetime) -> None:
+        if deadline not in self._pending:
+            self._pending.add(deadline)
+            heapq.heappush(self._heap, deadline)
+
+    async def reload(self, db: AsyncSession, now: datetime) -> None:
+        until = now + timedelta(seconds=self.horizon)
+        deadlines = await crud.get_role_deadlines(db, until, self.max_pending)
+        await db.commit()
+        self._heap, self._pending = [], set()
+        for deadline in deadlines:
+            self._push(deadline)
+        # куча заполнена до предела: что после последнего срока — неизвестно
+        full = len(deadlines) == self.max_pending
+        self._loaded_until = deadlines[-1] if full else until
+        self._reload_at = now + timedelta(seconds=self.reload_interval)
+
+    async def fire(self, db: AsyncSession, now: datetime) -> list[tuple[int, int]]:
+        """Обрабатывает все наступившие сроки; возвращает затронутых пользователей."""
+        while self._heap and self._heap[0] <= now:
+            self._pending.discard(heapq.heappop(self._heap))
+        touched: list[tuple[int, int]] = []
+        more = True
+        while more:
+            batch, more = await crud.apply_role_deadlines(db, now, self.batch_size)
+            touched += batch
+        if touched:
+            security.decision_cache.discard(touched)
+            principal_cache.cache.discard(touched)
+            logger.info("role deadlines applied for %d user(s)", len(touched))
+        return touched
+
+    def _next_wakeup(self, now: datetime) -> float:
+        wake = min(self._reload_at, self._loaded_until)
+        if self._heap:
+            wake = min(wake, self._heap[0])
+        return max((wake - now).total_seconds(), 0.0)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                async with AsyncSession(self._engine) as db:
+                    now = _utcnow()
+                    if self._loaded_until is None or now >= min(
+                        self._reload_at, self._loaded_until
+                    ):
+                        await self.reload(db, now)
+                    if self._heap and self._heap[0] <= now:
+                        await self.fire(db, now)
+                timeout = self._next_wakeup(_utcnow())
+            except Exception:
+                logger.exception("role expiry failed")
+                timeout = self.reload_interval
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+# Настраивается в create_app из настроек
+scheduler = ExpiryScheduler()
@@ -0,0 +1,260 @@
+# src/access_manager/instrumentation.py
+"""
+Поэтапный учёт времени запроса: SQL (число и время), auth (JWT/bcrypt),
+сериализация ответа. Счётчики живут в ContextVar, который middleware
+выставляет на входе; хуки SQLAlchemy и security пишут в него без явной
+передачи состояния. Итог уходит в заголовок Server-Timing и в гистограммы
+Prometheus.
+"""
+
+import inspect
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import wraps
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+from fastapi.routing import APIRoute
+from prometheus_client import Histogram
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+PHASE_SECONDS = Histogram(
+    "access_manager_request_phase_seconds",
+    "Time spent per request in each phase",
+    ["phase"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+QUERIES_PER_REQUEST = Histogram(
+    "access_manager_request_queries",
+    "SQL statements executed per request",
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+
+
+@dataclass
+class RequestTimings:
+    db_count: int = 0
+    db_time: float = 0.0
+    auth_time: float = 0.0
+    serialization_time: float = 0.0
+    # момент возврата из эндпоинта; всё после него — сериализация ответа
+    endpoint_done: Optional[float] = None
+
+    def server_timing(self, total: float) -> str:
+        return ", ".join(
+            (
+                f'db;dur={self.db_time * 1000:.2f};desc="{self.db_count} queries"',
+                f"auth;dur={self.auth_time * 1000:.2f}",
+                f"ser;dur={self.serialization_time * 1000:.2f}",
+                f"total;dur={total * 1000:.2f}",
+            )
+        )
+
+    def observe(self, total: float) -> None:
+        PHASE_SECONDS.labels("db").observe(self.db_time)
+        PHASE_SECONDS.labels("auth").observe(self.auth_time)
+        PHASE_SECONDS.labels("serialization").observe(self.serialization_time)
+        PHASE_SECONDS.labels("total").observe(total)
+        QUERIES_PER_REQUEST.observe(self.db_count)
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+def start_request() -> RequestTimings:
+    timings = RequestTimings()
+    _current.set(timings)
+    return timings
+
+
+@contextmanager
+def auth_timer() -> Iterator[None]:
+    """Учитывает блок как auth-время текущего запроса (вне запроса — no-op)."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.auth_time += time.perf_counter() - start
+
+
+# --- SQLAlchemy ---
+
+
+# Начало и длительность — на контексте выполнения: он свой у каждого
+# оператора, и упавший оператор (IntegrityError на дубликате) ничего не
+# оставляет на соединении. Длительность читает и query_observer
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    context._query_duration = duration = time.perf_counter() - context._query_start
+    timings = _current.get()
+    if timings is not None:
+        timings.db_count += 1
+        timings.db_time += duration
+
+
+def query_duration(context) -> float:
+    """Длительность оператора; в after_cursor_execute после хуков этого модуля."""
+    return context._query_duration
+
+
+def install_query_hooks(engine: AsyncEngine) -> None:
+    sync_engine = engine.sync_engine
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# --- FastAPI ---
+
+
+class InstrumentedRoute(APIRoute):
+    """
+    Разделяет время обработчика на «эндпоинт» и «сериализацию»: эндпоинт
+    отмечает момент возврата, остаток до готового Response — сериализация.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs) -> None:
+        super().__init__(path, _mark_endpoint_done(endpoint), **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def instrumented_handler(request):
+            response = await handler(request)
+            timings = _current.get()
+            if timings is not None and timings.endpoint_done is not None:
+                timings.serialization_time += (
+                    time.perf_counter() - timings.endpoint_done
+                )
+            return response
+
+        return instrumented_handler
+
+
+def _mark_endpoint_done(endpoint: Callable) -> Callable:
+    if not inspect.iscoroutinefunction(endpoint):
+        return endpoint
+
+    @wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            timings = _current.get()
+            if timings is not None:
+                timings.endpoint_done = time.perf_counter()
+
+    return wrapper
+
+
+# --- Sampling profiler ---
+
+
+class SamplingProfiler:
+    """
+    Семплирующий профайлер потока event loop'а. Пока активен, фоновый поток
+    раз в interval снимает стек целевого потока; если запрос оказался
+    медленнее threshold, стеки сбрасываются в файл в формате collapsed stacks
+    (flamegraph.pl, speedscope). Одновременно профилируется один запрос:
+    на общем event loop в стеки попадают и соседние корутины.
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        interval: float = 0.005,
+        sample_rate: float = 1.0,
+        output_dir: str = "profiles",
+    ) -> None:
+        self.threshold = threshold
+        self.interval = interval
+        self.sample_rate = sample_rate
+        self.output_dir = Path(output_dir)
+        self._lock = threading.Lock()
+        self._active = False
+
+    def start(self) -> Optional["_ProfileSession"]:
+        if random.random() >= self.sample_rate:
+            return None
+        with self._lock:
+            if self._active:
+                return None
+            self._active = True
+        session = _ProfileSession(self, threading.get_ident())
+        session.start()
+        return session
+
+    def _release(self) -> None:
+        with self._lock:
+            self._active = False
+
+
+class _ProfileSession:
+    def __init__(self, profiler: SamplingProfiler, target_thread: int) -> None:
+        self._profiler = profiler
+        self._target = target_thread
+        self._stacks: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="request-profiler", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._profiler.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}"
+                    f":{frame.f_lineno})"
+                )
+                frame = frame.f_back
+            self._stacks[";".join(reversed(stack))] += 1
+
+    def finish(self, duration: float, label: str) -> Optional[Path]:
+        self._stop.set()
+        self._thread.join()
+        self._profiler._release()
+        if duration < self._profiler.threshold or not self._stacks:
+            return None
+        output_dir = self._profiler.output_dir
+        output_dir.mkdir(parents=True, exist_ok=True)
+        safe_label = "".join(c if c.isalnum() else "_" for c in label).strip("_")
+        path = output_dir / (
+            f"{time.strftime('%Y%m%dT%H%M%S')}_{int(duration * 1000)}ms_"
+            f"{safe_label}.folded"
+        )
+        path.write_text(
+            "".join(f"{stack} {count}\n" for stack, count in self._stacks.items())
+        )
+        return path
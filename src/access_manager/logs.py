@@ -0,0 +1,260 @@
+# src/access_manager/logs.py
+"""
+Логирование без записи в поток обработчика запроса.
+
+Запись лога в stdout синхронная: под нагрузкой запрос ждёт, пока терминал
+или сборщик логов заберёт строку. Здесь logger.info(...) только собирает
+запись и кладёт её в ограниченную очередь (QueueHandler); JSON собирает и
+пишет фоновый поток (QueueListener). Переполненная очередь запись
+отбрасывает и считает это в метрике, а не ждёт.
+
+К каждой записи приклеиваются id запроса и принципала из ContextVar —
+их ставят middleware (request_id) и get_current_active_user
+(principal_id).
+
+Правила (LogRule) по префиксу имени логгера — сэмплинг и лимит записей
+в секунду — действуют на записи ниже WARNING: так SQL-лог SQLAlchemy можно
+держать включённым в проде на доле запросов. Сэмплинг решается по id
+запроса — попавший в выборку запрос логируется целиком, а не через строчку.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import IO, Mapping, Optional
+
+from prometheus_client import Counter
+
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+principal_id: ContextVar[Optional[int]] = ContextVar("principal_id", default=None)
+
+DROPPED = Counter(
+    "access_manager_log_records_dropped_total",
+    "Log records dropped before reaching the output",
+    ["reason"],
+)
+
+# атрибуты LogRecord; всё остальное пришло через extra= и идёт в JSON
+_RESERVED = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message",
+    "asctime",
+}
+_CONTEXT = ("request_id", "principal_id")
+_TRACEBACKS = logging.Formatter()
+# uvicorn пишет своими обработчиками мимо корня
+_UVICORN = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+
+class LogRule:
+    """
+    sample — доля запросов, чьи записи пишутся (1.0 — все); rate — записей
+    в секунду на правило, 0 — без лимита.
+    """
+
+    def __init__(self, sample: float = 1.0, rate: float = 0.0) -> None:
+        self.sample = sample
+        self.rate = rate
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def sampled(self, request: Optional[str]) -> bool:
+        if self.sample >= 1.0:
+            return True
+        if request is None:
+            return random.random() < self.sample
+        # crc32, а не hash(): одна выборка во всех воркерах
+        return zlib.crc32(request.encode()) / 0xFFFFFFFF < self.sample
+
+    def allow(self, now: Optional[float] = None) -> bool:
+        if self.rate <= 0:
+            return True
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            elapsed = max(0.0, now - self._updated)
+            self._tokens = min(self.rate, self._tokens + elapsed * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class ContextFilter(logging.Filter):
+    """Приклеивает id запроса и принципала и применяет правила."""
+
+    def __init__(self, rules: Optional[Mapping[str, LogRule]] = None) -> None:
+        super().__init__()
+        # длинные префиксы раньше: sqlalchemy.engine.Engine точнее sqlalchemy
+        self.rules = sorted(
+            (rules or {}).items(), key=lambda item: len(item[0]), reverse=True
+        )
+
+    def _rule(self, name: str) -> Optional[LogRule]:
+        for prefix, rule in self.rules:
+            if name == prefix or name.startswith(prefix + "."):
+                return rule
+        return None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        record.principal_id = principal_id.get()
+        if record.levelno >= logging.WARNING:
+            return True
+        rule = self._rule(record.name)
+        if rule is None:
+            return True
+        if not rule.sampled(record.request_id):
+            DROPPED.labels("sampled").inc()
+            return False
+        if not rule.allow():
+            DROPPED.labels("rate_limited").inc()
+            return False
+        return True
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # в потоке вызова — только то, что нельзя отложить: аргументы могут
+        # измениться, трейсбек живёт до выхода из except. JSON — в фоне
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _TRACEBACKS.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED.labels("queue_full").inc()
+
+
+class _QueueListener(QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # очередь может быть полна: ждём, пока поток записи её разберёт
+        self.queue.put(self._sentinel)
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in _CONTEXT:
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        for key, value in vars(record).items():
+            if key not in _RESERVED and key not in _CONTEXT and key not in entry:
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class LogPipeline:
+    """Очередь, фильтр контекста и фоновый поток записи в stream."""
+
+    def __init__(
+        self,
+        stream: Optional[IO[str]] = None,
+        queue_size: int = 10_000,
+        rules: Optional[Mapping[str, LogRule]] = None,
+        formatter: Optional[logging.Formatter] = None,
+    ) -> None:
+        self.queue: queue.Queue = queue.Queue(queue_size)
+        self.handler = _QueueHandler(self.queue)
+        self.handler.addFilter(ContextFilter(rules))
+        output = logging.StreamHandler(sys.stdout if stream is None else stream)
+        output.setFormatter(formatter or JsonFormatter())
+        self.listener = _QueueListener(self.queue, output)
+        self._started = False
+
+    def start(self) -> None:
+        if not self._started:
+            self.listener.start()
+            self._started = True
+
+    def stop(self) -> None:
+        """Дописывает очередь и останавливает поток."""
+        if self._started:
+            self.listener.stop()
+            self._started = False
+
+
+_pipeline: Optional[LogPipeline] = None
+
+
+def configure(
+    level: str = "INFO",
+    fmt: str = "json",
+    queue_size: int = 10_000,
+    sql: bool = False,
+    sample: Optional[Mapping[str, float]] = None,
+    rate: Optional[Mapping[str, float]] = None,
+) -> LogPipeline:
+    """
+    Ставит конвейер обработчиком корневого логгера (повторный вызов меняет
+    его) и переводит на него логи uvicorn. sql — SQL-лог SQLAlchemy (бывший
+    echo=True); sample и rate — правила по префиксам имён логгеров.
+    """
+    global _pipeline
+    sample, rate = sample or {}, rate or {}
+    rules = {
+        prefix: LogRule(sample.get(prefix, 1.0), rate.get(prefix, 0.0))
+        for prefix in {*sample, *rate}
+    }
+    formatter = (
+        JsonFormatter()
+        if fmt == "json"
+        else logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    )
+    pipeline = LogPipeline(queue_size=queue_size, rules=rules, formatter=formatter)
+
+    root = logging.getLogger()
+    if _pipeline is not None:
+        root.removeHandler(_pipeline.handler)
+        _pipeline.stop()
+    root.addHandler(pipeline.handler)
+    root.setLevel(level.upper())
+    for name in _UVICORN:
+        logger = logging.getLogger(name)
+        logger.handlers.clear()
+        logger.propagate = True
+    logging.getLogger("sqlalchemy.engine").setLevel(
+        logging.INFO if sql else logging.WARNING
+    )
+    pipeline.start()
+    _pipeline = pipeline
+    return pipeline
+
+
+def shutdown() -> None:
+    global _pipeline
+    if _pipeline is not None:
+        logging.getLogger().removeHandler(_pipeline.handler)
+        _pipeline.stop()
+        _pipeline = None
+
+
+atexit.register(shutdown)
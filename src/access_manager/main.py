@@ -1,47 +1,101 @@
 # src/access_manager/main.py
 
+import asyncio
+import logging
 import time
+from contextlib import asynccontextmanager
 from datetime import timedelta
-from typing import Annotated
+from typing import Annotated, Optional
+from uuid import uuid4
 
 import psutil
-from fastapi import Depends, FastAPI, HTTPException, Request, Response, status
+from fastapi import (
+    APIRouter,
+    Depends,
+    FastAPI,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.access_manager import crud, schemas, security
-from src.access_manager.core.config import settings
-from src.access_manager.db import get_db
-from src.access_manager.models import User as UserModel
-
-app = FastAPI(title="Access Manager API")
+from src.access_manager import (
+    admission,
+    changes,
+    coalesce,
+    counters,
+    crud,
+    db,
+    expiry,
+    instrumentation,
+    logs,
+    principal_cache,
+    query_observer,
+    ratelimit,
+    replica,
+    schemas,
+    security,
+    snapshot,
+    snapshot_store,
+)
+from src.access_manager.core.config import Settings, get_settings
+from src.access_manager.db import get_db, get_shards
+from src.access_manager.models import Permission as PermissionModel
+from src.access_manager.models import Role as RoleModel
+from src.access_manager.principal import Principal
+from src.access_manager.sharding import ShardSet, sum_counts
 
-origins = ["http://localhost:3000"]
+logger = logging.getLogger("access_manager.main")
 
+# Эндпоинты собираются в роутер при импорте; приложение, middleware, движок
+# и прогрев — в create_app() и его lifespan.
+router = APIRouter(route_class=instrumentation.InstrumentedRoute)
 
-# Middleware для логирования времени запросов
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    response.headers["X-Process-Time"] = str(process_time)
-    return response
+origins = ["http://localhost:3000"]
 
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+_REQUEST_ID_MAX = 128
+
+
+def _timing_middleware(profiler: Optional[instrumentation.SamplingProfiler]):
+    # X-Process-Time + Server-Timing с разбивкой на БД / auth / сериализацию,
+    # плюс детектор N+1 по запросу
+    async def add_process_time_header(request: Request, call_next):
+        # id запроса — из X-Request-ID прокси или свой; попадает в каждую
+        # запись лога этого запроса (logs.py)
+        rid = request.headers.get("X-Request-ID", "")[:_REQUEST_ID_MAX] or uuid4().hex
+        logs.request_id.set(rid)
+        timings = instrumentation.start_request()
+        query_observer.start_request()
+        profile = profiler.start() if profiler is not None else None
+        label = f"{request.method} {request.url.path}"
+        start_time = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            process_time = time.perf_counter() - start_time
+            if profile is not None:
+                profile.finish(process_time, label)
+            query_observer.finish_request(label)
+        response.headers["X-Request-ID"] = rid
+        response.headers["X-Process-Time"] = str(process_time)
+        response.headers["Server-Timing"] = timings.server_timing(process_time)
+        timings.observe(process_time)
+        return response
+
+    return add_process_time_header
 
 
 # Health Check Endpoint
-@app.get("/health")
+@router.get("/health")
 async def health_check(db: AsyncSession = Depends(get_db)):
     """
     Проверка здоровья сервиса и его зависимостей.
@@ -84,20 +138,41 @@ async def health_check(db: AsyncSession = Depends(get_db)):
     except Exception as e:
         health_status["checks"]["resources"] = {"status": "unhealthy", "error": str(e)}
 
+    # Edge-реплика: отставание от основной установки
+    if replica.replica.enabled:
+        fresh = replica.replica.fresh()
+        health_status["checks"]["replica"] = {
+            "status": "healthy" if fresh else "stale",
+            "version": replica.replica.version,
+            "staleness": replica.replica.staleness(),
+        }
+        if not fresh:
+            health_status["status"] = "degraded"
+
     status_code = 200 if health_status["status"] in ["healthy", "degraded"] else 503
     return Response(content=str(health_status), status_code=status_code)
 
 
-@app.get("/metrics")
-async def get_metrics(db: AsyncSession = Depends(get_db)):
+@router.get("/metrics")
+async def get_metrics(
+    db: AsyncSession = Depends(get_db),
+    shards: ShardSet = Depends(get_shards),
+):
     """
     Метрики для мониторинга Prometheus.
     """
     try:
-        # Получение базовых метрик
-        users_count = await crud.get_users_count(db)
-        roles_count = await crud.get_roles_count(db)
-        permissions_count = await crud.get_permissions_count(db)
+        # Получение базовых метрик (поддерживаемые счётчики, запрос на шард).
+        # Итоги по всей установке: метка на арендатора при тысячах арендаторов
+        # раздула бы кардинальность; итоги арендатора — в X-Total-Count
+        per_shard = await shards.each(db, crud.get_counts, None)
+        # пользователи — сумма по шардам, каталог — из основной БД
+        counts = dict(per_shard[0])
+        for name in _USER_COUNTERS:
+            counts[name] = sum(shard[name] for shard in per_shard)
+        users_count = counts[counters.USERS]
+        roles_count = counts[counters.ROLES]
+        permissions_count = counts[counters.PERMISSIONS]
 
         # Системные метрики
         cpu_usage = psutil.cpu_percent(interval=0.1)
@@ -108,6 +183,14 @@ async def get_metrics(db: AsyncSession = Depends(get_db)):
 # TYPE access_manager_users_total gauge
 access_manager_users_total {users_count}
 
+# HELP access_manager_users_active_total Number of active users
+# TYPE access_manager_users_active_total gauge
+access_manager_users_active_total {counts[counters.USERS_ACTIVE]}
+
+# HELP access_manager_users_superuser_total Number of superusers
+# TYPE access_manager_users_superuser_total gauge
+access_manager_users_superuser_total {counts[counters.USERS_SUPERUSER]}
+
 # HELP access_manager_roles_total Total number of roles
 # TYPE access_manager_roles_total gauge
 access_manager_roles_total {roles_count}
@@ -127,9 +210,12 @@ access_manager_memory_usage_percent {memory.percent}
 # HELP access_manager_disk_usage_percent Disk usage percentage
 # TYPE access_manager_disk_usage_percent gauge
 access_manager_disk_usage_percent {disk.percent}
+
 """
 
-        return metrics
+        # Гистограммы Server-Timing (instrumentation) из реестра prometheus_client
+        metrics += generate_latest().decode()
+        return Response(content=metrics, media_type=CONTENT_TYPE_LATEST)
 
     except Exception as e:
         raise HTTPException(
@@ -138,6 +224,29 @@ access_manager_disk_usage_percent {disk.percent}
         )
 
 
+_USER_COUNTERS = (counters.USERS, counters.USERS_ACTIVE, counters.USERS_SUPERUSER)
+
+
+def _keyset_page(items: list, limit: int) -> dict:
+    # Полная страница — возможно, есть продолжение
+    next_after = items[-1].id if len(items) == limit else None
+    return {"items": items, "next_after": next_after}
+
+
+def _set_total_count(response: Response, total: Optional[int]) -> None:
+    # None — фильтр не покрыт счётчиками, COUNT(*) ради заголовка не делаем
+    if total is not None:
+        response.headers["X-Total-Count"] = str(total)
+
+
+def _in_request_order(ids: list[int], rows) -> dict:
+    # повторы id в запросе повторяются и в ответе
+    found = {row.id: row for row in rows}
+    items = [found.get(i) for i in ids]
+    missing = [i for i, item in zip(ids, items) if item is None]
+    return {"items": items, "missing": missing}
+
+
 # --------------------------------------
 #   AUTH: получение и проверка токена
 # --------------------------------------
@@ -148,13 +257,35 @@ class TokenResponse(schemas.BaseModel):
     token_type: str = "bearer"
 
 
-@app.post("/login/token", response_model=TokenResponse)
+@router.post("/login/token", response_model=TokenResponse)
 async def login_for_access_token(
+    request: Request,
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+    tenant_id: int = Depends(security.get_request_tenant),
     db: AsyncSession = Depends(get_db),
+    shards: ShardSet = Depends(get_shards),
 ):
-    user = await crud.get_user_by_username(db, form_data.username)
-    if not user or not security.verify_password(
+    # лимит — до БД и bcrypt: отклонённая попытка не стоит раунда хэширования.
+    # IP за прокси — из X-Forwarded-For через uvicorn --proxy-headers
+    client_ip = request.client.host if request.client else "unknown"
+    retry_after = await ratelimit.login_limiter.check(
+        db, tenant_id, form_data.username, client_ip
+    )
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    # шард по имени не вычислить — спрашиваем все одновременно
+    found = await shards.each(
+        db, crud.get_user_by_username, tenant_id, form_data.username
+    )
+    user = next((user for user in found if user is not None), None)
+    if user is None:
+        security.dummy_verify()
+    if user is None or not security.verify_password(
         form_data.password, user.hashed_password
     ):
         raise HTTPException(
@@ -162,10 +293,11 @@ async def login_for_access_token(
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    await ratelimit.login_limiter.succeeded(db, tenant_id, form_data.username)
 
-    expires = timedelta(minutes=settings.access_token_expire_minutes)
+    expires = timedelta(minutes=get_settings().access_token_expire_minutes)
     token = security.create_access_token(
-        data={"sub": str(user.id)}, expires_delta=expires
+        data={"sub": str(user.id), "tid": user.tenant_id}, expires_delta=expires
     )
     return {"access_token": token, "token_type": "bearer"}
 
@@ -175,18 +307,40 @@ async def login_for_access_token(
 # --------------------------------------
 
 
-@app.post(
+@router.post(
     "/register", response_model=schemas.UserRead, status_code=status.HTTP_201_CREATED
 )
 async def register_new_user(
     payload: schemas.UserCreate,
+    tenant_id: int = Depends(security.get_request_tenant),
     db: AsyncSession = Depends(get_db),
+    shards: ShardSet = Depends(get_shards),
 ):
     """
-    Регистрация нового пользователя.
+    Регистрация нового пользователя в арендаторе из X-Tenant-ID.
     Доступно без аутентификации.
     """
-    return await crud.create_user(db, payload)
+    return await _create_user(db, shards, tenant_id, payload)
+
+
+_USER_CONFLICT = "User with given username or email already exists."
+
+
+async def _create_user(
+    db: AsyncSession, shards: ShardSet, tenant_id: int, payload: schemas.UserCreate
+):
+    if shards.single:
+        return await crud.create_user(db, tenant_id, payload)
+    # уникальные индексы действуют внутри шарда; между шардами — проверка
+    # до записи (две одновременные регистрации одного имени она не разведёт)
+    taken = await shards.each(
+        db, crud.user_conflict, tenant_id, payload.username, payload.email
+    )
+    if any(taken):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, _USER_CONFLICT)
+    user_id = await shards.allocate_user_id(db)
+    async with shards.user_session(db, user_id) as session:
+        return await crud.create_user(session, tenant_id, payload, user_id=user_id)
 
 
 # --------------------------------------
@@ -194,89 +348,255 @@ async def register_new_user(
 # --------------------------------------
 
 
-@app.get("/users/me", response_model=schemas.UserRead)
+@router.get("/users/me", response_model=schemas.UserRead)
 async def read_users_me(
-    current_user: UserModel = Depends(security.get_current_active_user),
+    current_user: Principal = Depends(security.get_current_active_user),
+    db: AsyncSession = Depends(get_db),
+    shards: ShardSet = Depends(get_shards),
 ):
     """
     Информация о текущем аутентифицированном и активном пользователе.
+    Авторизации хватает принципала; полный пользователь с ролями нужен
+    только ответу и загружается здесь.
     """
-    return current_user
+    async with shards.user_session(db, current_user.id) as session:
+        user = await coalesce.users.do(
+            (current_user.tenant_id, current_user.id),
+            crud.get_user,
+            session,
+            current_user.tenant_id,
+            current_user.id,
+        )
+    if user is None:
+        # удалён между проверкой токена и загрузкой
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
 
 
-@app.post(
+@router.post(
     "/users/", response_model=schemas.UserRead, status_code=status.HTTP_201_CREATED
 )
 async def create_user(
     payload: schemas.UserCreate,
-    current_user: UserModel = Depends(security.require_permission("create_user")),
+    current_user: Principal = Depends(security.require_permission("users:create")),
     db: AsyncSession = Depends(get_db),
+    shards: ShardSet = Depends(get_shards),
 ):
     """
     Создание нового пользователя.
-    Требуется разрешение "create_user".
+    Требуется разрешение "users:create".
     """
-    return await crud.create_user(db, payload)
+    return await _create_user(db, shards, current_user.tenant_id, payload)
 
 
-@app.get("/users/{user_id}", response_model=schemas.UserRead)
+@router.get("/users/batch", response_model=schemas.UserBatch)
+async def read_users_batch(
+    query: Annotated[schemas.IdList, Query()],
+    current_user: Principal = Depends(security.require_permission("users:read")),
+    db: AsyncSession = Depends(get_db),
+    shards: ShardSet = Depends(get_shards),
+):
+    """
+    Пользователи по списку id (`?ids=1,2,3`) одним запросом на шард.
+    Ответ — в порядке id, null и `missing` на месте не найденных.
+    Требуется разрешение "users:read".
+    """
+    users = await shards.by_users(
+        db, query.ids, crud.get_users_by_ids, current_user.tenant_id
+    )
+    return _in_request_order(query.ids, users)
+
+
+@router.post("/users/batch", response_model=schemas.UserBatch)
+async def read_users_batch_post(
+    payload: schemas.IdList,
+    current_user: Principal = Depends(security.require_permission("users:read")),
+    db: AsyncSession = Depends(get_db),
+    shards: ShardSet = Depends(get_shards),
+):
+    """То же, что GET /users/batch, для списков, не влезающих в URL."""
+    users = await shards.by_users(
+        db, payload.ids, crud.get_users_by_ids, current_user.tenant_id
+    )
+    return _in_request_order(payload.ids, users)
+
+
+@router.get("/users/{user_id}", response_model=schemas.UserRead)
 async def read_user(
     user_id: int,
-    current_user: UserModel = Depends(security.require_permission("read_user")),
+    current_user: Principal = Depends(
+        security.require_permission_on("users:read", "user", "user_id")
+    ),
     db: AsyncSession = Depends(get_db),
+    shards: ShardSet = Depends(get_shards),
 ):
     """
     Получение пользователя по ID.
-    Требуется разрешение "read_user".
+    Требуется разрешение "users:read" — глобально или грантом на этот объект.
     """
-    user = await crud.get_user(db, user_id)
+    async with shards.user_session(db, user_id) as session:
+        user = await coalesce.users.do(
+            (current_user.tenant_id, user_id),
+            crud.get_user,
+            session,
+            current_user.tenant_id,
+            user_id,
+        )
     if not user:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
     return user
 
 
-@app.get("/users/", response_model=list[schemas.UserRead])
+@router.get("/users/", response_model=list[schemas.UserRead])
 async def read_users(
-    current_user: UserModel = Depends(security.require_permission("read_user")),
-    skip: int = 0,
-    limit: int = 100,
+    filters: Annotated[schemas.UserFilter, Query()],
+    response: Response,
+    current_user: Principal = Depends(security.require_permission("users:read")),
     db: AsyncSession = Depends(get_db),
+    shards: ShardSet = Depends(get_shards),
 ):
     """
-    Список пользователей.
-    Требуется разрешение "read_user".
+    Список пользователей с фильтрами по username/email (prefix или contains),
+    is_active, is_superuser, role_id и диапазону created_at.
+    X-Total-Count отдаётся без фильтров или с одним из is_active/is_superuser.
+    Требуется разрешение "users:read".
     """
-    return await crud.get_users(db, skip, limit)
+    tenant_id = current_user.tenant_id
+    counts = await shards.each(db, crud.get_users_count, tenant_id, filters)
+    _set_total_count(response, sum_counts(counts))
+    if shards.single:
+        return await crud.get_users(db, tenant_id, filters.skip, filters.limit, filters)
+    # skip — по общему порядку id: у каждого шарда первые skip + limit
+    window = filters.skip + filters.limit
+    users = await shards.merge(
+        db, window, crud.get_users, tenant_id, 0, window, filters
+    )
+    return users[filters.skip :]
 
 
-@app.put("/users/{user_id}", response_model=schemas.UserRead)
+@router.put("/users/{user_id}", response_model=schemas.UserRead)
 async def update_user(
     user_id: int,
     payload: schemas.UserUpdate,
-    current_user: UserModel = Depends(security.require_permission("update_user")),
+    current_user: Principal = Depends(
+        security.require_permission_on("users:update", "user", "user_id")
+    ),
     db: AsyncSession = Depends(get_db),
+    shards: ShardSet = Depends(get_shards),
 ):
     """
     Обновление пользователя по ID.
-    Требуется разрешение "update_user".
+    Требуется разрешение "users:update" — глобально или грантом на этот объект.
     """
-    user = await crud.update_user(db, user_id, payload)
+    tenant_id = current_user.tenant_id
+    if not shards.single and (payload.username or payload.email):
+        taken = await shards.each(
+            db, crud.user_conflict, tenant_id, payload.username, payload.email, user_id
+        )
+        if any(taken):
+            raise HTTPException(
+                status.HTTP_400_BAD_REQUEST, "Update conflict: fields must be unique."
+            )
+    async with shards.user_session(db, user_id) as session:
+        user = await crud.update_user(session, tenant_id, user_id, payload)
+    principal_cache.cache.discard([(tenant_id, user_id)])
     if not user:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
     return user
 
 
-@app.delete("/users/{user_id}", response_model=schemas.UserRead)
+@router.get("/users/{user_id}/roles", response_model=list[schemas.RoleAssignmentRead])
+async def read_user_role_assignments(
+    user_id: int,
+    current_user: Principal = Depends(
+        security.require_permission_on("users:read", "user", "user_id")
+    ),
+    db: AsyncSession = Depends(get_db),
+    shards: ShardSet = Depends(get_shards),
+):
+    """
+    Назначения ролей пользователя со сроками действия.
+    Требуется разрешение "users:read" — глобально или грантом на этот объект.
+    """
+    async with shards.user_session(db, user_id) as session:
+        links = await crud.get_role_assignments(
+            session, current_user.tenant_id, user_id
+        )
+    if links is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
+    return links
+
+
+@router.post("/users/{user_id}/roles", response_model=schemas.RoleAssignmentRead)
+async def assign_user_role(
+    user_id: int,
+    payload: schemas.RoleAssignment,
+    current_user: Principal = Depends(
+        security.require_permission_on("users:update", "user", "user_id")
+    ),
+    db: AsyncSession = Depends(get_db),
+    shards: ShardSet = Depends(get_shards),
+):
+    """
+    Назначение роли — бессрочное или на срок [valid_from, valid_until)
+    (например, временные права на время инцидента); повторное назначение
+    меняет срок. В срок роль перестаёт действовать сама.
+    Требуется разрешение "users:update" — глобально или грантом на этот объект.
+    """
+    async with shards.user_session(db, user_id) as session:
+        link = await crud.assign_role(session, current_user.tenant_id, user_id, payload)
+    principal_cache.cache.discard([(current_user.tenant_id, user_id)])
+    if link is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
+    expiry.scheduler.start(db.bind)
+    expiry.scheduler.notify(link.valid_from, link.valid_until)
+    return link
+
+
+@router.delete(
+    "/users/{user_id}/roles/{role_id}", response_model=schemas.RoleAssignmentRead
+)
+async def revoke_user_role(
+    user_id: int,
+    role_id: int,
+    current_user: Principal = Depends(
+        security.require_permission_on("users:update", "user", "user_id")
+    ),
+    db: AsyncSession = Depends(get_db),
+    shards: ShardSet = Depends(get_shards),
+):
+    """
+    Снятие роли с пользователя.
+    Требуется разрешение "users:update" — глобально или грантом на этот объект.
+    """
+    async with shards.user_session(db, user_id) as session:
+        link = await crud.revoke_role(session, current_user.tenant_id, user_id, role_id)
+    principal_cache.cache.discard([(current_user.tenant_id, user_id)])
+    if link is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Role assignment not found")
+    return link
+
+
+@router.delete("/users/{user_id}", response_model=schemas.UserRead)
 async def delete_user(
     user_id: int,
-    current_user: UserModel = Depends(security.require_permission("delete_user")),
+    current_user: Principal = Depends(
+        security.require_permission_on("users:delete", "user", "user_id")
+    ),
     db: AsyncSession = Depends(get_db),
+    shards: ShardSet = Depends(get_shards),
 ):
     """
     Удаление пользователя по ID.
-    Требуется разрешение "delete_user".
+    Требуется разрешение "users:delete" — глобально или грантом на этот объект.
     """
-    user = await crud.delete_user(db, user_id)
+    async with shards.user_session(db, user_id) as session:
+        user = await crud.delete_user(session, current_user.tenant_id, user_id)
+    principal_cache.cache.discard([(current_user.tenant_id, user_id)])
     if not user:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
     return user
@@ -287,164 +607,696 @@ async def delete_user(
 # --------------------------------------
 
 
-@app.post(
+@router.post(
     "/roles/", response_model=schemas.RoleRead, status_code=status.HTTP_201_CREATED
 )
 async def create_role(
     payload: schemas.RoleCreate,
-    current_user: UserModel = Depends(security.require_permission("create_role")),
+    current_user: Principal = Depends(security.require_permission("roles:create")),
     db: AsyncSession = Depends(get_db),
+    shards: ShardSet = Depends(get_shards),
 ):
     """
     Создание роли.
-    Требуется разрешение "create_role".
+    Требуется разрешение "roles:create".
     """
-    return await crud.create_role(db, payload)
+    role = await crud.create_role(db, current_user.tenant_id, payload)
+    await shards.replicate(db, RoleModel, [role.id])
+    return role
 
 
-@app.get("/roles/{role_id}", response_model=schemas.RoleRead)
+@router.get("/roles/batch", response_model=schemas.RoleBatch)
+async def read_roles_batch(
+    query: Annotated[schemas.IdList, Query()],
+    current_user: Principal = Depends(security.require_permission("roles:read")),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Роли по списку id (`?ids=1,2,3`) одним запросом.
+    Ответ — в порядке id, null и `missing` на месте не найденных.
+    Требуется разрешение "roles:read".
+    """
+    roles = await crud.get_roles_by_ids(db, current_user.tenant_id, query.ids)
+    return _in_request_order(query.ids, roles)
+
+
+@router.post("/roles/batch", response_model=schemas.RoleBatch)
+async def read_roles_batch_post(
+    payload: schemas.IdList,
+    current_user: Principal = Depends(security.require_permission("roles:read")),
+    db: AsyncSession = Depends(get_db),
+):
+    """То же, что GET /roles/batch, для списков, не влезающих в URL."""
+    roles = await crud.get_roles_by_ids(db, current_user.tenant_id, payload.ids)
+    return _in_request_order(payload.ids, roles)
+
+
+@router.get("/roles/{role_id}", response_model=schemas.RoleRead)
 async def read_role(
     role_id: int,
-    current_user: UserModel = Depends(security.require_permission("read_role")),
+    current_user: Principal = Depends(
+        security.require_permission_on("roles:read", "role", "role_id")
+    ),
     db: AsyncSession = Depends(get_db),
 ):
     """
     Получение роли по ID.
-    Требуется разрешение "read_role".
+    Требуется разрешение "roles:read" — глобально или грантом на этот объект.
     """
-    role = await crud.get_role(db, role_id)
+    role = await coalesce.roles.do(
+        (current_user.tenant_id, role_id),
+        crud.get_role,
+        db,
+        current_user.tenant_id,
+        role_id,
+    )
     if not role:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Role not found")
     return role
 
 
-@app.get("/roles/", response_model=list[schemas.RoleRead])
+@router.get("/roles/", response_model=list[schemas.RoleRead])
 async def read_roles(
-    current_user: UserModel = Depends(security.require_permission("read_role")),
-    skip: int = 0,
-    limit: int = 100,
+    filters: Annotated[schemas.NameFilter, Query()],
+    response: Response,
+    current_user: Principal = Depends(security.require_permission("roles:read")),
     db: AsyncSession = Depends(get_db),
 ):
     """
-    Список ролей.
-    Требуется разрешение "read_role".
+    Список ролей с поиском по имени (prefix или contains).
+    Требуется разрешение "roles:read".
     """
-    return await crud.get_roles(db, skip, limit)
+    _set_total_count(
+        response, await crud.get_roles_count(db, current_user.tenant_id, filters)
+    )
+    return await crud.get_roles(
+        db, current_user.tenant_id, filters.skip, filters.limit, filters
+    )
 
 
-@app.put("/roles/{role_id}", response_model=schemas.RoleRead)
+@router.put("/roles/{role_id}", response_model=schemas.RoleRead)
 async def update_role(
     role_id: int,
     payload: schemas.RoleUpdate,
-    current_user: UserModel = Depends(security.require_permission("update_role")),
+    current_user: Principal = Depends(
+        security.require_permission_on("roles:update", "role", "role_id")
+    ),
     db: AsyncSession = Depends(get_db),
+    shards: ShardSet = Depends(get_shards),
 ):
     """
     Обновление роли по ID.
-    Требуется разрешение "update_role".
+    Требуется разрешение "roles:update" — глобально или грантом на этот объект.
     """
-    role = await crud.update_role(db, role_id, payload)
+    role = await crud.update_role(db, current_user.tenant_id, role_id, payload)
+    principal_cache.cache.discard_role(role_id)
     if not role:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Role not found")
+    await shards.replicate(db, RoleModel, [role.id])
     return role
 
 
-@app.delete("/roles/{role_id}", response_model=schemas.RoleRead)
+@router.delete("/roles/{role_id}", response_model=schemas.RoleRead)
 async def delete_role(
     role_id: int,
-    current_user: UserModel = Depends(security.require_permission("delete_role")),
+    current_user: Principal = Depends(
+        security.require_permission_on("roles:delete", "role", "role_id")
+    ),
     db: AsyncSession = Depends(get_db),
+    shards: ShardSet = Depends(get_shards),
 ):
     """
     Удаление роли по ID.
-    Требуется разрешение "delete_role".
+    Требуется разрешение "roles:delete" — глобально или грантом на этот объект.
     """
-    role = await crud.delete_role(db, role_id)
+    role = await crud.delete_role(db, current_user.tenant_id, role_id)
+    principal_cache.cache.discard_role(role_id)
     if not role:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Role not found")
+    await shards.replicate(db, RoleModel, [role.id])
     return role
 
 
+@router.get("/roles/{role_id}/users", response_model=schemas.UserPage)
+async def read_role_users(
+    role_id: int,
+    current_user: Principal = Depends(security.require_permission("users:read")),
+    after: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    shards: ShardSet = Depends(get_shards),
+):
+    """
+    Пользователи, которым назначена роль (keyset-пагинация по id).
+    Требуется разрешение "users:read".
+    """
+    users = await shards.merge(
+        db,
+        limit,
+        crud.get_users_by_role,
+        current_user.tenant_id,
+        role_id,
+        after,
+        limit,
+    )
+    if not users and not await crud.exists(
+        db, current_user.tenant_id, RoleModel, role_id
+    ):
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Role not found")
+    return _keyset_page(users, limit)
+
+
+@router.get("/roles/{role_id}/grants", response_model=list[schemas.ScopedGrantRead])
+async def read_role_grants(
+    role_id: int,
+    current_user: Principal = Depends(security.require_permission("roles:read")),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Гранты роли на конкретные объекты.
+    Требуется разрешение "roles:read".
+    """
+    grants = await crud.get_scoped_grants(db, current_user.tenant_id, role_id)
+    if not grants and not await crud.exists(
+        db, current_user.tenant_id, RoleModel, role_id
+    ):
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Role not found")
+    return grants
+
+
+@router.post(
+    "/roles/{role_id}/grants",
+    response_model=schemas.ScopedGrantRead,
+    status_code=status.HTTP_201_CREATED,
+)
+async def create_role_grant(
+    role_id: int,
+    payload: schemas.ScopedGrantCreate,
+    current_user: Principal = Depends(security.require_permission("roles:update")),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Выдача роли разрешения на объект: (permission_id, resource_type,
+    resource_id); без resource_id — на все объекты типа.
+    Требуется разрешение "roles:update".
+    """
+    grant = await crud.create_scoped_grant(db, current_user.tenant_id, role_id, payload)
+    if not grant:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Permission not found")
+    # закэшированные отказы по этому объекту больше не верны
+    security.decision_cache.clear(current_user.tenant_id)
+    return grant
+
+
+@router.delete(
+    "/roles/{role_id}/grants/{grant_id}", response_model=schemas.ScopedGrantRead
+)
+async def delete_role_grant(
+    role_id: int,
+    grant_id: int,
+    current_user: Principal = Depends(security.require_permission("roles:update")),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Отзыв гранта на объект.
+    Требуется разрешение "roles:update".
+    """
+    grant = await crud.delete_scoped_grant(
+        db, current_user.tenant_id, role_id, grant_id
+    )
+    if not grant:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Grant not found")
+    # отозванный грант не должен дожить в кэше решений до конца ttl
+    security.decision_cache.clear(current_user.tenant_id)
+    return grant
+
+
 # --------------------------------------
 #   PERMISSION эндпоинты
 # --------------------------------------
 
 
-@app.post(
+@router.post(
     "/permissions/",
     response_model=schemas.PermissionRead,
     status_code=status.HTTP_201_CREATED,
 )
 async def create_permission(
     payload: schemas.PermissionCreate,
-    current_user: UserModel = Depends(security.require_permission("create_permission")),
+    current_user: Principal = Depends(
+        security.require_permission("permissions:create")
+    ),
     db: AsyncSession = Depends(get_db),
+    shards: ShardSet = Depends(get_shards),
 ):
     """
     Создание разрешения.
-    Требуется разрешение "create_permission".
+    Требуется разрешение "permissions:create".
     """
-    return await crud.create_permission(db, payload)
+    perm = await crud.create_permission(db, current_user.tenant_id, payload)
+    await shards.replicate(db, PermissionModel, [perm.id])
+    return perm
 
 
-@app.get("/permissions/{perm_id}", response_model=schemas.PermissionRead)
+@router.get("/permissions/batch", response_model=schemas.PermissionBatch)
+async def read_permissions_batch(
+    query: Annotated[schemas.IdList, Query()],
+    current_user: Principal = Depends(security.require_permission("permissions:read")),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Разрешения по списку id (`?ids=1,2,3`) одним запросом.
+    Ответ — в порядке id, null и `missing` на месте не найденных.
+    Требуется разрешение "permissions:read".
+    """
+    permissions = await crud.get_permissions_by_ids(
+        db, current_user.tenant_id, query.ids
+    )
+    return _in_request_order(query.ids, permissions)
+
+
+@router.post("/permissions/batch", response_model=schemas.PermissionBatch)
+async def read_permissions_batch_post(
+    payload: schemas.IdList,
+    current_user: Principal = Depends(security.require_permission("permissions:read")),
+    db: AsyncSession = Depends(get_db),
+):
+    """То же, что GET /permissions/batch, для списков, не влезающих в URL."""
+    permissions = await crud.get_permissions_by_ids(
+        db, current_user.tenant_id, payload.ids
+    )
+    return _in_request_order(payload.ids, permissions)
+
+
+@router.get("/permissions/{perm_id}", response_model=schemas.PermissionRead)
 async def read_permission(
     perm_id: int,
-    current_user: UserModel = Depends(security.require_permission("read_permission")),
+    current_user: Principal = Depends(
+        security.require_permission_on("permissions:read", "permission", "perm_id")
+    ),
     db: AsyncSession = Depends(get_db),
 ):
     """
     Получение разрешения по ID.
-    Требуется разрешение "read_permission".
+    Требуется разрешение "permissions:read" — глобально или грантом на этот объект.
     """
-    perm = await crud.get_permission(db, perm_id)
+    perm = await coalesce.permissions.do(
+        (current_user.tenant_id, perm_id),
+        crud.get_permission,
+        db,
+        current_user.tenant_id,
+        perm_id,
+    )
     if not perm:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Permission not found")
     return perm
 
 
-@app.get("/permissions/", response_model=list[schemas.PermissionRead])
+@router.get("/permissions/", response_model=list[schemas.PermissionRead])
 async def read_permissions(
-    current_user: UserModel = Depends(security.require_permission("read_permission")),
-    skip: int = 0,
-    limit: int = 100,
+    filters: Annotated[schemas.NameFilter, Query()],
+    response: Response,
+    current_user: Principal = Depends(security.require_permission("permissions:read")),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Список разрешений с поиском по имени (prefix или contains).
+    Требуется разрешение "permissions:read".
+    """
+    _set_total_count(
+        response, await crud.get_permissions_count(db, current_user.tenant_id, filters)
+    )
+    return await crud.get_permissions(
+        db, current_user.tenant_id, filters.skip, filters.limit, filters
+    )
+
+
+@router.get("/permissions/{perm_id}/roles", response_model=schemas.RolePage)
+async def read_permission_roles(
+    perm_id: int,
+    current_user: Principal = Depends(security.require_permission("roles:read")),
+    after: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Роли, выдающие разрешение — само или wildcard над ним, `users:*` для
+    `users:read` (keyset-пагинация по id).
+    Требуется разрешение "roles:read".
+    """
+    roles = await crud.get_roles_by_permission(
+        db, current_user.tenant_id, perm_id, after, limit
+    )
+    if not roles and not await crud.exists(
+        db, current_user.tenant_id, PermissionModel, perm_id
+    ):
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Permission not found")
+    return _keyset_page(roles, limit)
+
+
+@router.get("/permissions/{perm_id}/users", response_model=schemas.UserPage)
+async def read_permission_users(
+    perm_id: int,
+    current_user: Principal = Depends(security.require_permission("users:read")),
+    after: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
     db: AsyncSession = Depends(get_db),
+    shards: ShardSet = Depends(get_shards),
 ):
     """
-    Список разрешений.
-    Требуется разрешение "read_permission".
+    Пользователи, у которых разрешение есть хотя бы через одну роль, в том
+    числе через wildcard — как решает require_permission (keyset-пагинация
+    по id).
+    Требуется разрешение "users:read".
     """
-    return await crud.get_permissions(db, skip, limit)
+    users = await shards.merge(
+        db,
+        limit,
+        crud.get_users_by_permission,
+        current_user.tenant_id,
+        perm_id,
+        after,
+        limit,
+    )
+    if not users and not await crud.exists(
+        db, current_user.tenant_id, PermissionModel, perm_id
+    ):
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Permission not found")
+    return _keyset_page(users, limit)
 
 
-@app.put("/permissions/{perm_id}", response_model=schemas.PermissionRead)
+@router.put("/permissions/{perm_id}", response_model=schemas.PermissionRead)
 async def update_permission(
     perm_id: int,
     payload: schemas.PermissionUpdate,
-    current_user: UserModel = Depends(security.require_permission("update_permission")),
+    current_user: Principal = Depends(
+        security.require_permission_on("permissions:update", "permission", "perm_id")
+    ),
     db: AsyncSession = Depends(get_db),
+    shards: ShardSet = Depends(get_shards),
 ):
     """
     Обновление разрешения по ID.
-    Требуется разрешение "update_permission".
+    Требуется разрешение "permissions:update" — глобально или грантом на этот объект.
     """
-    perm = await crud.update_permission(db, perm_id, payload)
+    perm = await crud.update_permission(db, current_user.tenant_id, perm_id, payload)
+    # переименование меняет смысл грантов на объекты
+    security.decision_cache.clear(current_user.tenant_id)
+    principal_cache.cache.clear(current_user.tenant_id)
     if not perm:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Permission not found")
+    await shards.replicate(db, PermissionModel, [perm.id])
     return perm
 
 
-@app.delete("/permissions/{perm_id}", response_model=schemas.PermissionRead)
+@router.delete("/permissions/{perm_id}", response_model=schemas.PermissionRead)
 async def delete_permission(
     perm_id: int,
-    current_user: UserModel = Depends(security.require_permission("delete_permission")),
+    current_user: Principal = Depends(
+        security.require_permission_on("permissions:delete", "permission", "perm_id")
+    ),
     db: AsyncSession = Depends(get_db),
+    shards: ShardSet = Depends(get_shards),
 ):
     """
     Удаление разрешения по ID.
-    Требуется разрешение "delete_permission".
+    Требуется разрешение "permissions:delete" — глобально или грантом на этот объект.
     """
-    perm = await crud.delete_permission(db, perm_id)
+    perm = await crud.delete_permission(db, current_user.tenant_id, perm_id)
+    security.decision_cache.clear(current_user.tenant_id)
+    principal_cache.cache.clear(current_user.tenant_id)
     if not perm:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Permission not found")
+    await shards.replicate(db, PermissionModel, [perm.id])
     return perm
+
+
+# --------------------------------------
+#   ЛЕНТА ИЗМЕНЕНИЙ (SSE)
+# --------------------------------------
+
+# разрешение на чтение -> типы событий, которые с ним видны
+_CHANGE_TYPES = {
+    "users:read": ("user",),
+    "roles:read": ("role", "grant"),
+    "permissions:read": ("permission",),
+}
+
+# keep-alive комментарий, чтобы прокси не закрывали простаивающий поток
+_HEARTBEAT_SECONDS = 15.0
+
+
+@router.get("/changes")
+async def stream_changes(
+    current_user: Principal = Depends(security.require_permission(*_CHANGE_TYPES)),
+    last_event_id: Optional[int] = Header(None, ge=0),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Поток изменений (Server-Sent Events): событие `change` с
+    {seq, type, id, op}. Поздно закоммиченное событие приходит не по порядку
+    seq, поэтому id события — точка возобновления, а не seq. Переподключение
+    с Last-Event-ID досылает пропущенное (события могут повториться); если
+    журнал уже очищен — событие `reset`, и клиент перечитывает состояние
+    целиком.
+    Видны типы, на чтение которых есть разрешение ("users:read" и т.п.).
+    """
+    types = [
+        entity_type
+        for permission, entity_types in _CHANGE_TYPES.items()
+        if security.has_permission(current_user, permission)
+        for entity_type in entity_types
+    ]
+    await changes.feed.start(db.bind)
+    subscription = changes.feed.subscribe(
+        current_user.tenant_id, types, last_event_id, heartbeat=_HEARTBEAT_SECONDS
+    )
+
+    async def events():
+        try:
+            async for change in subscription:
+                yield ": keep-alive\n\n" if change is None else change.sse
+        except changes.ResyncRequired:
+            yield "event: reset\ndata: {}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/sync", response_model=schemas.SyncPage)
+async def sync_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=10_000),
+    current_user: Principal = Depends(security.require_permission(*_CHANGE_TYPES)),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Дельта-синхронизация: строки, созданные или изменённые после версии
+    `since`, и удалённые (`deleted`). `since=0` — полный снимок. Следующий
+    запрос — с `since` из `version` ответа; пока `has_more`, догрузка не
+    закончена. 410 — журнал за этот период уже очищен, синхронизация
+    начинается заново с 0. Типы — как у /changes, по разрешениям на чтение.
+    """
+    types = [
+        entity_type
+        for permission, entity_types in _CHANGE_TYPES.items()
+        if security.has_permission(current_user, permission)
+        for entity_type in entity_types
+    ]
+    upto = await changes.settled_version(db, get_settings().sync_settle_seconds)
+    return await crud.get_changes_since(
+        db, current_user.tenant_id, since, upto, types, limit
+    )
+
+
+@router.get(
+    "/snapshot",
+    response_class=Response,
+    responses={200: {"content": {snapshot.MEDIA_TYPE: {}}}, 304: {}},
+)
+async def get_snapshot(
+    current_user: Principal = Depends(security.require_permission(*_CHANGE_TYPES)),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Весь RBAC-граф арендатора одним бинарным блоком (формат — snapshot.py)
+    для авторизации на edge-узлах. Снимок собран заранее и обновляется в
+    фоне; сильный ETag позволяет перезапрашивать его с If-None-Match.
+    Нужны разрешения на чтение пользователей, ролей и разрешений разом.
+    """
+    if not all(security.has_permission(current_user, p) for p in _CHANGE_TYPES):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Permissions {tuple(_CHANGE_TYPES)} required",
+        )
+    snapshot_store.store.start(db.bind)
+    encoded = await snapshot_store.store.get(db, current_user.tenant_id)
+    headers = {"ETag": encoded.etag, "X-RBAC-Version": str(encoded.version)}
+    if if_none_match is not None and (
+        if_none_match.strip() == "*"
+        or encoded.etag in (tag.strip() for tag in if_none_match.split(","))
+    ):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(encoded.data, media_type=snapshot.MEDIA_TYPE, headers=headers)
+
+
+# --------------------------------------
+#   ПРИЛОЖЕНИЕ: фабрика и lifespan
+# --------------------------------------
+
+
+async def warmup(app: FastAPI, settings: Settings) -> None:
+    """
+    Разовые расходы первых запросов — до приёма трафика: соединения пула,
+    backend bcrypt и JWT (в потоке, параллельно с пулом), OpenAPI-схема и,
+    по настройке, кэши авторизации.
+    """
+    start = time.perf_counter()
+    engine = db.get_engine()
+    await asyncio.gather(
+        db.warm_pool(engine, settings.db_pool_size),
+        asyncio.to_thread(security.warmup),
+    )
+    app.openapi()
+    if settings.warmup_authz_cache and security.authz_cache_preloaders:
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            for preload in security.authz_cache_preloaders:
+                await preload(session)
+    logger.info("warmup finished in %.1f ms", (time.perf_counter() - start) * 1000)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings = get_settings()
+    engine = db.get_engine()
+    try:
+        if replica.replica.enabled:
+            await replica.replica.prepare(engine)
+        if settings.warmup_enabled:
+            await warmup(app, settings)
+        # копии каталога на шардах могли отстать (сбой между записью и
+        # копированием) — сверяем до приёма трафика
+        async with AsyncSession(engine) as session:
+            await db.get_shards().sync_catalog(session)
+        await changes.feed.start(engine)
+        principal_cache.checkpointer.start(engine)
+        snapshot_store.store.start(engine)
+        await replica.replica.start(engine)
+        if not replica.replica.enabled:
+            # на реплике сроки назначений применяет основная установка
+            expiry.scheduler.start(engine)
+        yield
+    finally:
+        await replica.replica.stop()
+        # до ленты: последний checkpoint пишется с её курсором
+        await principal_cache.checkpointer.stop()
+        await changes.feed.stop()
+        await snapshot_store.store.stop()
+        await expiry.scheduler.stop()
+        await db.dispose_engine()
+
+
+def create_app() -> FastAPI:
+    """
+    Собирает приложение. uvicorn: `--factory src.access_manager.main:create_app`.
+    """
+    settings = get_settings()
+    logs.configure(
+        level=settings.log_level,
+        fmt=settings.log_format,
+        queue_size=settings.log_queue_size,
+        sql=settings.log_sql,
+        sample=settings.log_sample,
+        rate=settings.log_rate_limits,
+    )
+    app = FastAPI(title="Access Manager API", lifespan=lifespan)
+
+    profiler = (
+        instrumentation.SamplingProfiler(
+            threshold=settings.profiler_threshold_ms / 1000,
+            interval=settings.profiler_interval_ms / 1000,
+            sample_rate=settings.profiler_sample_rate,
+            output_dir=settings.profiler_output_dir,
+        )
+        if settings.profiler_enabled
+        else None
+    )
+    app.middleware("http")(_timing_middleware(profiler))
+    # снаружи таймингов, но под CORS: браузер должен прочитать 503
+    app.add_middleware(admission.AdmissionMiddleware, limiter=admission.limiter)
+    # запись на реплике отклоняется до лимита: она не стоит места в нём
+    app.add_middleware(replica.ReplicaMiddleware, replica=replica.replica)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        # браузерному клиенту нужен доступ к итогу списка
+        expose_headers=["X-Total-Count"],
+    )
+    app.include_router(router)
+
+    security.decision_cache.ttl = settings.authz_decision_ttl_seconds
+    security.decision_cache.max_users = settings.authz_decision_cache_users
+    changes.feed.poll_interval = settings.change_feed_poll_interval_seconds
+    changes.feed.retention = settings.change_log_retention_hours * 3600
+    changes.feed.resize(settings.change_feed_buffer_size)
+    snapshot_store.store.refresh_interval = settings.snapshot_refresh_interval_seconds
+    snapshot_store.store.settle = settings.sync_settle_seconds
+    ratelimit.login_limiter.enabled = settings.login_rate_limit_enabled
+    ratelimit.login_limiter.backend = (
+        ratelimit.DatabaseBuckets()
+        if settings.login_rate_limit_backend == "database"
+        else ratelimit.MemoryBuckets()
+    )
+    ratelimit.login_limiter.per_user = ratelimit.Rate(
+        settings.login_attempts_per_user, settings.login_user_window_seconds
+    )
+    ratelimit.login_limiter.per_ip = ratelimit.Rate(
+        settings.login_attempts_per_ip, settings.login_ip_window_seconds
+    )
+    admission.limiter.enabled = settings.concurrency_limit_enabled
+    admission.limiter.min_limit = settings.concurrency_min_limit
+    admission.limiter.max_limit = settings.concurrency_max_limit
+    admission.limiter.target_latency = settings.concurrency_target_latency_ms / 1000
+    admission.limiter.retry_after = settings.concurrency_retry_after_seconds
+    admission.limiter.reset(settings.concurrency_initial_limit)
+    expiry.scheduler.reload_interval = settings.role_expiry_reload_interval_seconds
+    expiry.scheduler.batch_size = settings.role_expiry_batch_size
+    # при шардировании лента не видит журналы шардов — кэш выключен
+    principal_cache.checkpointer.enabled = (
+        settings.principal_cache_enabled and not settings.shard_dsns
+    )
+    principal_cache.checkpointer.path = settings.authz_checkpoint_path
+    principal_cache.checkpointer.interval = settings.authz_checkpoint_interval_seconds
+    principal_cache.checkpointer.max_age = settings.authz_checkpoint_max_age_seconds
+    principal_cache.cache.max_users = settings.principal_cache_users
+    principal_cache.cache.ttl = settings.principal_cache_ttl_seconds
+    replica.replica.enabled = settings.replica_enabled
+    replica.replica.primary_url = settings.replica_primary_url
+    replica.replica.username = settings.replica_username
+    replica.replica.password = settings.replica_password
+    replica.replica.tenant_id = settings.replica_tenant_id
+    replica.replica.interval = settings.replica_sync_interval_seconds
+    replica.replica.max_staleness = settings.replica_max_staleness_seconds
+    replica.replica.proxy_writes = settings.replica_proxy_writes
+    return app
+
+
+_app: Optional[FastAPI] = None
+
+
+def __getattr__(name: str):
+    # `src.access_manager.main:app` (uvicorn без --factory, тесты) — приложение
+    # собирается при первом обращении, а не при импорте модуля
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,49 +1,150 @@
+from datetime import datetime, timezone
+
 from sqlalchemy import (
+    DDL,
+    BigInteger,
     Boolean,
     Column,
     DateTime,
+    Float,
     ForeignKey,
+    Index,
     Integer,
     MetaData,
+    Sequence,
     String,
     Table,
+    and_,
+    bindparam,
+    event,
     func,
+    or_,
 )
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+from sqlalchemy.sql.functions import FunctionElement
 
 # Общее метаданные
 metadata = MetaData()
 
-# Таблицы ассоциаций
+# Арендатор (tenant) — непрозрачный номер клиента, выдаётся снаружи. Все
+# сущности живут внутри арендатора; crud принимает его явным аргументом.
+# Строки, созданные в обход crud (фикстуры, загрузчики), по умолчанию
+# попадают в арендатора 1 — однотенантная установка работает как раньше.
+DEFAULT_TENANT_ID = 1
+
+# Глобальная версия: номер события журнала изменений (change_log.seq).
+# crud ставит её в version каждой записываемой строки и в seq события,
+# так что «изменения после версии N» — это version > N плюс удаления из
+# журнала с seq > N. Строки, созданные в обход crud, имеют version 0.
+VERSION_SEQUENCE = Sequence("rbac_version_seq", metadata=metadata)
+
+# Таблицы ассоциаций.
+# Строки связей удаляет сама БД (ON DELETE CASCADE), поэтому у relationship
+# стоит passive_deletes — ORM не подгружает коллекции ради DELETE.
+# Своего tenant_id у связей нет: crud связывает только строки одного
+# арендатора, и связь принадлежит арендатору своих концов.
 user_roles = Table(
     "user_roles",
     metadata,
-    Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
-    Column("role_id", Integer, ForeignKey("roles.id"), primary_key=True),
+    Column(
+        "user_id",
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column(
+        "role_id",
+        Integer,
+        ForeignKey("roles.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    # срок назначения (наивное UTC, как остальные даты); NULL — без границы.
+    # Действует при valid_from <= now < valid_until; истёкшие строки удаляет
+    # expiry.ExpiryScheduler
+    Column("valid_from", DateTime, nullable=True),
+    Column("valid_until", DateTime, nullable=True),
+    # PK ведёт с user_id — для «пользователей с ролью R» нужен обратный индекс
+    Index("ix_user_roles_role_id_user_id", "role_id", "user_id"),
+    # ближайшие сроки для планировщика: истечения и вступления в силу
+    Index("ix_user_roles_valid_until", "valid_until"),
+    Index("ix_user_roles_valid_from", "valid_from"),
 )
 
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def link_in_force(now):
+    """Связь user_roles действует в момент now (наивное UTC)."""
+    c = user_roles.c
+    return and_(
+        or_(c.valid_from.is_(None), c.valid_from <= now),
+        or_(c.valid_until.is_(None), c.valid_until > now),
+    )
+
+
 role_permissions = Table(
     "role_permissions",
     metadata,
-    Column("role_id", Integer, ForeignKey("roles.id"), primary_key=True),
-    Column("permission_id", Integer, ForeignKey("permissions.id"), primary_key=True),
+    Column(
+        "role_id",
+        Integer,
+        ForeignKey("roles.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column(
+        "permission_id",
+        Integer,
+        ForeignKey("permissions.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Index("ix_role_permissions_permission_id_role_id", "permission_id", "role_id"),
 )
 
 
+class statement_time(FunctionElement):
+    """
+    Время выполнения оператора. На Postgres — clock_timestamp(): now() там
+    время начала транзакции.
+    """
+
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(statement_time)
+def _compile_statement_time(element, compiler, **kw) -> str:
+    return "CURRENT_TIMESTAMP"
+
+
+@compiles(statement_time, "postgresql")
+def _compile_statement_time_pg(element, compiler, **kw) -> str:
+    return "clock_timestamp()"
+
+
 class Base(DeclarativeBase):
     metadata = metadata
 
 
 class User(Base):
     __tablename__ = "users"
+    # уникальность — внутри арендатора; индексы ведут с tenant_id
+    __table_args__ = (
+        Index("uq_users_tenant_id_username", "tenant_id", "username", unique=True),
+        Index("uq_users_tenant_id_email", "tenant_id", "email", unique=True),
+        Index("ix_users_tenant_id_id", "tenant_id", "id"),
+        # /sync: изменения арендатора после версии N
+        Index("ix_users_tenant_id_version", "tenant_id", "version"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
-    username: Mapped[str] = mapped_column(
-        String(100), unique=True, index=True, nullable=False
-    )
-    email: Mapped[str] = mapped_column(
-        String(255), unique=True, index=True, nullable=False
+    tenant_id: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=DEFAULT_TENANT_ID
     )
+    username: Mapped[str] = mapped_column(String(100), nullable=False)
+    email: Mapped[str] = mapped_column(String(255), nullable=False)
     hashed_password: Mapped[str] = mapped_column(String(255), nullable=False)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     is_superuser: Mapped[bool] = mapped_column(Boolean, default=False)
@@ -51,9 +152,26 @@ class User(Base):
     updated_at: Mapped[DateTime] = mapped_column(
         DateTime, default=func.now(), onupdate=func.now()
     )
+    # см. VERSION_SEQUENCE
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
 
     roles: Mapped[list["Role"]] = relationship(
-        "Role", secondary=user_roles, back_populates="users"
+        "Role", secondary=user_roles, back_populates="users", passive_deletes=True
+    )
+    # только действующие назначения, как их видит авторизация: ответы API
+    # читают роли отсюда. Время подставляется при каждом запросе
+    # (callable_), а не при сборке маппинга; запись связей — через roles
+    active_roles: Mapped[list["Role"]] = relationship(
+        "Role",
+        secondary=user_roles,
+        primaryjoin=lambda: and_(
+            User.id == user_roles.c.user_id,
+            link_in_force(
+                bindparam("role_link_now", callable_=_utcnow, type_=DateTime)
+            ),
+        ),
+        secondaryjoin=lambda: Role.id == user_roles.c.role_id,
+        viewonly=True,
     )
 
     def __repr__(self) -> str:
@@ -62,22 +180,33 @@ class User(Base):
 
 class Role(Base):
     __tablename__ = "roles"
+    __table_args__ = (
+        Index("uq_roles_tenant_id_name", "tenant_id", "name", unique=True),
+        Index("ix_roles_tenant_id_id", "tenant_id", "id"),
+        Index("ix_roles_tenant_id_version", "tenant_id", "version"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
-    name: Mapped[str] = mapped_column(
-        String(100), unique=True, index=True, nullable=False
+    tenant_id: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=DEFAULT_TENANT_ID
     )
+    name: Mapped[str] = mapped_column(String(100), nullable=False)
     description: Mapped[str | None] = mapped_column(String(255), nullable=True)
     created_at: Mapped[DateTime] = mapped_column(DateTime, default=func.now())
     updated_at: Mapped[DateTime] = mapped_column(
         DateTime, default=func.now(), onupdate=func.now()
     )
+    # см. VERSION_SEQUENCE
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
 
     users: Mapped[list[User]] = relationship(
-        "User", secondary=user_roles, back_populates="roles"
+        "User", secondary=user_roles, back_populates="roles", passive_deletes=True
     )
     permissions: Mapped[list["Permission"]] = relationship(
-        "Permission", secondary=role_permissions, back_populates="roles"
+        "Permission",
+        secondary=role_permissions,
+        back_populates="roles",
+        passive_deletes=True,
     )
 
     def __repr__(self) -> str:
@@ -86,20 +215,210 @@ class Role(Base):
 
 class Permission(Base):
     __tablename__ = "permissions"
+    __table_args__ = (
+        Index("uq_permissions_tenant_id_name", "tenant_id", "name", unique=True),
+        Index("ix_permissions_tenant_id_id", "tenant_id", "id"),
+        Index("ix_permissions_tenant_id_version", "tenant_id", "version"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
-    name: Mapped[str] = mapped_column(
-        String(100), unique=True, index=True, nullable=False
+    tenant_id: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=DEFAULT_TENANT_ID
     )
+    name: Mapped[str] = mapped_column(String(100), nullable=False)
     description: Mapped[str | None] = mapped_column(String(255), nullable=True)
     created_at: Mapped[DateTime] = mapped_column(DateTime, default=func.now())
     updated_at: Mapped[DateTime] = mapped_column(
         DateTime, default=func.now(), onupdate=func.now()
     )
+    # см. VERSION_SEQUENCE
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
 
     roles: Mapped[list[Role]] = relationship(
-        "Role", secondary=role_permissions, back_populates="permissions"
+        "Role",
+        secondary=role_permissions,
+        back_populates="permissions",
+        passive_deletes=True,
     )
 
     def __repr__(self) -> str:
         return f"<Permission(id={self.id}, name='{self.name}')>"
+
+
+class ScopedGrant(Base):
+    """
+    Разрешение роли на конкретный объект: (permission, resource_type,
+    resource_id). resource_id = NULL — на все объекты этого типа.
+    """
+
+    __tablename__ = "scoped_grants"
+    __table_args__ = (
+        # проверка идёт от объекта: «какие роли что могут с user 42»
+        Index(
+            "ix_scoped_grants_resource",
+            "tenant_id",
+            "resource_type",
+            "resource_id",
+            "role_id",
+        ),
+        Index(
+            "uq_scoped_grants_role_permission_resource",
+            "role_id",
+            "permission_id",
+            "resource_type",
+            "resource_id",
+            unique=True,
+        ),
+        Index("ix_scoped_grants_tenant_id_version", "tenant_id", "version"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    tenant_id: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=DEFAULT_TENANT_ID
+    )
+    role_id: Mapped[int] = mapped_column(
+        ForeignKey("roles.id", ondelete="CASCADE"), nullable=False
+    )
+    permission_id: Mapped[int] = mapped_column(
+        ForeignKey("permissions.id", ondelete="CASCADE"), nullable=False
+    )
+    resource_type: Mapped[str] = mapped_column(String(50), nullable=False)
+    resource_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    created_at: Mapped[DateTime] = mapped_column(DateTime, default=func.now())
+    # см. VERSION_SEQUENCE
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
+    permission: Mapped[Permission] = relationship("Permission")
+
+    def __repr__(self) -> str:
+        return (
+            f"<ScopedGrant(role_id={self.role_id}, permission_id="
+            f"{self.permission_id}, {self.resource_type}:{self.resource_id})>"
+        )
+
+
+class EntityCount(Base):
+    """
+    Поддерживаемые счётчики сущностей: crud меняет их в той же транзакции,
+    что и сами строки (см. counters.py), чтобы не считать COUNT(*) на запрос.
+    Ключ — (арендатор, имя счётчика).
+    """
+
+    __tablename__ = "entity_counts"
+
+    tenant_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    value: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
+    def __repr__(self) -> str:
+        return (
+            f"<EntityCount(tenant_id={self.tenant_id}, name='{self.name}', "
+            f"value={self.value})>"
+        )
+
+
+class ChangeLogEntry(Base):
+    """
+    Журнал изменений для ленты /changes: crud пишет строку в той же
+    транзакции, что и саму запись (см. changes.py). seq — глобальный
+    возрастающий номер события; старые события удаляются диапазоном seq.
+    """
+
+    __tablename__ = "change_log"
+    __table_args__ = (
+        # догрузка пропущенного при возобновлении: события арендатора после N
+        Index("ix_change_log_tenant_id_seq", "tenant_id", "seq"),
+        # без AUTOINCREMENT SQLite переиспользует номера после очистки журнала
+        {"sqlite_autoincrement": True},
+    )
+
+    seq: Mapped[int] = mapped_column(
+        BigInteger().with_variant(Integer, "sqlite"),
+        VERSION_SEQUENCE,
+        primary_key=True,
+    )
+    tenant_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    entity_type: Mapped[str] = mapped_column(String(20), nullable=False)
+    entity_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    op: Mapped[str] = mapped_column(String(10), nullable=False)
+    # время оператора, а не начала транзакции: по нему changes.finished_seq
+    # отделяет номера завершённых транзакций от ещё идущих
+    created_at: Mapped[DateTime] = mapped_column(
+        DateTime, nullable=False, default=statement_time()
+    )
+
+    def __repr__(self) -> str:
+        return (
+            f"<ChangeLogEntry(seq={self.seq}, {self.op} "
+            f"{self.entity_type}:{self.entity_id})>"
+        )
+
+
+class LoginBucket(Base):
+    """
+    Корзина токенов ограничителя входа, общая для всех воркеров (бэкенд
+    database, см. ratelimit.py). Время — секунды эпохи с часов воркера.
+    """
+
+    __tablename__ = "login_buckets"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    tokens: Mapped[float] = mapped_column(Float, nullable=False)
+    updated_at: Mapped[float] = mapped_column(Float, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<LoginBucket(key='{self.key}', tokens={self.tokens:.2f})>"
+
+
+# ----------------------
+# Индексы под фильтры списков
+# ----------------------
+#
+# Поиск по имени/email регистронезависимый: crud сравнивает lower(column)
+# через LIKE, поэтому индексы строятся по тому же выражению.
+#   • prefix   → btree (tenant_id, lower(column)) с varchar_pattern_ops (на
+#                Postgres обычный btree не обслуживает LIKE 'abc%' при не-C
+#                collation);
+#   • contains → GIN pg_trgm, создаётся только на Postgres. Целочисленный
+#                tenant_id в GIN без btree_gin не положить — арендатор
+#                фильтруется после битмапа.
+# На SQLite (тесты) остаются обычные индексы по lower(column).
+
+
+def _search_indexes(table_name: str, column) -> None:
+    label = f"{column.key}_lower"
+    Index(
+        f"ix_{table_name}_{column.key}_lower_pattern",
+        column.table.c.tenant_id,
+        func.lower(column).label(label),
+        postgresql_ops={label: "varchar_pattern_ops"},
+    )
+    Index(
+        f"ix_{table_name}_{column.key}_lower_trgm",
+        func.lower(column).label(label),
+        postgresql_using="gin",
+        postgresql_ops={label: "gin_trgm_ops"},
+    ).ddl_if(dialect="postgresql")
+
+
+_search_indexes("users", User.__table__.c.username)
+_search_indexes("users", User.__table__.c.email)
+_search_indexes("roles", Role.__table__.c.name)
+_search_indexes("permissions", Permission.__table__.c.name)
+
+_users = User.__table__.c
+Index("ix_users_tenant_id_is_active_id", _users.tenant_id, _users.is_active, _users.id)
+Index(
+    "ix_users_tenant_id_is_superuser_id",
+    _users.tenant_id,
+    _users.is_superuser,
+    _users.id,
+)
+Index("ix_users_tenant_id_created_at", _users.tenant_id, _users.created_at)
+
+# gin_trgm_ops требует расширения pg_trgm до создания индексов
+event.listen(
+    metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
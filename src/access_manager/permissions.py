@@ -0,0 +1,213 @@
+# src/access_manager/permissions.py
+"""
+Иерархические имена разрешений и их сопоставление.
+
+Имя — сегменты через двоеточие: `users:read`, `billing:invoices:read`.
+Последний сегмент гранта может быть `*` — тогда грант покрывает всё
+поддерево: `users:*` даёт `users:read` и `users:roles:assign`, но не сам
+`users`; одиночный `*` даёт всё. Старые плоские имена (`export_reports`) —
+просто имена из одного сегмента.
+
+Гранты роли компилируются в префиксное дерево (PermissionMatcher), проверка
+идёт по сегментам запрошенного имени — O(глубины) при любом числе грантов.
+Скомпилированные деревья кэшируются по роли (RoleMatcherCache), решения по
+конкретным объектам — по пользователю (DecisionCache).
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+SEPARATOR = ":"
+WILDCARD = "*"
+
+# сегмент — непустой, без пробелов, `:` и `*`; `*` допустим только последним
+NAME_PATTERN = r"^[^:*\s]+(:[^:*\s]+)*(:\*)?$|^\*$"
+_NAME = re.compile(NAME_PATTERN)
+
+
+def is_valid_name(name: str) -> bool:
+    return _NAME.match(name) is not None
+
+
+def covering_grants(name: str) -> list[str]:
+    """
+    Гранты, дающие name: само имя, `<предок>:*` на каждом уровне выше и `*`.
+    `billing:invoices:read` → `*`, `billing:*`, `billing:invoices:*`, имя.
+    """
+    segments = name.split(SEPARATOR)
+    grants = {name, WILDCARD}
+    for depth in range(1, len(segments)):
+        grants.add(SEPARATOR.join(segments[:depth] + [WILDCARD]))
+    return sorted(grants)
+
+
+class _Node:
+    __slots__ = ("children", "terminal", "subtree")
+
+    def __init__(self) -> None:
+        self.children: dict[str, "_Node"] = {}
+        # грант ровно на этот путь
+        self.terminal = False
+        # грант `<путь>:*` — на всё, что глубже
+        self.subtree = False
+
+
+class PermissionMatcher:
+    """Скомпилированный набор грантов одной роли."""
+
+    __slots__ = ("_root",)
+
+    def __init__(self, grants: Iterable[str]) -> None:
+        self._root = _Node()
+        for grant in grants:
+            self._add(grant)
+
+    def _add(self, grant: str) -> None:
+        node = self._root
+        segments = grant.split(SEPARATOR)
+        for segment in segments[:-1]:
+            node = node.children.setdefault(segment, _Node())
+        last = segments[-1]
+        if last == WILDCARD:
+            node.subtree = True
+        else:
+            node.children.setdefault(last, _Node()).terminal = True
+
+    def allows(self, name: str) -> bool:
+        node = self._root
+        for segment in name.split(SEPARATOR):
+            if node.subtree:
+                return True
+            node = node.children.get(segment)
+            if node is None:
+                return False
+        return node.terminal
+
+
+class RoleMatcherCache:
+    """
+    LRU скомпилированных матчеров по id роли. Вместе с матчером хранится
+    набор грантов, из которого он собран: если у роли поменялись разрешения
+    (в том числе в другом воркере), набор не совпадёт и матчер пересоберётся —
+    явная инвалидация не нужна.
+    """
+
+    def __init__(self, maxsize: int = 4096) -> None:
+        self.maxsize = maxsize
+        self._entries: OrderedDict[int, tuple[frozenset, PermissionMatcher]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def get(self, role_id: int, grants: frozenset) -> PermissionMatcher:
+        with self._lock:
+            entry = self._entries.get(role_id)
+            # тот же объект — без сравнения по элементам
+            if entry is not None and (entry[0] is grants or entry[0] == grants):
+                self._entries.move_to_end(role_id)
+                return entry[1]
+        matcher = PermissionMatcher(grants)
+        with self._lock:
+            self._entries[role_id] = (grants, matcher)
+            self._entries.move_to_end(role_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return matcher
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class _UserDecisions:
+    __slots__ = ("roles", "expires", "decisions")
+
+    def __init__(self, roles: frozenset, expires: float) -> None:
+        self.roles = roles
+        self.expires = expires
+        self.decisions: dict[tuple, bool] = {}
+
+
+class DecisionCache:
+    """
+    Кэш решений по объектам (scoped grants) на пользователя. Запись
+    пользователя привязана к набору его ролей: сменились роли — записи нет.
+    Живёт ttl секунд — столько максимум видна чужая (другой воркер) отмена
+    гранта; изменения в своём процессе сбрасываются через clear(tenant_id),
+    не задевая остальных арендаторов.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 30.0,
+        max_users: int = 10_000,
+        max_decisions_per_user: int = 10_000,
+    ) -> None:
+        self.ttl = ttl
+        self.max_users = max_users
+        self.max_decisions_per_user = max_decisions_per_user
+        # ключ — (tenant_id, user_id)
+        self._users: OrderedDict[tuple[int, int], _UserDecisions] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(
+        self, user: tuple[int, int], roles: frozenset, now: float
+    ) -> _UserDecisions:
+        entry = self._users.get(user)
+        if entry is None or entry.roles != roles or entry.expires <= now:
+            entry = _UserDecisions(roles, now + self.ttl)
+            self._users[user] = entry
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        self._users.move_to_end(user)
+        return entry
+
+    def get_many(
+        self,
+        tenant_id: int,
+        user_id: int,
+        roles: frozenset,
+        keys: Iterable[tuple],
+        now: float,
+    ) -> dict[tuple, bool]:
+        """Известные решения из keys; отсутствующих ключей в ответе нет."""
+        with self._lock:
+            decisions = self._entry((tenant_id, user_id), roles, now).decisions
+            return {key: decisions[key] for key in keys if key in decisions}
+
+    def put_many(
+        self,
+        tenant_id: int,
+        user_id: int,
+        roles: frozenset,
+        decisions: dict[tuple, bool],
+        now: float,
+    ) -> None:
+        with self._lock:
+            entry = self._entry((tenant_id, user_id), roles, now)
+            if len(entry.decisions) + len(decisions) > self.max_decisions_per_user:
+                entry.decisions.clear()
+            entry.decisions.update(decisions)
+
+    def discard(self, users: Iterable[tuple[int, int]]) -> None:
+        """Сбрасывает решения пользователей — пар (tenant_id, user_id)."""
+        with self._lock:
+            for user in users:
+                self._users.pop(user, None)
+
+    def clear(self, tenant_id: Optional[int] = None) -> None:
+        """Сбрасывает решения арендатора (None — всех)."""
+        with self._lock:
+            if tenant_id is None:
+                self._users.clear()
+                return
+            for user in [user for user in self._users if user[0] == tenant_id]:
+                del self._users[user]
+
+    def __len__(self) -> int:
+        return len(self._users)
@@ -0,0 +1,165 @@
+# src/access_manager/policy.py
+"""
+Встраиваемая проверка разрешений по снимку RBAC-графа (GET /snapshot) —
+для сервисов, которым нужен ответ `has_permission(user_id, name)` в своём
+процессе, без сетевого вызова.
+
+Модуль не импортирует ни FastAPI, ни SQLAlchemy: только формат снимка
+(snapshot.py) и сопоставление имён (permissions.py) — то же дерево
+грантов, по которому решает security.has_permission, так что решения
+совпадают по построению (и общими тестами).
+
+    engine = PolicyEngine()
+    engine.fetch("https://rbac/snapshot", {"Authorization": "Bearer …"})
+    engine.has_permission(42, "users:read")
+
+Снимок разбирается в массивы (id по возрастанию, CSR-связи) и
+скомпилированные деревья грантов ролей; проверка — двоичный поиск
+пользователя и проход по дереву его ролей. Новый снимок собирается рядом
+и подменяет текущий одним присваиванием: читатели видят либо старый граф,
+либо новый целиком.
+"""
+
+import threading
+import urllib.error
+import urllib.request
+from array import array
+from bisect import bisect_left
+from typing import Mapping, Optional
+
+from src.access_manager.permissions import PermissionMatcher
+from src.access_manager.snapshot import ACTIVE, Snapshot, decode
+
+
+class PolicySnapshot:
+    """Неизменяемый граф одного снимка, готовый к проверкам."""
+
+    __slots__ = (
+        "tenant_id",
+        "version",
+        "_user_ids",
+        "_user_flags",
+        "_user_offsets",
+        "_user_roles",
+        "_role_matchers",
+    )
+
+    def __init__(self, snapshot: Snapshot) -> None:
+        self.tenant_id = snapshot.tenant_id
+        self.version = snapshot.version
+        self._user_ids: array = snapshot.user_ids
+        self._user_flags: bytes = snapshot.user_flags
+        self._user_offsets: array = snapshot.user_offsets
+        self._user_roles: array = snapshot.user_roles
+        names = snapshot.permission_names
+        offsets = snapshot.role_offsets
+        self._role_matchers = tuple(
+            PermissionMatcher(
+                names[p] for p in snapshot.role_permissions[offsets[i] : offsets[i + 1]]
+            )
+            for i in range(len(snapshot.role_ids))
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "PolicySnapshot":
+        return cls(decode(data))
+
+    def _position(self, user_id: int) -> int:
+        i = bisect_left(self._user_ids, user_id)
+        if i < len(self._user_ids) and self._user_ids[i] == user_id:
+            return i
+        return -1
+
+    def has_permission(self, user_id: int, *permission_names: str) -> bool:
+        """
+        Есть ли у пользователя хотя бы одно из разрешений — как
+        security.require_permission; неизвестный или неактивный
+        пользователь не может ничего.
+        """
+        i = self._position(user_id)
+        if i < 0 or not self._user_flags[i] & ACTIVE:
+            return False
+        matchers = self._role_matchers
+        for role in self._user_roles[self._user_offsets[i] : self._user_offsets[i + 1]]:
+            matcher = matchers[role]
+            for name in permission_names:
+                if matcher.allows(name):
+                    return True
+        return False
+
+    def __len__(self) -> int:
+        return len(self._user_ids)
+
+
+class PolicyEngine:
+    """
+    Текущий снимок и его подмена. Проверки не берут блокировок: ссылка на
+    снимок читается один раз за вызов. Снимок старее текущего не
+    принимается (ответ отставшей реплики, повтор старого файла).
+    """
+
+    def __init__(self, data: Optional[bytes] = None) -> None:
+        self._current: Optional[PolicySnapshot] = None
+        self._etag: Optional[str] = None
+        self._swap_lock = threading.Lock()
+        if data is not None:
+            self.load(data)
+
+    @property
+    def snapshot(self) -> Optional[PolicySnapshot]:
+        return self._current
+
+    @property
+    def version(self) -> Optional[int]:
+        current = self._current
+        return None if current is None else current.version
+
+    def load(self, data: bytes, force: bool = False) -> bool:
+        """Разбирает снимок и подменяет текущий; False — снимок не новее."""
+        candidate = PolicySnapshot.from_bytes(data)
+        with self._swap_lock:
+            current = self._current
+            if (
+                not force
+                and current is not None
+                and candidate.version < current.version
+            ):
+                return False
+            self._current = candidate
+            return True
+
+    def load_file(self, path: str, force: bool = False) -> bool:
+        with open(path, "rb") as f:
+            return self.load(f.read(), force=force)
+
+    def fetch(
+        self,
+        url: str,
+        headers: Optional[Mapping[str, str]] = None,
+        timeout: float = 10.0,
+    ) -> bool:
+        """
+        Загружает снимок с GET /snapshot с If-None-Match; True — снимок
+        подменён, False — не изменился. Блокирующий: из потока или таймера.
+        """
+        request = urllib.request.Request(url, headers=dict(headers or {}))
+        if self._etag is not None:
+            request.add_header("If-None-Match", self._etag)
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                data = response.read()
+                etag = response.headers.get("ETag")
+        except urllib.error.HTTPError as exc:
+            if exc.code == 304:
+                return False
+            raise
+        swapped = self.load(data)
+        if swapped:
+            self._etag = etag
+        return swapped
+
+    def has_permission(self, user_id: int, *permission_names: str) -> bool:
+        current = self._current
+        if current is None:
+            raise RuntimeError("no policy snapshot loaded")
+        return current.has_permission(user_id, *permission_names)
@@ -0,0 +1,61 @@
+# src/access_manager/principal.py
+"""
+Принципал запроса — то, что нужно авторизации, и ничего больше: id,
+арендатор, флаги и имена разрешений по ролям.
+
+Собирается crud.get_principal одним Core-запросом, имена разрешений
+агрегирует сама БД (array_agg / group_concat) — ни одного ORM-объекта,
+ничего в identity map сессии. Значение неизменяемое, поэтому его можно
+отдавать нескольким запросам сразу (coalesce.principals). Полный
+ORM-пользователь загружается только там, где он нужен ответу (/users/me).
+"""
+
+from typing import Iterable, Optional
+
+
+class Principal:
+    __slots__ = (
+        "id",
+        "tenant_id",
+        "is_active",
+        "is_superuser",
+        "roles",
+        "valid_until",
+        "matchers",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        tenant_id: int,
+        is_active: bool,
+        is_superuser: bool,
+        roles: Iterable[tuple[int, frozenset]] = (),
+        valid_until: Optional[float] = None,
+    ) -> None:
+        self.id = id
+        self.tenant_id = tenant_id
+        self.is_active = is_active
+        self.is_superuser = is_superuser
+        # (id роли, имена её разрешений) — матчеры кэшируются по роли
+        self.roles: tuple[tuple[int, frozenset], ...] = tuple(roles)
+        # unix-время ближайшего срока назначений (вступление в силу или
+        # истечение): после него набор ролей другой; None — сроков нет
+        self.valid_until = valid_until
+        # матчеры ролей по порядку roles; собирает has_permission при первой
+        # проверке — дальше проверка не сравнивает наборы грантов
+        self.matchers: Optional[tuple] = None
+
+    @property
+    def role_ids(self) -> frozenset:
+        return frozenset(role_id for role_id, _ in self.roles)
+
+    @property
+    def permission_names(self) -> frozenset:
+        return frozenset().union(*(names for _, names in self.roles))
+
+    def __repr__(self) -> str:
+        return (
+            f"Principal(id={self.id}, tenant_id={self.tenant_id}, "
+            f"roles={sorted(self.role_ids)})"
+        )
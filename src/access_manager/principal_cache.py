@@ -0,0 +1,421 @@
+# src/access_manager/principal_cache.py
+"""
+Кэш принципалов и checkpoint-файл для тёплого рестарта.
+
+Без кэша каждый запрос загружает принципал из БД (склеиваются только
+одновременные, coalesce.principals). PrincipalCache держит горячих
+принципалов процесса; записи сбрасывает лента изменений (changes.feed):
+событие пользователя — его запись, роли — всех с этой ролью, изменение
+или удаление разрешения — весь арендатор. Изменения своего процесса
+endpoint'ы сбрасывают сразу, не дожидаясь ленты, как decision_cache.
+ttl — страховка на случай, если лента встала. Запись принципала с
+назначением на срок живёт не дольше ближайшего срока (Principal.valid_until):
+роль вступает в силу или истекает во всех воркерах вовремя, не дожидаясь
+события планировщика (expiry.py).
+
+Checkpointer раз в interval пишет горячих принципалов в файл (формат —
+checkpoint.py) с версией журнала, на которую они актуальны. Новый воркер
+открывает файл через mmap и отвечает из него сразу, а в фоне сверяется с
+журналом: всё, что менялось после версии файла, из файла больше не
+отдаётся. Воркеры пода открывают один файл и делят его страницы; пишет
+тот, кто держит flock на `<path>.lock`.
+
+Лента видит журнал только основной БД, поэтому при шардировании
+(sharding.py) кэш не используется.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+from prometheus_client import Counter
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from src.access_manager import changes, crud
+from src.access_manager.checkpoint import Checkpoint, CheckpointError, encode
+from src.access_manager.models import ChangeLogEntry
+from src.access_manager.principal import Principal
+
+try:
+    import fcntl
+except ImportError:  # не POSIX: пишет каждый воркер, подмена файла атомарна
+    fcntl = None
+
+logger = logging.getLogger("access_manager.principal_cache")
+
+LOOKUPS = Counter(
+    "access_manager_principal_cache_lookups_total",
+    "Principal lookups by where they were answered",
+    ["source"],
+)
+
+
+class PrincipalCache:
+    """
+    Записи процесса (LRU с ttl) поверх необязательного checkpoint. Записи
+    checkpoint не копируются: сброшенное помечается множествами
+    пользователей, ролей и арендаторов, которым файл больше не верен.
+    """
+
+    def __init__(self, max_users: int = 10_000, ttl: float = 300.0) -> None:
+        self.enabled = False
+        self.max_users = max_users
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple[int, int], tuple[Principal, float]] = (
+            OrderedDict()
+        )
+        self._base: Optional[Checkpoint] = None
+        self._stale_users: set[tuple[int, int]] = set()
+        self._stale_roles: set[int] = set()
+        self._stale_tenants: set[int] = set()
+        # растёт при каждом сбросе: загрузка, начатая до сброса, не кэшируется
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    @property
+    def epoch(self) -> int:
+        return self._epoch
+
+    @property
+    def checkpoint(self) -> Optional[Checkpoint]:
+        return self._base
+
+    def get(
+        self, tenant_id: int, user_id: int, now: Optional[float] = None
+    ) -> Optional[Principal]:
+        if not self.enabled:
+            return None
+        now = time.monotonic() if now is None else now
+        key = (tenant_id, user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    LOOKUPS.labels("memory").inc()
+                    return entry[0]
+                del self._entries[key]
+            principal = self._from_base(key)
+        LOOKUPS.labels("miss" if principal is None else "checkpoint").inc()
+        return principal
+
+    def _from_base(self, key: tuple[int, int]) -> Optional[Principal]:
+        base = self._base
+        if base is None:
+            return None
+        if base.valid_until <= time.time():
+            self._detach()
+            return None
+        if key in self._stale_users or key[0] in self._stale_tenants:
+            return None
+        principal = base.principal(*key)
+        if principal is None or any(
+            role_id in self._stale_roles for role_id, _ in principal.roles
+        ):
+            return None
+        return principal
+
+    def put(
+        self, principal: Principal, epoch: int, now: Optional[float] = None
+    ) -> None:
+        """Кэширует загруженный принципал, если с epoch ничего не сбрасывалось."""
+        if not self.enabled:
+            return
+        now = time.monotonic() if now is None else now
+        key = (principal.tenant_id, principal.id)
+        expires = now + self.ttl
+        if principal.valid_until is not None:
+            # срок назначения раньше ttl: каждый воркер сбрасывает запись
+            # сам, не дожидаясь события планировщика по ленте
+            expires = min(expires, now + principal.valid_until - time.time())
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            self._entries[key] = (principal, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def discard(self, users: Iterable[tuple[int, int]]) -> None:
+        """Сбрасывает принципалов — пар (tenant_id, user_id)."""
+        with self._lock:
+            self._epoch += 1
+            for user in users:
+                self._entries.pop(user, None)
+                if self._base is not None:
+                    self._stale_users.add(user)
+
+    def discard_role(self, role_id: int) -> None:
+        with self._lock:
+            self._epoch += 1
+            for key, (principal, _) in list(self._entries.items()):
+                if any(rid == role_id for rid, _ in principal.roles):
+                    del self._entries[key]
+            if self._base is not None:
+                self._stale_roles.add(role_id)
+
+    def clear(self, tenant_id: Optional[int] = None) -> None:
+        """Сбрасывает принципалов арендатора (None — всех)."""
+        with self._lock:
+            self._epoch += 1
+            if tenant_id is None:
+                self._entries.clear()
+                self._detach()
+                return
+            for key in [key for key in self._entries if key[0] == tenant_id]:
+                del self._entries[key]
+            if self._base is not None:
+                self._stale_tenants.add(tenant_id)
+
+    def invalidate(self, change) -> None:
+        """Событие журнала (changes.Change или строка change_log)."""
+        if change.entity_type == "user":
+            self.discard([(change.tenant_id, change.entity_id)])
+        elif change.entity_type == "role":
+            self.discard_role(change.entity_id)
+        elif change.entity_type == "permission" and change.op != changes.CREATE:
+            self.clear(change.tenant_id)
+
+    def attach(self, checkpoint: Checkpoint) -> None:
+        with self._lock:
+            self._detach()
+            self._base = checkpoint
+
+    def detach(self) -> None:
+        with self._lock:
+            self._detach()
+
+    def _detach(self) -> None:
+        if self._base is not None:
+            self._base.close()
+        self._base = None
+        self._stale_users.clear()
+        self._stale_roles.clear()
+        self._stale_tenants.clear()
+
+    def hot(self, now: Optional[float] = None) -> list[Principal]:
+        """
+        До max_users принципалов для checkpoint: свежие записи процесса,
+        затем ещё верные записи открытого checkpoint.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            hot = {
+                key: principal
+                for key, (principal, expires) in reversed(self._entries.items())
+                if expires > now
+            }
+            if self._base is not None and self._base.valid_until > time.time():
+                for principal in self._base:
+                    if len(hot) >= self.max_users:
+                        break
+                    key = (principal.tenant_id, principal.id)
+                    if key not in hot and self._from_base(key) is not None:
+                        hot[key] = principal
+        return list(hot.values())[: self.max_users]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _replace(path: str, data: bytes) -> None:
+    # рядом и подменой: открытые map'ы других воркеров остаются на старом inode
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class Checkpointer:
+    """
+    Загрузка checkpoint на старте, сверка с журналом и периодическая запись.
+    max_age — предельный возраст файла; раньше него файл перестаёт быть
+    верным в ближайший срок назначения роли (user_roles.valid_from/until).
+    """
+
+    def __init__(
+        self,
+        cache: PrincipalCache,
+        path: str = "",
+        interval: float = 60.0,
+        max_age: float = 3600.0,
+        batch_size: int = 5_000,
+        feed: Optional[changes.ChangeFeed] = None,
+    ) -> None:
+        self.enabled = False
+        self.cache = cache
+        self.path = path
+        self.interval = interval
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.feed = changes.feed if feed is None else feed
+        self._lock_file = None
+        self._engine: Optional[AsyncEngine] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def load(self) -> bool:
+        """Открывает файл и подключает его к кэшу; False — файла нет или он негоден."""
+        if not self.path:
+            return False
+        try:
+            checkpoint = Checkpoint.open(self.path)
+        except FileNotFoundError:
+            return False
+        except (OSError, CheckpointError) as exc:
+            logger.warning("checkpoint %s ignored: %s", self.path, exc)
+            return False
+        if checkpoint.valid_until <= time.time():
+            checkpoint.close()
+            return False
+        self.cache.attach(checkpoint)
+        logger.info(
+            "checkpoint loaded: %d principal(s) at version %d",
+            len(checkpoint),
+            checkpoint.version,
+        )
+        return True
+
+    async def validate(self, db: AsyncSession) -> int:
+        """
+        Применяет к открытому checkpoint события журнала после его версии;
+        возвращает их число. Журнал очищен дальше версии — файл отключается.
+        """
+        base = self.cache.checkpoint
+        if base is None:
+            return 0
+        after = base.version
+        oldest = await changes.oldest_retained(db)
+        if oldest is not None and oldest > after + 1:
+            logger.info("checkpoint version %d is older than the change log", after)
+            self.cache.detach()
+            return 0
+        applied = 0
+        while True:
+            rows = (
+                await db.execute(
+                    select(
+                        ChangeLogEntry.seq,
+                        ChangeLogEntry.tenant_id,
+                        ChangeLogEntry.entity_type,
+                        ChangeLogEntry.entity_id,
+                        ChangeLogEntry.op,
+                    )
+                    .where(ChangeLogEntry.seq > after)
+                    .order_by(ChangeLogEntry.seq)
+                    .limit(self.batch_size)
+                )
+            ).all()
+            for row in rows:
+                self.cache.invalidate(row)
+            applied += len(rows)
+            if len(rows) < self.batch_size:
+                return applied
+            after = rows[-1].seq
+
+    def _acquire(self) -> bool:
+        # писатель один на под: первый, кто взял flock, держит его до stop()
+        if fcntl is None or self._lock_file is not None:
+            return True
+        lock_file = open(f"{self.path}.lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _release(self) -> None:
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    async def write(self, db: AsyncSession) -> bool:
+        """Пишет checkpoint; False — пишет другой воркер или писать нечего."""
+        if not self.path or not self.feed.running or not self._acquire():
+            return False
+        # до сбора записей: всё, что в журнале до этой версии, кэш уже видел
+        version = self.feed.watermark
+        principals = self.cache.hot()
+        created = time.time()
+        valid_until = created + self.max_age
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        deadlines = await crud.get_role_deadlines(
+            db, now + timedelta(seconds=self.max_age), 1, after=now
+        )
+        await db.commit()
+        if deadlines:
+            deadline = deadlines[0].replace(tzinfo=timezone.utc).timestamp()
+            valid_until = min(valid_until, deadline)
+        data = await asyncio.to_thread(
+            encode, version, created, valid_until, principals
+        )
+        await asyncio.to_thread(_replace, self.path, data)
+        return True
+
+    def start(self, engine: AsyncEngine) -> None:
+        """
+        Включает кэш: подключает файл и ленту, сверку и запись — в фоне.
+        Лента должна быть запущена; повторный вызов — no-op.
+        """
+        if not self.enabled or self.running:
+            return
+        self._engine = engine
+        self.load()
+        self.feed.add_listener(self.cache.invalidate)
+        self.cache.enabled = True
+        self._task = asyncio.create_task(self._run(), name="principal-checkpoint")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # последний checkpoint — для следующего старта
+        try:
+            async with AsyncSession(self._engine) as db:
+                await self.write(db)
+        except Exception:
+            logger.exception("checkpoint write failed")
+        self.feed.remove_listener(self.cache.invalidate)
+        self.cache.enabled = False
+        self.cache.detach()
+        self._release()
+
+    async def _run(self) -> None:
+        try:
+            async with AsyncSession(self._engine) as db:
+                applied = await self.validate(db)
+            if self.cache.checkpoint is not None:
+                logger.info("checkpoint validated: %d change(s) since it", applied)
+        except Exception:
+            logger.exception("checkpoint validation failed")
+            self.cache.detach()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                async with AsyncSession(self._engine) as db:
+                    await self.write(db)
+            except Exception:
+                logger.exception("checkpoint write failed")
+
+
+# Настраиваются в create_app из настроек
+cache = PrincipalCache()
+checkpointer = Checkpointer(cache)
@@ -0,0 +1,148 @@
+# src/access_manager/query_observer.py
+"""
+Наблюдатель SQL-запросов: нормализует SQL в отпечатки (fingerprint), пишет
+медленные запросы в лог с замаскированными параметрами и помечает
+повторяющиеся в рамках одного HTTP-запроса отпечатки как вероятный N+1.
+"""
+
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.access_manager import instrumentation
+
+logger = logging.getLogger("access_manager.query_observer")
+
+# Порог медленного запроса и число повторов одного отпечатка за HTTP-запрос,
+# после которого он считается N+1. Переопределяются через configure().
+SLOW_QUERY_THRESHOLD = 0.2
+N_PLUS_ONE_THRESHOLD = 5
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PARAM = re.compile(r"\$\d+|%\(\w+\)s|%s|:\w+|\?")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(statement: str) -> str:
+    """
+    Приводит SQL к виду без литералов и параметров:
+    `SELECT ... WHERE id IN (1, 2, 3)` → `SELECT ... WHERE id IN (?+)`.
+    """
+    sql = _STRING.sub("?", statement)
+    sql = _PARAM.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("(?+)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+def redact(parameters: Any) -> Any:
+    """Оставляет от параметров только типы — значения в лог не попадают."""
+    if isinstance(parameters, dict):
+        return {key: f"<{type(value).__name__}>" for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (list, tuple, dict)):
+            return f"<{len(parameters)} rows>"
+        return [f"<{type(value).__name__}>" for value in parameters]
+    return "<redacted>"
+
+
+def configure(
+    slow_query_threshold: Optional[float] = None,
+    n_plus_one_threshold: Optional[int] = None,
+) -> None:
+    global SLOW_QUERY_THRESHOLD, N_PLUS_ONE_THRESHOLD
+    if slow_query_threshold is not None:
+        SLOW_QUERY_THRESHOLD = slow_query_threshold
+    if n_plus_one_threshold is not None:
+        N_PLUS_ONE_THRESHOLD = n_plus_one_threshold
+
+
+# --- per-request state ---
+
+_request_queries: ContextVar[Optional[Counter]] = ContextVar(
+    "request_queries", default=None
+)
+
+
+def start_request() -> None:
+    _request_queries.set(Counter())
+
+
+def finish_request(label: str) -> list[tuple[str, int]]:
+    """
+    Возвращает отпечатки, повторённые не меньше N_PLUS_ONE_THRESHOLD раз,
+    и пишет по ним предупреждение.
+    """
+    queries = _request_queries.get()
+    _request_queries.set(None)
+    if not queries:
+        return []
+    suspects = [
+        (fp, count) for fp, count in queries.items() if count >= N_PLUS_ONE_THRESHOLD
+    ]
+    for fp, count in suspects:
+        logger.warning(
+            "possible N+1 in %s: %d executions of %s",
+            label,
+            count,
+            fp,
+            extra={"fingerprint": fp, "count": count, "request": label},
+        )
+    return suspects
+
+
+# --- SQLAlchemy ---
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    # время уже замерил хук instrumentation, подключённый раньше
+    duration = instrumentation.query_duration(context)
+    queries = _request_queries.get()
+    if queries is not None:
+        queries[fingerprint(statement)] += 1
+    if duration >= SLOW_QUERY_THRESHOLD:
+        fp = fingerprint(statement)
+        logger.warning(
+            "slow query %.1f ms: %s params=%s",
+            duration * 1000,
+            fp,
+            redact(parameters),
+            extra={"fingerprint": fp, "duration_ms": round(duration * 1000, 3)},
+        )
+
+
+def install(engine: AsyncEngine) -> None:
+    sync_engine = engine.sync_engine
+    if event.contains(sync_engine, "after_cursor_execute", _after_cursor_execute):
+        return
+    # слушатели вызываются в порядке подключения: замер — до наблюдателя
+    instrumentation.install_query_hooks(engine)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def capture(engine: AsyncEngine) -> Iterator[list[str]]:
+    """
+    Собирает отпечатки всех запросов, выполненных на engine внутри блока.
+    Используется фикстурой query_budget в тестах.
+    """
+    captured: list[str] = []
+
+    def _collect(conn, cursor, statement, parameters, context, many):
+        captured.append(fingerprint(statement))
+
+    event.listen(engine.sync_engine, "after_cursor_execute", _collect)
+    try:
+        yield captured
+    finally:
+        event.remove(engine.sync_engine, "after_cursor_execute", _collect)
@@ -0,0 +1,179 @@
+# src/access_manager/ratelimit.py
+"""
+Ограничение попыток входа до проверки пароля.
+
+bcrypt стоит сотни миллисекунд CPU на попытку; перебор паролей без
+ограничения занимает все ядра. Поэтому /login/token сначала берёт по
+токену из двух корзин — на клиентский IP и на имя пользователя в
+арендаторе — и только потом идёт в БД и в bcrypt. Пустая корзина — 429 с
+Retry-After за время одного обращения к корзине.
+
+Корзина (token bucket) вмещает capacity попыток и пополняется равномерно
+capacity за period секунд — скользящее окно без хранения истории. Успешный
+вход возвращает пользователю полную корзину; корзина IP не сбрасывается.
+
+Бэкенды: memory — корзины процесса (LRU по числу ключей), database — общая
+таблица login_buckets, одна атомарная upsert-операция на корзину.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from prometheus_client import Counter
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.access_manager.models import LoginBucket
+
+LOGIN_REJECTED = Counter(
+    "access_manager_login_rejected_total",
+    "Login attempts rejected by the rate limiter before password verification",
+    ["scope"],
+)
+
+
+@dataclass(frozen=True, slots=True)
+class Rate:
+    capacity: int
+    period: float
+
+    @property
+    def per_second(self) -> float:
+        return self.capacity / self.period
+
+
+def _refill(tokens: float, updated: float, rate: Rate, now: float) -> float:
+    return min(rate.capacity, tokens + max(now - updated, 0.0) * rate.per_second)
+
+
+class MemoryBuckets:
+    """Корзины в памяти процесса: у каждого воркера свои."""
+
+    def __init__(self, max_keys: int = 100_000) -> None:
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def take(self, db: AsyncSession, key: str, rate: Rate, now: float) -> float:
+        """Берёт токен; 0 — взят, иначе секунды до следующего токена."""
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (rate.capacity, now))
+            tokens = _refill(tokens, updated, rate, now)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate.per_second
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    async def reset(self, db: AsyncSession, key: str) -> None:
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class DatabaseBuckets:
+    """
+    Корзины в таблице login_buckets — общие для всех воркеров. Пополнение
+    и списание — в одном INSERT ... ON CONFLICT DO UPDATE ... WHERE: пустая
+    корзина не обновляется и не возвращает строку. Полные корзины
+    неотличимы от отсутствующих и раз в prune_interval удаляются.
+    """
+
+    def __init__(self, prune_interval: float = 300.0) -> None:
+        self.prune_interval = prune_interval
+        self._pruned_at = 0.0
+
+    async def take(self, db: AsyncSession, key: str, rate: Rate, now: float) -> float:
+        is_postgres = db.get_bind().dialect.name == "postgresql"
+        insert = pg_insert if is_postgres else sqlite_insert
+        least = func.least if is_postgres else func.min
+        c = LoginBucket.__table__.c
+        refilled = least(
+            rate.capacity, c.tokens + (now - c.updated_at) * rate.per_second
+        )
+        stmt = insert(LoginBucket).values(
+            key=key, tokens=rate.capacity - 1, updated_at=now
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[c.key],
+            set_={"tokens": refilled - 1, "updated_at": now},
+            where=refilled >= 1,
+        ).returning(c.tokens)
+        taken = (await db.execute(stmt)).first() is not None
+        wait = 0.0
+        if not taken:
+            row = (
+                await db.execute(select(c.tokens, c.updated_at).where(c.key == key))
+            ).one()
+            wait = (1 - _refill(row.tokens, row.updated_at, rate, now)) / (
+                rate.per_second
+            )
+        if now - self._pruned_at >= self.prune_interval:
+            self._pruned_at = now
+            # корзина, не тронутая дольше period, уже полная
+            await db.execute(
+                delete(LoginBucket).where(LoginBucket.updated_at < now - rate.period)
+            )
+        await db.commit()
+        return wait
+
+    async def reset(self, db: AsyncSession, key: str) -> None:
+        await db.execute(delete(LoginBucket).where(LoginBucket.key == key))
+        await db.commit()
+
+
+class LoginLimiter:
+    def __init__(
+        self,
+        backend=None,
+        per_user: Rate = Rate(10, 300.0),
+        per_ip: Rate = Rate(100, 60.0),
+        enabled: bool = True,
+    ) -> None:
+        self.backend = backend if backend is not None else MemoryBuckets()
+        self.per_user = per_user
+        self.per_ip = per_ip
+        self.enabled = enabled
+
+    @staticmethod
+    def _user_key(tenant_id: int, username: str) -> str:
+        return f"user:{tenant_id}:{username.lower()}"
+
+    async def check(
+        self, db: AsyncSession, tenant_id: int, username: str, client_ip: str
+    ) -> Optional[int]:
+        """None — попытка разрешена, иначе Retry-After в секундах."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        for scope, key, rate in (
+            ("ip", f"ip:{client_ip}", self.per_ip),
+            ("user", self._user_key(tenant_id, username), self.per_user),
+        ):
+            wait = await self.backend.take(db, key, rate, now)
+            if wait:
+                LOGIN_REJECTED.labels(scope).inc()
+                return max(1, math.ceil(wait))
+        return None
+
+    async def succeeded(self, db: AsyncSession, tenant_id: int, username: str) -> None:
+        if self.enabled:
+            await self.backend.reset(db, self._user_key(tenant_id, username))
+
+
+# Настраивается в create_app из настроек
+login_limiter = LoginLimiter()
@@ -0,0 +1,566 @@
+# src/access_manager/replica.py
+"""
+Режим edge-реплики: экземпляр только для чтения на своей SQLite — для
+филиалов с ненадёжным каналом до основной установки.
+
+Реплика отвечает на /users/me, проверки прав и чтения из локальной БД, а
+свежесть держит фоновая синхронизация: Replica раз в interval забирает у
+основной установки дельту /sync (вход — учётной записью из настроек) и
+применяет её одной транзакцией. Страницы одного прохода собираются целиком
+и применяются вместе — промежуточные страницы не согласованы между собой
+(строка приходит с последней версией, её связи могут сослаться на строку
+следующей страницы). SQLite — в режиме WAL: читатели видят прошлый коммит и
+не ждут синхронизацию. 410 (журнал основной установки очищен дальше нашей
+версии) — полная пересинхронизация с 0 в той же транзакции.
+
+Применённые события пишутся и в локальный change_log с номерами основной
+установки: лента (/changes), /sync для следующих уровней и сверка
+checkpoint (principal_cache.py) на реплике работают как обычно.
+
+Отставание — время с последнего полного прохода: заголовки
+X-Replica-Staleness / X-Replica-Version в ответах, /health и метрика.
+Сверх max_staleness реплика отвечает 503 — решать о правах по слишком
+старым данным хуже, чем не отвечать. Запись (всё, кроме GET/HEAD/OPTIONS
+и POST /…/batch, в том числе вход) отклоняется 405 или проксируется в
+основную установку.
+
+JWT реплика проверяет сама: SECRET_KEY — тот же, что у основной установки.
+"""
+
+import asyncio
+import logging
+import math
+import re
+import time
+from typing import Optional
+
+import httpx
+from prometheus_client import Counter, Gauge
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Float,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    cast,
+    delete,
+    event,
+    insert,
+    literal,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.access_manager import changes, counters, principal_cache, security
+from src.access_manager.models import (
+    DEFAULT_TENANT_ID,
+    Base,
+    ChangeLogEntry,
+    Permission,
+    Role,
+    ScopedGrant,
+    User,
+    role_permissions,
+    user_roles,
+)
+from src.access_manager.schemas import SyncPage
+
+logger = logging.getLogger("access_manager.replica")
+
+SYNCS = Counter(
+    "access_manager_replica_syncs_total",
+    "Replica sync passes by outcome",
+    ["result"],
+)
+APPLIED = Counter(
+    "access_manager_replica_applied_total",
+    "Rows and tombstones applied by the replica",
+)
+STALENESS = Gauge(
+    "access_manager_replica_staleness_seconds",
+    "Seconds since the replica last caught up with the primary",
+)
+
+# Состояние синхронизации — своя таблица реплики, не часть схемы основной БД
+# (миграции alembic её не видят)
+_metadata = MetaData()
+sync_state = Table(
+    "replica_sync_state",
+    _metadata,
+    Column("tenant_id", Integer, primary_key=True),
+    Column("version", BigInteger, nullable=False),
+    # unix-время: отставание переживает перезапуск
+    Column("synced_at", Float, nullable=False),
+)
+
+_MODELS = {"user": User, "role": Role, "permission": Permission, "grant": ScopedGrant}
+# уникальные (tenant_id, ...) поля: освобождаются перед применением, чтобы
+# обмен именами двух строк не упёрся в индекс посередине
+_UNIQUE = {"user": ("username", "email"), "role": ("name",), "permission": ("name",)}
+# войти на реплике нельзя: паролей она не получает
+_NO_PASSWORD = "!"
+
+_READS = frozenset({"GET", "HEAD", "OPTIONS"})
+# multi-get по длинному списку id — POST, но только чтение
+_READ_POSTS = re.compile(r"/(users|roles|permissions)/batch")
+# служебные пути отвечают и у отставшей реплики — по ним это и видно
+_ALWAYS = frozenset({"/health", "/metrics"})
+_HOP_BY_HOP = frozenset(
+    {
+        "connection",
+        "keep-alive",
+        "transfer-encoding",
+        "upgrade",
+        "host",
+        "content-length",
+        "content-encoding",
+    }
+)
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    # WAL: чтения не ждут применения дельты, применение — чтений
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+def _upsert(db: AsyncSession, table, rows: list[dict], keep=()):
+    insert_ = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    stmt = insert_(table)
+    key = list(table.primary_key.columns)
+    columns = [
+        name for name in rows[0] if name not in keep and name not in table.primary_key
+    ]
+    return stmt.on_conflict_do_update(
+        index_elements=key,
+        set_={name: stmt.excluded[name] for name in columns},
+    )
+
+
+class Replica:
+    """
+    Синхронизация с основной установкой и учёт отставания. transport —
+    для тестов (httpx.ASGITransport вместо сети).
+    """
+
+    def __init__(
+        self,
+        primary_url: str = "",
+        username: str = "",
+        password: str = "",
+        tenant_id: int = DEFAULT_TENANT_ID,
+        interval: float = 5.0,
+        page_size: int = 1000,
+        timeout: float = 10.0,
+        max_staleness: float = 300.0,
+        proxy_writes: bool = False,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.enabled = False
+        self.primary_url = primary_url
+        self.username = username
+        self.password = password
+        self.tenant_id = tenant_id
+        self.interval = interval
+        self.page_size = page_size
+        self.timeout = timeout
+        self.max_staleness = max_staleness
+        self.proxy_writes = proxy_writes
+        self.transport = transport
+        self.version = 0
+        # unix-время последнего полного прохода; None — ещё не было
+        self.synced_at: Optional[float] = None
+        self._token: Optional[str] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._engine: Optional[AsyncEngine] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.primary_url,
+                transport=self.transport,
+                timeout=self.timeout,
+            )
+        return self._client
+
+    def staleness(self, now: Optional[float] = None) -> float:
+        """Секунд с последнего полного прохода; inf — синхронизации не было."""
+        if self.synced_at is None:
+            return math.inf
+        return max(0.0, (time.time() if now is None else now) - self.synced_at)
+
+    def fresh(self, now: Optional[float] = None) -> bool:
+        return self.max_staleness <= 0 or self.staleness(now) <= self.max_staleness
+
+    # ——— основная установка ———
+
+    async def _login(self) -> None:
+        r = await self.client.post(
+            "/login/token",
+            data={"username": self.username, "password": self.password},
+            headers={"X-Tenant-ID": str(self.tenant_id)},
+        )
+        r.raise_for_status()
+        self._token = r.json()["access_token"]
+
+    async def fetch(self, since: int) -> Optional[SyncPage]:
+        """Страница /sync после since; None — журнал основной установки очищен."""
+        for attempt in range(2):
+            if self._token is None:
+                await self._login()
+            r = await self.client.get(
+                "/sync",
+                params={"since": since, "limit": self.page_size},
+                headers={"Authorization": f"Bearer {self._token}"},
+            )
+            if r.status_code != 401:
+                break
+            # токен истёк — входим заново один раз
+            self._token = None
+        if r.status_code == 410:
+            return None
+        r.raise_for_status()
+        return SyncPage.model_validate(r.json())
+
+    # ——— применение ———
+
+    async def load_state(self, db: AsyncSession) -> None:
+        row = (
+            await db.execute(
+                select(sync_state.c.version, sync_state.c.synced_at).where(
+                    sync_state.c.tenant_id == self.tenant_id
+                )
+            )
+        ).first()
+        if row is not None:
+            self.version, self.synced_at = row.version, row.synced_at
+
+    async def sync_once(self, db: AsyncSession) -> int:
+        """
+        Один проход: страницы /sync до конца, применение одной транзакцией.
+        Возвращает число применённых строк и удалений.
+        """
+        await self.load_state(db)
+        since, reset = self.version, False
+        # (тип, id) -> (версия, строка; None — удалена): последнее, что
+        # прислала основная установка
+        latest: dict[tuple[str, int], tuple[int, Optional[dict]]] = {}
+        while True:
+            sent = time.time()
+            page = await self.fetch(since)
+            if page is None:
+                logger.warning("replica version %d is gone on the primary", since)
+                since, reset, latest = 0, True, {}
+                continue
+            # строка страницы существует на момент запроса — удаления той же
+            # страницы старше неё (SQLite переиспользует id), а следующей — новее
+            for tombstone in page.deleted:
+                latest[tombstone.type, tombstone.id] = (tombstone.version, None)
+            for entity_type, rows in (
+                ("user", page.users),
+                ("role", page.roles),
+                ("permission", page.permissions),
+                ("grant", page.grants),
+            ):
+                for row in rows:
+                    latest[entity_type, row.id] = (row.version, row)
+            since = page.version
+            if not page.has_more:
+                break
+
+        if db.get_bind().dialect.name == "sqlite":
+            # связи могут сослаться на строку, применённую позже в проходе
+            await db.execute(text("PRAGMA defer_foreign_keys=ON"))
+        if reset:
+            for model in (ScopedGrant, User, Role, Permission):
+                await db.execute(delete(model).where(model.tenant_id == self.tenant_id))
+        if latest:
+            await self._apply(db, latest)
+        if latest or reset:
+            await counters.rebuild(db, self.tenant_id)
+        state = {"tenant_id": self.tenant_id, "version": since, "synced_at": sent}
+        await db.execute(_upsert(db, sync_state, [state]).values(state))
+        await db.commit()
+
+        self.version, self.synced_at = since, sent
+        SYNCS.labels("ok").inc()
+        if latest or reset:
+            APPLIED.inc(len(latest))
+            security.decision_cache.clear(self.tenant_id)
+            principal_cache.cache.clear(self.tenant_id)
+            changes.feed.wake()
+        return len(latest)
+
+    async def _apply(self, db: AsyncSession, latest) -> None:
+        rows = {entity_type: [] for entity_type in _MODELS}
+        deleted = {entity_type: [] for entity_type in _MODELS}
+        for (entity_type, entity_id), (_, row) in latest.items():
+            if row is None:
+                deleted[entity_type].append(entity_id)
+            else:
+                rows[entity_type].append(row)
+
+        for entity_type in ("grant", "user", "role", "permission"):
+            if deleted[entity_type]:
+                model = _MODELS[entity_type]
+                await db.execute(
+                    delete(model).where(
+                        model.tenant_id == self.tenant_id,
+                        model.id.in_(deleted[entity_type]),
+                    )
+                )
+        for entity_type, fields in _UNIQUE.items():
+            if rows[entity_type]:
+                model = _MODELS[entity_type]
+                placeholder = literal("\x00") + cast(model.id, String)
+                await db.execute(
+                    update(model)
+                    .where(model.id.in_([row.id for row in rows[entity_type]]))
+                    .values({field: placeholder for field in fields})
+                )
+
+        tenant = {"tenant_id": self.tenant_id}
+        if rows["permission"]:
+            values = [{**row.model_dump(), **tenant} for row in rows["permission"]]
+            await db.execute(_upsert(db, Permission.__table__, values), values)
+        if rows["role"]:
+            values = [
+                {**row.model_dump(exclude={"permission_ids"}), **tenant}
+                for row in rows["role"]
+            ]
+            await db.execute(_upsert(db, Role.__table__, values), values)
+            await self._replace_links(
+                db,
+                role_permissions.c.role_id,
+                role_permissions.c.permission_id,
+                {row.id: row.permission_ids for row in rows["role"]},
+            )
+        if rows["user"]:
+            values = [
+                {
+                    **row.model_dump(exclude={"role_ids"}),
+                    **tenant,
+                    "hashed_password": _NO_PASSWORD,
+                }
+                for row in rows["user"]
+            ]
+            await db.execute(
+                _upsert(db, User.__table__, values, keep=("hashed_password",)), values
+            )
+            await self._replace_links(
+                db,
+                user_roles.c.user_id,
+                user_roles.c.role_id,
+                {row.id: row.role_ids for row in rows["user"]},
+            )
+        if rows["grant"]:
+            values = [
+                {**row.model_dump(), **tenant, "resource_type": row.resource_type.value}
+                for row in rows["grant"]
+            ]
+            await db.execute(_upsert(db, ScopedGrant.__table__, values), values)
+
+        log = [
+            {
+                "seq": version,
+                "tenant_id": self.tenant_id,
+                "entity_type": entity_type,
+                "entity_id": entity_id,
+                "op": changes.UPDATE if row is not None else changes.DELETE,
+            }
+            for (entity_type, entity_id), (version, row) in latest.items()
+            # версия 0 — строки, записанные в обход crud: события у них нет
+            if version
+        ]
+        if log:
+            insert_ = (
+                pg_insert
+                if db.get_bind().dialect.name == "postgresql"
+                else sqlite_insert
+            )
+            await db.execute(
+                insert_(ChangeLogEntry).on_conflict_do_nothing(index_elements=["seq"]),
+                log,
+            )
+
+    @staticmethod
+    async def _replace_links(db: AsyncSession, owner, target, links) -> None:
+        await db.execute(delete(owner.table).where(owner.in_(list(links))))
+        pairs = [
+            {owner.key: owner_id, target.key: target_id}
+            for owner_id, target_ids in links.items()
+            for target_id in target_ids
+        ]
+        if pairs:
+            await db.execute(insert(owner.table), pairs)
+
+    # ——— запись через реплику ———
+
+    async def proxy(self, scope: Scope, receive: Receive) -> Response:
+        """Пересылает запрос в основную установку и будит синхронизацию."""
+        request = Request(scope, receive)
+        headers = [
+            (key, value)
+            for key, value in request.headers.items()
+            if key not in _HOP_BY_HOP and key != "x-forwarded-for"
+        ]
+        if request.client is not None:
+            headers.append(("x-forwarded-for", request.client.host))
+        url = request.url.path
+        if request.url.query:
+            url += f"?{request.url.query}"
+        try:
+            r = await self.client.request(
+                request.method, url, content=await request.body(), headers=headers
+            )
+        except httpx.HTTPError as exc:
+            logger.warning("proxying %s %s failed: %s", request.method, url, exc)
+            return JSONResponse({"detail": "Primary is unreachable"}, status_code=502)
+        # своя запись видна на реплике через один проход, а не через interval
+        self.wake()
+        return Response(
+            r.content,
+            status_code=r.status_code,
+            headers={
+                key: value
+                for key, value in r.headers.items()
+                if key.lower() not in _HOP_BY_HOP
+            },
+        )
+
+    # ——— фоновая синхронизация ———
+
+    async def prepare(self, engine: AsyncEngine) -> None:
+        """WAL и схема локальной БД — до первых запросов."""
+        if engine.dialect.name == "sqlite":
+            event.listen(engine.sync_engine, "connect", _sqlite_pragmas)
+        async with engine.begin() as conn:
+            if engine.dialect.name == "sqlite":
+                await conn.execute(text("PRAGMA journal_mode=WAL"))
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(_metadata.create_all)
+
+    async def start(self, engine: AsyncEngine) -> None:
+        """Запускает синхронизацию; повторный вызов — no-op."""
+        if not self.enabled or self.running:
+            return
+        self._engine = engine
+        self._wakeup = asyncio.Event()
+        async with AsyncSession(engine) as db:
+            await self.load_state(db)
+        self._task = asyncio.create_task(self._run(), name="replica-sync")
+
+    def wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                async with AsyncSession(self._engine) as db:
+                    applied = await self.sync_once(db)
+                if applied:
+                    logger.info(
+                        "replica applied %d change(s), version %d",
+                        applied,
+                        self.version,
+                    )
+            except Exception as exc:
+                # канал до основной установки ненадёжен: отставание растёт,
+                # его и видно в заголовках и метрике
+                SYNCS.labels("error").inc()
+                logger.warning("replica sync failed: %s", exc)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+class ReplicaMiddleware:
+    """
+    ASGI-middleware реплики: запись — 405 или прокси, чтения сверх
+    max_staleness — 503, остальные ответы — с заголовками отставания.
+    """
+
+    def __init__(self, app: ASGIApp, replica: Replica) -> None:
+        self.app = app
+        self.replica = replica
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        replica = self.replica
+        if scope["type"] != "http" or not replica.enabled:
+            await self.app(scope, receive, send)
+            return
+        if scope["method"] not in _READS and not (
+            scope["method"] == "POST" and _READ_POSTS.fullmatch(scope["path"])
+        ):
+            if replica.proxy_writes:
+                response = await replica.proxy(scope, receive)
+            else:
+                response = JSONResponse(
+                    {"detail": "Read-only replica: send writes to the primary"},
+                    status_code=405,
+                    headers={"Allow": ", ".join(sorted(_READS))},
+                )
+            await response(scope, receive, send)
+            return
+
+        staleness = f"{replica.staleness():.3f}"
+        if scope["path"] not in _ALWAYS and not replica.fresh():
+            response = JSONResponse(
+                {"detail": "Replica is too far behind the primary"},
+                status_code=503,
+                headers={
+                    "Retry-After": str(math.ceil(replica.interval)),
+                    "X-Replica-Staleness": staleness,
+                },
+            )
+            await response(scope, receive, send)
+            return
+
+        async def send_with_staleness(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["X-Replica-Staleness"] = staleness
+                headers["X-Replica-Version"] = str(replica.version)
+            await send(message)
+
+        await self.app(scope, receive, send_with_staleness)
+
+
+# Настраивается в create_app из настроек
+replica = Replica()
+STALENESS.set_function(lambda: replica.staleness() if replica.enabled else 0.0)
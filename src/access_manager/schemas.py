@@ -1,9 +1,12 @@
 from __future__ import annotations
 
-from datetime import datetime
-from typing import List, Optional
+from datetime import datetime, timezone
+from enum import Enum
+from typing import ClassVar, List, Optional
 
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, field_validator, model_validator
+
+from src.access_manager.permissions import NAME_PATTERN
 
 # ----------------------
 # Permission Schemas
@@ -21,12 +24,15 @@ class PermissionRead(BaseModel):
 
 
 class PermissionCreate(BaseModel):
-    name: str = Field(..., min_length=3, max_length=100)
+    # `users:read`, `billing:invoices:read`; `users:*` — грант на поддерево
+    name: str = Field(..., min_length=1, max_length=100, pattern=NAME_PATTERN)
     description: Optional[str] = Field(None, max_length=255)
 
 
 class PermissionUpdate(BaseModel):
-    name: Optional[str] = Field(None, min_length=3, max_length=100)
+    name: Optional[str] = Field(
+        None, min_length=1, max_length=100, pattern=NAME_PATTERN
+    )
     description: Optional[str] = Field(None, max_length=255)
 
 
@@ -58,6 +64,35 @@ class RoleUpdate(BaseModel):
     permission_ids: Optional[List[int]] = None
 
 
+# ----------------------
+# Scoped Grant Schemas
+# ----------------------
+
+
+class ResourceType(str, Enum):
+    user = "user"
+    role = "role"
+    permission = "permission"
+
+
+class ScopedGrantCreate(BaseModel):
+    permission_id: int
+    resource_type: ResourceType
+    # None — на все объекты типа
+    resource_id: Optional[int] = None
+
+
+class ScopedGrantRead(BaseModel):
+    id: int
+    role_id: int
+    permission: PermissionRead
+    resource_type: ResourceType
+    resource_id: Optional[int]
+    created_at: datetime
+
+    model_config = {"from_attributes": True}
+
+
 # ----------------------
 # User Schemas
 # ----------------------
@@ -71,7 +106,9 @@ class UserRead(BaseModel):
     is_superuser: bool
     created_at: datetime
     updated_at: datetime
-    roles: List[RoleRead] = []
+    # только действующие назначения (User.active_roles); запланированные и
+    # истёкшие — в /users/{id}/roles
+    roles: List[RoleRead] = Field([], validation_alias="active_roles")
 
     model_config = {"from_attributes": True}
 
@@ -92,6 +129,217 @@ class UserUpdate(BaseModel):
     role_ids: Optional[List[int]] = None
 
 
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # даты в БД — наивное UTC; без смещения дата считается UTC
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class RoleAssignment(BaseModel):
+    """Назначение роли; без границ — бессрочное."""
+
+    role_id: int
+    valid_from: Optional[datetime] = None
+    valid_until: Optional[datetime] = None
+
+    @model_validator(mode="after")
+    def _check_window(self):
+        self.valid_from = _naive_utc(self.valid_from)
+        self.valid_until = _naive_utc(self.valid_until)
+        if (
+            self.valid_from is not None
+            and self.valid_until is not None
+            and self.valid_until <= self.valid_from
+        ):
+            raise ValueError("'valid_until' must be later than 'valid_from'")
+        return self
+
+
+class RoleAssignmentRead(BaseModel):
+    user_id: int
+    role_id: int
+    valid_from: Optional[datetime]
+    valid_until: Optional[datetime]
+
+    model_config = {"from_attributes": True}
+
+
+# ----------------------
+# Keyset pages
+# ----------------------
+
+
+class UserPage(BaseModel):
+    items: List[UserRead]
+    # id последнего элемента; передаётся как `after` для следующей страницы
+    next_after: Optional[int] = None
+
+
+class RolePage(BaseModel):
+    items: List[RoleRead]
+    next_after: Optional[int] = None
+
+
+# ----------------------
+# List filters
+# ----------------------
+
+# pg_trgm не может использовать индекс для подстрок короче одной триграммы
+MIN_CONTAINS_LENGTH = 3
+
+
+class MatchMode(str, Enum):
+    prefix = "prefix"
+    contains = "contains"
+
+
+class _SearchFilter(BaseModel):
+    # FastAPI разворачивает в query-параметры только одну модель на эндпоинт,
+    # поэтому пагинация живёт здесь же
+    skip: int = Field(0, ge=0)
+    limit: int = Field(100, ge=1)
+    match: MatchMode = MatchMode.prefix
+
+    search_fields: ClassVar[tuple[str, ...]] = ()
+
+    @model_validator(mode="after")
+    def _check_contains_length(self):
+        if self.match is MatchMode.contains:
+            for field in self.search_fields:
+                value = getattr(self, field)
+                if value is not None and len(value) < MIN_CONTAINS_LENGTH:
+                    raise ValueError(
+                        f"'{field}' must be at least {MIN_CONTAINS_LENGTH} "
+                        "characters long for match=contains"
+                    )
+        return self
+
+
+class NameFilter(_SearchFilter):
+    name: Optional[str] = Field(None, min_length=1, max_length=100)
+
+    search_fields = ("name",)
+
+
+class UserFilter(_SearchFilter):
+    username: Optional[str] = Field(None, min_length=1, max_length=100)
+    email: Optional[str] = Field(None, min_length=1, max_length=255)
+    is_active: Optional[bool] = None
+    is_superuser: Optional[bool] = None
+    role_id: Optional[int] = None
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+
+    search_fields = ("username", "email")
+
+
+# ----------------------
+# Multi-get
+# ----------------------
+
+# один запрос IN: больше id — больше параметров, чем примут драйверы
+MAX_BATCH_IDS = 1000
+
+
+class IdList(BaseModel):
+    # ?ids=1,2,3 и ?ids=1&ids=2 в GET, {"ids": [...]} в POST
+    ids: List[int] = Field(..., min_length=1, max_length=MAX_BATCH_IDS)
+
+    @field_validator("ids", mode="before")
+    @classmethod
+    def _split_commas(cls, value):
+        if isinstance(value, str):
+            value = [value]
+        if isinstance(value, list):
+            return [
+                part.strip() if isinstance(part, str) else part
+                for item in value
+                for part in (item.split(",") if isinstance(item, str) else [item])
+            ]
+        return value
+
+
+# items — в порядке запрошенных id, null на месте не найденных;
+# missing — эти id по порядку
+
+
+class UserBatch(BaseModel):
+    items: List[Optional[UserRead]]
+    missing: List[int]
+
+
+class RoleBatch(BaseModel):
+    items: List[Optional[RoleRead]]
+    missing: List[int]
+
+
+class PermissionBatch(BaseModel):
+    items: List[Optional[PermissionRead]]
+    missing: List[int]
+
+
+# ----------------------
+# Delta sync
+# ----------------------
+
+
+class SyncUser(BaseModel):
+    id: int
+    username: str
+    email: EmailStr
+    is_active: bool
+    is_superuser: bool
+    updated_at: datetime
+    version: int
+    # назначения приходят целиком вместе с владельцем
+    role_ids: List[int] = []
+
+
+class SyncRole(BaseModel):
+    id: int
+    name: str
+    description: Optional[str]
+    updated_at: datetime
+    version: int
+    permission_ids: List[int] = []
+
+
+class SyncPermission(BaseModel):
+    id: int
+    name: str
+    description: Optional[str]
+    updated_at: datetime
+    version: int
+
+
+class SyncGrant(BaseModel):
+    id: int
+    role_id: int
+    permission_id: int
+    resource_type: ResourceType
+    resource_id: Optional[int]
+    version: int
+
+
+class Tombstone(BaseModel):
+    # "user" | "role" | "permission" | "grant"
+    type: str
+    id: int
+    version: int
+
+
+class SyncPage(BaseModel):
+    # передаётся как `since` в следующий запрос
+    version: int
+    has_more: bool = False
+    users: List[SyncUser] = []
+    roles: List[SyncRole] = []
+    permissions: List[SyncPermission] = []
+    grants: List[SyncGrant] = []
+    deleted: List[Tombstone] = []
+
+
 # ----------------------
 # Forward refs (если потребуется)
 # ----------------------
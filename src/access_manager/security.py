@@ -1,44 +1,66 @@
+import time
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, Optional
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from pydantic import BaseModel, ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.access_manager import crud
-from src.access_manager.core.config import settings
-from src.access_manager.db import get_db
-from src.access_manager.models import User as UserModel
+from src.access_manager import coalesce, crud, logs, principal_cache
+from src.access_manager.core.config import get_settings
+from src.access_manager.db import get_db, get_shards
+from src.access_manager.instrumentation import auth_timer
+from src.access_manager.models import DEFAULT_TENANT_ID
+from src.access_manager.permissions import (
+    DecisionCache,
+    PermissionMatcher,
+    RoleMatcherCache,
+)
+from src.access_manager.principal import Principal
+from src.access_manager.sharding import ShardSet
 
 # --- Password hashing ---
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    with auth_timer():
+        return pwd_context.verify(plain_password, hashed_password)
+
+
+def dummy_verify() -> None:
+    """
+    bcrypt против фиктивного хэша — для несуществующего пользователя, чтобы
+    по времени ответа нельзя было отличить его от неверного пароля.
+    """
+    with auth_timer():
+        pwd_context.dummy_verify()
 
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    with auth_timer():
+        return pwd_context.hash(password)
 
 
-# --- JWT settings ---
-SECRET_KEY = settings.secret_key
-ALGORITHM = settings.algorithm
-ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
+# --- JWT ---
+# Ключ и алгоритм берутся из настроек при вызове: импорт модуля их не читает
 
 
 def create_access_token(
     data: Dict[str, Any], expires_delta: Optional[timedelta] = None
 ) -> str:
+    settings = get_settings()
     to_encode = data.copy()
     now = datetime.now(timezone.utc)
-    expire = now + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    expire = now + (
+        expires_delta or timedelta(minutes=settings.access_token_expire_minutes)
+    )
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    with auth_timer():
+        return jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login/token")
@@ -46,6 +68,8 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login/token")
 
 class TokenData(BaseModel):
     sub: Optional[str] = None
+    # арендатор пользователя; в токенах, выданных до его появления, — нет
+    tid: Optional[int] = None
 
 
 async def decode_access_token(token: str) -> Dict[str, Any]:
@@ -55,7 +79,11 @@ async def decode_access_token(token: str) -> Dict[str, Any]:
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        with auth_timer():
+            settings = get_settings()
+            payload = jwt.decode(
+                token, settings.secret_key, algorithms=[settings.algorithm]
+            )
         # validate payload structure
         TokenData(**payload)
         return payload
@@ -63,12 +91,26 @@ async def decode_access_token(token: str) -> Dict[str, Any]:
         raise credentials_exception
 
 
+# --- Арендатор ---
+
+
+def get_request_tenant(
+    x_tenant_id: Optional[int] = Header(None, ge=1),
+) -> int:
+    """
+    Арендатор запроса без токена (вход, регистрация) — из X-Tenant-ID.
+    После входа арендатор берётся из токена (claim `tid`), заголовок
+    не читается.
+    """
+    return DEFAULT_TENANT_ID if x_tenant_id is None else x_tenant_id
+
+
 # --- Новая зависимость: текущий активный пользователь ---
 
 
 async def get_current_user_from_payload(
-    payload: Dict[str, Any], db: AsyncSession
-) -> Optional[UserModel]:
+    payload: Dict[str, Any], db: AsyncSession, shards: ShardSet
+) -> Optional[Principal]:
     sub = payload.get("sub")
     if sub is None:
         return None
@@ -76,17 +118,39 @@ async def get_current_user_from_payload(
         user_id = int(sub)
     except ValueError:
         return None
-    return await crud.get_user(db, user_id)
+    tenant_id = payload.get("tid") or DEFAULT_TENANT_ID
+    if not shards.single:
+        async with shards.user_session(db, user_id) as session:
+            return await crud.get_principal(session, tenant_id, user_id)
+    cache = principal_cache.cache
+    principal = cache.get(tenant_id, user_id)
+    if principal is None:
+        epoch = cache.epoch
+        principal = await crud.get_principal(db, tenant_id, user_id)
+        if principal is not None:
+            cache.put(principal, epoch)
+    return principal
+
+
+async def _resolve_principal(
+    token: str, db: AsyncSession, shards: ShardSet
+) -> Optional[Principal]:
+    payload = await decode_access_token(token)
+    return await get_current_user_from_payload(payload, db, shards)
 
 
 async def get_current_active_user(
     token: str = Depends(oauth2_scheme),
     db: AsyncSession = Depends(get_db),
-) -> UserModel:
-    # 1) Декодируем и валидируем токен
-    payload = await decode_access_token(token)
-    # 2) Загружаем пользователя
-    user = await get_current_user_from_payload(payload, db)
+    shards: ShardSet = Depends(get_shards),
+) -> Principal:
+    """
+    Принципал запроса (principal.py): id, арендатор, флаги и разрешения по
+    ролям — без ORM-пользователя.
+    """
+    # 1-2) Декодируем токен и загружаем пользователя — одна загрузка на
+    # все одновременные запросы с этим токеном
+    user = await coalesce.principals.do(token, _resolve_principal, token, db, shards)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -99,9 +163,30 @@ async def get_current_active_user(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Inactive user",
         )
+    # логи запроса дальше — с id принципала
+    logs.principal_id.set(user.id)
     return user
 
 
+# Скомпилированные гранты ролей (wildcard `users:*` и т.п., см. permissions.py)
+role_matchers = RoleMatcherCache()
+
+
+def has_permission(user: Principal, *permission_names: str) -> bool:
+    """Есть ли у user хотя бы одно из разрешений — напрямую или через wildcard."""
+    matchers = user.matchers
+    if matchers is None:
+        # один раз на принципала: кэшированный принципал проверяется за
+        # O(глубины имени) на роль, без сравнения наборов грантов
+        matchers = user.matchers = tuple(
+            role_matchers.get(role_id, grants) for role_id, grants in user.roles
+        )
+    for matcher in matchers:
+        if any(matcher.allows(name) for name in permission_names):
+            return True
+    return False
+
+
 def require_permission(*permission_names: str):
     """
     Возвращает зависимость, которая проверяет,
@@ -109,14 +194,9 @@ def require_permission(*permission_names: str):
     """
 
     async def dependency(
-        current_user: UserModel = Depends(get_current_active_user),
-    ) -> UserModel:
-        # Собираем имена всех разрешений пользователя через его роли
-        user_perms = {
-            perm.name for role in current_user.roles for perm in role.permissions
-        }
-        # Проверяем наличие хотя бы одного требуемого
-        if not any(name in user_perms for name in permission_names):
+        current_user: Principal = Depends(get_current_active_user),
+    ) -> Principal:
+        if not has_permission(current_user, *permission_names):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Permission(s) {permission_names} required",
@@ -124,3 +204,116 @@ def require_permission(*permission_names: str):
         return current_user
 
     return dependency
+
+
+# --- Гранты на объекты ---
+
+# Решения по объектам на пользователя; ttl задаётся в create_app из настроек
+decision_cache = DecisionCache()
+
+
+async def check_scoped(
+    db: AsyncSession,
+    user: Principal,
+    permission: str,
+    resource_type: str,
+    resource_ids: Iterable[int],
+) -> Dict[int, bool]:
+    """
+    Решения «может ли user сделать permission с объектами resource_ids».
+    Глобальное разрешение роли покрывает все объекты без обращения к БД;
+    иначе решения берутся из decision_cache, а промахи догружаются одним
+    запросом по всем объектам сразу.
+    """
+    resource_ids = list(resource_ids)
+    if has_permission(user, permission):
+        return dict.fromkeys(resource_ids, True)
+
+    roles = user.role_ids
+    now = time.monotonic()
+    keys = {rid: (permission, resource_type, rid) for rid in resource_ids}
+    known = decision_cache.get_many(user.tenant_id, user.id, roles, keys.values(), now)
+    decisions = {rid: known[key] for rid, key in keys.items() if key in known}
+
+    missing = [rid for rid in resource_ids if rid not in decisions]
+    if missing:
+        grants: Dict[Optional[int], List[str]] = {}
+        for name, rid in await crud.get_grants_for_resources(
+            db, user.tenant_id, roles, resource_type, missing
+        ):
+            grants.setdefault(rid, []).append(name)
+        type_wide = PermissionMatcher(grants.get(None, ())).allows(permission)
+        loaded = {
+            rid: type_wide or PermissionMatcher(grants.get(rid, ())).allows(permission)
+            for rid in missing
+        }
+        decision_cache.put_many(
+            user.tenant_id,
+            user.id,
+            roles,
+            {keys[rid]: allowed for rid, allowed in loaded.items()},
+            now,
+        )
+        decisions.update(loaded)
+    return decisions
+
+
+def require_permission_on(permission: str, resource_type: str, path_param: str):
+    """
+    Как require_permission, но достаточно и гранта на объект из пути:
+    require_permission_on("users:update", "user", "user_id") пускает к
+    /users/42 и с глобальным users:update, и с грантом на user 42.
+    """
+
+    async def dependency(
+        request: Request,
+        current_user: Principal = Depends(get_current_active_user),
+        db: AsyncSession = Depends(get_db),
+    ) -> Principal:
+        try:
+            resource_id = int(request.path_params[path_param])
+        except (KeyError, ValueError):
+            resource_id = None
+        if (
+            resource_id is None
+            or not (
+                await check_scoped(
+                    db, current_user, permission, resource_type, [resource_id]
+                )
+            )[resource_id]
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Permission {permission!r} on {resource_type} required",
+            )
+        return current_user
+
+    return dependency
+
+
+# --- Прогрев ---
+
+
+async def preload_role_matchers(db: AsyncSession) -> None:
+    """Собирает матчеры ролей из БД: первые проверки прав не компилируют гранты."""
+    for role_id, grants in await crud.get_role_grants(db, role_matchers.maxsize):
+        role_matchers.get(role_id, grants)
+
+
+# Загрузчики кэшей авторизации для прогрева на старте (warmup_authz_cache).
+# Кэш регистрирует сюда корутину, которая заполняет его из БД.
+authz_cache_preloaders: List[Callable[[AsyncSession], Awaitable[None]]] = [
+    preload_role_matchers
+]
+
+
+def warmup() -> None:
+    """
+    Снимает с первых запросов разовые расходы: passlib выбирает и проверяет
+    backend bcrypt при первом хэше, jose — при первом encode/decode.
+    Блокирующая (bcrypt), вызывается из потока.
+    """
+    pwd_context.hash("warmup")
+    settings = get_settings()
+    token = jwt.encode({"sub": "warmup"}, settings.secret_key, settings.algorithm)
+    jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
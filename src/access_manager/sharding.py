@@ -0,0 +1,260 @@
+# src/access_manager/sharding.py
+"""
+Шардирование пользователей по нескольким БД.
+
+Пользователь и его связи user_roles живут на шарде, который выбирает
+консистентное хэширование его id (HashRing): добавление шарда переносит
+только ~1/N пользователей, а не перемешивает всех. Шард 0 — основная БД
+(сессия get_db): на ней каталог ролей и разрешений, гранты на объекты,
+журнал изменений, корзины входа; остальные шарды держат своих
+пользователей и копию каталога (роли, разрешения, role_permissions) —
+её требуют внешние ключи user_roles и запрос принципала.
+
+Каталог пишется только в основную БД; после записи endpoint вызывает
+replicate, а при старте приложения sync_catalog сверяет копии целиком.
+Двухфазного коммита нет: сбой между записью и копированием доводит до
+согласованности следующий старт.
+
+Без настроенных шардов ShardSet одиночный: все вызовы идут в ту же
+сессию, что и раньше, и лишних запросов не делают.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import heapq
+from contextlib import asynccontextmanager
+from itertools import islice
+from operator import attrgetter
+from typing import AsyncIterator, Awaitable, Callable, Optional, Sequence, TypeVar
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from src.access_manager.models import Permission, Role, User, role_permissions
+
+T = TypeVar("T")
+
+
+def _hash(value: str) -> int:
+    # стабильный между процессами (в отличие от hash()) и быстрый
+    return int.from_bytes(
+        hashlib.blake2b(value.encode(), digest_size=8).digest(), "big"
+    )
+
+
+class HashRing:
+    """
+    Кольцо консистентного хэширования: у каждого шарда vnodes точек, ключ
+    принадлежит шарду первой точки по часовой стрелке от его хэша.
+    """
+
+    def __init__(self, shards: int, vnodes: int = 64) -> None:
+        if shards < 1:
+            raise ValueError("at least one shard is required")
+        points = sorted(
+            (_hash(f"shard-{shard}-{vnode}"), shard)
+            for shard in range(shards)
+            for vnode in range(vnodes)
+        )
+        self.shards = shards
+        self._points = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    def shard_of(self, key: int) -> int:
+        if self.shards == 1:
+            return 0
+        index = bisect.bisect(self._points, _hash(str(key)))
+        return self._owners[index % len(self._owners)]
+
+
+class ShardSet:
+    """
+    Маршрутизация сессий: шард 0 — сессия запроса, для остальных шардов
+    сессии открываются на время вызова.
+    """
+
+    def __init__(self, engines: Sequence[AsyncEngine] = (), vnodes: int = 64) -> None:
+        self.engines = list(engines)
+        self._factories = [
+            sessionmaker(
+                bind=engine,
+                class_=AsyncSession,
+                autoflush=False,
+                expire_on_commit=False,
+            )
+            for engine in self.engines
+        ]
+        self.ring = HashRing(len(self.engines) + 1, vnodes)
+
+    @property
+    def count(self) -> int:
+        return self.ring.shards
+
+    @property
+    def single(self) -> bool:
+        return not self.engines
+
+    def shard_of(self, user_id: int) -> int:
+        return self.ring.shard_of(user_id)
+
+    @asynccontextmanager
+    async def session(
+        self, db: AsyncSession, shard: int
+    ) -> AsyncIterator[AsyncSession]:
+        if shard == 0:
+            yield db
+            return
+        async with self._factories[shard - 1]() as session:
+            yield session
+
+    def user_session(self, db: AsyncSession, user_id: int):
+        """Сессия шарда пользователя (async with)."""
+        return self.session(db, self.shard_of(user_id))
+
+    async def each(
+        self, db: AsyncSession, fn: Callable[..., Awaitable[T]], *args
+    ) -> list[T]:
+        """fn(session, *args) на всех шардах одновременно; результаты по номеру."""
+
+        async def call(shard: int) -> T:
+            async with self.session(db, shard) as session:
+                return await fn(session, *args)
+
+        if self.single:
+            return [await fn(db, *args)]
+        return list(await asyncio.gather(*(call(s) for s in range(self.count))))
+
+    async def merge(
+        self,
+        db: AsyncSession,
+        limit: int,
+        fetch: Callable[..., Awaitable[Sequence[T]]],
+        *args,
+        key: Callable[[T], int] = attrgetter("id"),
+    ) -> list[T]:
+        """
+        Первые limit строк по key из страниц всех шардов. Каждая страница
+        уже упорядочена по key (keyset-пагинация), так что хватает слияния
+        отсортированных списков.
+        """
+        pages = await self.each(db, fetch, *args)
+        return list(islice(heapq.merge(*pages, key=key), limit))
+
+    async def by_users(
+        self,
+        db: AsyncSession,
+        user_ids: Sequence[int],
+        fetch: Callable[..., Awaitable[Sequence[T]]],
+        *args,
+    ) -> list[T]:
+        """
+        fetch(session, *args, ids) только на шардах этих пользователей, каждому
+        шарду — его id; строки всех шардов одним списком без порядка.
+        """
+        if self.single:
+            return list(await fetch(db, *args, user_ids))
+        groups: dict[int, list[int]] = {}
+        for user_id in user_ids:
+            groups.setdefault(self.shard_of(user_id), []).append(user_id)
+
+        async def call(shard: int, ids: list[int]) -> Sequence[T]:
+            async with self.session(db, shard) as session:
+                return await fetch(session, *args, ids)
+
+        pages = await asyncio.gather(*(call(s, ids) for s, ids in groups.items()))
+        return [row for page in pages for row in page]
+
+    async def allocate_user_id(self, db: AsyncSession) -> int:
+        """
+        id нового пользователя — до вставки: от него зависит шард. На
+        Postgres — из последовательности users основной БД; на SQLite
+        (разработка, тесты) — max(id) по всем шардам + 1. Гонка двух
+        регистраций на SQLite выдаёт один id, но один id — это один шард,
+        и дубликат отклонит первичный ключ.
+        """
+        if db.get_bind().dialect.name == "postgresql":
+            sequence = func.pg_get_serial_sequence(User.__tablename__, "id")
+            return await db.scalar(select(func.nextval(sequence)))
+        highest = await self.each(db, _max_user_id)
+        return max(highest) + 1
+
+    async def replicate(self, db: AsyncSession, model, ids: Sequence[int]) -> None:
+        """
+        Копирует строки каталога (Role или Permission) с этими id из основной
+        БД на остальные шарды; id, которых в основной БД уже нет, удаляются
+        (вместе со связями — ON DELETE CASCADE).
+        """
+        if self.single or not ids:
+            return
+        await self._copy(db, model, model.id.in_(ids))
+
+    async def sync_catalog(self, db: AsyncSession) -> None:
+        """Сверяет копии каталога на шардах с основной БД целиком."""
+        if self.single:
+            return
+        # разрешения раньше ролей: на них ссылаются role_permissions
+        await self._copy(db, Permission, None)
+        await self._copy(db, Role, None)
+        await db.commit()
+
+    async def _copy(self, db: AsyncSession, model, scope) -> None:
+        table = model.__table__
+        stmt = select(table)
+        if scope is not None:
+            stmt = stmt.where(scope)
+        rows = [dict(row) for row in (await db.execute(stmt)).mappings()]
+        links = []
+        if model is Role:
+            linked = select(role_permissions)
+            if scope is not None:
+                linked = linked.where(
+                    role_permissions.c.role_id.in_(select(table.c.id).where(scope))
+                )
+            links = [dict(row) for row in (await db.execute(linked)).mappings()]
+
+        async def apply(factory: sessionmaker) -> None:
+            async with factory() as session:
+                present = [row["id"] for row in rows]
+                stale = delete(table).where(table.c.id.not_in(present))
+                if scope is not None:
+                    stale = stale.where(scope)
+                await session.execute(stale)
+                if rows:
+                    await session.execute(_upsert(session, table), rows)
+                if model is Role and present:
+                    await session.execute(
+                        delete(role_permissions).where(
+                            role_permissions.c.role_id.in_(present)
+                        )
+                    )
+                    if links:
+                        await session.execute(insert(role_permissions), links)
+                await session.commit()
+
+        await asyncio.gather(*(apply(factory) for factory in self._factories))
+
+    async def dispose(self) -> None:
+        for engine in self.engines:
+            await engine.dispose()
+
+
+async def _max_user_id(db: AsyncSession) -> int:
+    return await db.scalar(select(func.coalesce(func.max(User.id), 0)))
+
+
+def _upsert(db: AsyncSession, table):
+    insert_ = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    stmt = insert_(table)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.id],
+        set_={c.key: stmt.excluded[c.key] for c in table.c if c.key != "id"},
+    )
+
+
+def sum_counts(counts: Sequence[Optional[int]]) -> Optional[int]:
+    """Итог по шардам; None, если хотя бы у одного шарда итога нет."""
+    return None if None in counts else sum(counts)
@@ -0,0 +1,226 @@
+# src/access_manager/snapshot.py
+"""
+Компактный бинарный снимок RBAC-графа арендатора для edge-кэшей:
+разрешения, роли с их разрешениями, пользователи с ролями — одним блоком
+вместо тысяч запросов к постраничным спискам.
+
+Модуль только о формате и зависит лишь от стандартной библиотеки: его
+читают сервисы, которым не нужны ни FastAPI, ни БД. Снимок собирает и
+обновляет snapshot_store.
+
+Формат (little-endian): заголовок HEADER без сжатия, за ним zlib-тело —
+колонки подряд, без разделителей:
+
+    segments       словарь сегментов имён, UTF-8 через "\\n"
+    perm_ids       u32[P]     id разрешений по возрастанию
+    perm_offsets   u32[P+1]   CSR: имя i — perm_segments[o[i]:o[i+1]]
+    perm_segments  u32[...]   номера в словаре сегментов
+    role_ids       u32[R]     по возрастанию
+    role_offsets   u32[R+1]   CSR: разрешения роли — позиции в perm_ids
+    role_perms     u32[...]
+    user_ids       u32[U]     по возрастанию
+    user_flags     u8[U]      ACTIVE | SUPERUSER
+    user_offsets   u32[U+1]   CSR: роли пользователя — позиции в role_ids
+    user_roles     u32[...]
+
+Имена закодированы словарём сегментов: `users`, `read`, `*` хранятся один
+раз на снимок. Связи — списки смежности по позициям, а не по id: читателю
+не нужны словари id → запись, чтобы обойти граф.
+"""
+
+import struct
+import sys
+import zlib
+from array import array
+from dataclasses import dataclass
+from typing import Iterable, Mapping
+
+MEDIA_TYPE = "application/vnd.access-manager.rbac-snapshot"
+MAGIC = b"RBAC"
+FORMAT_VERSION = 1
+
+# magic, формат, tenant_id, версия RBAC, длина словаря сегментов, P, R, U
+HEADER = struct.Struct("<4sHxxIQIIII")
+
+ACTIVE = 1
+SUPERUSER = 2
+
+SEPARATOR = ":"
+
+# array("I") — 4 байта на всех платформах, где это важно, но не по стандарту
+_U32 = "I" if array("I").itemsize == 4 else "L"
+_BIG_ENDIAN = sys.byteorder == "big"
+
+
+class SnapshotError(ValueError):
+    """Блок — не снимок или снимок неподдерживаемой версии формата."""
+
+
+@dataclass(frozen=True, slots=True)
+class Snapshot:
+    """Колонки снимка как есть: позиции вместо id, CSR-смещения."""
+
+    tenant_id: int
+    version: int
+    permission_ids: array
+    permission_names: list[str]
+    role_ids: array
+    role_offsets: array
+    role_permissions: array
+    user_ids: array
+    user_flags: bytes
+    user_offsets: array
+    user_roles: array
+
+
+def _u32(values: Iterable[int] = ()) -> array:
+    return array(_U32, values)
+
+
+def _to_bytes(column: array) -> bytes:
+    if _BIG_ENDIAN:
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _adjacency(
+    owners: Mapping[int, Iterable[int]], owner_ids: list[int], positions: dict
+) -> tuple[array, array]:
+    # CSR по позициям; ссылки на отсутствующие в снимке id отбрасываются
+    offsets, targets = _u32([0]), _u32()
+    for owner_id in owner_ids:
+        targets.extend(sorted(positions[t] for t in owners[owner_id] if t in positions))
+        offsets.append(len(targets))
+    return offsets, targets
+
+
+def encode(
+    tenant_id: int,
+    version: int,
+    permissions: Mapping[int, str],
+    roles: Mapping[int, Iterable[int]],
+    users: Mapping[int, tuple[int, Iterable[int]]],
+    level: int = 6,
+) -> bytes:
+    """
+    permissions — id → имя, roles — id → id разрешений, users — id →
+    (флаги, id ролей). Результат детерминирован: один граф — одни байты.
+    """
+    perm_ids = sorted(permissions)
+    segments: dict[str, int] = {}
+    perm_offsets, perm_segments = _u32([0]), _u32()
+    for perm_id in perm_ids:
+        for segment in permissions[perm_id].split(SEPARATOR):
+            perm_segments.append(segments.setdefault(segment, len(segments)))
+        perm_offsets.append(len(perm_segments))
+
+    role_ids = sorted(roles)
+    role_offsets, role_perms = _adjacency(
+        roles, role_ids, {perm_id: i for i, perm_id in enumerate(perm_ids)}
+    )
+    user_ids = sorted(users)
+    user_flags = bytes(users[user_id][0] for user_id in user_ids)
+    user_offsets, user_roles = _adjacency(
+        {user_id: users[user_id][1] for user_id in user_ids},
+        user_ids,
+        {role_id: i for i, role_id in enumerate(role_ids)},
+    )
+
+    dictionary = "\n".join(segments).encode()
+    body = b"".join(
+        (
+            dictionary,
+            _to_bytes(_u32(perm_ids)),
+            _to_bytes(perm_offsets),
+            _to_bytes(perm_segments),
+            _to_bytes(_u32(role_ids)),
+            _to_bytes(role_offsets),
+            _to_bytes(role_perms),
+            _to_bytes(_u32(user_ids)),
+            user_flags,
+            _to_bytes(user_offsets),
+            _to_bytes(user_roles),
+        )
+    )
+    header = HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        tenant_id,
+        version,
+        len(dictionary),
+        len(perm_ids),
+        len(role_ids),
+        len(user_ids),
+    )
+    return header + zlib.compress(body, level)
+
+
+class _Reader:
+    __slots__ = ("_body", "_pos")
+
+    def __init__(self, body: bytes) -> None:
+        self._body = memoryview(body)
+        self._pos = 0
+
+    def raw(self, size: int) -> bytes:
+        if self._pos + size > len(self._body):
+            raise SnapshotError("truncated snapshot")
+        chunk = self._body[self._pos : self._pos + size].tobytes()
+        self._pos += size
+        return chunk
+
+    def u32(self, count: int) -> array:
+        column = _u32()
+        column.frombytes(self.raw(count * column.itemsize))
+        if _BIG_ENDIAN:
+            column.byteswap()
+        return column
+
+
+def decode(data: bytes) -> Snapshot:
+    if len(data) < HEADER.size:
+        raise SnapshotError("truncated snapshot header")
+    magic, fmt, tenant_id, version, dict_size, n_perms, n_roles, n_users = (
+        HEADER.unpack_from(data)
+    )
+    if magic != MAGIC:
+        raise SnapshotError("not an RBAC snapshot")
+    if fmt != FORMAT_VERSION:
+        raise SnapshotError(f"unsupported snapshot format {fmt}")
+    try:
+        body = zlib.decompress(data[HEADER.size :])
+    except zlib.error as exc:
+        raise SnapshotError(f"corrupt snapshot: {exc}") from None
+
+    reader = _Reader(body)
+    dictionary = reader.raw(dict_size).decode().split("\n")
+    perm_ids = reader.u32(n_perms)
+    perm_offsets = reader.u32(n_perms + 1)
+    perm_segments = reader.u32(perm_offsets[-1])
+    names = [
+        SEPARATOR.join(
+            dictionary[s] for s in perm_segments[perm_offsets[i] : perm_offsets[i + 1]]
+        )
+        for i in range(n_perms)
+    ]
+    role_ids = reader.u32(n_roles)
+    role_offsets = reader.u32(n_roles + 1)
+    role_perms = reader.u32(role_offsets[-1])
+    user_ids = reader.u32(n_users)
+    user_flags = reader.raw(n_users)
+    user_offsets = reader.u32(n_users + 1)
+    user_roles = reader.u32(user_offsets[-1])
+    return Snapshot(
+        tenant_id=tenant_id,
+        version=version,
+        permission_ids=perm_ids,
+        permission_names=names,
+        role_ids=role_ids,
+        role_offsets=role_offsets,
+        role_permissions=role_perms,
+        user_ids=user_ids,
+        user_flags=user_flags,
+        user_offsets=user_offsets,
+        user_roles=user_roles,
+    )
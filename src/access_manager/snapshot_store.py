@@ -0,0 +1,190 @@
+# src/access_manager/snapshot_store.py
+"""
+Снимки RBAC-графа (формат — snapshot.py) для GET /snapshot.
+
+Граф арендатора собирается при первом запросе полной синхронизацией
+(crud.get_changes_since с 0) и дальше живёт в памяти процесса: фоновая
+задача раз в refresh_interval догружает дельту с версии графа и, если
+граф поменялся, перекодирует снимок. Ответ — уже готовые байты с ETag;
+на запрос в БД не ходит.
+"""
+
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from src.access_manager import changes, crud, snapshot
+
+logger = logging.getLogger("access_manager.snapshot_store")
+
+# типы сущностей графа; гранты на объекты в снимок не входят
+TYPES = ("user", "role", "permission")
+
+
+@dataclass(frozen=True, slots=True)
+class EncodedSnapshot:
+    data: bytes
+    # сильный ETag: хэш байтов снимка
+    etag: str
+    version: int
+
+
+class _TenantGraph:
+    __slots__ = ("tenant_id", "version", "permissions", "roles", "users", "encoded")
+
+    def __init__(self, tenant_id: int) -> None:
+        self.tenant_id = tenant_id
+        self.version = 0
+        self.permissions: dict[int, str] = {}
+        self.roles: dict[int, tuple[int, ...]] = {}
+        self.users: dict[int, tuple[int, tuple[int, ...]]] = {}
+        self.encoded: Optional[EncodedSnapshot] = None
+
+    def reset(self) -> None:
+        self.version = 0
+        self.permissions.clear()
+        self.roles.clear()
+        self.users.clear()
+
+    def apply(self, page) -> bool:
+        """Применяет страницу /sync; True — граф поменялся."""
+        for perm in page.permissions:
+            self.permissions[perm.id] = perm.name
+        for role in page.roles:
+            self.roles[role.id] = tuple(role.permission_ids)
+        for user in page.users:
+            flags = (snapshot.ACTIVE if user.is_active else 0) | (
+                snapshot.SUPERUSER if user.is_superuser else 0
+            )
+            self.users[user.id] = (flags, tuple(user.role_ids))
+        # связи с удалённой ролью или разрешением отбросит кодирование
+        tables = {
+            "permission": self.permissions,
+            "role": self.roles,
+            "user": self.users,
+        }
+        for tombstone in page.deleted:
+            tables[tombstone.type].pop(tombstone.id, None)
+        return bool(page.permissions or page.roles or page.users or page.deleted)
+
+    async def catch_up(self, db: AsyncSession, upto: int, batch_size: int) -> None:
+        changed = self.encoded is None
+        while True:
+            try:
+                page = await crud.get_changes_since(
+                    db, self.tenant_id, self.version, upto, TYPES, batch_size
+                )
+            except HTTPException as exc:
+                if exc.status_code != status.HTTP_410_GONE:
+                    raise
+                # журнал очищен дальше версии графа — собираем заново
+                self.reset()
+                changed = True
+                continue
+            changed |= self.apply(page)
+            self.version = page.version
+            if not page.has_more:
+                break
+        if changed:
+            # копии: кодирование идёт в потоке, пока граф может меняться
+            data = await asyncio.to_thread(
+                snapshot.encode,
+                self.tenant_id,
+                self.version,
+                dict(self.permissions),
+                dict(self.roles),
+                dict(self.users),
+            )
+            self.encoded = EncodedSnapshot(
+                data=data,
+                etag='"' + hashlib.blake2b(data, digest_size=16).hexdigest() + '"',
+                version=self.version,
+            )
+
+
+class SnapshotStore:
+    """
+    Снимки по арендаторам. settle — окно из /sync (changes.settled_version):
+    граф догружается только до версии, раньше которой новых записей уже не
+    появится.
+    """
+
+    def __init__(
+        self,
+        refresh_interval: float = 1.0,
+        settle: float = 1.0,
+        batch_size: int = 5_000,
+    ) -> None:
+        self.refresh_interval = refresh_interval
+        self.settle = settle
+        self.batch_size = batch_size
+        self._graphs: dict[int, _TenantGraph] = {}
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._engine: Optional[AsyncEngine] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, engine: AsyncEngine) -> None:
+        """Запускает фоновое обновление; повторный вызов — no-op."""
+        if self.running:
+            return
+        self._engine = engine
+        self._task = asyncio.create_task(self._run(), name="snapshot-refresh")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def clear(self) -> None:
+        self._graphs.clear()
+
+    def _lock(self, tenant_id: int) -> asyncio.Lock:
+        return self._locks.setdefault(tenant_id, asyncio.Lock())
+
+    async def get(self, db: AsyncSession, tenant_id: int) -> EncodedSnapshot:
+        """Готовый снимок; первый запрос арендатора собирает граф."""
+        graph = self._graphs.get(tenant_id)
+        if graph is None:
+            async with self._lock(tenant_id):
+                graph = self._graphs.get(tenant_id)
+                if graph is None:
+                    graph = _TenantGraph(tenant_id)
+                    upto = await changes.settled_version(db, self.settle)
+                    await graph.catch_up(db, upto, self.batch_size)
+                    self._graphs[tenant_id] = graph
+        return graph.encoded
+
+    async def refresh(self, db: AsyncSession) -> None:
+        """Догружает дельту во все собранные графы."""
+        upto = await changes.settled_version(db, self.settle)
+        for tenant_id, graph in list(self._graphs.items()):
+            if graph.version < upto:
+                async with self._lock(tenant_id):
+                    await graph.catch_up(db, upto, self.batch_size)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            if not self._graphs:
+                continue
+            try:
+                async with AsyncSession(self._engine) as db:
+                    await self.refresh(db)
+            except Exception:
+                logger.exception("snapshot refresh failed")
+
+
+store = SnapshotStore()
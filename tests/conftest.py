@@ -1,15 +1,25 @@
 # tests/conftest.py
 import asyncio
 import os
+from collections import Counter
+from contextlib import contextmanager
 
 import pytest
-from httpx import AsyncClient
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import select, selectinload, sessionmaker
+from sqlalchemy.orm import selectinload, sessionmaker
 
-from src.access_manager.db import Base, get_db
+from src.access_manager import query_observer
+from src.access_manager.db import configure_engine, get_db
 from src.access_manager.main import app
-from src.access_manager.models import Permission, Role, User
+from src.access_manager.models import (
+    DEFAULT_TENANT_ID,
+    Base,
+    Permission,
+    Role,
+    User,
+)
 from src.access_manager.security import create_access_token, get_password_hash
 
 TEST_DB_URL = os.getenv(
@@ -39,7 +49,7 @@ def event_loop():
 # ──────────────────────────────────────────────────────────────────────────
 @pytest.fixture(scope="session")
 async def engine():
-    engine = create_async_engine(TEST_DB_URL, future=True, echo=False)
+    engine = configure_engine(create_async_engine(TEST_DB_URL, future=True, echo=False))
 
     async with engine.begin() as conn:
         # Полностью перестраиваем схему на чистую
@@ -70,6 +80,33 @@ async def db(session_maker):
 # ──────────────────────────────────────────────────────────────────────────
 #  Подмена зависимости get_db → тестовая сессия
 # ──────────────────────────────────────────────────────────────────────────
+@pytest.fixture(scope="function")
+def query_budget(engine):
+    """
+    Бюджет SQL-запросов на блок:
+
+        with query_budget(3):
+            await client.get("/users/1", headers=auth_header)
+
+    Тест падает, если внутри блока выполнено больше запросов, чем заявлено;
+    в сообщении — отпечатки с числом повторов (повторы обычно и есть N+1).
+    """
+
+    @contextmanager
+    def budget(max_queries: int):
+        with query_observer.capture(engine) as captured:
+            yield captured
+        if len(captured) > max_queries:
+            report = "\n".join(
+                f"  {count}× {fp}" for fp, count in Counter(captured).most_common()
+            )
+            pytest.fail(
+                f"query budget exceeded: {len(captured)} > {max_queries}\n{report}"
+            )
+
+    return budget
+
+
 @pytest.fixture(scope="function")
 async def client(session_maker):
     async def _get_test_db():
@@ -78,7 +115,8 @@ async def client(session_maker):
 
     app.dependency_overrides[get_db] = _get_test_db
 
-    async with AsyncClient(app=app, base_url="http://testserver") as ac:
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as ac:
         yield ac
 
     app.dependency_overrides.clear()
@@ -88,7 +126,9 @@ async def client(session_maker):
 #  Суперпользователь + Bearer-токен
 # ──────────────────────────────────────────────────────────────────────────
 async def _ensure_permission(session: AsyncSession, name: str) -> Permission:
-    stmt = select(Permission).where(Permission.name == name)
+    stmt = select(Permission).where(
+        Permission.tenant_id == DEFAULT_TENANT_ID, Permission.name == name
+    )
     result = await session.execute(stmt)
     perm = result.scalar_one_or_none()
     if perm:
@@ -104,44 +144,42 @@ async def auth_header(session_maker):
     """
     Заголовок { 'Authorization': 'Bearer …' } для запросов к защищённым эндпойнтам.
     Создаёт:
-      • обязательные permissions (`create_user`, `read_user`, …)
+      • обязательные permissions (`users:create`, `users:read`, …)
       • роль `admin` с этими разрешениями
       • суперпользователя admin / password
+    — всё в арендаторе по умолчанию.
     """
     async with session_maker() as session:
         required_perms = [
-            "create_user",
-            "read_user",
-            "update_user",
-            "delete_user",
-            "create_role",
-            "read_role",
-            "update_role",
-            "delete_role",
-            "create_permission",
-            "read_permission",
-            "update_permission",
-            "delete_permission",
+            f"{entity}:{action}"
+            for entity in ("users", "roles", "permissions")
+            for action in ("create", "read", "update", "delete")
         ]
         perms = [await _ensure_permission(session, name) for name in required_perms]
 
         # Роль «admin» (idempotent)
         stmt = (
             select(Role)
-            .where(Role.name == "admin")
+            .where(Role.tenant_id == DEFAULT_TENANT_ID, Role.name == "admin")
             .options(selectinload(Role.permissions))
         )
         result = await session.execute(stmt)
         role = result.scalar_one_or_none()
         if not role:
-            role = Role(name="admin", description="Autogenerated admin role")
+            role = Role(
+                name="admin", description="Autogenerated admin role", permissions=[]
+            )
             session.add(role)
             await session.flush()
         # Обновляем список perm'ов у роли, если он был не полный
         role.permissions = perms
 
         # Суперпользователь
-        stmt = select(User).where(User.username == "admin")
+        stmt = (
+            select(User)
+            .where(User.tenant_id == DEFAULT_TENANT_ID, User.username == "admin")
+            .options(selectinload(User.roles))
+        )
         result = await session.execute(stmt)
         user = result.scalar_one_or_none()
         if not user:
@@ -151,6 +189,7 @@ async def auth_header(session_maker):
                 hashed_password=get_password_hash("password"),
                 is_active=True,
                 is_superuser=True,
+                roles=[],
             )
             session.add(user)
             await session.flush()
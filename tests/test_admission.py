@@ -0,0 +1,84 @@
+import pytest
+
+from src.access_manager import admission
+from src.access_manager.admission import AdaptiveLimiter, Priority, classify
+
+
+@pytest.mark.parametrize(
+    "method, path, expected",
+    [
+        ("POST", "/login/token", Priority.CRITICAL),
+        ("GET", "/users/me", Priority.CRITICAL),
+        ("GET", "/snapshot", Priority.CRITICAL),
+        ("GET", "/users/", Priority.SHEDDABLE),
+        ("GET", "/roles/3/users", Priority.SHEDDABLE),
+        ("GET", "/users/3", Priority.NORMAL),
+        ("POST", "/users/", Priority.NORMAL),
+        ("GET", "/changes", None),
+        ("GET", "/metrics", None),
+    ],
+)
+def test_classify(method, path, expected):
+    assert classify(method, path) is expected
+
+
+def test_priority_shares():
+    limiter = AdaptiveLimiter(initial=10)
+    admitted = {
+        priority: sum(limiter.try_acquire(priority) for _ in range(10))
+        for priority in (Priority.SHEDDABLE, Priority.NORMAL, Priority.CRITICAL)
+    }
+    # списки — до 60 % лимита, обычные — до 90 %, критичные — весь лимит
+    assert admitted == {
+        Priority.SHEDDABLE: 6,
+        Priority.NORMAL: 3,
+        Priority.CRITICAL: 1,
+    }
+
+
+def test_limit_grows_under_target_and_backs_off_once_per_window():
+    limiter = AdaptiveLimiter(initial=10, target_latency=0.5, backoff=0.5)
+
+    # ненагруженный лимит не растёт
+    limiter.try_acquire(Priority.NORMAL)
+    limiter.release(0.01, now=0.0)
+    assert limiter.limit == 10
+
+    # +1/limit на быстрый ответ: меньше +1 за каждые limit ответов
+    for _ in range(10):
+        for _ in range(8):
+            limiter.try_acquire(Priority.CRITICAL)
+        for _ in range(8):
+            limiter.release(0.01, now=0.0)
+    assert 10 < limiter.limit < 18
+
+    limiter.reset(16)
+    for _ in range(5):
+        limiter.try_acquire(Priority.CRITICAL)
+    for _ in range(5):
+        limiter.release(2.0, now=1.0)
+    assert limiter.limit == 8
+    limiter.try_acquire(Priority.CRITICAL)
+    limiter.release(2.0, now=1.2)
+    assert limiter.limit == 8
+    limiter.try_acquire(Priority.CRITICAL)
+    limiter.release(2.0, now=1.6)
+    assert limiter.limit == limiter.min_limit == 4
+
+
+@pytest.mark.anyio
+async def test_overload_sheds_lists_before_critical(client, auth_header, monkeypatch):
+    limiter = admission.limiter
+    monkeypatch.setattr(limiter, "enabled", True)
+    monkeypatch.setattr(limiter, "retry_after", 3)
+    monkeypatch.setattr(limiter, "limit", 10.0)
+    # шесть запросов уже в работе: 60 % лимита
+    monkeypatch.setattr(limiter, "in_flight", 6)
+
+    r = await client.get("/users/", headers=auth_header)
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "3"
+
+    r = await client.get("/users/me", headers=auth_header)
+    assert r.status_code == 200
+    assert limiter.in_flight == 6
@@ -0,0 +1,73 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from src.access_manager import crud
+from src.access_manager import db as db_module
+from src.access_manager import security
+from src.access_manager.core.config import get_settings
+from src.access_manager.main import create_app
+from src.access_manager.models import DEFAULT_TENANT_ID
+
+
+def test_import_is_cheap():
+    # без DSN и ключа: импорт не читает настройки, не создаёт движок и
+    # приложение и не тянет драйвер БД
+    env = {
+        key: value
+        for key, value in os.environ.items()
+        if key not in ("POSTGRES_DSN", "SECRET_KEY")
+    }
+    code = (
+        "import sys\n"
+        "import src.access_manager.main as main\n"
+        "from src.access_manager import db\n"
+        "from src.access_manager.core.config import get_settings\n"
+        "assert 'asyncpg' not in sys.modules\n"
+        "assert db._engine is None and main._app is None\n"
+        "assert get_settings.cache_info().currsize == 0\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True, env=env)
+
+
+@pytest.mark.anyio
+async def test_lifespan_warms_up_and_disposes(engine, monkeypatch):
+    # lifespan берёт движок тестов и сбрасывает его на выходе
+    monkeypatch.setattr(db_module, "_engine", None)
+    monkeypatch.setattr(db_module, "_session_factory", None)
+    db_module.set_engine(engine)
+    monkeypatch.setattr(get_settings(), "warmup_authz_cache", True)
+    preloaded = []
+
+    async def preload(session):
+        preloaded.append(session)
+
+    monkeypatch.setattr(security, "authz_cache_preloaders", [preload])
+    app = create_app()
+
+    await engine.dispose()
+    async with app.router.lifespan_context(app):
+        assert engine.pool.checkedin() >= get_settings().db_pool_size
+        assert len(preloaded) == 1
+        assert app.openapi_schema is not None
+
+    assert db_module._engine is None
+
+
+@pytest.mark.anyio
+async def test_role_matchers_are_preloaded(client, auth_header, db, monkeypatch):
+    assert security.preload_role_matchers in security.authz_cache_preloaders
+    monkeypatch.setattr(security, "role_matchers", security.RoleMatcherCache())
+    await security.preload_role_matchers(db)
+    preloaded = dict(security.role_matchers._entries)
+    assert len(preloaded) == len(await crud.get_role_grants(db, 4096))
+
+    # принципал админа берёт уже собранные матчеры
+    r = await client.get("/users/me", headers=auth_header)
+    principal = await crud.get_principal(db, DEFAULT_TENANT_ID, r.json()["id"])
+    (role_id, grants), *_ = principal.roles
+    compiled = security.role_matchers.get(role_id, grants)
+    assert compiled is preloaded[role_id][1]
+    assert compiled.allows("users:read")
@@ -0,0 +1,31 @@
+import pytest
+from benchmarks.dataset import DatasetSpec
+from benchmarks.runner import percentile, run_benchmark
+from benchmarks.scenarios import SCENARIOS
+
+
+def test_percentile_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 95) == 95.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([7.0], 99) == 7.0
+    assert percentile([], 50) == 0.0
+
+
+@pytest.mark.anyio
+async def test_benchmark_smoke(tmp_path):
+    spec = DatasetSpec(users=20, roles=4, permissions=10, permissions_per_role=(2, 4))
+    report = await run_benchmark(
+        f"sqlite+aiosqlite:///{tmp_path}/bench.sqlite",
+        spec,
+        requests=3,
+        concurrency=2,
+    )
+
+    assert report["meta"]["dataset"]["users"] == 20
+    assert set(report["scenarios"]) == set(SCENARIOS)
+    for name, result in report["scenarios"].items():
+        assert result["errors"] == 0, name
+        assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+        assert result["queries_per_request"] > 0
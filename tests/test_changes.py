@@ -0,0 +1,218 @@
+import asyncio
+
+import pytest
+from sqlalchemy import delete, func, select
+
+from src.access_manager import changes
+from src.access_manager.main import app
+from src.access_manager.models import DEFAULT_TENANT_ID, ChangeLogEntry
+
+TYPES = ("user", "role", "permission", "grant")
+
+
+async def _next(stream):
+    return await asyncio.wait_for(anext(stream), 5)
+
+
+async def _last_seq(db) -> int:
+    return await db.scalar(select(func.max(ChangeLogEntry.seq)))
+
+
+@pytest.fixture
+async def feed(engine):
+    feed = changes.ChangeFeed(poll_interval=0.05, buffer_size=3)
+    yield feed
+    await feed.stop()
+
+
+@pytest.mark.anyio
+async def test_feed_delivers_writes_in_order(client, auth_header, engine, feed):
+    await feed.start(engine)
+    live = feed.subscribe(DEFAULT_TENANT_ID, TYPES)
+    # подписка регистрируется на первом шаге генератора
+    waiting = asyncio.ensure_future(_next(live))
+    await asyncio.sleep(0.05)
+
+    r = await client.post("/roles/", json={"name": "fed-role"}, headers=auth_header)
+    role_id = r.json()["id"]
+    await client.put(
+        f"/roles/{role_id}", json={"description": "changed"}, headers=auth_header
+    )
+    await client.delete(f"/roles/{role_id}", headers=auth_header)
+
+    events = [await waiting, await _next(live), await _next(live)]
+    assert [(e.entity_type, e.entity_id, e.op) for e in events] == [
+        ("role", role_id, "create"),
+        ("role", role_id, "update"),
+        ("role", role_id, "delete"),
+    ]
+    assert events[0].seq < events[1].seq < events[2].seq
+    assert events[0].sse.startswith(f"id: {events[0].seq}\nevent: change\n")
+    await live.aclose()
+
+    # возобновление: из буфера (последние 3 события) ...
+    resumed = feed.subscribe(DEFAULT_TENANT_ID, TYPES, events[0].seq)
+    assert [(await _next(resumed)).seq for _ in range(2)] == [
+        events[1].seq,
+        events[2].seq,
+    ]
+    await resumed.aclose()
+
+    # ... и из журнала, когда буфер пропуск уже не покрывает
+    for name in ("fed:a", "fed:b", "fed:c"):
+        await client.post("/permissions/", json={"name": name}, headers=auth_header)
+    while feed.cursor < events[2].seq + 3:
+        await asyncio.sleep(0.05)
+    resumed = feed.subscribe(DEFAULT_TENANT_ID, ("role",), events[0].seq)
+    assert [(await _next(resumed)).seq for _ in range(2)] == [
+        events[1].seq,
+        events[2].seq,
+    ]
+    await resumed.aclose()
+
+    # другой арендатор этих событий не видит
+    foreign = feed.subscribe(DEFAULT_TENANT_ID + 1, TYPES, events[0].seq - 1)
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(anext(foreign), 0.3)
+
+
+@pytest.mark.anyio
+async def test_late_commit_below_cursor_is_published(db, engine, monkeypatch):
+    # опрос — явным poll(), а не фоновой задачей
+    feed = changes.ChangeFeed(poll_interval=3600)
+    await feed.start(engine)
+    base = feed.cursor
+    finished = base
+
+    async def finished_seq(conn):
+        return finished
+
+    # транзакция с номером base + 1 ещё идёт, base + 2 уже закоммичена
+    monkeypatch.setattr(changes, "finished_seq", finished_seq)
+    live = feed.subscribe(DEFAULT_TENANT_ID, TYPES)
+    waiting = asyncio.ensure_future(_next(live))
+    await asyncio.sleep(0)
+
+    def entry(seq):
+        return ChangeLogEntry(
+            seq=seq,
+            tenant_id=DEFAULT_TENANT_ID,
+            entity_type="role",
+            entity_id=seq,
+            op="update",
+        )
+
+    db.add(entry(base + 2))
+    await db.commit()
+    assert await feed.poll() == 1
+    assert (feed.cursor, feed.watermark) == (base + 2, base)
+    early = await waiting
+    assert early.sse.startswith(f"id: {base}\n")
+
+    # курсор ушёл дальше, но пропуск перечитывается и не тормозит ленту
+    assert await feed.poll() == 0
+    db.add(entry(base + 1))
+    await db.commit()
+    assert await feed.poll() == 1
+    late = await _next(live)
+    assert (early.seq, late.seq) == (base + 2, base + 1)
+    assert late.sse.startswith(f"id: {base + 2}\n")
+    assert feed.watermark == base + 2
+    await live.aclose()
+
+    # откаченный номер снимается, как только его транзакция завершилась
+    db.add(entry(base + 4))
+    await db.commit()
+    await feed.poll()
+    assert feed.watermark == base + 2
+    finished = base + 4
+    await feed.poll()
+    assert feed.watermark == base + 4
+
+    # возобновление с id раннего события досылает опоздавшее
+    resumed = feed.subscribe(DEFAULT_TENANT_ID, TYPES, base)
+    assert [(await _next(resumed)).seq for _ in range(3)] == [
+        base + 2,
+        base + 1,
+        base + 4,
+    ]
+    await resumed.aclose()
+    await feed.stop()
+    await db.execute(delete(ChangeLogEntry).where(ChangeLogEntry.seq > base))
+    await db.commit()
+
+
+@pytest.mark.anyio
+async def test_resume_from_pruned_log_requires_resync(
+    client, auth_header, db, engine, feed
+):
+    await client.post("/permissions/", json={"name": "pruned:a"}, headers=auth_header)
+    pruned = await _last_seq(db)
+    await client.post("/permissions/", json={"name": "pruned:b"}, headers=auth_header)
+    # очистка журнала удаляет диапазон seq от начала
+    await db.execute(delete(ChangeLogEntry).where(ChangeLogEntry.seq <= pruned))
+    await db.commit()
+
+    await feed.start(engine)
+    stream = feed.subscribe(DEFAULT_TENANT_ID, TYPES, pruned - 1)
+    with pytest.raises(changes.ResyncRequired):
+        await _next(stream)
+
+
+async def _read_sse(path: str, headers: dict, count: int) -> list[str]:
+    """
+    Читает count событий потока и отключается: ASGITransport из httpx ждёт
+    конца тела, а поток SSE бесконечен.
+    """
+    received: list[str] = []
+    disconnected = asyncio.Event()
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body = message.get("body", b"").decode()
+            received.extend(chunk for chunk in body.split("\n\n") if chunk)
+            if len(received) >= count:
+                disconnected.set()
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        "client": ("test", 1),
+        "server": ("testserver", 80),
+    }
+    await asyncio.wait_for(app(scope, receive, send), 10)
+    return received
+
+
+@pytest.mark.anyio
+async def test_sse_endpoint_resumes_from_last_event_id(client, auth_header, db):
+    r = await client.post("/permissions/", json={"name": "sse:a"}, headers=auth_header)
+    first = r.json()["id"]
+    first_seq = await _last_seq(db)
+    r = await client.post("/permissions/", json={"name": "sse:b"}, headers=auth_header)
+    second = r.json()["id"]
+
+    try:
+        events = await _read_sse(
+            "/changes", {**auth_header, "Last-Event-ID": str(first_seq - 1)}, 2
+        )
+    finally:
+        await changes.feed.stop()
+
+    assert events[0] == (
+        f"id: {first_seq}\nevent: change\n"
+        f'data: {{"seq":{first_seq},"type":"permission","id":{first},"op":"create"}}'
+    )
+    assert f'"id":{second},"op":"create"' in events[1]
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+
+from src.access_manager import crud
+from src.access_manager.coalesce import SingleFlight
+
+
+def _coalesced(loader: str) -> float:
+    return (
+        REGISTRY.get_sample_value(
+            "access_manager_singleflight_coalesced_total", {"loader": loader}
+        )
+        or 0.0
+    )
+
+
+@pytest.mark.anyio
+async def test_concurrent_calls_share_one_load():
+    flight = SingleFlight("test")
+    calls = []
+    release = asyncio.Event()
+
+    async def load(key):
+        calls.append(key)
+        await release.wait()
+        return {"key": key}
+
+    before = _coalesced("test")
+    tasks = [asyncio.create_task(flight.do("k", load, "k")) for _ in range(5)]
+    other = asyncio.create_task(flight.do("other", load, "other"))
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*tasks)
+
+    assert calls == ["k", "other"]
+    assert all(result is results[0] for result in results)
+    assert (await other) == {"key": "other"}
+    assert _coalesced("test") - before == 4
+    # после завершения — снова загрузка, а не кэш
+    await flight.do("k", load, "k")
+    assert calls == ["k", "other", "k"]
+
+
+@pytest.mark.anyio
+async def test_errors_and_leader_cancellation():
+    flight = SingleFlight("test")
+    release = asyncio.Event()
+
+    async def fail():
+        await release.wait()
+        raise LookupError("boom")
+
+    tasks = [asyncio.create_task(flight.do("k", fail)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    for task in tasks:
+        with pytest.raises(LookupError):
+            await task
+
+    async def slow():
+        await asyncio.sleep(3600)
+
+    async def fast():
+        return 42
+
+    leader = asyncio.create_task(flight.do("k", slow))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(flight.do("k", fast))
+    await asyncio.sleep(0)
+    leader.cancel()
+    # отмена ведущего не отменяет ожидавших: они загружают сами
+    assert await follower == 42
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+
+
+@pytest.mark.anyio
+async def test_parallel_requests_with_one_token_load_principal_once(
+    client, auth_header, monkeypatch
+):
+    loads = []
+    get_principal = crud.get_principal
+
+    async def slow_get_principal(db, tenant_id, user_id):
+        loads.append(user_id)
+        # держим загрузку, пока подтянутся остальные запросы
+        await asyncio.sleep(0.05)
+        return await get_principal(db, tenant_id, user_id)
+
+    monkeypatch.setattr(crud, "get_principal", slow_get_principal)
+    responses = await asyncio.gather(
+        *(client.get("/users/me", headers=auth_header) for _ in range(10))
+    )
+
+    assert {r.status_code for r in responses} == {200}
+    assert len({r.json()["id"] for r in responses}) == 1
+    assert len(loads) == 1
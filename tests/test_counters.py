@@ -0,0 +1,91 @@
+import pytest
+from sqlalchemy import func, select, text
+
+from src.access_manager import counters
+from src.access_manager.models import DEFAULT_TENANT_ID, User
+
+
+async def _total(client, auth_header, **params):
+    r = await client.get("/users/", params=params, headers=auth_header)
+    assert r.status_code == 200
+    return r.headers.get("X-Total-Count")
+
+
+@pytest.mark.anyio
+async def test_total_count_follows_writes(client, auth_header, db):
+    # админ из фикстуры вставлен в обход crud — сверяем счётчики с таблицей
+    await counters.rebuild(db)
+    await db.commit()
+    actual = await db.scalar(
+        select(func.count())
+        .select_from(User)
+        .where(User.tenant_id == DEFAULT_TENANT_ID)
+    )
+    assert await _total(client, auth_header) == str(actual)
+
+    r = await client.post(
+        "/users/",
+        json={
+            "username": "counted",
+            "email": "counted@example.com",
+            "password": "secret123",
+        },
+        headers=auth_header,
+    )
+    user_id = r.json()["id"]
+    assert await _total(client, auth_header) == str(actual + 1)
+    inactive = int(await _total(client, auth_header, is_active="false"))
+
+    r = await client.put(
+        f"/users/{user_id}", json={"is_active": False}, headers=auth_header
+    )
+    assert r.status_code == 200
+    assert await _total(client, auth_header, is_active="false") == str(inactive + 1)
+
+    r = await client.delete(f"/users/{user_id}", headers=auth_header)
+    assert r.status_code == 200
+    assert await _total(client, auth_header) == str(actual)
+    assert await _total(client, auth_header, is_active="false") == str(inactive)
+
+    # фильтр без счётчика — заголовка нет, COUNT(*) не выполняется
+    assert await _total(client, auth_header, username="count") is None
+    assert (
+        await _total(client, auth_header, is_active="true", is_superuser="true") is None
+    )
+
+
+@pytest.mark.anyio
+async def test_name_filtered_lists_and_metrics(client, auth_header, db):
+    counts = await counters.rebuild(db)
+    await db.commit()
+
+    # X-Total-Count — итог арендатора, /metrics — всей установки
+    roles = await counters.read(db, DEFAULT_TENANT_ID, [counters.ROLES])
+    r = await client.get("/roles/", headers=auth_header)
+    assert r.headers["X-Total-Count"] == str(roles[counters.ROLES])
+    r = await client.get("/permissions/", params={"name": "read"}, headers=auth_header)
+    assert "X-Total-Count" not in r.headers
+
+    r = await client.get("/metrics")
+    assert r.status_code == 200
+    assert f"access_manager_users_total {counts[counters.USERS]}" in r.text
+    assert f"access_manager_permissions_total {counts[counters.PERMISSIONS]}" in r.text
+    assert "access_manager_users_active_total" in r.text
+
+
+@pytest.mark.anyio
+async def test_approximate_mode_uses_planner_statistics(db, monkeypatch):
+    if db.get_bind().dialect.name != "postgresql":
+        pytest.skip("pg_class statistics are Postgres-only")
+    rebuilt = await counters.rebuild(db)
+    await db.commit()
+    await db.execute(text("ANALYZE users"))
+    estimate = await db.scalar(
+        text("SELECT reltuples::bigint FROM pg_class WHERE relname = 'users'")
+    )
+
+    monkeypatch.setattr(counters, "APPROXIMATE", True)
+    counts = await counters.read(db, None, [counters.USERS, counters.USERS_ACTIVE])
+    assert counts[counters.USERS] == estimate
+    # срезы всегда читаются из поддерживаемых счётчиков
+    assert counts[counters.USERS_ACTIVE] == rebuilt[counters.USERS_ACTIVE]
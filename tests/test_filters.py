@@ -0,0 +1,85 @@
+from uuid import uuid4
+
+import pytest
+
+
+async def _create_user(client, auth_header, username, **extra):
+    payload = {
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": "VerySecret123!",
+        "role_ids": [],
+        **extra,
+    }
+    r = await client.post("/users/", json=payload, headers=auth_header)
+    assert r.status_code == 201, r.text
+    return r.json()
+
+
+@pytest.mark.anyio
+async def test_user_filters(client, auth_header):
+    tag = uuid4().hex[:6]
+    r = await client.post(
+        "/roles/", json={"name": f"filter_role_{tag}"}, headers=auth_header
+    )
+    role_id = r.json()["id"]
+
+    alice = await _create_user(client, auth_header, f"Alice_{tag}", role_ids=[role_id])
+    bob = await _create_user(client, auth_header, f"bob_{tag}")
+    r = await client.put(
+        f"/users/{bob['id']}", json={"is_active": False}, headers=auth_header
+    )
+    assert r.status_code == 200
+
+    async def ids(**params):
+        r = await client.get("/users/", params=params, headers=auth_header)
+        assert r.status_code == 200, r.text
+        return {u["id"] for u in r.json()}
+
+    # prefix — регистронезависимый
+    assert await ids(username=f"alice_{tag}") == {alice["id"]}
+    # contains
+    assert await ids(username=tag, match="contains") == {alice["id"], bob["id"]}
+    assert await ids(email=f"_{tag}@", match="contains") == {alice["id"], bob["id"]}
+    # '_' экранируется и не работает как wildcard
+    assert await ids(username=f"bob{tag}") == set()
+
+    assert await ids(username=tag, match="contains", is_active=False) == {bob["id"]}
+    assert await ids(role_id=role_id) == {alice["id"]}
+    assert await ids(username=tag, match="contains", created_from="2000-01-01") == {
+        alice["id"],
+        bob["id"],
+    }
+    assert await ids(username=tag, match="contains", created_to="2000-01-01") == set()
+    assert await ids(username=tag, match="contains", is_superuser=True) == set()
+
+
+@pytest.mark.anyio
+async def test_name_filters(client, auth_header):
+    tag = uuid4().hex[:6]
+    r = await client.post(
+        "/permissions/", json={"name": f"Billing_{tag}"}, headers=auth_header
+    )
+    perm_id = r.json()["id"]
+    r = await client.post(
+        "/roles/", json={"name": f"auditor_{tag}"}, headers=auth_header
+    )
+    role_id = r.json()["id"]
+
+    r = await client.get(
+        "/permissions/", params={"name": f"billing_{tag}"}, headers=auth_header
+    )
+    assert [p["id"] for p in r.json()] == [perm_id]
+
+    r = await client.get(
+        "/roles/", params={"name": tag, "match": "contains"}, headers=auth_header
+    )
+    assert [role["id"] for role in r.json()] == [role_id]
+
+
+@pytest.mark.anyio
+async def test_contains_requires_trigram_length(client, auth_header):
+    r = await client.get(
+        "/users/", params={"username": "ab", "match": "contains"}, headers=auth_header
+    )
+    assert r.status_code == 422
@@ -0,0 +1,80 @@
+import re
+import time
+from uuid import uuid4
+
+import pytest
+from prometheus_client import REGISTRY
+
+from src.access_manager.instrumentation import SamplingProfiler
+from src.access_manager.models import User
+from src.access_manager.security import get_password_hash
+
+SERVER_TIMING = re.compile(
+    r'db;dur=(?P<db>[\d.]+);desc="(?P<queries>\d+) queries", '
+    r"auth;dur=(?P<auth>[\d.]+), ser;dur=(?P<ser>[\d.]+), total;dur=(?P<total>[\d.]+)"
+)
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@pytest.mark.anyio
+async def test_server_timing_header(client, auth_header):
+    before = _sample("access_manager_request_queries_count")
+
+    r = await client.get("/users/", headers=auth_header)
+    assert r.status_code == 200
+
+    match = SERVER_TIMING.fullmatch(r.headers["Server-Timing"])
+    assert match, r.headers["Server-Timing"]
+    # принципал + список пользователей + selectin-загрузки
+    assert int(match["queries"]) >= 2
+    assert float(match["db"]) > 0
+    assert float(match["auth"]) > 0  # jwt.decode
+    assert float(match["total"]) >= float(match["db"]) + float(match["ser"])
+    assert "X-Process-Time" in r.headers
+
+    assert _sample("access_manager_request_queries_count") == before + 1
+
+
+@pytest.mark.anyio
+async def test_login_auth_time_includes_bcrypt(client, db):
+    username = f"timing_{uuid4().hex[:8]}"
+    db.add(
+        User(
+            username=username,
+            email=f"{username}@example.com",
+            hashed_password=get_password_hash("secretPass123"),
+        )
+    )
+    await db.commit()
+
+    r = await client.post(
+        "/login/token", data={"username": username, "password": "secretPass123"}
+    )
+    assert r.status_code == 200
+    match = SERVER_TIMING.fullmatch(r.headers["Server-Timing"])
+    assert int(match["queries"]) == 1
+    # bcrypt verify доминирует над остальным
+    assert float(match["auth"]) > float(match["db"])
+
+
+def test_sampling_profiler_dumps_slow_requests(tmp_path):
+    profiler = SamplingProfiler(threshold=0.01, interval=0.001, output_dir=tmp_path)
+
+    session = profiler.start()
+    assert profiler.start() is None  # одна сессия за раз
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        pass
+    path = session.finish(0.05, "GET /users/")
+
+    assert path is not None and path.parent == tmp_path
+    lines = path.read_text().splitlines()
+    assert lines and all(re.fullmatch(r".+ \d+", line) for line in lines)
+    assert any("test_sampling_profiler_dumps_slow_requests" in line for line in lines)
+
+    # быстрый запрос ничего не пишет
+    session = profiler.start()
+    assert session.finish(0.001, "GET /health") is None
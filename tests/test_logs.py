@@ -0,0 +1,119 @@
+import io
+import json
+import logging
+import queue
+from uuid import uuid4
+
+import pytest
+
+from src.access_manager import logs
+from src.access_manager.logs import LogPipeline, LogRule
+
+
+@pytest.fixture
+def capture():
+    # свой логгер без выхода в корень: конвейер приложения не мешает
+    stream = io.StringIO()
+    logger = logging.getLogger(f"test.logs.{uuid4().hex[:8]}")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+
+    def attach(**options):
+        pipeline = LogPipeline(stream, **options)
+        logger.addHandler(pipeline.handler)
+        pipeline.start()
+        return pipeline
+
+    yield logger, stream, attach
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+
+
+def _lines(stream: io.StringIO) -> list[dict]:
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_records_are_json_with_request_context(capture):
+    logger, stream, attach = capture
+    pipeline = attach()
+    token = logs.request_id.set("req-1")
+    logs.principal_id.set(7)
+    try:
+        args = ["before"]
+        logger.info("value=%s", args, extra={"role_id": 3})
+        # аргументы форматируются в момент вызова, а не в фоновом потоке
+        args[0] = "after"
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            logger.exception("boom")
+    finally:
+        logs.request_id.reset(token)
+        logs.principal_id.set(None)
+    pipeline.stop()
+
+    info, error = _lines(stream)
+    assert info["msg"] == "value=['before']"
+    assert info["level"] == "INFO"
+    assert (info["request_id"], info["principal_id"], info["role_id"]) == (
+        "req-1",
+        7,
+        3,
+    )
+    assert "ZeroDivisionError" in error["exc"]
+
+
+def test_rules_sample_by_request_and_limit_rate(capture):
+    logger, stream, attach = capture
+    pipeline = attach(rules={logger.name: LogRule(sample=0.5)})
+    kept = 0
+    for i in range(200):
+        token = logs.request_id.set(f"req-{i}")
+        # записи одного запроса в выборку попадают вместе
+        logger.debug("first")
+        logger.debug("second")
+        logger.warning("always")
+        logs.request_id.reset(token)
+        kept += LogRule(sample=0.5).sampled(f"req-{i}")
+    pipeline.stop()
+
+    lines = _lines(stream)
+    assert sum(line["level"] == "WARNING" for line in lines) == 200
+    assert sum(line["level"] == "DEBUG" for line in lines) == 2 * kept
+    assert 50 < kept < 150
+
+    # лимит — корзина на rate записей, пополняется rate в секунду
+    bucket = LogRule(rate=5)
+    bucket.allow(now=0.0)
+    assert sum(bucket.allow(now=0.0) for _ in range(20)) == 4
+    assert bucket.allow(now=0.3)
+    assert not bucket.allow(now=0.3)
+
+
+def test_full_queue_drops_records_without_blocking(capture):
+    logger, stream, attach = capture
+    # поток записи не запущен — очередь никто не разбирает
+    pipeline = LogPipeline(stream, queue_size=3)
+    logger.addHandler(pipeline.handler)
+    dropped = logs.DROPPED.labels("queue_full")._value.get()
+    for i in range(10):
+        logger.info("record %d", i)
+    assert logs.DROPPED.labels("queue_full")._value.get() - dropped == 7
+    with pytest.raises(queue.Full):
+        pipeline.queue.put_nowait(None)
+
+    pipeline.start()
+    pipeline.stop()
+    assert [line["msg"] for line in _lines(stream)] == [
+        "record 0",
+        "record 1",
+        "record 2",
+    ]
+
+
+@pytest.mark.anyio
+async def test_request_id_is_echoed_or_generated(client):
+    r = await client.get("/health", headers={"X-Request-ID": "edge-42"})
+    assert r.headers["X-Request-ID"] == "edge-42"
+    r = await client.get("/health")
+    assert len(r.headers["X-Request-ID"]) == 32
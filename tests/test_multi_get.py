@@ -0,0 +1,87 @@
+from uuid import uuid4
+
+import pytest
+
+from src.access_manager.schemas import MAX_BATCH_IDS
+
+MISSING = 10**6
+
+
+@pytest.fixture
+async def catalog(client, auth_header):
+    tag = uuid4().hex[:8]
+    perm_ids, role_ids, user_ids = [], [], []
+    for i in range(3):
+        r = await client.post(
+            "/permissions/", json={"name": f"mg{tag}:p{i}"}, headers=auth_header
+        )
+        perm_ids.append(r.json()["id"])
+        r = await client.post(
+            "/roles/",
+            json={"name": f"mg-{tag}-{i}", "permission_ids": perm_ids[: i + 1]},
+            headers=auth_header,
+        )
+        role_ids.append(r.json()["id"])
+        r = await client.post(
+            "/users/",
+            json={
+                "username": f"mg{i}_{tag}",
+                "email": f"mg{i}_{tag}@example.com",
+                "password": "secret123",
+                "role_ids": role_ids[: i + 1],
+            },
+            headers=auth_header,
+        )
+        user_ids.append(r.json()["id"])
+    return {"users": user_ids, "roles": role_ids, "permissions": perm_ids}
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("kind", ["users", "roles", "permissions"])
+async def test_batch_returns_request_order_with_misses(
+    client, auth_header, catalog, kind
+):
+    a, b, c = catalog[kind]
+    ids = [c, MISSING, a, c]
+    r = await client.get(
+        f"/{kind}/batch", params={"ids": ",".join(map(str, ids))}, headers=auth_header
+    )
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert [item and item["id"] for item in body["items"]] == [c, None, a, c]
+    assert body["missing"] == [MISSING]
+
+    # POST — то же для длинных списков; ?ids= можно и повторять
+    r = await client.post(f"/{kind}/batch", json={"ids": ids}, headers=auth_header)
+    assert r.json() == body
+    r = await client.get(
+        f"/{kind}/batch", params=[("ids", c), ("ids", b)], headers=auth_header
+    )
+    assert [item["id"] for item in r.json()["items"]] == [c, b]
+
+
+@pytest.mark.anyio
+async def test_batch_loads_relations_in_one_query_each(
+    client, auth_header, catalog, query_budget
+):
+    ids = ",".join(map(str, catalog["users"]))
+    # принципал + пользователи + selectin ролей + selectin разрешений
+    with query_budget(4):
+        r = await client.get("/users/batch", params={"ids": ids}, headers=auth_header)
+    last = r.json()["items"][-1]
+    assert sorted(role["id"] for role in last["roles"]) == catalog["roles"]
+    assert {len(role["permissions"]) for role in last["roles"]} == {1, 2, 3}
+
+
+@pytest.mark.anyio
+async def test_batch_enforces_size_limits(client, auth_header):
+    too_many = list(range(1, MAX_BATCH_IDS + 2))
+    r = await client.post("/roles/batch", json={"ids": too_many}, headers=auth_header)
+    assert r.status_code == 422
+    r = await client.post("/roles/batch", json={"ids": []}, headers=auth_header)
+    assert r.status_code == 422
+    for ids in ("", "1,x"):
+        r = await client.get("/roles/batch", params={"ids": ids}, headers=auth_header)
+        assert r.status_code == 422
+    r = await client.get("/roles/batch")
+    assert r.status_code == 401
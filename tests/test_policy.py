@@ -0,0 +1,108 @@
+import os
+import subprocess
+import sys
+from itertools import count
+
+import pytest
+from fastapi import HTTPException
+
+from src.access_manager import security, snapshot
+from src.access_manager.policy import PolicyEngine
+from src.access_manager.principal import Principal
+
+# роли пользователя (списки грантов), запрошенные имена (хотя бы одно), решение
+CASES = [
+    ([["users:read"]], ["users:read"], True),
+    ([["users:read"]], ["users:update"], False),
+    ([["users:*"]], ["users:roles:assign"], True),
+    ([["users:*"]], ["users"], False),
+    ([["*"]], ["billing:invoices:read"], True),
+    ([["billing:invoices:read"]], ["billing:invoices"], False),
+    ([["export_reports"]], ["export_reports"], True),
+    ([["export_reports"]], ["export_reports:csv"], False),
+    ([["roles:read"], ["users:*"]], ["users:delete"], True),
+    ([["roles:read"]], ["users:read", "roles:read"], True),
+    ([[], ["roles:*"]], ["users:read"], False),
+    ([], ["users:read"], False),
+]
+
+_ids = count(10_000)
+
+
+async def _require_permission(roles: list, names: list) -> bool:
+    user = Principal(
+        id=next(_ids),
+        tenant_id=1,
+        is_active=True,
+        is_superuser=False,
+        roles=[(next(_ids), frozenset(grants)) for grants in roles],
+    )
+    try:
+        await security.require_permission(*names)(current_user=user)
+    except HTTPException as exc:
+        assert exc.status_code == 403
+        return False
+    return True
+
+
+async def _policy_engine(roles: list, names: list) -> bool:
+    permissions, role_perms = {}, {}
+    for role_id, grants in enumerate(roles):
+        role_perms[role_id] = []
+        for name in grants:
+            perm_id = permissions.setdefault(name, len(permissions))
+            role_perms[role_id].append(perm_id)
+    data = snapshot.encode(
+        1,
+        1,
+        {perm_id: name for name, perm_id in permissions.items()},
+        role_perms,
+        {7: (snapshot.ACTIVE, list(role_perms))},
+    )
+    return PolicyEngine(data).has_permission(7, *names)
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("decide", [_require_permission, _policy_engine])
+@pytest.mark.parametrize("roles, names, expected", CASES)
+async def test_decisions_match_require_permission(decide, roles, names, expected):
+    assert await decide(roles, names) is expected
+
+
+def test_inactive_and_unknown_users_are_denied():
+    data = snapshot.encode(
+        1, 1, {1: "*"}, {1: [1]}, {1: (snapshot.ACTIVE, [1]), 2: (0, [1])}
+    )
+    engine = PolicyEngine(data)
+    assert engine.has_permission(1, "users:read")
+    # неактивного не пускает get_current_active_user
+    assert not engine.has_permission(2, "users:read")
+    assert not engine.has_permission(3, "users:read")
+
+
+def test_hot_swap_keeps_newest_snapshot():
+    engine = PolicyEngine()
+    with pytest.raises(RuntimeError):
+        engine.has_permission(1, "users:read")
+
+    old = snapshot.encode(1, 5, {1: "users:read"}, {1: [1]}, {1: (1, [1])})
+    new = snapshot.encode(1, 9, {1: "roles:read"}, {1: [1]}, {1: (1, [1])})
+    assert engine.load(old)
+    before = engine.snapshot
+    assert engine.load(new)
+    assert engine.version == 9
+    assert engine.has_permission(1, "roles:read")
+    # снятый раньше снимок не меняется под читателем
+    assert before.has_permission(1, "users:read")
+    assert not engine.load(old)
+    assert engine.has_permission(1, "roles:read")
+
+
+def test_import_has_no_server_dependencies():
+    code = (
+        "import sys\n"
+        "import src.access_manager.policy\n"
+        "for module in ('fastapi', 'sqlalchemy', 'pydantic'):\n"
+        "    assert module not in sys.modules, module\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True, env=dict(os.environ))
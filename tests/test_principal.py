@@ -0,0 +1,47 @@
+from uuid import uuid4
+
+import pytest
+
+from src.access_manager import crud
+from src.access_manager.models import DEFAULT_TENANT_ID, Permission, Role, User
+
+
+@pytest.mark.anyio
+async def test_principal_aggregates_permissions_per_role(db):
+    tag = uuid4().hex[:8]
+    read = Permission(name=f"p{tag}:read")
+    write = Permission(name=f"p{tag}:*")
+    full = Role(name=f"full_{tag}", permissions=[read, write])
+    empty = Role(name=f"empty_{tag}", permissions=[])
+    user = User(
+        username=f"principal_{tag}",
+        email=f"principal_{tag}@example.com",
+        hashed_password="x",
+        is_active=True,
+        roles=[full, empty],
+    )
+    lonely = User(
+        username=f"lonely_{tag}",
+        email=f"lonely_{tag}@example.com",
+        hashed_password="x",
+        is_active=False,
+    )
+    db.add_all([user, lonely])
+    await db.commit()
+    db.expunge_all()
+
+    principal = await crud.get_principal(db, DEFAULT_TENANT_ID, user.id)
+    assert (principal.id, principal.tenant_id) == (user.id, DEFAULT_TENANT_ID)
+    assert principal.is_active and not principal.is_superuser
+    assert dict(principal.roles) == {
+        full.id: frozenset({f"p{tag}:read", f"p{tag}:*"}),
+        empty.id: frozenset(),
+    }
+    # только значения: в сессии нет ни одного ORM-объекта
+    assert len(db.identity_map) == 0
+
+    principal = await crud.get_principal(db, DEFAULT_TENANT_ID, lonely.id)
+    assert principal.roles == () and not principal.is_active
+    assert await crud.get_principal(db, DEFAULT_TENANT_ID + 1, user.id) is None
+    with pytest.raises(AttributeError):
+        principal.username = "x"
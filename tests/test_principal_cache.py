@@ -0,0 +1,253 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import func, select
+
+from src.access_manager import changes, crud, expiry, principal_cache
+from src.access_manager.checkpoint import Checkpoint, CheckpointError, encode
+from src.access_manager.models import DEFAULT_TENANT_ID, ChangeLogEntry
+from src.access_manager.principal import Principal
+from src.access_manager.principal_cache import Checkpointer, PrincipalCache
+
+READ = frozenset({"docs:read"})
+WRITE = frozenset({"docs:read", "docs:write"})
+
+
+def _principals() -> list[Principal]:
+    return [
+        Principal(7, 2, True, False, [(10, READ)]),
+        Principal(3, 1, True, True, [(10, READ), (11, WRITE)]),
+        Principal(5, 1, False, False, []),
+    ]
+
+
+async def _caught_up(feed, db) -> None:
+    last = await db.scalar(select(func.max(ChangeLogEntry.seq)))
+    for _ in range(100):
+        if feed.cursor >= last:
+            return
+        await asyncio.sleep(0.05)
+    raise AssertionError("feed did not catch up")
+
+
+@pytest.fixture
+async def feed(engine):
+    feed = changes.ChangeFeed(poll_interval=0.05)
+    await feed.start(engine)
+    yield feed
+    await feed.stop()
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    # глобальный кэш включается только на тест
+    principal_cache.cache.clear()
+    monkeypatch.setattr(principal_cache.cache, "enabled", True)
+    yield principal_cache.cache
+    principal_cache.cache.clear()
+
+
+def test_checkpoint_round_trip(tmp_path):
+    data = encode(42, 1000.0, 2000.0, _principals())
+    assert data == encode(42, 1000.0, 2000.0, reversed(_principals()))
+    path = tmp_path / "authz.ckpt"
+    path.write_bytes(data)
+
+    checkpoint = Checkpoint.open(str(path))
+    assert (checkpoint.version, checkpoint.valid_until, len(checkpoint)) == (
+        42,
+        2000.0,
+        3,
+    )
+    admin = checkpoint.principal(1, 3)
+    assert (admin.id, admin.tenant_id, admin.is_active, admin.is_superuser) == (
+        3,
+        1,
+        True,
+        True,
+    )
+    assert admin.roles == ((10, READ), (11, WRITE))
+    assert checkpoint.principal(1, 5).roles == ()
+    assert checkpoint.principal(2, 3) is None
+    assert [(p.tenant_id, p.id) for p in checkpoint] == [(1, 3), (1, 5), (2, 7)]
+    checkpoint.close()
+
+    with pytest.raises(CheckpointError):
+        Checkpoint(b"XXXX" + data[4:])
+    with pytest.raises(CheckpointError):
+        Checkpoint(data[:-8])
+
+
+def test_cache_drops_stale_entries():
+    cache = PrincipalCache(max_users=2, ttl=10.0)
+    cache.enabled = True
+    alice, bob, carol = _principals()
+
+    # загрузка, начатая до сброса, не кэшируется
+    epoch = cache.epoch
+    cache.discard([(2, 7)])
+    cache.put(alice, epoch, now=0.0)
+    assert cache.get(2, 7, now=1.0) is None
+
+    for principal in (alice, bob, carol):
+        cache.put(principal, cache.epoch, now=0.0)
+    assert len(cache) == 2
+    assert cache.get(2, 7, now=1.0) is None
+    assert cache.get(1, 3, now=1.0) is bob
+    assert cache.get(1, 3, now=11.0) is None
+
+    cache.put(bob, cache.epoch, now=0.0)
+    cache.invalidate(changes.Change(1, 1, "role", 11, changes.UPDATE, ""))
+    assert cache.get(1, 3, now=1.0) is None
+    assert cache.get(1, 5, now=1.0) is carol
+    # новое разрешение ничьих ролей не меняет
+    cache.invalidate(changes.Change(2, 1, "permission", 99, changes.CREATE, ""))
+    assert cache.get(1, 5, now=1.0) is carol
+    cache.invalidate(changes.Change(3, 1, "permission", 99, changes.DELETE, ""))
+    assert cache.get(1, 5, now=1.0) is None
+
+
+@pytest.mark.anyio
+async def test_entry_expires_at_next_role_deadline(
+    client, auth_header, db, monkeypatch
+):
+    # срок проверяется по записи кэша, а не планировщиком
+    monkeypatch.setattr(expiry.scheduler, "start", lambda engine: None)
+    tag = uuid4().hex[:8]
+    r = await client.post("/roles/", json={"name": f"dl-{tag}"}, headers=auth_header)
+    role_id = r.json()["id"]
+    r = await client.post(
+        "/users/",
+        json={
+            "username": f"dl_{tag}",
+            "email": f"dl_{tag}@example.com",
+            "password": "secret123",
+        },
+        headers=auth_header,
+    )
+    user_id = r.json()["id"]
+    principal = await crud.get_principal(db, DEFAULT_TENANT_ID, user_id)
+    assert principal.valid_until is None
+
+    start = datetime.now(timezone.utc) + timedelta(seconds=30)
+    await client.post(
+        f"/users/{user_id}/roles",
+        json={"role_id": role_id, "valid_from": start.isoformat()},
+        headers=auth_header,
+    )
+    principal = await crud.get_principal(db, DEFAULT_TENANT_ID, user_id)
+    assert principal.roles == ()
+    assert abs(principal.valid_until - start.timestamp()) < 1
+
+    # ttl 300 с, но запись живёт до вступления роли в силу
+    cache = PrincipalCache(ttl=300.0)
+    cache.enabled = True
+    cache.put(principal, cache.epoch, now=0.0)
+    left = principal.valid_until - time.time()
+    assert cache.get(DEFAULT_TENANT_ID, user_id, now=left - 5) is principal
+    assert cache.get(DEFAULT_TENANT_ID, user_id, now=left + 1) is None
+    # сроки в БД общие для тестов
+    await client.delete(f"/users/{user_id}/roles/{role_id}", headers=auth_header)
+
+
+def test_cache_masks_invalidated_checkpoint_entries():
+    cache = PrincipalCache()
+    cache.enabled = True
+    cache.attach(Checkpoint(encode(1, 0.0, 2e10, _principals())))
+    assert cache.get(2, 7).id == 7
+    assert cache.get(1, 3).id == 3
+
+    cache.discard_role(11)
+    assert cache.get(1, 3) is None
+    assert cache.get(1, 5).id == 5
+    cache.clear(1)
+    assert cache.get(1, 5) is None
+    assert cache.get(2, 7).id == 7
+    assert {p.id for p in cache.hot()} == {7}
+
+    # просроченный файл отключается
+    cache.attach(Checkpoint(encode(1, 0.0, 1.0, _principals())))
+    assert cache.get(2, 7) is None
+    assert cache.checkpoint is None
+
+
+@pytest.mark.anyio
+async def test_checkpoint_survives_restart_and_replays_changes(
+    client, auth_header, db, feed, tmp_path
+):
+    tag = uuid4().hex[:8]
+    r = await client.post("/roles/", json={"name": f"ck-{tag}"}, headers=auth_header)
+    role_id = r.json()["id"]
+    user_ids = []
+    for i in range(2):
+        r = await client.post(
+            "/users/",
+            json={
+                "username": f"ck{i}_{tag}",
+                "email": f"ck{i}_{tag}@example.com",
+                "password": "secret123",
+                "role_ids": [role_id] if i else [],
+            },
+            headers=auth_header,
+        )
+        user_ids.append(r.json()["id"])
+
+    path = str(tmp_path / "authz.ckpt")
+    before = PrincipalCache()
+    before.enabled = True
+    for user_id in user_ids:
+        principal = await crud.get_principal(db, DEFAULT_TENANT_ID, user_id)
+        before.put(principal, before.epoch)
+    await _caught_up(feed, db)
+    assert await Checkpointer(before, path, feed=feed).write(db)
+
+    # «рестарт»: пока воркер лежал, роль переименовали
+    r = await client.put(
+        f"/roles/{role_id}", json={"description": "changed"}, headers=auth_header
+    )
+    assert r.status_code == 200
+    after = PrincipalCache()
+    after.enabled = True
+    checkpointer = Checkpointer(after, path, feed=feed)
+    assert checkpointer.load()
+    assert after.get(DEFAULT_TENANT_ID, user_ids[1]).role_ids == {role_id}
+
+    assert await checkpointer.validate(db) >= 1
+    assert after.get(DEFAULT_TENANT_ID, user_ids[0]).id == user_ids[0]
+    assert after.get(DEFAULT_TENANT_ID, user_ids[1]) is None
+    after.detach()
+
+    # мусор вместо файла — старт без checkpoint
+    with open(path, "wb") as f:
+        f.write(b"garbage")
+    assert not checkpointer.load()
+
+
+@pytest.mark.anyio
+async def test_me_is_served_from_cache(client, auth_header, cache, monkeypatch):
+    loads = []
+    get_principal = crud.get_principal
+
+    async def counting(db, tenant_id, user_id):
+        loads.append(user_id)
+        return await get_principal(db, tenant_id, user_id)
+
+    monkeypatch.setattr(crud, "get_principal", counting)
+    for _ in range(2):
+        r = await client.get("/users/me", headers=auth_header)
+        assert r.status_code == 200
+    assert len(loads) == 1
+
+    # изменение пользователя сбрасывает его запись сразу
+    user_id = r.json()["id"]
+    r = await client.put(
+        f"/users/{user_id}",
+        json={"email": f"cached_{uuid4().hex[:8]}@example.com"},
+        headers=auth_header,
+    )
+    assert r.status_code == 200
+    await client.get("/users/me", headers=auth_header)
+    assert loads == [user_id, user_id]
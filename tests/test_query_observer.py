@@ -0,0 +1,93 @@
+import logging
+
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from src.access_manager import query_observer
+from src.access_manager.models import User
+
+
+def test_fingerprint_normalizes_literals_and_params():
+    a = query_observer.fingerprint(
+        "SELECT users.id FROM users\n  WHERE users.id IN (1, 2, 3) AND name = 'x'"
+    )
+    b = query_observer.fingerprint(
+        "SELECT users.id FROM users WHERE users.id IN ($1, $2) AND name = 'it''s'"
+    )
+    assert a == b == "SELECT users.id FROM users WHERE users.id IN (?+) AND name = ?"
+    # цифры внутри идентификаторов не трогаем
+    assert query_observer.fingerprint("SELECT anon_1.id FROM t AS anon_1") == (
+        "SELECT anon_1.id FROM t AS anon_1"
+    )
+
+
+def test_redact_hides_values():
+    assert query_observer.redact({"username": "alice", "id": 1}) == {
+        "username": "<str>",
+        "id": "<int>",
+    }
+    assert query_observer.redact(("secret", 5)) == ["<str>", "<int>"]
+    assert query_observer.redact([(1, 2), (3, 4)]) == "<2 rows>"
+
+
+@pytest.mark.anyio
+async def test_n_plus_one_and_slow_query_logging(db, caplog, monkeypatch):
+    monkeypatch.setattr(query_observer, "SLOW_QUERY_THRESHOLD", 0.0)
+    caplog.set_level(logging.WARNING, logger="access_manager.query_observer")
+
+    query_observer.start_request()
+    for user_id in range(query_observer.N_PLUS_ONE_THRESHOLD):
+        await db.execute(select(User.username).where(User.id == user_id))
+    suspects = query_observer.finish_request("GET /test")
+
+    assert len(suspects) == 1
+    fp, count = suspects[0]
+    assert count == query_observer.N_PLUS_ONE_THRESHOLD
+    assert "possible N+1 in GET /test" in caplog.text
+    assert "slow query" in caplog.text
+    # значения параметров в лог не попадают
+    assert "params=['<int>']" in caplog.text
+
+
+@pytest.mark.anyio
+async def test_failed_statement_leaves_no_timing_state(db, caplog, monkeypatch):
+    monkeypatch.setattr(query_observer, "SLOW_QUERY_THRESHOLD", 0.0)
+    caplog.set_level(logging.WARNING, logger="access_manager.query_observer")
+    conn = await db.connection()
+    info = (await conn.get_raw_connection()).info
+    for _ in range(3):
+        with pytest.raises((OperationalError, ProgrammingError)):
+            await db.execute(text("SELECT * FROM no_such_table"))
+        await db.rollback()
+    # время живёт на контексте оператора, а не стеком на соединении
+    assert not {"query_start", "observer_start"} & set(info)
+
+    await db.execute(select(User.id).limit(1))
+    assert "slow query" in caplog.text
+
+
+@pytest.mark.anyio
+async def test_endpoint_query_budgets(client, auth_header, query_budget):
+    # принципал (без ORM) + пользователь с ролями для ответа
+    with query_budget(2):
+        r = await client.get("/users/me", headers=auth_header)
+    assert r.status_code == 200
+    user_id = r.json()["id"]
+
+    # принципал + пользователь
+    with query_budget(2):
+        r = await client.get(f"/users/{user_id}", headers=auth_header)
+    assert r.status_code == 200
+
+    # принципал + счётчик + страница + selectin ролей + selectin разрешений
+    with query_budget(5):
+        r = await client.get("/users/", headers=auth_header)
+    assert r.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_query_budget_fails_when_exceeded(client, auth_header, query_budget):
+    with pytest.raises(pytest.fail.Exception, match="query budget exceeded"):
+        with query_budget(1):
+            await client.get("/users/", headers=auth_header)
@@ -0,0 +1,132 @@
+from uuid import uuid4
+
+import pytest
+
+from src.access_manager import ratelimit, security
+from src.access_manager.models import User
+from src.access_manager.security import get_password_hash
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    monkeypatch.setattr(ratelimit.login_limiter, "enabled", True)
+    monkeypatch.setattr(ratelimit.login_limiter, "backend", ratelimit.MemoryBuckets())
+    monkeypatch.setattr(ratelimit.login_limiter, "per_user", ratelimit.Rate(2, 300))
+    monkeypatch.setattr(ratelimit.login_limiter, "per_ip", ratelimit.Rate(100, 60))
+    return ratelimit.login_limiter
+
+
+@pytest.fixture
+def bcrypt_calls(monkeypatch):
+    """Считает проверки пароля, включая фиктивные."""
+    calls = []
+    verify, dummy = security.verify_password, security.dummy_verify
+
+    def _verify(plain, hashed):
+        calls.append("verify")
+        return verify(plain, hashed)
+
+    def _dummy():
+        calls.append("dummy")
+        dummy()
+
+    monkeypatch.setattr(security, "verify_password", _verify)
+    monkeypatch.setattr(security, "dummy_verify", _dummy)
+    return calls
+
+
+async def _user(db, password: str) -> str:
+    username = f"user_{uuid4().hex[:8]}"
+    db.add(
+        User(
+            username=username,
+            email=f"{username}@example.com",
+            hashed_password=get_password_hash(password),
+            is_active=True,
+        )
+    )
+    await db.commit()
+    return username
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "backend", [ratelimit.MemoryBuckets, ratelimit.DatabaseBuckets]
+)
+async def test_bucket_refills_over_period(db, backend):
+    buckets = backend()
+    key = f"user:1:{uuid4().hex}"
+    rate = ratelimit.Rate(3, 30.0)
+
+    assert [await buckets.take(db, key, rate, 1000.0) for _ in range(3)] == [0] * 3
+    # пусто: следующий токен через period / capacity
+    assert await buckets.take(db, key, rate, 1000.0) == pytest.approx(10.0)
+    assert await buckets.take(db, key, rate, 1005.0) == pytest.approx(5.0)
+    assert await buckets.take(db, key, rate, 1010.0) == 0
+
+    await buckets.reset(db, key)
+    assert [await buckets.take(db, key, rate, 1010.0) for _ in range(3)] == [0] * 3
+
+
+@pytest.mark.anyio
+async def test_login_limited_before_bcrypt(client, db, limiter, bcrypt_calls):
+    username = await _user(db, "correct_password")
+    form = {"username": username, "password": "wrong_password"}
+
+    for _ in range(2):
+        r = await client.post("/login/token", data=form)
+        assert r.status_code == 401
+    assert bcrypt_calls == ["verify", "verify"]
+
+    r = await client.post("/login/token", data=form)
+    assert r.status_code == 429
+    assert int(r.headers["Retry-After"]) >= 1
+    # отклонено до проверки пароля — даже верного
+    r = await client.post(
+        "/login/token", data={"username": username.upper(), "password": "x"}
+    )
+    assert r.status_code == 429
+    assert bcrypt_calls == ["verify", "verify"]
+
+
+@pytest.mark.anyio
+async def test_successful_login_resets_user_bucket(client, db, limiter):
+    username = await _user(db, "correct_password")
+
+    r = await client.post(
+        "/login/token", data={"username": username, "password": "wrong_password"}
+    )
+    assert r.status_code == 401
+    r = await client.post(
+        "/login/token", data={"username": username, "password": "correct_password"}
+    )
+    assert r.status_code == 200
+    for _ in range(2):
+        r = await client.post(
+            "/login/token", data={"username": username, "password": "wrong_password"}
+        )
+        assert r.status_code == 401
+
+
+@pytest.mark.anyio
+async def test_unknown_user_costs_one_bcrypt_round(client, limiter, bcrypt_calls):
+    r = await client.post(
+        "/login/token", data={"username": f"ghost_{uuid4().hex[:8]}", "password": "x"}
+    )
+    assert r.status_code == 401
+    assert bcrypt_calls == ["dummy"]
+
+
+@pytest.mark.anyio
+async def test_ip_limit_spans_usernames(client, limiter, monkeypatch):
+    monkeypatch.setattr(limiter, "per_ip", ratelimit.Rate(3, 60))
+    codes = [
+        (
+            await client.post(
+                "/login/token",
+                data={"username": f"ghost_{uuid4().hex[:8]}", "password": "x"},
+            )
+        ).status_code
+        for _ in range(4)
+    ]
+    assert codes == [401, 401, 401, 429]
@@ -0,0 +1,181 @@
+import os
+import time
+from uuid import uuid4
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from src.access_manager import crud, security
+from src.access_manager.core.config import get_settings
+from src.access_manager.db import configure_engine
+from src.access_manager.main import app
+from src.access_manager.models import DEFAULT_TENANT_ID, Base, ChangeLogEntry, User
+from src.access_manager.replica import Replica, ReplicaMiddleware, _metadata
+
+EDGE_URL = os.getenv("TEST_EDGE_URL", "sqlite+aiosqlite:///./test_edge.sqlite")
+
+
+@pytest.fixture(autouse=True)
+def no_settle(monkeypatch):
+    # /sync в тестах — до конца журнала
+    monkeypatch.setattr(get_settings(), "sync_settle_seconds", 0)
+
+
+@pytest.fixture
+async def edge_engine():
+    engine = configure_engine(create_async_engine(EDGE_URL))
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(_metadata.drop_all)
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+async def edge(client, auth_header, edge_engine):
+    # основная установка — тестовое приложение (client подменяет его БД)
+    replica = Replica(
+        "http://primary",
+        "admin",
+        "password",
+        max_staleness=60.0,
+        transport=ASGITransport(app=app),
+    )
+    replica.enabled = True
+    await replica.prepare(edge_engine)
+    yield replica
+    await replica.stop()
+
+
+async def _principal(engine, user_id: int):
+    async with AsyncSession(engine) as db:
+        return await crud.get_principal(db, DEFAULT_TENANT_ID, user_id)
+
+
+@pytest.mark.anyio
+async def test_replica_applies_deltas(client, auth_header, edge, edge_engine):
+    tag = uuid4().hex[:8]
+    r = await client.post(
+        "/permissions/", json={"name": f"edge{tag}:read"}, headers=auth_header
+    )
+    perm_id = r.json()["id"]
+    r = await client.post(
+        "/roles/",
+        json={"name": f"edge-{tag}", "permission_ids": [perm_id]},
+        headers=auth_header,
+    )
+    role_id = r.json()["id"]
+    r = await client.post(
+        "/users/",
+        json={
+            "username": f"edge_{tag}",
+            "email": f"edge_{tag}@example.com",
+            "password": "secret123",
+            "role_ids": [role_id],
+        },
+        headers=auth_header,
+    )
+    user_id = r.json()["id"]
+
+    async with AsyncSession(edge_engine) as db:
+        assert await edge.sync_once(db) > 0
+    assert edge.version > 0
+    assert edge.staleness() < 5
+    principal = await _principal(edge_engine, user_id)
+    assert security.has_permission(principal, f"edge{tag}:read")
+
+    # снятие роли и удаление разрешения доходят следующим проходом
+    await client.delete(f"/users/{user_id}/roles/{role_id}", headers=auth_header)
+    await client.delete(f"/permissions/{perm_id}", headers=auth_header)
+    async with AsyncSession(edge_engine) as db:
+        assert await edge.sync_once(db) >= 2
+        logged = await db.scalars(
+            select(ChangeLogEntry.op)
+            .where(
+                ChangeLogEntry.entity_type == "permission",
+                ChangeLogEntry.entity_id == perm_id,
+            )
+            .order_by(ChangeLogEntry.seq)
+        )
+        assert logged.all() == ["update", "delete"]
+        hashed = await db.scalar(select(User.hashed_password).where(User.id == user_id))
+        assert hashed == "!"
+    assert (await _principal(edge_engine, user_id)).roles == ()
+
+    # пустой проход ничего не применяет, но отставание обнуляет
+    edge.synced_at -= 30
+    async with AsyncSession(edge_engine) as db:
+        assert await edge.sync_once(db) == 0
+    assert edge.staleness() < 5
+
+
+@pytest.mark.anyio
+async def test_replica_resyncs_when_primary_log_is_gone(
+    client, auth_header, edge, edge_engine, monkeypatch
+):
+    async with AsyncSession(edge_engine) as db:
+        await edge.sync_once(db)
+        # строка, которой у основной установки нет
+        await db.execute(
+            insert(User).values(
+                id=10**6,
+                username="ghost",
+                email="ghost@example.com",
+                hashed_password="!",
+            )
+        )
+        await db.commit()
+
+    fetch, gone = edge.fetch, []
+
+    async def fetch_once_gone(since):
+        if not gone:
+            gone.append(since)
+            return None
+        return await fetch(since)
+
+    monkeypatch.setattr(edge, "fetch", fetch_once_gone)
+    async with AsyncSession(edge_engine) as db:
+        await edge.sync_once(db)
+        assert await db.get(User, 10**6) is None
+    assert len(gone) == 1
+    r = await client.get("/users/me", headers=auth_header)
+    assert await _principal(edge_engine, r.json()["id"]) is not None
+
+
+@pytest.mark.anyio
+async def test_replica_rejects_or_proxies_writes_and_reports_staleness(
+    client, auth_header, edge
+):
+    transport = ASGITransport(app=ReplicaMiddleware(app, edge))
+    async with AsyncClient(transport=transport, base_url="http://edge") as edge_client:
+        # ни одного прохода: права не проверяются, /health отвечает
+        r = await edge_client.get("/users/me", headers=auth_header)
+        assert r.status_code == 503
+        assert r.headers["X-Replica-Staleness"] == "inf"
+        r = await edge_client.get("/health")
+        assert r.status_code == 200
+
+        edge.synced_at = time.time() - 2
+        r = await edge_client.get("/users/me", headers=auth_header)
+        assert r.status_code == 200
+        assert 2 <= float(r.headers["X-Replica-Staleness"]) < 10
+        assert r.headers["X-Replica-Version"] == "0"
+
+        role = {"name": f"edge-w-{uuid4().hex[:8]}"}
+        r = await edge_client.post("/roles/", json=role, headers=auth_header)
+        assert r.status_code == 405
+        assert "GET" in r.headers["Allow"]
+        # multi-get через POST — чтение
+        r = await edge_client.post(
+            "/roles/batch", json={"ids": [1]}, headers=auth_header
+        )
+        assert r.status_code == 200
+
+        edge.proxy_writes = True
+        r = await edge_client.post("/roles/", json=role, headers=auth_header)
+        assert r.status_code == 201, r.text
+        r = await client.get(f"/roles/{r.json()['id']}", headers=auth_header)
+        assert r.json()["name"] == role["name"]
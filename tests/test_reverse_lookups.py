@@ -0,0 +1,133 @@
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import select
+
+from src.access_manager.models import role_permissions, user_roles
+
+
+@pytest.mark.anyio
+async def test_reverse_lookups(client, db, auth_header):
+    tag = uuid4().hex[:6]
+    r = await client.post(
+        "/permissions/", json={"name": f"export_{tag}"}, headers=auth_header
+    )
+    perm_id = r.json()["id"]
+    role_ids = []
+    for i in range(2):
+        r = await client.post(
+            "/roles/",
+            json={"name": f"exporter_{i}_{tag}", "permission_ids": [perm_id]},
+            headers=auth_header,
+        )
+        role_ids.append(r.json()["id"])
+
+    user_ids = []
+    for i in range(3):
+        r = await client.post(
+            "/users/",
+            json={
+                "username": f"exp_{i}_{tag}",
+                "email": f"exp_{i}_{tag}@example.com",
+                "password": "VerySecret123!",
+                # у первого пользователя разрешение приходит через обе роли
+                "role_ids": role_ids if i == 0 else [role_ids[i % 2]],
+            },
+            headers=auth_header,
+        )
+        user_ids.append(r.json()["id"])
+
+    # ───── users by role, по странице из одного элемента ─────
+    seen, after = [], 0
+    while True:
+        r = await client.get(
+            f"/roles/{role_ids[0]}/users",
+            params={"after": after, "limit": 1},
+            headers=auth_header,
+        )
+        assert r.status_code == 200, r.text
+        page = r.json()
+        seen += [u["id"] for u in page["items"]]
+        if page["next_after"] is None:
+            break
+        after = page["next_after"]
+    assert seen == [user_ids[0], user_ids[2]]
+
+    # ───── roles by permission ─────
+    r = await client.get(f"/permissions/{perm_id}/roles", headers=auth_header)
+    assert [role["id"] for role in r.json()["items"]] == role_ids
+    assert r.json()["next_after"] is None
+
+    # ───── users by effective permission: без дублей ─────
+    r = await client.get(f"/permissions/{perm_id}/users", headers=auth_header)
+    assert [u["id"] for u in r.json()["items"]] == user_ids
+
+    r = await client.get("/permissions/999999/users", headers=auth_header)
+    assert r.status_code == 404
+    r = await client.get("/roles/999999/users", headers=auth_header)
+    assert r.status_code == 404
+
+    # ───── ON DELETE CASCADE чистит строки связей ─────
+    r = await client.delete(f"/roles/{role_ids[0]}", headers=auth_header)
+    assert r.status_code == 200
+    r = await client.delete(f"/permissions/{perm_id}", headers=auth_header)
+    assert r.status_code == 200
+
+    q = await db.execute(
+        select(user_roles.c.user_id).where(user_roles.c.role_id == role_ids[0])
+    )
+    assert q.all() == []
+    q = await db.execute(
+        select(role_permissions.c.role_id).where(
+            role_permissions.c.permission_id == perm_id
+        )
+    )
+    assert q.all() == []
+
+
+@pytest.mark.anyio
+async def test_reverse_lookups_follow_wildcard_grants(client, auth_header):
+    tag = uuid4().hex[:6]
+    perm_ids = {}
+    for name in ("reports:read", "*", "reports_x:*"):
+        r = await client.post(
+            "/permissions/",
+            json={"name": f"rl{tag}:{name}"},
+            headers=auth_header,
+        )
+        perm_ids[name] = r.json()["id"]
+    role_ids, user_ids = {}, {}
+    for name in perm_ids:
+        r = await client.post(
+            "/roles/",
+            json={"name": f"rl-{tag}-{name}", "permission_ids": [perm_ids[name]]},
+            headers=auth_header,
+        )
+        role_ids[name] = r.json()["id"]
+        r = await client.post(
+            "/users/",
+            json={
+                "username": f"rl_{tag}_{len(user_ids)}",
+                "email": f"rl_{tag}_{len(user_ids)}@example.com",
+                "password": "VerySecret123!",
+                "role_ids": [role_ids[name]],
+            },
+            headers=auth_header,
+        )
+        user_ids[name] = r.json()["id"]
+
+    # `rl…:*` покрывает `rl…:reports:read`, соседний `rl…:reports_x:*` — нет
+    covering = {"reports:read", "*"}
+    r = await client.get(
+        f"/permissions/{perm_ids['reports:read']}/roles", headers=auth_header
+    )
+    found = {role["id"] for role in r.json()["items"]}
+    assert {role_ids[name] for name in covering} <= found
+    assert role_ids["reports_x:*"] not in found
+
+    r = await client.get(
+        f"/permissions/{perm_ids['reports:read']}/users", headers=auth_header
+    )
+    found = {user["id"] for user in r.json()["items"]}
+    assert {user_ids[name] for name in covering} <= found
+    assert user_ids["reports_x:*"] not in found
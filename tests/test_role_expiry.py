@@ -0,0 +1,204 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import select
+
+from src.access_manager import crud, security
+from src.access_manager.core.config import get_settings
+from src.access_manager.expiry import ExpiryScheduler, scheduler
+from src.access_manager.models import DEFAULT_TENANT_ID, User, user_roles
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+@pytest.fixture(autouse=True)
+def no_settle(monkeypatch):
+    # /sync в тестах — до конца журнала
+    monkeypatch.setattr(get_settings(), "sync_settle_seconds", 0)
+
+
+@pytest.fixture
+async def running_scheduler():
+    yield scheduler
+    await scheduler.stop()
+
+
+@pytest.fixture
+def paused_scheduler(monkeypatch):
+    # сроки применяются явным fire(), а не фоновой задачей
+    monkeypatch.setattr(scheduler, "start", lambda engine: None)
+
+
+async def _setup(client, auth_header):
+    tag = uuid4().hex[:8]
+    r = await client.post(
+        "/permissions/", json={"name": f"incident{tag}:*"}, headers=auth_header
+    )
+    r = await client.post(
+        "/roles/",
+        json={"name": f"oncall-{tag}", "permission_ids": [r.json()["id"]]},
+        headers=auth_header,
+    )
+    role_id = r.json()["id"]
+    r = await client.post(
+        "/users/",
+        json={
+            "username": f"oncall_{tag}",
+            "email": f"oncall_{tag}@example.com",
+            "password": "secret123",
+        },
+        headers=auth_header,
+    )
+    return f"incident{tag}:restart", role_id, r.json()["id"]
+
+
+async def _allowed(db, user_id: int, permission: str) -> bool:
+    principal = await crud.get_principal(db, DEFAULT_TENANT_ID, user_id)
+    return security.has_permission(principal, permission)
+
+
+@pytest.mark.anyio
+async def test_expired_assignment_is_ignored_then_revoked(
+    client, auth_header, db, paused_scheduler
+):
+    permission, role_id, user_id = await _setup(client, auth_header)
+    until = _utcnow() + timedelta(hours=1)
+
+    r = await client.post(
+        f"/users/{user_id}/roles",
+        json={"role_id": role_id, "valid_until": until.isoformat() + "Z"},
+        headers=auth_header,
+    )
+    assert r.status_code == 200, r.text
+    assert r.json()["valid_until"] == until.isoformat()
+    assert await _allowed(db, user_id, permission)
+    version = await db.scalar(select(User.version).where(User.id == user_id))
+
+    # срок в прошлом: роль не действует сразу, до планировщика
+    past = _utcnow() - timedelta(seconds=1)
+    r = await client.post(
+        f"/users/{user_id}/roles",
+        json={"role_id": role_id, "valid_until": past.isoformat()},
+        headers=auth_header,
+    )
+    assert r.status_code == 200
+    assert not await _allowed(db, user_id, permission)
+    r = await client.get(f"/users/{user_id}/roles", headers=auth_header)
+    assert [link["role_id"] for link in r.json()] == [role_id]
+
+    security.decision_cache.put_many(
+        DEFAULT_TENANT_ID, user_id, frozenset({role_id}), {("x", "user", 1): True}, 0
+    )
+    touched = await ExpiryScheduler().fire(db, _utcnow())
+    assert (DEFAULT_TENANT_ID, user_id) in touched
+    assert (
+        security.decision_cache.get_many(
+            DEFAULT_TENANT_ID, user_id, frozenset({role_id}), [("x", "user", 1)], 0
+        )
+        == {}
+    )
+    r = await client.get(f"/users/{user_id}/roles", headers=auth_header)
+    assert r.json() == []
+    db.expire_all()
+    assert await db.scalar(select(User.version).where(User.id == user_id)) > version
+
+
+@pytest.mark.anyio
+async def test_assignment_comes_into_force(client, auth_header, db, paused_scheduler):
+    permission, role_id, user_id = await _setup(client, auth_header)
+    start = _utcnow() + timedelta(minutes=5)
+    r = await client.post(
+        f"/users/{user_id}/roles",
+        json={"role_id": role_id, "valid_from": start.isoformat()},
+        headers=auth_header,
+    )
+    assert r.status_code == 200
+    assert not await _allowed(db, user_id, permission)
+    r = await client.get("/sync?since=0&limit=10000", headers=auth_header)
+    synced = {user["id"]: user for user in r.json()["users"]}
+    assert synced[user_id]["role_ids"] == []
+
+    assert await crud.get_role_deadlines(db, start, 10_000) == [start]
+    await ExpiryScheduler().fire(db, start)
+    link = (
+        await db.execute(select(user_roles).where(user_roles.c.user_id == user_id))
+    ).one()
+    assert link.valid_from is None
+    assert await _allowed(db, user_id, permission)
+
+    r = await client.post(
+        f"/users/{user_id}/roles",
+        json={
+            "role_id": role_id,
+            "valid_from": start.isoformat(),
+            "valid_until": start.isoformat(),
+        },
+        headers=auth_header,
+    )
+    assert r.status_code == 422
+
+
+@pytest.mark.anyio
+async def test_read_apis_list_only_assignments_in_force(
+    client, auth_header, paused_scheduler
+):
+    _, role_id, user_id = await _setup(client, auth_header)
+    r = await client.post(
+        f"/users/{user_id}/roles",
+        json={
+            "role_id": role_id,
+            "valid_from": (_utcnow() + timedelta(minutes=5)).isoformat(),
+        },
+        headers=auth_header,
+    )
+    assert r.status_code == 200
+
+    # роль ещё не действует — как для авторизации, /sync и /snapshot
+    r = await client.get(f"/users/{user_id}", headers=auth_header)
+    assert r.json()["roles"] == []
+    r = await client.put(
+        f"/users/{user_id}", json={"is_active": True}, headers=auth_header
+    )
+    assert r.json()["roles"] == []
+    r = await client.get(f"/roles/{role_id}/users", headers=auth_header)
+    assert r.json()["items"] == []
+    r = await client.get(f"/users/?role_id={role_id}", headers=auth_header)
+    assert r.json() == []
+    # запланированное назначение видно в его собственном списке
+    r = await client.get(f"/users/{user_id}/roles", headers=auth_header)
+    assert [link["role_id"] for link in r.json()] == [role_id]
+
+    r = await client.post(
+        f"/users/{user_id}/roles", json={"role_id": role_id}, headers=auth_header
+    )
+    r = await client.get(f"/users/{user_id}", headers=auth_header)
+    assert [role["id"] for role in r.json()["roles"]] == [role_id]
+
+
+@pytest.mark.anyio
+async def test_scheduler_revokes_at_deadline(client, auth_header, running_scheduler):
+    permission, role_id, user_id = await _setup(client, auth_header)
+    r = await client.post(
+        f"/users/{user_id}/roles",
+        json={
+            "role_id": role_id,
+            "valid_until": (_utcnow() + timedelta(seconds=0.5)).isoformat(),
+        },
+        headers=auth_header,
+    )
+    assert r.status_code == 200
+    assert scheduler.running
+
+    for _ in range(50):
+        await asyncio.sleep(0.1)
+        r = await client.get(f"/users/{user_id}/roles", headers=auth_header)
+        if r.json() == []:
+            break
+    assert r.json() == []
+
+    r = await client.delete(f"/users/{user_id}/roles/{role_id}", headers=auth_header)
+    assert r.status_code == 404
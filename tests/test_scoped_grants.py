@@ -0,0 +1,144 @@
+from uuid import uuid4
+
+import pytest
+
+from src.access_manager import security
+from src.access_manager.models import DEFAULT_TENANT_ID
+from src.access_manager.permissions import DecisionCache
+from src.access_manager.security import create_access_token
+
+
+def test_decision_cache_is_bound_to_roles_and_ttl():
+    cache = DecisionCache(ttl=10)
+    key = ("users:update", "user", 1)
+    cache.put_many(1, 7, frozenset({1}), {key: True}, now=0)
+
+    assert cache.get_many(1, 7, frozenset({1}), [key], now=5) == {key: True}
+    # роли сменились — решения пользователя недействительны
+    assert cache.get_many(1, 7, frozenset({1, 2}), [key], now=5) == {}
+    cache.put_many(1, 7, frozenset({1}), {key: True}, now=5)
+    assert cache.get_many(1, 7, frozenset({1}), [key], now=16) == {}
+
+    # сброс по арендатору не трогает остальных
+    cache.put_many(1, 7, frozenset({1}), {key: True}, now=20)
+    cache.put_many(2, 8, frozenset({3}), {key: True}, now=20)
+    cache.clear(2)
+    assert cache.get_many(1, 7, frozenset({1}), [key], now=21) == {key: True}
+    assert cache.get_many(2, 8, frozenset({3}), [key], now=21) == {}
+
+
+async def _user_with_role(client, auth_header, tag):
+    r = await client.post(
+        "/roles/", json={"name": f"scoped_{tag}"}, headers=auth_header
+    )
+    role_id = r.json()["id"]
+    r = await client.post(
+        "/users/",
+        json={
+            "username": f"scoped_{tag}",
+            "email": f"scoped_{tag}@example.com",
+            "password": "secret123",
+            "role_ids": [role_id],
+        },
+        headers=auth_header,
+    )
+    user_id = r.json()["id"]
+    token = create_access_token({"sub": str(user_id)})
+    return role_id, user_id, {"Authorization": f"Bearer {token}"}
+
+
+@pytest.mark.anyio
+async def test_scoped_grant_allows_only_its_object(client, auth_header, query_budget):
+    tag = uuid4().hex[:8]
+    role_id, user_id, headers = await _user_with_role(client, auth_header, tag)
+    r = await client.post(
+        "/users/",
+        json={
+            "username": f"other_{tag}",
+            "email": f"other_{tag}@example.com",
+            "password": "secret123",
+        },
+        headers=auth_header,
+    )
+    other_id = r.json()["id"]
+
+    r = await client.get(
+        "/permissions/", params={"name": "users:read"}, headers=auth_header
+    )
+    read_perm = next(p for p in r.json() if p["name"] == "users:read")
+
+    r = await client.get(f"/users/{other_id}", headers=headers)
+    assert r.status_code == 403
+
+    r = await client.post(
+        f"/roles/{role_id}/grants",
+        json={
+            "permission_id": read_perm["id"],
+            "resource_type": "user",
+            "resource_id": other_id,
+        },
+        headers=auth_header,
+    )
+    assert r.status_code == 201
+    grant = r.json()
+    assert grant["permission"]["name"] == "users:read"
+
+    r = await client.get(f"/users/{other_id}", headers=headers)
+    assert r.status_code == 200
+    # повторная проверка — из кэша решений: принципал + сам пользователь
+    with query_budget(2):
+        r = await client.get(f"/users/{other_id}", headers=headers)
+    assert r.status_code == 200
+
+    # грант только на чтение и только на этот объект
+    r = await client.get(f"/users/{user_id}", headers=headers)
+    assert r.status_code == 403
+    r = await client.delete(f"/users/{other_id}", headers=headers)
+    assert r.status_code == 403
+    r = await client.get("/users/", headers=headers)
+    assert r.status_code == 403
+
+    r = await client.get(f"/roles/{role_id}/grants", headers=auth_header)
+    assert [g["id"] for g in r.json()] == [grant["id"]]
+
+    r = await client.delete(
+        f"/roles/{role_id}/grants/{grant['id']}", headers=auth_header
+    )
+    assert r.status_code == 200
+    r = await client.get(f"/users/{other_id}", headers=headers)
+    assert r.status_code == 403
+
+
+@pytest.mark.anyio
+async def test_type_wide_and_wildcard_grants(client, auth_header, db):
+    tag = uuid4().hex[:8]
+    role_id, user_id, headers = await _user_with_role(client, auth_header, tag)
+    r = await client.post(
+        "/permissions/", json={"name": f"roles{tag}:*"}, headers=auth_header
+    )
+    perm_id = r.json()["id"]
+
+    # грант без resource_id — на все роли
+    r = await client.post(
+        f"/roles/{role_id}/grants",
+        json={"permission_id": perm_id, "resource_type": "role"},
+        headers=auth_header,
+    )
+    assert r.status_code == 201
+
+    user = await security.crud.get_principal(db, DEFAULT_TENANT_ID, user_id)
+    decisions = await security.check_scoped(
+        db, user, f"roles{tag}:update", "role", [role_id, 999999]
+    )
+    assert decisions == {role_id: True, 999999: True}
+    decisions = await security.check_scoped(
+        db, user, f"roles{tag}:update", "user", [user_id]
+    )
+    assert decisions == {user_id: False}
+
+    r = await client.post(
+        f"/roles/{role_id}/grants",
+        json={"permission_id": 999999, "resource_type": "role"},
+        headers=auth_header,
+    )
+    assert r.status_code == 404
@@ -0,0 +1,234 @@
+import os
+from collections import Counter
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.access_manager import crud
+from src.access_manager.db import configure_engine, set_shards
+from src.access_manager.models import (
+    DEFAULT_TENANT_ID,
+    Base,
+    Role,
+    User,
+    role_permissions,
+)
+from src.access_manager.schemas import UserCreate
+from src.access_manager.security import create_access_token
+from src.access_manager.sharding import HashRing, ShardSet
+
+# шарды 1..N; шард 0 — тестовая БД из conftest
+SHARD_URLS = os.getenv(
+    "TEST_SHARD_URLS",
+    "sqlite+aiosqlite:///./test_shard_1.sqlite,"
+    "sqlite+aiosqlite:///./test_shard_2.sqlite",
+).split(",")
+
+
+@pytest.fixture
+async def shards(session_maker, auth_header):
+    # auth_header — до сверки: роль admin и её разрешения уже в каталоге
+    engines = [configure_engine(create_async_engine(url)) for url in SHARD_URLS]
+    for engine in engines:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+    shard_set = ShardSet(engines)
+    async with session_maker() as session:
+        await shard_set.sync_catalog(session)
+    set_shards(shard_set)
+    yield shard_set
+    set_shards(ShardSet())
+    await shard_set.dispose()
+
+
+@pytest.fixture
+async def shard_admin(shards, session_maker):
+    """Админ, созданный на своём шарде (админ conftest лежит на шарде 0)."""
+    async with session_maker() as db:
+        admin_role = await db.scalar(
+            select(Role.id).where(
+                Role.tenant_id == DEFAULT_TENANT_ID, Role.name == "admin"
+            )
+        )
+        user_id = await shards.allocate_user_id(db)
+        tag = uuid4().hex[:8]
+        async with shards.user_session(db, user_id) as session:
+            await crud.create_user(
+                session,
+                DEFAULT_TENANT_ID,
+                UserCreate(
+                    username=f"shadmin_{tag}",
+                    email=f"shadmin_{tag}@example.com",
+                    password="password",
+                    role_ids=[admin_role],
+                ),
+                user_id=user_id,
+            )
+    token = create_access_token({"sub": str(user_id)})
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def _user_shards(shards: ShardSet, session_maker, user_id: int) -> list[int]:
+    # на каких шардах лежит строка пользователя
+    async with session_maker() as db:
+        found = await shards.each(db, crud.exists, DEFAULT_TENANT_ID, User, user_id)
+    return [shard for shard, present in enumerate(found) if present]
+
+
+def test_hash_ring_balances_and_moves_few_keys():
+    ring = HashRing(3)
+    keys = range(1, 30_001)
+    placed = [ring.shard_of(key) for key in keys]
+    assert placed == [HashRing(3).shard_of(key) for key in keys]
+    for count in Counter(placed).values():
+        assert 0.2 < count / len(keys) < 0.47
+
+    grown = HashRing(4)
+    moved = [key for key, shard in zip(keys, placed) if grown.shard_of(key) != shard]
+    # переезжают только ключи нового шарда
+    assert {grown.shard_of(key) for key in moved} == {3}
+    assert len(moved) / len(keys) < 0.4
+
+
+@pytest.mark.anyio
+async def test_users_live_on_their_shard_with_replicated_catalog(
+    client, shards, shard_admin, session_maker
+):
+    tag = uuid4().hex[:8]
+    r = await client.post(
+        "/permissions/", json={"name": f"shard{tag}:read"}, headers=shard_admin
+    )
+    perm_id = r.json()["id"]
+    r = await client.post(
+        "/roles/",
+        json={"name": f"shard-{tag}", "permission_ids": [perm_id]},
+        headers=shard_admin,
+    )
+    assert r.status_code == 201, r.text
+    role_id = r.json()["id"]
+    for engine in shards.engines:
+        async with engine.connect() as conn:
+            links = await conn.scalar(
+                select(func.count()).where(role_permissions.c.role_id == role_id)
+            )
+        assert links == 1
+
+    user_ids = []
+    for i in range(12):
+        r = await client.post(
+            "/users/",
+            json={
+                "username": f"sh{i}_{tag}",
+                "email": f"sh{i}_{tag}@example.com",
+                "password": "secret123",
+                "role_ids": [role_id],
+            },
+            headers=shard_admin,
+        )
+        assert r.status_code == 201, r.text
+        user_ids.append(r.json()["id"])
+    for user_id in user_ids:
+        assert await _user_shards(shards, session_maker, user_id) == [
+            shards.shard_of(user_id)
+        ]
+    assert len({shards.shard_of(user_id) for user_id in user_ids}) > 1
+
+    # чтение и изменение по id — на шарде пользователя
+    user_id = user_ids[-1]
+    r = await client.get(f"/users/{user_id}", headers=shard_admin)
+    assert [role["id"] for role in r.json()["roles"]] == [role_id]
+    r = await client.put(
+        f"/users/{user_id}", json={"is_active": False}, headers=shard_admin
+    )
+    assert r.json()["is_active"] is False
+
+    # имя занято на другом шарде
+    r = await client.post(
+        "/users/",
+        json={
+            "username": f"sh0_{tag}",
+            "email": f"other_{tag}@example.com",
+            "password": "secret123",
+        },
+        headers=shard_admin,
+    )
+    assert r.status_code == 400
+
+    # удаление роли в каталоге снимает её копии и связи на шардах
+    r = await client.delete(f"/roles/{role_id}", headers=shard_admin)
+    assert r.status_code == 200
+    r = await client.get(f"/users/{user_ids[0]}", headers=shard_admin)
+    assert r.json()["roles"] == []
+
+
+@pytest.mark.anyio
+async def test_cross_shard_lists_merge_in_id_order(client, shards, shard_admin):
+    tag = uuid4().hex[:8]
+    r = await client.post("/roles/", json={"name": f"m-{tag}"}, headers=shard_admin)
+    role_id = r.json()["id"]
+    r = await client.get("/users/?limit=1", headers=shard_admin)
+    total = int(r.headers["X-Total-Count"])
+    created = []
+    for i in range(9):
+        r = await client.post(
+            "/users/",
+            json={
+                "username": f"m{i}_{tag}",
+                "email": f"m{i}_{tag}@example.com",
+                "password": "secret123",
+                "role_ids": [role_id],
+            },
+            headers=shard_admin,
+        )
+        created.append(r.json()["id"])
+
+    seen, after = [], 0
+    while after is not None:
+        r = await client.get(
+            f"/roles/{role_id}/users?after={after}&limit=4", headers=shard_admin
+        )
+        page = r.json()
+        seen += [user["id"] for user in page["items"]]
+        after = page["next_after"]
+    assert seen == sorted(created)
+
+    r = await client.get("/users/?limit=1000", headers=shard_admin)
+    everyone = [user["id"] for user in r.json()]
+    assert everyone == sorted(everyone)
+    assert set(created) <= set(everyone)
+    # итог — сумма счётчиков шардов
+    assert int(r.headers["X-Total-Count"]) == total + len(created)
+    r = await client.get("/users/?skip=3&limit=5", headers=shard_admin)
+    assert [user["id"] for user in r.json()] == everyone[3:8]
+
+    # multi-get — каждому шарду свои id, ответ в порядке запроса
+    ids = created[::-1] + [10**6]
+    r = await client.post("/users/batch", json={"ids": ids}, headers=shard_admin)
+    assert [user and user["id"] for user in r.json()["items"]] == ids[:-1] + [None]
+    assert len({shards.shard_of(user_id) for user_id in created}) > 1
+
+
+@pytest.mark.anyio
+async def test_register_and_login_on_a_shard(client, shards):
+    tag = uuid4().hex[:8]
+    r = await client.post(
+        "/register",
+        json={
+            "username": f"reg_{tag}",
+            "email": f"reg_{tag}@example.com",
+            "password": "secret123",
+        },
+    )
+    assert r.status_code == 201
+    user_id = r.json()["id"]
+
+    r = await client.post(
+        "/login/token", data={"username": f"reg_{tag}", "password": "secret123"}
+    )
+    assert r.status_code == 200
+    token = r.json()["access_token"]
+    r = await client.get("/users/me", headers={"Authorization": f"Bearer {token}"})
+    assert r.json()["id"] == user_id
@@ -0,0 +1,129 @@
+import pytest
+
+from src.access_manager import snapshot
+from src.access_manager.models import DEFAULT_TENANT_ID
+from src.access_manager.snapshot_store import store
+
+
+@pytest.fixture
+async def snapshots(monkeypatch):
+    monkeypatch.setattr(store, "settle", 0)
+    # обновление в тестах — явным store.refresh()
+    monkeypatch.setattr(store, "refresh_interval", 3600)
+    store.clear()
+    yield store
+    await store.stop()
+    store.clear()
+
+
+def _graph(decoded: snapshot.Snapshot) -> dict:
+    """id пользователя -> (флаги, {id роли: имена разрешений})."""
+    roles = {
+        decoded.role_ids[i]: {
+            decoded.permission_names[p]
+            for p in decoded.role_permissions[
+                decoded.role_offsets[i] : decoded.role_offsets[i + 1]
+            ]
+        }
+        for i in range(len(decoded.role_ids))
+    }
+    return {
+        user_id: (
+            decoded.user_flags[i],
+            {
+                decoded.role_ids[r]: roles[decoded.role_ids[r]]
+                for r in decoded.user_roles[
+                    decoded.user_offsets[i] : decoded.user_offsets[i + 1]
+                ]
+            },
+        )
+        for i, user_id in enumerate(decoded.user_ids)
+    }
+
+
+def test_encode_roundtrip():
+    permissions = {7: "billing:invoices:read", 3: "users:*", 5: "export_reports"}
+    # 99 — удалённое разрешение, 42 — удалённая роль: в снимок не попадают
+    roles = {10: [7, 3, 99], 11: [5]}
+    users = {2: (snapshot.ACTIVE, [11, 10, 42]), 1: (snapshot.SUPERUSER, [])}
+
+    data = snapshot.encode(4, 123, permissions, roles, users)
+    assert data == snapshot.encode(4, 123, permissions, roles, users)
+    decoded = snapshot.decode(data)
+
+    assert (decoded.tenant_id, decoded.version) == (4, 123)
+    assert list(decoded.permission_ids) == [3, 5, 7]
+    assert decoded.permission_names == [
+        "users:*",
+        "export_reports",
+        "billing:invoices:read",
+    ]
+    assert _graph(decoded) == {
+        1: (snapshot.SUPERUSER, {}),
+        2: (
+            snapshot.ACTIVE,
+            {10: {"users:*", "billing:invoices:read"}, 11: {"export_reports"}},
+        ),
+    }
+
+    with pytest.raises(snapshot.SnapshotError):
+        snapshot.decode(b"JUNK" + data[4:])
+
+
+@pytest.mark.anyio
+async def test_snapshot_endpoint_serves_refreshed_graph(
+    client, auth_header, db, snapshots
+):
+    r = await client.get("/snapshot", headers=auth_header)
+    assert r.status_code == 200
+    assert r.headers["content-type"] == snapshot.MEDIA_TYPE
+    etag = r.headers["ETag"]
+    decoded = snapshot.decode(r.content)
+    assert decoded.tenant_id == DEFAULT_TENANT_ID
+
+    r = await client.get("/users/me", headers=auth_header)
+    admin_id = r.json()["id"]
+    admin_roles = _graph(decoded)[admin_id][1]
+    assert any("users:read" in names for names in admin_roles.values())
+
+    r = await client.get("/snapshot", headers={**auth_header, "If-None-Match": etag})
+    assert r.status_code == 304
+
+    r = await client.post(
+        "/permissions/", json={"name": "edge:read"}, headers=auth_header
+    )
+    perm_id = r.json()["id"]
+    r = await client.post(
+        "/roles/",
+        json={"name": "edge-role", "permission_ids": [perm_id]},
+        headers=auth_header,
+    )
+    role_id = r.json()["id"]
+    r = await client.post(
+        "/users/",
+        json={
+            "username": "edger",
+            "email": "edger@example.com",
+            "password": "secret123",
+            "role_ids": [role_id],
+        },
+        headers=auth_header,
+    )
+    user_id = r.json()["id"]
+
+    # ответ — готовые байты: до фонового обновления снимок прежний
+    r = await client.get("/snapshot", headers=auth_header)
+    assert r.headers["ETag"] == etag
+    await store.refresh(db)
+    r = await client.get("/snapshot", headers={**auth_header, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+    assert _graph(snapshot.decode(r.content))[user_id] == (
+        snapshot.ACTIVE,
+        {role_id: {"edge:read"}},
+    )
+
+    await client.delete(f"/roles/{role_id}", headers=auth_header)
+    await store.refresh(db)
+    r = await client.get("/snapshot", headers=auth_header)
+    assert _graph(snapshot.decode(r.content))[user_id] == (snapshot.ACTIVE, {})
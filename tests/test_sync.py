@@ -0,0 +1,149 @@
+import random
+
+import pytest
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.access_manager import crud
+from src.access_manager.core.config import get_settings
+from src.access_manager.models import DEFAULT_TENANT_ID, ChangeLogEntry, Permission
+from src.access_manager.schemas import PermissionCreate
+
+
+@pytest.fixture(autouse=True)
+def no_settle(monkeypatch):
+    # в тестах записи коммитятся сразу: версия ответа — конец журнала
+    monkeypatch.setattr(get_settings(), "sync_settle_seconds", 0)
+
+
+async def _sync(client, headers, **params) -> dict:
+    r = await client.get("/sync", params=params, headers=headers)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+@pytest.mark.anyio
+async def test_sync_returns_changes_since_version(client, auth_header):
+    r = await client.post(
+        "/users/",
+        json={
+            "username": "syncer",
+            "email": "syncer@example.com",
+            "password": "secret123",
+        },
+        headers=auth_header,
+    )
+    user_id = r.json()["id"]
+    r = await client.post("/permissions/", json={"name": "sync:a"}, headers=auth_header)
+    kept_id = r.json()["id"]
+    r = await client.post("/permissions/", json={"name": "sync:b"}, headers=auth_header)
+    doomed_id = r.json()["id"]
+
+    full = await _sync(client, auth_header)
+    assert not full["has_more"]
+    assert user_id in [u["id"] for u in full["users"]]
+    assert {kept_id, doomed_id} <= {p["id"] for p in full["permissions"]}
+    since = full["version"]
+
+    r = await client.post(
+        "/roles/",
+        json={"name": "sync-role", "permission_ids": [kept_id]},
+        headers=auth_header,
+    )
+    role_id = r.json()["id"]
+    await client.put(
+        f"/users/{user_id}", json={"role_ids": [role_id]}, headers=auth_header
+    )
+    await client.delete(f"/permissions/{doomed_id}", headers=auth_header)
+
+    delta = await _sync(client, auth_header, since=since)
+    assert delta["version"] > since
+    assert [(r["id"], r["permission_ids"]) for r in delta["roles"]] == [
+        (role_id, [kept_id])
+    ]
+    assert [(u["id"], u["role_ids"]) for u in delta["users"]] == [(user_id, [role_id])]
+    assert delta["permissions"] == []
+    assert [(d["type"], d["id"]) for d in delta["deleted"]] == [
+        ("permission", doomed_id)
+    ]
+
+    # ничего нового: пустой ответ с той же версией
+    again = await _sync(client, auth_header, since=delta["version"])
+    assert again == {**again, "version": delta["version"], "users": [], "roles": []}
+    assert again["deleted"] == []
+
+
+@pytest.mark.anyio
+async def test_sync_pages_by_version(client, auth_header):
+    since = (await _sync(client, auth_header))["version"]
+    created = []
+    for name in ("page:a", "page:b", "page:c"):
+        r = await client.post("/permissions/", json={"name": name}, headers=auth_header)
+        created.append(r.json()["id"])
+
+    first = await _sync(client, auth_header, since=since, limit=2)
+    assert first["has_more"]
+    assert [p["id"] for p in first["permissions"]] == created[:2]
+    second = await _sync(client, auth_header, since=first["version"], limit=2)
+    assert not second["has_more"]
+    assert [p["id"] for p in second["permissions"]] == created[2:]
+
+
+@pytest.mark.anyio
+async def test_version_stays_below_uncommitted_transaction(
+    client, auth_header, engine, monkeypatch
+):
+    if engine.dialect.name != "postgresql":
+        pytest.skip("SQLite writers never commit out of seq order")
+    since = (await _sync(client, auth_header))["version"]
+    # долгая транзакция берёт номер раньше, а коммитится позже следующей
+    slow = AsyncSession(engine)
+    commit = slow.commit
+
+    async def hold():
+        pass
+
+    monkeypatch.setattr(slow, "commit", hold)
+    late = await crud.create_permission(
+        slow, DEFAULT_TENANT_ID, PermissionCreate(name="late:a")
+    )
+    r = await client.post("/permissions/", json={"name": "late:b"}, headers=auth_header)
+    early_id = r.json()["id"]
+
+    held = await _sync(client, auth_header, since=since)
+    assert held["version"] < late.version
+    assert held["permissions"] == []
+
+    await commit()
+    await slow.close()
+    delta = await _sync(client, auth_header, since=held["version"])
+    assert [p["id"] for p in delta["permissions"]] == [late.id, early_id]
+
+
+@pytest.mark.anyio
+async def test_full_sync_includes_rows_written_around_crud(db):
+    # строки, записанные в обход crud, имеют версию 0 — полная синхронизация
+    # отдаёт их все, независимо от limit
+    tenant_id = random.randint(1000, 10**6)
+    db.add_all(
+        Permission(tenant_id=tenant_id, name=name) for name in ("raw:a", "raw:b")
+    )
+    await db.commit()
+
+    page = await crud.get_changes_since(db, tenant_id, 0, 10**9, ("permission",), 1)
+    assert sorted(p.name for p in page.permissions) == ["raw:a", "raw:b"]
+    assert page.version == 10**9 and not page.has_more
+
+
+@pytest.mark.anyio
+async def test_sync_from_pruned_log_is_gone(client, auth_header, db):
+    await client.post("/permissions/", json={"name": "gone:a"}, headers=auth_header)
+    pruned = await db.scalar(select(func.max(ChangeLogEntry.seq)))
+    await client.post("/permissions/", json={"name": "gone:b"}, headers=auth_header)
+    await db.execute(delete(ChangeLogEntry).where(ChangeLogEntry.seq <= pruned))
+    await db.commit()
+
+    r = await client.get("/sync", params={"since": pruned - 1}, headers=auth_header)
+    assert r.status_code == 410
+    r = await client.get("/sync", params={"since": pruned}, headers=auth_header)
+    assert r.status_code == 200
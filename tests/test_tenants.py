@@ -0,0 +1,108 @@
+import random
+
+import pytest
+
+from src.access_manager import counters
+from src.access_manager.models import Permission, Role, User
+from src.access_manager.security import create_access_token, get_password_hash
+
+
+async def _tenant_admin(db, tenant_id: int) -> dict:
+    """Админ арендатора: свои разрешения, роль и пользователь `admin`."""
+    perms = [
+        Permission(tenant_id=tenant_id, name=f"{entity}:*")
+        for entity in ("users", "roles", "permissions")
+    ]
+    role = Role(tenant_id=tenant_id, name="admin", permissions=perms)
+    # то же имя, что у админа арендатора по умолчанию из фикстуры auth_header
+    user = User(
+        tenant_id=tenant_id,
+        username="admin",
+        email="admin@example.com",
+        hashed_password=get_password_hash("password"),
+        roles=[role],
+    )
+    db.add(user)
+    await db.commit()
+    await counters.rebuild(db, tenant_id)
+    await db.commit()
+    token = create_access_token({"sub": str(user.id), "tid": tenant_id})
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.mark.anyio
+async def test_tenants_are_isolated(client, auth_header, db):
+    tenant_id = random.randint(1000, 10**6)
+    headers = await _tenant_admin(db, tenant_id)
+
+    r = await client.get("/users/", headers=headers)
+    assert [u["username"] for u in r.json()] == ["admin"]
+    assert r.headers["X-Total-Count"] == "1"
+
+    r = await client.get("/users/me", headers=auth_header)
+    default_admin_id = r.json()["id"]
+    r = await client.get("/roles/", params={"name": "admin"}, headers=auth_header)
+    default_role_id = r.json()[0]["id"]
+
+    # чужие объекты неотличимы от отсутствующих
+    r = await client.get(f"/users/{default_admin_id}", headers=headers)
+    assert r.status_code == 404
+    r = await client.put(
+        f"/users/{default_admin_id}", json={"is_active": False}, headers=headers
+    )
+    assert r.status_code == 404
+    r = await client.delete(f"/roles/{default_role_id}", headers=headers)
+    assert r.status_code == 404
+    r = await client.get(f"/roles/{default_role_id}/users", headers=headers)
+    assert r.status_code == 404
+
+    # роль другого арендатора не привязывается
+    r = await client.post(
+        "/users/",
+        json={
+            "username": "alice",
+            "email": "alice@example.com",
+            "password": "secret123",
+            "role_ids": [default_role_id],
+        },
+        headers=headers,
+    )
+    assert r.status_code == 201
+    assert r.json()["roles"] == []
+    r = await client.get("/users/", headers=headers)
+    assert r.headers["X-Total-Count"] == "2"
+
+    # имена уникальны внутри арендатора, не глобально
+    r = await client.post("/permissions/", json={"name": "users:read"}, headers=headers)
+    assert r.status_code == 201
+    r = await client.post("/permissions/", json={"name": "users:read"}, headers=headers)
+    assert r.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_login_resolves_tenant_from_header(client, auth_header, db):
+    tenant_id = random.randint(1000, 10**6)
+    r = await client.post(
+        "/register",
+        json={
+            "username": "admin",
+            "email": "admin@example.com",
+            "password": "tenantpass",
+        },
+        headers={"X-Tenant-ID": str(tenant_id)},
+    )
+    assert r.status_code == 201
+
+    form = {"username": "admin", "password": "tenantpass"}
+    r = await client.post("/login/token", data=form)
+    assert r.status_code == 401
+    r = await client.post(
+        "/login/token", data=form, headers={"X-Tenant-ID": str(tenant_id)}
+    )
+    assert r.status_code == 200
+
+    token = r.json()["access_token"]
+    r = await client.get("/users/me", headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 200
+    me = await db.get(User, r.json()["id"])
+    assert me.tenant_id == tenant_id
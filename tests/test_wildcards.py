@@ -0,0 +1,109 @@
+from uuid import uuid4
+
+import pytest
+
+from src.access_manager import security
+from src.access_manager.permissions import (
+    PermissionMatcher,
+    RoleMatcherCache,
+    is_valid_name,
+)
+from src.access_manager.principal import Principal
+from src.access_manager.security import create_access_token
+
+
+def test_matcher_exact_and_subtree_grants():
+    matcher = PermissionMatcher(["users:*", "billing:invoices:read", "export"])
+
+    assert matcher.allows("users:read")
+    assert matcher.allows("users:roles:assign")
+    # `users:*` — поддерево, а не сам узел
+    assert not matcher.allows("users")
+    assert matcher.allows("billing:invoices:read")
+    assert not matcher.allows("billing:invoices:write")
+    assert not matcher.allows("billing:invoices")
+    assert not matcher.allows("billing")
+    # плоские имена — один сегмент
+    assert matcher.allows("export")
+    assert not matcher.allows("export:csv")
+
+    assert PermissionMatcher(["*"]).allows("anything:at:all")
+    assert not PermissionMatcher([]).allows("users:read")
+
+
+def test_name_validation():
+    for name in ("users:read", "users:*", "*", "read_user", "Billing_1"):
+        assert is_valid_name(name), name
+    for name in ("users:*:read", "users:", ":read", "users read", "us*rs", ""):
+        assert not is_valid_name(name), name
+
+
+def test_role_matcher_cache_recompiles_on_changed_grants():
+    cache = RoleMatcherCache(maxsize=2)
+    first = cache.get(1, frozenset({"users:read"}))
+    assert cache.get(1, frozenset({"users:read"})) is first
+
+    changed = cache.get(1, frozenset({"users:*"}))
+    assert changed is not first
+    assert changed.allows("users:delete")
+
+    cache.get(2, frozenset())
+    cache.get(3, frozenset())
+    assert len(cache) == 2
+    assert cache.get(1, frozenset({"users:*"})) is not changed
+
+
+def test_principal_resolves_matchers_once(monkeypatch):
+    lookups = []
+    get = security.role_matchers.get
+
+    def counting(role_id, grants):
+        lookups.append(role_id)
+        return get(role_id, grants)
+
+    monkeypatch.setattr(security.role_matchers, "get", counting)
+    grants = frozenset(f"perm{i}:read" for i in range(1000))
+    user = Principal(1, 1, True, False, [(1, grants), (2, frozenset({"users:*"}))])
+    for _ in range(3):
+        assert security.has_permission(user, "users:read")
+        assert not security.has_permission(user, "roles:read")
+    # наборы грантов сверяются с кэшем один раз на принципала
+    assert lookups == [1, 2]
+
+
+@pytest.mark.anyio
+async def test_wildcard_grant_guards_endpoints(client, auth_header):
+    tag = uuid4().hex[:8]
+    r = await client.post(
+        "/permissions/", json={"name": f"users{tag}:*:read"}, headers=auth_header
+    )
+    assert r.status_code == 422
+
+    r = await client.post(
+        "/permissions/", json={"name": "users:*"}, headers=auth_header
+    )
+    assert r.status_code == 201
+    r = await client.post(
+        "/roles/",
+        json={"name": f"user_admin_{tag}", "permission_ids": [r.json()["id"]]},
+        headers=auth_header,
+    )
+    r = await client.post(
+        "/users/",
+        json={
+            "username": f"wild_{tag}",
+            "email": f"wild_{tag}@example.com",
+            "password": "secret123",
+            "role_ids": [r.json()["id"]],
+        },
+        headers=auth_header,
+    )
+    user_id = r.json()["id"]
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"}
+
+    r = await client.get(f"/users/{user_id}", headers=headers)
+    assert r.status_code == 200
+    r = await client.get("/users/", headers=headers)
+    assert r.status_code == 200
+    r = await client.get("/roles/", headers=headers)
+    assert r.status_code == 403
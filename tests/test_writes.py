@@ -0,0 +1,95 @@
+import pytest
+
+
+def _followups(db, statements):
+    # на Postgres связи, счётчики и журнал изменений пишутся CTE того же
+    # запроса, на SQLite — отдельными запросами в той же транзакции
+    return 0 if db.get_bind().dialect.name == "postgresql" else statements
+
+
+@pytest.mark.anyio
+async def test_create_update_delete_round_trips(client, auth_header, db, query_budget):
+    r = await client.post(
+        "/permissions/", json={"name": "writes:read"}, headers=auth_header
+    )
+    assert r.status_code == 201
+    perm_id = r.json()["id"]
+
+    # принципал + INSERT ... RETURNING + загрузка разрешений
+    # (+ связи, счётчик, журнал)
+    with query_budget(3 + _followups(db, 3)):
+        r = await client.post(
+            "/roles/",
+            json={"name": "writer", "permission_ids": [perm_id]},
+            headers=auth_header,
+        )
+    assert r.status_code == 201
+    role = r.json()
+    assert [p["id"] for p in role["permissions"]] == [perm_id]
+
+    # принципал + UPDATE ... RETURNING + разрешения для ответа (+ журнал)
+    with query_budget(3 + _followups(db, 1)):
+        r = await client.put(
+            f"/roles/{role['id']}",
+            json={"description": "updated"},
+            headers=auth_header,
+        )
+    assert r.status_code == 200
+    assert r.json()["description"] == "updated"
+
+    # принципал + разрешения роли + DELETE ... RETURNING (+ счётчик, журнал)
+    with query_budget(3 + _followups(db, 2)):
+        r = await client.delete(f"/roles/{role['id']}", headers=auth_header)
+    assert r.status_code == 200
+
+    with query_budget(2 + _followups(db, 2)):
+        r = await client.delete(f"/permissions/{perm_id}", headers=auth_header)
+    assert r.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_update_replaces_role_links(client, auth_header):
+    role_ids = []
+    for name in ("links-a", "links-b", "links-c"):
+        r = await client.post("/roles/", json={"name": name}, headers=auth_header)
+        role_ids.append(r.json()["id"])
+
+    r = await client.post(
+        "/users/",
+        json={
+            "username": "linked",
+            "email": "linked@example.com",
+            "password": "secret123",
+            "role_ids": role_ids[:2],
+        },
+        headers=auth_header,
+    )
+    assert r.status_code == 201
+    user = r.json()
+    assert sorted(role["id"] for role in user["roles"]) == role_ids[:2]
+
+    # несуществующие id игнорируются, лишние связи снимаются
+    r = await client.put(
+        f"/users/{user['id']}",
+        json={"role_ids": [role_ids[1], role_ids[2], 999999]},
+        headers=auth_header,
+    )
+    assert r.status_code == 200
+    assert sorted(role["id"] for role in r.json()["roles"]) == role_ids[1:]
+
+    r = await client.put(
+        f"/users/{user['id']}", json={"role_ids": []}, headers=auth_header
+    )
+    assert r.status_code == 200
+    assert r.json()["roles"] == []
+
+    r = await client.put(
+        f"/users/{user['id']}", json={"username": "admin"}, headers=auth_header
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Update conflict: fields must be unique."
+
+    r = await client.put(
+        "/users/999999", json={"username": "ghost"}, headers=auth_header
+    )
+    assert r.status_code == 404